@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark del diario de ingesta con varios escritores concurrentes
+
+Crea un libro vacío (create_excel) en un directorio temporal y lanza N procesos que
+añaden lotes de visitas con ingesta_csv.anexar, cada uno bajo el bloqueo del diario,
+mientras un confirmador compacta el libro cada --cada segundos. Mide filas/s y la
+latencia de cada lote, y al final comprueba que el libro contiene exactamente una vez
+cada fila escrita.
+
+Uso:
+    python benchmark_diario.py --escritores 16 --lotes 40 --filas-lote 5 --cada 1
+    python benchmark_diario.py --escritores 8 --cada 0        # sin confirmador durante la escritura
+"""
+
+import argparse
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from column_schema import INDICE, nueva_fila
+from create_excel import crear_excel
+from ingesta_csv import anexar, compactar, confirmar_periodicamente, contar_pendientes
+from xlsx_reader import iter_visits
+
+# ================ ESCRITORES ================
+
+def _fila(escritor, numero):
+    """Visita de seguimiento mínima válida; ESPA y APS alternos con un ID único por fila"""
+    fila = nueva_fila()
+    codigo, diagnostico = ('ESP', 'espa') if numero % 2 == 0 else ('APS', 'aps')
+    fila[INDICE['ID_Paciente']] = f'{codigo}-{escritor:04d}-{numero:06d}'
+    fila[INDICE['Fecha_Visita']] = '2024-01-15'
+    fila[INDICE['Tipo_Visita']] = 'Seguimiento'
+    fila[INDICE['Diagnostico_Primario']] = diagnostico
+    return '\t'.join(fila) + '\n'
+
+def _escritor(libro, escritor, lotes, filas_lote):
+    """Devuelve (inicio, fin, [latencia de cada lote en s])"""
+    latencias = []
+    inicio = time.time()
+    for lote in range(lotes):
+        lineas = [_fila(escritor, lote * filas_lote + i) for i in range(filas_lote)]
+        t0 = time.perf_counter()
+        anexar(libro, lineas)
+        latencias.append(time.perf_counter() - t0)
+    return inicio, time.time(), latencias
+
+def _percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(p / 100 * len(valores)))]
+
+# ================ BENCHMARK ================
+
+def ejecutar(escritores=8, lotes=40, filas_lote=5, cada=1.0, directorio=None):
+    """Ejecuta el benchmark en un directorio temporal (se borra al terminar) y devuelve las métricas"""
+    temporal = tempfile.mkdtemp(prefix='benchmark_diario_', dir=directorio)
+    try:
+        libro = os.path.join(temporal, 'Hub_Clinico_Maestro.xlsx')
+        crear_excel(libro)
+
+        parar = multiprocessing.Event()
+        confirmador = None
+        if cada:
+            confirmador = multiprocessing.Process(target=confirmar_periodicamente, args=(libro, cada, parar))
+            confirmador.start()
+        with ProcessPoolExecutor(max_workers=escritores) as executor:
+            resultados = list(executor.map(_escritor, [libro] * escritores, range(escritores),
+                                           [lotes] * escritores, [filas_lote] * escritores))
+        parar.set()
+        if confirmador:
+            confirmador.join()
+
+        t0 = time.perf_counter()
+        while contar_pendientes(libro):
+            compactar(libro)
+        compactacion_final = time.perf_counter() - t0
+
+        ids = Counter(fila[0] for hoja in ('ESPA', 'APS')
+                      for fila in iter_visits(hoja, ['ID_Paciente'], workbook=libro))
+        esperados = {_fila(e, n).split('\t', 1)[0] for e in range(escritores) for n in range(lotes * filas_lote)}
+        latencias = [latencia for _, _, lista in resultados for latencia in lista]
+        duracion = max(fin for _, fin, _ in resultados) - min(inicio for inicio, _, _ in resultados)
+        total = escritores * lotes * filas_lote
+        return {
+            'filas': total,
+            'segundos': duracion,
+            'filas_s': total / duracion,
+            'lotes_s': len(latencias) / duracion,
+            'latencia_p50_ms': _percentil(latencias, 50) * 1000,
+            'latencia_p99_ms': _percentil(latencias, 99) * 1000,
+            'latencia_max_ms': max(latencias) * 1000,
+            'compactacion_final_s': compactacion_final,
+            'perdidas': len(esperados - set(ids)),
+            'duplicadas': sum(n - 1 for n in ids.values() if n > 1),
+            'sobrantes': len(set(ids) - esperados),
+        }
+    finally:
+        shutil.rmtree(temporal, ignore_errors=True)
+
+# ================ CLI ================
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark de escritores concurrentes sobre el diario de ingesta')
+    parser.add_argument('--escritores', type=int, default=8, help='Procesos escritores concurrentes')
+    parser.add_argument('--lotes', type=int, default=40, help='Lotes por escritor')
+    parser.add_argument('--filas-lote', type=int, default=5, help='Visitas por lote')
+    parser.add_argument('--cada', type=float, default=1.0,
+                        help='Segundos entre compactaciones del confirmador (0 = solo al final)')
+    parser.add_argument('--directorio', help='Directorio donde crear el temporal (p. ej. la unidad de red)')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    m = ejecutar(args.escritores, args.lotes, args.filas_lote, args.cada, args.directorio)
+    print(f"{args.escritores} escritores, {m['filas']} filas en {m['segundos']:.2f}s: "
+          f"{m['filas_s']:,.0f} filas/s, {m['lotes_s']:,.0f} lotes/s")
+    print(f"Latencia por lote: p50 {m['latencia_p50_ms']:.1f}ms, p99 {m['latencia_p99_ms']:.1f}ms, "
+          f"máx {m['latencia_max_ms']:.1f}ms")
+    print(f"Compactación final: {m['compactacion_final_s']:.2f}s")
+    print(f"Comprobación: {m['perdidas']} perdidas, {m['duplicadas']} duplicadas, {m['sobrantes']} sobrantes")
+    return 1 if m['perdidas'] or m['duplicadas'] or m['sobrantes'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Huellas por fila del libro maestro y diferencias entre versiones
+
+Los artefactos derivados (caché columnar, índices, agregados) se reconstruyen desde cero
+porque nada dice qué filas han cambiado. Este módulo calcula una huella (blake2b de 64
+bits) del contenido de cada fila de ESPA y APS, identificada por (ID_Paciente,
+Fecha_Visita, Tipo_Visita, n), donde n distingue las filas repetidas con la misma clave
+por orden de aparición, y la guarda en <libro>.huellas.json. Comparando dos juegos de
+huellas se obtienen las filas insertadas, actualizadas y eliminadas sin mirar los valores.
+
+La huella usa los valores decodificados por nombre de columna (no el XML), así que no
+cambia si Excel reordena las cadenas compartidas, los estilos o las columnas al guardar.
+Decodificar una fila entera es caro, así que también se guarda una huella del XML de la
+fila (sin su número): si coincide con la de la versión anterior, y las cadenas compartidas
+no han cambiado, se reutiliza la huella de contenido sin decodificar la fila.
+
+Uso:
+    python cambios_maestro.py Hub_Clinico_Maestro.xlsx                  # frente a las huellas guardadas
+    python cambios_maestro.py nuevo.xlsx --anterior copia_de_ayer.xlsx  # entre dos versiones
+
+    from cambios_maestro import diferencias, huellas_libro
+    cambios = diferencias(huellas_libro('ayer.xlsx'), huellas_libro('hoy.xlsx'))
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+import zipfile
+
+from column_schema import HOJAS_DATOS
+from columnar_cache import hash_libro
+from compactar_maestro import normalizar_fecha
+from particionar_maestro import plantilla_fila
+from xlsx_reader import (LIBRO_MAESTRO, NUM_FILA, LectorFilas, celdas_fila, convertir_celda, iter_filas_xml,
+                         leer_cadenas_compartidas, orden_columna)
+from xlsx_streaming import guardar_json, localizar_hojas
+
+VERSION_HUELLAS = 1
+COLUMNAS_CLAVE = ('ID_Paciente', 'Fecha_Visita', 'Tipo_Visita')
+
+# ================ HUELLAS ================
+
+def ruta_huellas(libro):
+    return os.path.splitext(libro)[0] + '.huellas.json'
+
+def _texto_clave(valor):
+    if valor is None:
+        return ''
+    return str(normalizar_fecha(valor)).strip()
+
+def _canonico(valor):
+    # 3.0 y 3 son la misma celda (Excel y openpyxl escriben los enteros sin decimales)
+    if isinstance(valor, float) and valor.is_integer():
+        return int(valor)
+    return valor
+
+def huella(nombres, valores):
+    """blake2b de 64 bits (hex) de los pares columna=valor no vacíos de una fila"""
+    partes = [f'{nombre}\x1e{_canonico(valor)!r}' for nombre, valor in zip(nombres, valores) if valor is not None]
+    return hashlib.blake2b('\x1f'.join(partes).encode('utf-8'), digest_size=8).hexdigest()
+
+def huellas_hoja(zf, ruta, compartidas, previas=None):
+    """
+    {clave: [huella, fila, huella del XML]} de una hoja; la clave es 'ID\\tFecha\\tTipo\\tn'.
+    `previas` son las de una versión anterior con las mismas cadenas compartidas.
+    """
+    previas = previas or {}
+    lector = LectorFilas(compartidas)
+    filas = iter_filas_xml(zf, ruta)
+    nombres = {}
+    for fila in filas:
+        if '<c' in fila:
+            nombres = {letra: convertir_celda(*celda, compartidas) for letra, celda in celdas_fila(fila).items()}
+            break
+    letras_clave = {nombre: letra for letra, nombre in nombres.items() if nombre in COLUMNAS_CLAVE}
+    faltan = [nombre for nombre in COLUMNAS_CLAVE if nombre not in letras_clave]
+    if faltan:
+        raise ValueError(f"La hoja {ruta} no tiene las columnas clave {faltan}")
+
+    orden_clave = sorted(letras_clave.values(), key=orden_columna)
+    resultado = {}
+    for fila in filas:
+        if '</c>' not in fila:
+            continue
+        numero = NUM_FILA.match(fila)
+        num_fila = numero.group(1) if numero else ''
+        clave = dict(zip(orden_clave, lector.valores(fila, num_fila, orden_clave)))
+        base = '\t'.join(_texto_clave(clave[letras_clave[nombre]]) for nombre in COLUMNAS_CLAVE)
+        n = 0
+        while f'{base}\t{n}' in resultado:
+            n += 1
+        huella_xml = hashlib.blake2b(plantilla_fila(fila, num_fila).encode('utf-8'), digest_size=8).hexdigest()
+        previa = previas.get(f'{base}\t{n}')
+        if previa and previa[2] == huella_xml:
+            resultado[f'{base}\t{n}'] = [previa[0], int(num_fila) if num_fila else None, huella_xml]
+            continue
+        valores = lector.todas(fila)
+        # Celdas fuera de la cabecera cuentan con su letra para que un cambio en ellas se detecte
+        pares = sorted((str(nombres.get(letra, letra)), valor) for letra, valor in valores.items() if valor is not None)
+        if not pares:
+            continue
+        resultado[f'{base}\t{n}'] = [huella(*zip(*pares)), int(num_fila) if num_fila else None, huella_xml]
+    return resultado
+
+def _huella_cadenas(zf):
+    if 'xl/sharedStrings.xml' not in zf.namelist():
+        return ''
+    return hashlib.blake2b(zf.read('xl/sharedStrings.xml'), digest_size=16).hexdigest()
+
+def calcular_huellas(libro, hojas=HOJAS_DATOS, previas=None):
+    """
+    Huellas de todas las filas de las hojas, con los metadatos del libro para saber si
+    siguen al día. Con `previas` (huellas de otra versión) se reutilizan las de las filas
+    cuyo XML no ha cambiado.
+    """
+    info = os.stat(libro)
+    with zipfile.ZipFile(libro) as zf:
+        rutas = localizar_hojas(zf)
+        cadenas = _huella_cadenas(zf)
+        compartidas = leer_cadenas_compartidas(zf)
+        if not previas or previas.get('cadenas') != cadenas:
+            previas = {'hojas': {}}
+        filas = {hoja: huellas_hoja(zf, rutas[hoja], compartidas, previas['hojas'].get(hoja))
+                 for hoja in hojas if hoja in rutas}
+    return {'version': VERSION_HUELLAS, 'libro': os.path.basename(libro), 'mtime_ns': info.st_mtime_ns,
+            'tamano': info.st_size, 'sha256': hash_libro(libro), 'cadenas': cadenas, 'hojas': filas}
+
+def guardar_huellas(huellas, ruta):
+    guardar_json(huellas, ruta, separators=(',', ':'))
+
+def leer_huellas(ruta):
+    """Huellas guardadas (None si no existen o son de otra versión)"""
+    try:
+        with open(ruta, encoding='utf-8') as f:
+            huellas = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return huellas if huellas.get('version') == VERSION_HUELLAS else None
+
+def huellas_libro(libro, hojas=HOJAS_DATOS, previas=None):
+    """
+    Huellas del libro: las guardadas si siguen al día (misma fecha y tamaño, o mismo
+    sha256) y, si no, recalculadas (reutilizando `previas` o las guardadas) y guardadas
+    """
+    guardadas = leer_huellas(ruta_huellas(libro))
+    if guardadas and all(hoja in guardadas['hojas'] for hoja in hojas):
+        info = os.stat(libro)
+        if (guardadas['mtime_ns'], guardadas['tamano']) == (info.st_mtime_ns, info.st_size) \
+                or guardadas['sha256'] == hash_libro(libro):
+            return guardadas
+    huellas = calcular_huellas(libro, hojas, previas or guardadas)
+    guardar_huellas(huellas, ruta_huellas(libro))
+    return huellas
+
+# ================ DIFERENCIAS ================
+
+def _clave(texto):
+    id_paciente, fecha, tipo, n = texto.split('\t')
+    return {'ID_Paciente': id_paciente, 'Fecha_Visita': fecha, 'Tipo_Visita': tipo, 'n': int(n)}
+
+def diferencias(anteriores, nuevas):
+    """
+    {hoja: {'insertadas', 'actualizadas', 'eliminadas'}} entre dos juegos de huellas. Cada
+    cambio lleva su clave y el número de fila en el libro nuevo ('fila') y/o en el anterior
+    ('fila_anterior'). Si el sha256 coincide no se compara fila a fila.
+    """
+    hojas = sorted(set(anteriores['hojas']) | set(nuevas['hojas']), key=lambda h: (h not in HOJAS_DATOS, h))
+    cambios = {}
+    for hoja in hojas:
+        antes, ahora = anteriores['hojas'].get(hoja, {}), nuevas['hojas'].get(hoja, {})
+        if anteriores['sha256'] == nuevas['sha256']:
+            antes = ahora
+        cambios[hoja] = {
+            'insertadas': [dict(_clave(c), fila=ahora[c][1]) for c in ahora.keys() - antes.keys()],
+            'actualizadas': [dict(_clave(c), fila=ahora[c][1], fila_anterior=antes[c][1])
+                             for c in ahora.keys() & antes.keys() if ahora[c][0] != antes[c][0]],
+            'eliminadas': [dict(_clave(c), fila_anterior=antes[c][1]) for c in antes.keys() - ahora.keys()],
+        }
+        for tipo, campo in (('insertadas', 'fila'), ('actualizadas', 'fila'), ('eliminadas', 'fila_anterior')):
+            cambios[hoja][tipo].sort(key=lambda cambio: cambio[campo] or 0)
+    return cambios
+
+def ruta_cambios(libro):
+    return os.path.splitext(libro)[0] + '.cambios.json'
+
+# ================ CLI ================
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Filas insertadas, actualizadas y eliminadas entre versiones del libro')
+    parser.add_argument('libro', nargs='?', default=LIBRO_MAESTRO)
+    parser.add_argument('--anterior', help='Versión anterior del libro (por defecto, las huellas guardadas)')
+    parser.add_argument('--salida', help='Cambios en JSON (por defecto <libro>.cambios.json)')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    inicio = time.perf_counter()
+    if args.anterior:
+        anteriores = huellas_libro(args.anterior)
+    else:
+        anteriores = leer_huellas(ruta_huellas(args.libro))
+    nuevas = huellas_libro(args.libro, previas=anteriores)
+    if anteriores is None:
+        print(f"{ruta_huellas(args.libro)}: huellas iniciales guardadas ({time.perf_counter() - inicio:.1f}s)")
+        return
+    cambios = diferencias(anteriores, nuevas)
+    salida = args.salida or ruta_cambios(args.libro)
+    guardar_json({'anterior': anteriores['sha256'], 'nuevo': nuevas['sha256'], 'hojas': cambios}, salida, indent=1)
+    for hoja, tipos in cambios.items():
+        print(f"  {hoja}: " + ', '.join(f'{len(lista)} {tipo}' for tipo, lista in tipos.items()))
+    print(f"{salida} ({time.perf_counter() - inicio:.1f}s)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Esquema de columnas de las hojas ESPA y APS de Hub_Clinico_Maestro.xlsx
+
+Fuente única del orden de columnas para create_excel.py y los generadores de datos:
+nombre, tipo y dominio de cada columna y un mapa nombre → índice inmutable, de modo
+que las filas se rellenan por nombre sobre un ancho fijo y no por posición.
+"""
+
+from collections import namedtuple
+from types import MappingProxyType
+
+Columna = namedtuple('Columna', ['nombre', 'tipo', 'dominio'])
+
+# Tipos: 'texto', 'fecha' (YYYY-MM-DD), 'si_no', 'opcion' (dominio = valores admitidos)
+# y 'numero' (dominio = (mínimo, máximo) o None)
+SI_NO = ('SI', 'NO')
+
+HOJAS_DATOS = ('ESPA', 'APS')
+
+# ================ HOMÚNCULO ================
+
+# Regiones del homúnculo (mismo orden y data-region-id que en homunculus.js)
+ARTICULACIONES = (
+    'hombro-derecho', 'hombro-izquierdo', 'codo-derecho', 'codo-izquierdo',
+    'muneca-derecha', 'muneca-izquierda', 'rodilla-derecha', 'rodilla-izquierda',
+    'mcf1-derecha', 'mcf2-derecha', 'mcf3-derecha', 'mcf4-derecha', 'mcf5-derecha',
+    'mcf1-izquierda', 'mcf2-izquierda', 'mcf3-izquierda', 'mcf4-izquierda', 'mcf5-izquierda',
+    'ifp1-derecha', 'ifp2-derecha', 'ifp3-derecha', 'ifp4-derecha', 'ifp5-derecha',
+    'ifp1-izquierda', 'ifp2-izquierda', 'ifp3-izquierda', 'ifp4-izquierda', 'ifp5-izquierda'
+)
+
+DEDOS_DACTILITIS = tuple(
+    f'dactilitis-dedo{dedo}-{extremidad}'
+    for extremidad in ('mano-derecha', 'mano-izquierda', 'pie-derecho', 'pie-izquierdo')
+    for dedo in range(1, 6)
+)
+
+COLUMNAS_NAD = tuple('NAD_' + region.replace('-', '_') for region in ARTICULACIONES)
+COLUMNAS_NAT = tuple('NAT_' + region.replace('-', '_') for region in ARTICULACIONES)
+COLUMNAS_DACT = tuple('DACT_' + dedo.split('-', 1)[1].replace('-', '_') for dedo in DEDOS_DACTILITIS)
+
+COLUMNAS_ENTESITIS = (
+    'Entesitis_Aquiles_Der', 'Entesitis_Fascia_Der', 'Entesitis_Epicondilo_Lat_Der', 'Entesitis_Epicondilo_Med_Der',
+    'Entesitis_Trocanter_Der', 'Entesitis_Aquiles_Izq', 'Entesitis_Fascia_Izq', 'Entesitis_Epicondilo_Lat_Izq',
+    'Entesitis_Epicondilo_Med_Izq', 'Entesitis_Trocanter_Izq'
+)
+
+COLUMNAS_HAQ = ('HAQ_Vestirse', 'HAQ_Levantarse', 'HAQ_Comer', 'HAQ_Caminar',
+                'HAQ_Higiene', 'HAQ_Alcanzar', 'HAQ_Agarrar', 'HAQ_Actividades')
+
+COLUMNAS_LEI = ('LEI_Epicondilo_Lat_Izq', 'LEI_Epicondilo_Lat_Der', 'LEI_Epicondilo_Med_Izq',
+                'LEI_Epicondilo_Med_Der', 'LEI_Aquiles_Izq', 'LEI_Aquiles_Der')
+
+# ================ COLUMNAS ================
+
+def _texto(*nombres):
+    return [Columna(nombre, 'texto', None) for nombre in nombres]
+
+def _fecha(*nombres):
+    return [Columna(nombre, 'fecha', None) for nombre in nombres]
+
+def _si_no(*nombres):
+    return [Columna(nombre, 'si_no', SI_NO) for nombre in nombres]
+
+def _numero(*nombres, rango=None):
+    return [Columna(nombre, 'numero', rango) for nombre in nombres]
+
+COLUMNAS = tuple(
+    # Identificación
+    _texto('ID_Paciente', 'Nombre_Paciente')
+    + [Columna('Sexo', 'opcion', ('Hombre', 'Mujer'))]
+    + _fecha('Fecha_Visita')
+    + [Columna('Tipo_Visita', 'opcion', ('Primera Visita', 'Seguimiento'))]
+    # Profesional y diagnóstico
+    + _texto('Profesional')
+    + [Columna('Diagnostico_Primario', 'opcion', ('ESPA', 'APS'))]
+    + _texto('Diagnostico_Secundario')
+    + [Columna('HLA_B27', 'opcion', ('Positivo', 'Negativo'))]
+    + _si_no('FR', 'APCC')
+    # Anamnesis
+    + _texto('Inicio_Sintomas', 'Inicio_Psoriasis')
+    + _si_no('Dolor_Axial')
+    + _texto('Rigidez_Matutina', 'Duracion_Rigidez')
+    + _si_no('Irradiacion_Nalgas', 'Clinica_Axial_Presente')
+    # Homúnculo
+    + _si_no(*COLUMNAS_NAD)
+    + _si_no(*COLUMNAS_NAT)
+    + _si_no(*COLUMNAS_DACT)
+    + _numero('NAD_Total', 'NAT_Total', rango=(0, len(ARTICULACIONES)))
+    + _numero('Dactilitis_Total', rango=(0, len(DEDOS_DACTILITIS)))
+    # Antropometría
+    + _numero('Peso', 'Talla', 'IMC')
+    + _texto('TA')
+    # PROs
+    + _numero('EVA_Global', 'EVA_Dolor', 'EVA_Fatiga', rango=(0, 10))
+    + _numero('Rigidez_Matutina_Min')
+    + _numero('Dolor_Nocturno', rango=(0, 10))
+    # Afectación psoriasis
+    + _si_no('Psoriasis_Cuero_Cabelludo', 'Psoriasis_Ungueal', 'Psoriasis_Extensora',
+             'Psoriasis_Pliegues', 'Psoriasis_Palmoplantar')
+    # Manifestaciones extraarticulares
+    + _si_no('ExtraArticular_Digestiva', 'ExtraArticular_Uveitis', 'ExtraArticular_Psoriasis')
+    # Comorbilidades
+    + _si_no('Comorbilidad_HTA', 'Comorbilidad_DM', 'Comorbilidad_DLP', 'Comorbilidad_ECV',
+             'Comorbilidad_Gastritis', 'Comorbilidad_Obesidad', 'Comorbilidad_Osteoporosis', 'Comorbilidad_Gota')
+    # Antecedentes familiares
+    + _si_no('AF_Psoriasis', 'AF_Artritis', 'AF_EII', 'AF_Uveitis')
+    # Tóxicos
+    + _si_no('Toxico_Tabaco') + _texto('Toxico_Tabaco_Desc')
+    + _si_no('Toxico_Alcohol') + _texto('Toxico_Alcohol_Desc')
+    + _si_no('Toxico_Drogas') + _texto('Toxico_Drogas_Desc')
+    # Entesitis
+    + _si_no(*COLUMNAS_ENTESITIS)
+    + _texto('Otras_Entesitis')
+    # Pruebas complementarias
+    + _numero('PCR', 'VSG', rango=(0, None))
+    + _texto('Otros_Hallazgos_Analitica', 'Hallazgos_Radiografia', 'Hallazgos_RMN')
+    # BASDAI
+    + _numero('BASDAI_P1', 'BASDAI_P2', 'BASDAI_P3', 'BASDAI_P4', 'BASDAI_P5', rango=(0, 10))
+    + _numero('BASDAI_P6')
+    + _numero('BASDAI_Result', rango=(0, 10))
+    # ASDAS
+    + _numero('ASDAS_Dolor_Espalda', 'ASDAS_Duracion_Rigidez', 'ASDAS_EVA_Global', rango=(0, 10))
+    + _numero('ASDAS_CRP_Result', 'ASDAS_ESR_Result', rango=(0, None))
+    # Metrología
+    + _numero('Schober', 'Rotacion_Cervical', 'Distancia_OP', 'Distancia_TP',
+              'Expansion_Toracica', 'Distancia_Intermaleolar')
+    # Evaluación psoriasis
+    + _numero('PASI_Score', rango=(0, 72))
+    + _numero('BSA_Percentage', rango=(0, 100))
+    + _texto('Psoriasis_Descripcion')
+    # HAQ-DI
+    + _numero(*COLUMNAS_HAQ, 'HAQ_Total', rango=(0, 3))
+    # LEI
+    + _numero(*COLUMNAS_LEI)
+    + _numero('LEI_Score', rango=(0, len(COLUMNAS_LEI)))
+    # MDA
+    + _numero('MDA_NAT', 'MDA_NAD', 'MDA_PASI', 'MDA_Dolor', 'MDA_Global', 'MDA_HAQ', 'MDA_Entesitis')
+    + _si_no('MDA_Cumple')
+    # RAPID3
+    + _numero('RAPID3_Funcion', 'RAPID3_Dolor', 'RAPID3_Global', rango=(0, 10))
+    + _numero('RAPID3_Score', rango=(0, 30))
+    # Tratamiento actual
+    + _texto('Tratamiento_Actual') + _fecha('Fecha_Inicio_Tratamiento') + _texto('Decision_Terapeutica_PV')
+    # Continuar tratamiento
+    + _si_no('Continuar_Adherencia', 'Continuar_Ajuste_Terapeutico')
+    # Cambio de tratamiento
+    + _texto('Cambio_Motivo') + _si_no('Cambio_Efectos_Adversos')
+    + _texto('Cambio_Descripcion_Efectos', 'Cambio_Sistemico_Farmaco', 'Cambio_Sistemico_Dosis',
+             'Cambio_FAME_Farmaco', 'Cambio_FAME_Dosis', 'Cambio_Biologico_Farmaco', 'Cambio_Biologico_Dosis')
+    # Decisión terapéutica de seguimiento
+    + _texto('Decision_Terapeutica_SEG')
+    # Tratamientos iniciales
+    + _texto('Trat_Sistemico', 'Trat_Sistemico_Dosis', 'Trat_FAME', 'Trat_FAME_Dosis',
+             'Trat_Biologico', 'Trat_Biologico_Dosis')
+    # Seguimiento
+    + _fecha('Fecha_Proxima_Revision') + _texto('Comentarios_Adicionales')
+)
+
+NOMBRES = tuple(columna.nombre for columna in COLUMNAS)
+ANCHO = len(NOMBRES)
+INDICE = MappingProxyType({nombre: i for i, nombre in enumerate(NOMBRES)})
+TIPOS = MappingProxyType({columna.nombre: columna for columna in COLUMNAS})
+
+if len(INDICE) != ANCHO:
+    raise ValueError('column_schema: hay nombres de columna duplicados')
+
+# ================ NOMBRES DEL CONTRATO ================
+
+def _region_contrato(region):
+    return '_'.join(parte.upper() if parte[:3] in ('mcf', 'ifp') else parte.capitalize()
+                    for parte in region.split('-'))
+
+# Nombres de docs/CONTRATO_DATOS_UNIFICADO.md que difieren de la cabecera del libro
+ALIAS_CONTRATO = MappingProxyType({
+    'HLA-B27': 'HLA_B27',
+    'aPCC': 'APCC',
+    'Decision_Terapeutica': 'Decision_Terapeutica_PV',
+    **{f'{prefijo}_{_region_contrato(region)}': f'{prefijo}_{region.replace("-", "_")}'
+       for prefijo in ('NAD', 'NAT') for region in ARTICULACIONES},
+    **{'Dactilitis_' + _region_contrato(dedo.split('-', 1)[1]): columna
+       for dedo, columna in zip(DEDOS_DACTILITIS, COLUMNAS_DACT)},
+})
+
+# ================ FILAS ================
+
+def nueva_fila():
+    """Fila vacía de ancho fijo para rellenar con fila[INDICE['Columna']] = valor"""
+    return [''] * ANCHO
+
+def indices(nombres):
+    """Índices de varias columnas (en el mismo orden)"""
+    return tuple(INDICE[nombre] for nombre in nombres)
+
+def nombre_canonico(nombre):
+    """Nombre de columna de la cabecera para un nombre del contrato de datos (o el mismo)"""
+    return ALIAS_CONTRATO.get(nombre, nombre)
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Caché columnar del libro maestro (.npz junto al libro)
+
+Leer Hub_Clinico_Maestro.xlsx es lo más lento de cualquier análisis. Este módulo
+convierte una vez las hojas ESPA, APS, Fármacos y Profesionales en columnas tipadas
+(SI/NO → booleanos según normalizeYesNo, números → float64, fechas → días desde 1970
+en int32, texto → códigos int32 + diccionario de valores) y las guarda en
+<libro>.cache/<hoja>.npz.
+La caché se reconstruye solo si cambian la fecha de modificación y el contenido
+del libro (sha256); si solo cambia la fecha, se reaprovecha y se actualiza meta.json.
+
+Uso:
+    from columnar_cache import cargar
+    tablas = cargar('Hub_Clinico_Maestro.xlsx')
+    basdai = tablas['ESPA']['BASDAI_Result']      # float64 (NaN = vacío)
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import time
+import zipfile
+from datetime import date, datetime
+
+import numpy as np
+
+from column_schema import TIPOS
+from xlsx_reader import FILA, LIBRO_MAESTRO, columnas_hoja, iter_lotes
+from xlsx_streaming import escribir_atomico, guardar_json, localizar_hojas
+
+VERSION_CACHE = 3
+HOJAS_CACHE = ('ESPA', 'APS', 'Fármacos', 'Profesionales')
+
+FECHA_NULA = np.iinfo(np.int32).min
+TAM_LOTE_CACHE = 16384
+
+_FECHA_ISO = re.compile(r'^\s*(\d{4})-(\d{2})-(\d{2})')
+# DD/MM/YYYY, el otro formato que acepta parseVisitDate
+_FECHA_DMY = re.compile(r'^\s*(\d{1,2})/(\d{1,2})/(\d{4})\s*$')
+_EPOCA = date(1970, 1, 1).toordinal()
+# Número de serie 0 de Excel (sistema 1900, como normalizar_fecha de compactar_maestro)
+_EPOCA_EXCEL = date(1899, 12, 30).toordinal() - _EPOCA
+_MAX_SERIE_EXCEL = 2958466
+
+# normalizeYesNo de modules/dataManager.js
+_SI = frozenset(('si', 's', 'true', '1', 'positivo', 'positive', 'pos'))
+_NO = frozenset(('no', 'false', '0', 'negativo', 'negative', 'neg'))
+
+# ================ CONVERSIÓN DE COLUMNAS ================
+
+def tipo_columna(nombre):
+    """Tipo de almacenamiento de una columna: el de column_schema o 'texto' si no está en el esquema"""
+    columna = TIPOS.get(nombre)
+    if columna is None or columna.tipo == 'opcion':
+        return 'texto'
+    return columna.tipo
+
+def _a_numero(valor):
+    if valor is None or isinstance(valor, bool):
+        return np.nan
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    try:
+        return float(str(valor).replace(',', '.'))
+    except ValueError:
+        return np.nan
+
+def normalizar_texto(valor):
+    """normalizeString"""
+    return '' if valor is None else str(valor).strip().lower()
+
+def normalizar_si_no(valor):
+    """normalizeYesNo: True, False o None"""
+    texto = normalizar_texto(valor)
+    return True if texto in _SI else False if texto in _NO else None
+
+def a_dias(valor):
+    """
+    Días desde 1970-01-01 de una fecha ISO o DD/MM/YYYY (texto), date/datetime o número de
+    serie de Excel; FECHA_NULA si no es fecha
+    """
+    if isinstance(valor, (datetime, date)):
+        return valor.toordinal() - _EPOCA
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return _EPOCA_EXCEL + int(valor) if 0 < valor < _MAX_SERIE_EXCEL else FECHA_NULA
+    if isinstance(valor, str):
+        coincidencia = _FECHA_ISO.match(valor)
+        dmy = None if coincidencia else _FECHA_DMY.match(valor)
+        try:
+            if coincidencia:
+                return date(*map(int, coincidencia.groups())).toordinal() - _EPOCA
+            if dmy:
+                dia, mes, anio = map(int, dmy.groups())
+                return date(anio, mes, dia).toordinal() - _EPOCA
+        except ValueError:
+            pass
+    return FECHA_NULA
+
+def dias_a_fecha(dias):
+    """Array de días (int32) a datetime64[D] con NaT en los vacíos"""
+    dias = np.asarray(dias)
+    return np.where(dias == FECHA_NULA, np.datetime64('NaT'), dias.astype('datetime64[D]'))
+
+class _Codificador:
+    """Diccionario incremental de una columna de texto (código -1 = vacío)"""
+
+    def __init__(self):
+        self.codigos = {}
+        self.partes = []
+
+    def lote(self, valores):
+        codigos = self.codigos
+        resultado = np.empty(len(valores), dtype=np.int32)
+        for i, valor in enumerate(valores):
+            if valor is None or valor == '':
+                resultado[i] = -1
+                continue
+            texto = valor if isinstance(valor, str) else str(valor)
+            codigo = codigos.get(texto)
+            if codigo is None:
+                codigo = codigos[texto] = len(codigos)
+            resultado[i] = codigo
+        self.partes.append(resultado)
+
+    def arrays(self):
+        valores = np.array(list(self.codigos), dtype=str) if self.codigos else np.empty(0, dtype='<U1')
+        return np.concatenate(self.partes) if self.partes else np.empty(0, dtype=np.int32), valores
+
+def _convertir_lote(tipo, valores):
+    """Lote de objetos → arrays tipados ({sufijo: array})"""
+    if tipo == 'si_no':
+        estados = [normalizar_si_no(v) for v in valores]
+        return {'': np.fromiter((e is True for e in estados), dtype=bool, count=len(estados)),
+                '.nulo': np.fromiter((e is None for e in estados), dtype=bool, count=len(estados))}
+    if tipo == 'numero':
+        return {'': np.fromiter((_a_numero(v) for v in valores), dtype=np.float64, count=len(valores))}
+    if tipo == 'fecha':
+        return {'': np.fromiter((a_dias(v) for v in valores), dtype=np.int32, count=len(valores))}
+    raise ValueError(f"Tipo de columna desconocido: {tipo}")
+
+def construir_hoja(libro, hoja):
+    """Lee una hoja completa y devuelve sus arrays tipados {clave npz: array}"""
+    nombres = [n for n in columnas_hoja(hoja, libro) if n is not None]
+    tipos = {nombre: tipo_columna(nombre) for nombre in nombres}
+    codificadores = {nombre: _Codificador() for nombre in nombres if tipos[nombre] == 'texto'}
+    partes = {}
+    filas = []
+
+    for lote in iter_lotes(hoja, [FILA] + nombres, libro=libro, tam_lote=TAM_LOTE_CACHE):
+        filas.append(lote.pop(FILA).astype(np.int32))
+        for nombre, valores in lote.items():
+            if nombre in codificadores:
+                codificadores[nombre].lote(valores)
+                continue
+            for sufijo, array in _convertir_lote(tipos[nombre], valores).items():
+                partes.setdefault(nombre + sufijo, []).append(array)
+
+    arrays = {'__filas__': np.concatenate(filas) if filas else np.empty(0, dtype=np.int32)}
+    for nombre in nombres:
+        if nombre in codificadores:
+            arrays[nombre + '.codigos'], arrays[nombre + '.valores'] = codificadores[nombre].arrays()
+        else:
+            for sufijo in (('', '.nulo') if tipos[nombre] == 'si_no' else ('',)):
+                vacio = np.empty(0, dtype={'si_no': bool, 'numero': np.float64, 'fecha': np.int32}[tipos[nombre]])
+                arrays[nombre + sufijo] = np.concatenate(partes[nombre + sufijo]) if nombre + sufijo in partes else vacio
+    arrays['__columnas__'] = np.array(nombres, dtype=str)
+    arrays['__tipos__'] = np.array([tipos[n] for n in nombres], dtype=str)
+    return arrays
+
+# ================ TABLA ================
+
+class TablaColumnar:
+    """Columnas tipadas de una hoja; cada columna se lee del .npz la primera vez que se pide"""
+
+    def __init__(self, nombre, npz):
+        self.nombre = nombre
+        self._npz = npz
+        self.columnas = [str(c) for c in npz['__columnas__']]
+        self._tipos = dict(zip(self.columnas, (str(t) for t in npz['__tipos__'])))
+        self.filas = npz['__filas__']
+        self._cache = {}
+
+    def __len__(self):
+        return len(self.filas)
+
+    def __contains__(self, nombre):
+        return nombre in self._tipos
+
+    def tipo(self, nombre):
+        return self._tipos[nombre]
+
+    def _array(self, clave):
+        if clave not in self._cache:
+            self._cache[clave] = self._npz[clave]
+        return self._cache[clave]
+
+    def __getitem__(self, nombre):
+        """
+        Columna decodificada: booleanos (si_no), float64 con NaN (numero), días int32
+        con FECHA_NULA (fecha) o array de objetos con None en los vacíos (texto)
+        """
+        tipo = self._tipos[nombre]
+        if tipo != 'texto':
+            return self._array(nombre)
+        codigos, valores = self.codigos(nombre), self.categorias(nombre)
+        tabla = np.empty(len(valores) + 1, dtype=object)
+        tabla[:-1] = valores
+        return tabla[codigos]   # el código -1 apunta al None final
+
+    def codigos(self, nombre):
+        """Códigos int32 de una columna de texto (-1 = vacío)"""
+        return self._array(nombre + '.codigos')
+
+    def categorias(self, nombre):
+        """Valores distintos de una columna de texto (índice = código)"""
+        return self._array(nombre + '.valores')
+
+    def nulos(self, nombre):
+        """Máscara de celdas vacías de cualquier columna"""
+        tipo = self._tipos[nombre]
+        if tipo == 'si_no':
+            return self._array(nombre + '.nulo')
+        if tipo == 'numero':
+            return np.isnan(self._array(nombre))
+        if tipo == 'fecha':
+            return self._array(nombre) == FECHA_NULA
+        return self.codigos(nombre) < 0
+
+    def columnas_dict(self, nombres=None):
+        return {nombre: self[nombre] for nombre in (nombres or self.columnas)}
+
+# ================ CACHÉ ================
+
+def directorio_cache(libro):
+    return os.fspath(libro) + '.cache'
+
+def hash_libro(libro, tam_bloque=1 << 20):
+    resumen = hashlib.sha256()
+    with open(libro, 'rb') as f:
+        for bloque in iter(lambda: f.read(tam_bloque), b''):
+            resumen.update(bloque)
+    return resumen.hexdigest()
+
+def _leer_meta(directorio):
+    try:
+        with open(os.path.join(directorio, 'meta.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def estado_cache(libro, hojas=HOJAS_CACHE, directorio=None):
+    """
+    'valida', 'tocada' (misma huella, distinta fecha: se reaprovecha) u 'obsoleta',
+    junto con los metadatos actuales del libro
+    """
+    directorio = directorio or directorio_cache(libro)
+    info = os.stat(libro)
+    actual = {'version': VERSION_CACHE, 'mtime_ns': info.st_mtime_ns, 'tamano': info.st_size}
+    meta = _leer_meta(directorio)
+    completa = meta is not None and all(
+        hoja in meta.get('hojas', ()) and os.path.exists(os.path.join(directorio, f'{hoja}.npz')) for hoja in hojas)
+    if not completa or meta.get('version') != VERSION_CACHE:
+        return 'obsoleta', actual
+    if meta.get('mtime_ns') == actual['mtime_ns'] and meta.get('tamano') == actual['tamano']:
+        actual['sha256'] = meta.get('sha256')
+        return 'valida', actual
+    actual['sha256'] = hash_libro(libro)
+    return ('tocada' if actual['sha256'] == meta.get('sha256') else 'obsoleta'), actual
+
+def construir(libro=LIBRO_MAESTRO, hojas=HOJAS_CACHE, directorio=None):
+    """Reconstruye la caché de las hojas indicadas (las que no existan en el libro se omiten)"""
+    directorio = directorio or directorio_cache(libro)
+    os.makedirs(directorio, exist_ok=True)
+    info = os.stat(libro)
+    meta = {'version': VERSION_CACHE, 'mtime_ns': info.st_mtime_ns, 'tamano': info.st_size,
+            'sha256': hash_libro(libro), 'hojas': {}}
+    disponibles = set(_hojas_libro(libro))
+    for hoja in hojas:
+        if hoja not in disponibles:
+            continue
+        arrays = construir_hoja(libro, hoja)
+        escribir_atomico(os.path.join(directorio, f'{hoja}.npz'), lambda f: np.savez(f, **arrays), 'wb')
+        meta['hojas'][hoja] = {'filas': int(len(arrays['__filas__']))}
+    guardar_json(meta, os.path.join(directorio, 'meta.json'), indent=1)
+    return meta
+
+def _hojas_libro(libro):
+    with zipfile.ZipFile(libro) as zf:
+        return list(localizar_hojas(zf))
+
+def cargar(libro=LIBRO_MAESTRO, hojas=HOJAS_CACHE, directorio=None, forzar=False):
+    """
+    Tablas columnares {hoja: TablaColumnar} del libro, reconstruyendo la caché si el
+    libro ha cambiado (o con forzar=True). Las hojas que el libro no tenga se omiten.
+    """
+    directorio = directorio or directorio_cache(libro)
+    estado, actual = ('obsoleta', None) if forzar else estado_cache(libro, hojas, directorio)
+    if estado == 'obsoleta':
+        meta = construir(libro, hojas, directorio)
+    else:
+        meta = _leer_meta(directorio)
+        if estado == 'tocada':
+            meta.update(mtime_ns=actual['mtime_ns'], tamano=actual['tamano'])
+            guardar_json(meta, os.path.join(directorio, 'meta.json'), indent=1)
+    return {hoja: TablaColumnar(hoja, np.load(os.path.join(directorio, f'{hoja}.npz')))
+            for hoja in hojas if hoja in meta['hojas']}
+
+# ================ CLI ================
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Construye o comprueba la caché columnar del libro maestro')
+    parser.add_argument('libro', nargs='?', default=LIBRO_MAESTRO)
+    parser.add_argument('--forzar', action='store_true', help='Reconstruye aunque el libro no haya cambiado')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    inicio = time.perf_counter()
+    estado = 'forzada' if args.forzar else estado_cache(args.libro)[0] if os.path.exists(
+        os.path.join(directorio_cache(args.libro), 'meta.json')) else 'obsoleta'
+    tablas = cargar(args.libro, forzar=args.forzar)
+    print(f"Caché {directorio_cache(args.libro)} ({estado}, {time.perf_counter() - inicio:.2f}s)")
+    for hoja, tabla in tablas.items():
+        print(f"  {hoja}: {len(tabla)} filas, {len(tabla.columnas)} columnas")
+
+if __name__ == '__main__':
+    main()
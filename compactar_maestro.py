@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compactación del libro maestro agrupada por paciente + índice de desplazamientos
+
+findPatientById y getPatientHistory (modules/dataManager.js) recorren todas las visitas
+de ESPA y APS en cada llamada y después ordenan por fecha. Este script reescribe cada
+hoja de datos ordenada por (ID_Paciente, Fecha_Visita), con las fechas normalizadas a
+YYYY-MM-DD, y genera un índice JSON {ID_Paciente: [[hoja, inicio, fin], ...]} en el que
+inicio/fin son posiciones de visita (0 = primera fila de datos, fin excluido), es decir,
+el slice de appState.db[hoja] con el historial del paciente ya ordenado (antigua → reciente).
+
+Las celdas se copian por letra de columna, también las de columnas sin nombre o con un
+nombre repetido en la cabecera, que se listan en el índice ('columnas_ambiguas'). El libro
+original solo se sustituye con --en-sitio.
+
+Uso:
+    python compactar_maestro.py Hub_Clinico_Maestro.xlsx --salida compactado.xlsx
+    python compactar_maestro.py Hub_Clinico_Maestro.xlsx --en-sitio
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
+import zipfile
+from datetime import date, datetime, timedelta
+
+from column_schema import HOJAS_DATOS, TIPOS
+from openpyxl.utils import column_index_from_string
+
+from xlsx_reader import (LIBRO_MAESTRO, LectorFilas, cabecera_xml, columnas_ambiguas, iter_filas_xml,
+                         leer_cadenas_compartidas, orden_columna)
+from xlsx_streaming import CodificadorFilas, escribir_libro_streaming, guardar_json, localizar_hojas
+
+VERSION_INDICE = 1
+
+FECHA_ISO = re.compile(r'^\s*(\d{4})-(\d{1,2})-(\d{1,2})(?:[T ][\d:.]*)?\s*$')
+_FECHA_DMY = re.compile(r'^\s*(\d{1,2})/(\d{1,2})/(\d{4})\s*$')
+_EPOCA_EXCEL = date(1899, 12, 30)
+
+# ================ FECHAS ================
+
+def normalizar_fecha(valor):
+    """
+    Fecha en YYYY-MM-DD a partir de date/datetime, 'YYYY-MM-DD[...]', 'DD/MM/YYYY'
+    (el formato que acepta parseVisitDate) o un número de serie de Excel. Los valores
+    que no son fechas válidas se devuelven sin cambios.
+    """
+    if isinstance(valor, datetime):
+        return valor.date().isoformat()
+    if isinstance(valor, date):
+        return valor.isoformat()
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        if 0 < valor < 2958466:
+            return (_EPOCA_EXCEL + timedelta(days=int(valor))).isoformat()
+        return valor
+    if isinstance(valor, str):
+        iso = FECHA_ISO.match(valor)
+        dmy = _FECHA_DMY.match(valor)
+        try:
+            if iso:
+                return date(*map(int, iso.groups())).isoformat()
+            if dmy:
+                dia, mes, anio = map(int, dmy.groups())
+                return date(anio, mes, dia).isoformat()
+        except ValueError:
+            pass
+    return valor
+
+# ================ ORDENACIÓN ================
+
+def _clave(id_paciente, fecha, orden):
+    """Orden (ID_Paciente, Fecha_Visita); visitas sin ID al final y fechas no válidas al final de su paciente"""
+    sin_id = id_paciente is None or id_paciente == ''
+    fecha_valida = isinstance(fecha, str) and bool(FECHA_ISO.match(fecha))
+    return (sin_id, '' if sin_id else str(id_paciente).strip(), not fecha_valida,
+            fecha if fecha_valida else '', orden)
+
+def _volcar_hoja(zf, ruta, compartidas, temporal):
+    """
+    Lee la hoja, normaliza sus fechas y escribe cada fila ya codificada en `temporal`.
+    Cada celda conserva su letra de columna. Devuelve ([(clave, desplazamiento, longitud)]
+    sin ordenar, {etiqueta: celdas no vacías} de las columnas sin nombre o con nombre
+    repetido); así la memoria no depende del tamaño de la hoja sino solo del número de visitas.
+    """
+    filas = iter_filas_xml(zf, ruta)
+    cabecera = cabecera_xml(filas, compartidas)
+    ambiguas = columnas_ambiguas(cabecera)
+    # Primera columna con cada nombre (las repetidas se copian pero no deciden el orden)
+    letras = {}
+    for letra in sorted(cabecera, key=orden_columna):
+        if letra not in ambiguas:
+            letras[cabecera[letra]] = letra
+    fechas = {letra for nombre, letra in letras.items() if nombre in TIPOS and TIPOS[nombre].tipo == 'fecha'}
+    fechas.update(letra for letra in ambiguas if cabecera[letra] in TIPOS and TIPOS[cabecera[letra]].tipo == 'fecha')
+    letra_id, letra_fecha = letras['ID_Paciente'], letras['Fecha_Visita']
+
+    lector = LectorFilas(compartidas)
+    codificador = CodificadorFilas()
+    posiciones = {}
+    entradas, sin_nombre = [], {}
+    for fila in filas:
+        if '</c>' not in fila:
+            continue
+        celdas = {letra: valor for letra, valor in lector.todas(fila).items() if valor is not None and valor != ''}
+        if not celdas:
+            continue
+        valores = []
+        for letra, valor in celdas.items():
+            posicion = posiciones.get(letra)
+            if posicion is None:
+                posicion = posiciones[letra] = column_index_from_string(letra) - 1
+            if posicion >= len(valores):
+                valores.extend([None] * (posicion + 1 - len(valores)))
+            valores[posicion] = normalizar_fecha(valor) if letra in fechas else valor
+            if letra in ambiguas or letra not in cabecera:
+                sin_nombre[letra] = sin_nombre.get(letra, 0) + 1
+        datos = codificador.plantilla(valores).encode('utf-8')
+        clave = _clave(valores[posiciones[letra_id]] if letra_id in celdas else None,
+                       valores[posiciones[letra_fecha]] if letra_fecha in celdas else None, len(entradas))
+        entradas.append((clave, temporal.tell(), len(datos)))
+        temporal.write(datos)
+    return entradas, {ambiguas.get(letra, f'<col {letra}>'): sin_nombre[letra]
+                      for letra in sorted(sin_nombre, key=orden_columna)}
+
+def _filas_ordenadas(temporal, entradas):
+    for _, desplazamiento, longitud in entradas:
+        temporal.seek(desplazamiento)
+        yield temporal.read(longitud).decode('utf-8')
+
+def _rangos(entradas):
+    """{ID_Paciente: (inicio, fin)} de una hoja ya ordenada"""
+    rangos = {}
+    for posicion, (clave, _, _) in enumerate(entradas):
+        if clave[0]:
+            break
+        id_paciente = clave[1]
+        if id_paciente in rangos:
+            rangos[id_paciente][1] = posicion + 1
+        else:
+            rangos[id_paciente] = [posicion, posicion + 1]
+    return rangos
+
+# ================ COMPACTACIÓN ================
+
+def ruta_indice(libro):
+    return os.path.splitext(os.fspath(libro))[0] + '.indice.json'
+
+def _hash(ruta, tam_bloque=1 << 20):
+    resumen = hashlib.sha256()
+    with open(ruta, 'rb') as f:
+        for bloque in iter(lambda: f.read(tam_bloque), b''):
+            resumen.update(bloque)
+    return resumen.hexdigest()
+
+def compactar(libro, salida, indice=None, hojas=HOJAS_DATOS):
+    """
+    Reescribe las hojas de datos de `libro` en `salida` (que puede ser el propio libro,
+    sustituido de forma atómica) agrupadas por paciente y escribe el índice JSON.
+    Devuelve el índice.
+    """
+    indice = indice or ruta_indice(salida)
+    pacientes = {}
+    totales = {}
+    ambiguas = {}
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(salida))) as directorio:
+        temporales = {}
+        ordenadas = {}
+        try:
+            with zipfile.ZipFile(libro) as zf:
+                rutas = localizar_hojas(zf)
+                hojas = [hoja for hoja in hojas if hoja in rutas]
+                compartidas = leer_cadenas_compartidas(zf)
+                for hoja in hojas:
+                    temporales[hoja] = open(os.path.join(directorio, f'{len(temporales)}.filas'), 'w+b')
+                    ordenadas[hoja], sin_nombre = _volcar_hoja(zf, rutas[hoja], compartidas, temporales[hoja])
+                    if sin_nombre:
+                        ambiguas[hoja] = sin_nombre
+            for hoja in hojas:
+                entradas = ordenadas[hoja]
+                entradas.sort(key=lambda entrada: entrada[0])
+                for id_paciente, (inicio, fin) in _rangos(entradas).items():
+                    pacientes.setdefault(id_paciente, []).append([hoja, inicio, fin])
+                totales[hoja] = len(entradas)
+            escribir_libro_streaming(libro, salida, {hoja: _filas_ordenadas(temporales[hoja], ordenadas[hoja])
+                                                     for hoja in hojas})
+        finally:
+            for temporal in temporales.values():
+                temporal.close()
+
+    contenido = {
+        'version': VERSION_INDICE,
+        'libro': os.path.basename(salida),
+        'sha256': _hash(salida),
+        'hojas': totales,
+        'columnas_ambiguas': ambiguas,
+        'pacientes': pacientes,
+    }
+    guardar_json(contenido, indice, separators=(',', ':'))
+    return contenido
+
+# ================ CONSULTA ================
+
+def cargar_indice(ruta, libro=None):
+    """Lee el índice; con `libro` comprueba además que corresponde a ese libro (sha256)"""
+    with open(ruta, encoding='utf-8') as f:
+        contenido = json.load(f)
+    if contenido.get('version') != VERSION_INDICE:
+        raise ValueError(f"Versión de índice no soportada en {ruta}: {contenido.get('version')}")
+    if libro is not None and _hash(libro) != contenido['sha256']:
+        raise ValueError(f"El índice {ruta} no corresponde a {libro}: vuelve a compactar el libro")
+    return contenido
+
+def rangos_paciente(indice, id_paciente):
+    """[(hoja, inicio, fin)] del paciente; lista vacía si no está en el índice"""
+    return [tuple(rango) for rango in indice['pacientes'].get(id_paciente, ())]
+
+# ================ CLI ================
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Agrupa las visitas del libro maestro por paciente y genera el índice')
+    parser.add_argument('libro', nargs='?', default=LIBRO_MAESTRO)
+    destino = parser.add_mutually_exclusive_group(required=True)
+    destino.add_argument('--salida', help='Libro compactado')
+    destino.add_argument('--en-sitio', action='store_true', help='Sustituye el propio libro')
+    parser.add_argument('--indice', help='Ruta del índice JSON (por defecto <salida>.indice.json)')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    inicio = time.perf_counter()
+    salida = args.libro if args.en_sitio else args.salida
+    contenido = compactar(args.libro, salida, args.indice)
+    for hoja, filas in contenido['hojas'].items():
+        print(f"  {hoja}: {filas} visitas")
+        for etiqueta, celdas in contenido['columnas_ambiguas'].get(hoja, {}).items():
+            print(f"    {etiqueta}: {celdas} celdas sin nombre de columna único (copiadas por letra)")
+    print(f"{salida} compactado: {len(contenido['pacientes'])} pacientes indexados en "
+          f"{args.indice or ruta_indice(salida)} ({time.perf_counter() - inicio:.1f}s)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Matriz de correlaciones entre índices y nubes de puntos reducidas para estadisticas.html
+
+renderCorrelationScatterChart (scripts/script_estadisticas.js) solo dibuja los 100
+primeros pares de la cohorte, y calcular correlaciones sobre todas las visitas en el
+navegador es demasiado lento. Este proceso por lotes carga BASDAI, ASDAS, HAQ, PASI,
+PCR, VSG, EVA y RAPID3 de la caché columnar y calcula:
+
+- La matriz de correlación de Pearson de todos los pares con los datos disponibles en
+  cada par (pairwise complete): n, sumas y productos cruzados salen de productos de
+  matrices sobre los valores con NaN a 0 y la máscara de presentes, sin bucles por par.
+- Intervalos de confianza bootstrap (percentiles) de cada coeficiente. Cada réplica es
+  un vector de pesos de remuestreo (cuántas veces sale cada visita) y reutiliza los
+  mismos productos ponderados. Las réplicas se reparten entre procesos y cada una tiene
+  su propia semilla derivada de --semilla, así que el resultado no depende del número
+  de procesos.
+- Para cada par, una nube de puntos reducida por rejilla: cada celda ocupada de una
+  rejilla fija da un punto (media de x, media de y, visitas). El gráfico dibuja como
+  mucho celdas² puntos sea cual sea el tamaño de la cohorte.
+
+Como en la dispersión de dataManager.js, las visitas con las dos métricas del par a 0
+no cuentan ni en el coeficiente ni en la nube de ese par.
+
+Con --filtro se limita a una cohorte de motor_cohortes (mismos filtros que
+estadisticas.html). Con --salida *.js se escribe como script (window.HubCorrelaciones =
+{...};), que estadisticas.html carga si existe.
+
+Uso:
+    python correlaciones.py Hub_Clinico_Maestro.xlsx --salida correlaciones.js
+    python correlaciones.py Hub_Clinico_Maestro.xlsx --filtro pathology=ESPA --bootstrap 2000 --procesos 0
+"""
+
+import argparse
+import json
+import os
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from column_schema import HOJAS_DATOS, TIPOS
+from columnar_cache import cargar
+from motor_cohortes import MotorCohortes
+from xlsx_reader import LIBRO_MAESTRO
+from xlsx_streaming import escribir_atomico
+
+FORMATO = 'hub-correlaciones'
+VERSION_CORRELACIONES = 2
+
+# Etiqueta de los selectores de estadisticas.html → columna del libro (metricColumnMap)
+METRICAS = {
+    'BASDAI': 'BASDAI_Result', 'ASDAS': 'ASDAS_CRP_Result', 'HAQ': 'HAQ_Total', 'PASI': 'PASI_Score',
+    'PCR': 'PCR', 'VSG': 'VSG', 'EVA Dolor': 'EVA_Dolor', 'EVA Global': 'EVA_Global', 'RAPID3': 'RAPID3_Score',
+}
+REPLICAS = 1000
+NIVEL = 0.95
+CELDAS = 30
+# Pares con menos visitas no tienen coeficiente
+MIN_VISITAS = 3
+
+# ================ CORRELACIÓN ================
+
+def matriz_valores(tablas, mascara=None):
+    """(visitas × métricas) float64 con NaN en los vacíos, ESPA primero y después APS"""
+    columnas = []
+    for columna in METRICAS.values():
+        partes = [tabla[columna] if columna in tabla else np.full(len(tabla), np.nan) for tabla in tablas.values()]
+        columnas.append(np.concatenate(partes) if partes else np.empty(0))
+    valores = np.column_stack(columnas) if columnas else np.empty((0, 0))
+    return valores if mascara is None else valores[mascara]
+
+def correlacion_pares(valores, pesos=None):
+    """
+    (r, n) de Pearson para cada par de columnas con las filas que tienen ambos valores y
+    no los dos a 0; `pesos` (veces que cuenta cada fila) sirve para las réplicas bootstrap
+    """
+    presentes = ~np.isnan(valores)
+    x = np.where(presentes, valores, 0.0)
+    m = presentes.astype(np.float64)
+    ceros = (valores == 0).astype(np.float64)
+    if pesos is not None:
+        xw, mw, cw = x * pesos[:, None], m * pesos[:, None], ceros * pesos[:, None]
+    else:
+        xw, mw, cw = x, m, ceros
+    # Las filas (0, 0) de un par no suman nada a sumas ni productos: basta con no contarlas en n
+    ambos_cero = cw.T @ ceros
+    np.fill_diagonal(ambos_cero, 0.0)
+    n = mw.T @ m - ambos_cero        # n[i, j]: filas con i y j (sin las (0, 0))
+    suma = xw.T @ m                  # suma[i, j]: Σ x_i en las filas con i y j
+    cuadrados = (xw * x).T @ m       # Σ x_i² en las filas con i y j
+    cruzados = xw.T @ x              # Σ x_i x_j (las filas sin alguno de los dos suman 0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        covarianza = n * cruzados - suma * suma.T
+        varianza = n * cuadrados - suma ** 2
+        r = covarianza / np.sqrt(varianza * varianza.T)
+    r[(n < MIN_VISITAS) | ~np.isfinite(r)] = np.nan
+    np.fill_diagonal(r, np.where(np.diag(n) >= MIN_VISITAS, 1.0, np.nan))
+    return np.clip(r, -1.0, 1.0), n
+
+def _replicas(valores, semillas):
+    """Coeficientes de un remuestreo con reemplazo por semilla (réplicas × métricas × métricas)"""
+    visitas = len(valores)
+    resultado = np.empty((len(semillas), valores.shape[1], valores.shape[1]))
+    for i, semilla in enumerate(semillas):
+        rng = np.random.default_rng(semilla)
+        pesos = np.bincount(rng.integers(0, visitas, visitas), minlength=visitas).astype(np.float64)
+        resultado[i], _ = correlacion_pares(valores, pesos)
+    return resultado
+
+def bootstrap(valores, replicas=REPLICAS, nivel=NIVEL, procesos=1, semilla=0):
+    """Intervalos (inferior, superior) por percentiles de `replicas` remuestreos repartidos entre procesos"""
+    procesos = max(1, min(procesos, replicas))
+    # Una semilla por réplica: el resultado no depende de cómo se repartan
+    semillas = np.random.SeedSequence(semilla).spawn(replicas)
+    lotes = [semillas[i::procesos] for i in range(procesos)]
+    if procesos > 1:
+        with ProcessPoolExecutor(max_workers=procesos) as executor:
+            partes = list(executor.map(_replicas, [valores] * procesos, lotes))
+    else:
+        partes = [_replicas(valores, semillas)]
+    todas = np.concatenate(partes)
+    alfa = (1 - nivel) / 2
+    with warnings.catch_warnings():
+        # Pares sin coeficiente en ninguna réplica (p. ej. BASDAI y HAQ no coinciden en ninguna hoja)
+        warnings.simplefilter('ignore', RuntimeWarning)
+        inferior, superior = np.nanquantile(todas, [alfa, 1 - alfa], axis=0)
+    return inferior, superior
+
+# ================ NUBES DE PUNTOS ================
+
+def _limites(nombre, valores):
+    """Rango de la rejilla: el dominio de column_schema o, si es abierto, los percentiles 0,5-99,5"""
+    dominio = TIPOS[nombre].dominio if nombre in TIPOS else None
+    presentes = valores[~np.isnan(valores)]
+    bajo, alto = dominio if dominio else (None, None)
+    if bajo is None:
+        bajo = float(np.percentile(presentes, 0.5)) if len(presentes) else 0.0
+    if alto is None:
+        alto = float(np.percentile(presentes, 99.5)) if len(presentes) else 1.0
+    return bajo, alto if alto > bajo else bajo + 1.0
+
+def _celda(valores, bajo, alto, celdas):
+    indice = np.floor((valores - bajo) / (alto - bajo) * celdas).astype(np.int64)
+    return np.clip(indice, 0, celdas - 1)
+
+def nube_reducida(x, y, limites_x, limites_y, celdas=CELDAS):
+    """[[media x, media y, visitas], ...] de las celdas ocupadas de una rejilla celdas × celdas"""
+    validos = ~(np.isnan(x) | np.isnan(y) | ((x == 0) & (y == 0)))
+    x, y = x[validos], y[validos]
+    if not len(x):
+        return []
+    codigo = _celda(x, *limites_x, celdas) * celdas + _celda(y, *limites_y, celdas)
+    recuentos = np.bincount(codigo, minlength=celdas * celdas)
+    ocupadas = np.flatnonzero(recuentos)
+    medias_x = np.bincount(codigo, weights=x, minlength=celdas * celdas)[ocupadas] / recuentos[ocupadas]
+    medias_y = np.bincount(codigo, weights=y, minlength=celdas * celdas)[ocupadas] / recuentos[ocupadas]
+    return [[round(float(a), 2), round(float(b), 2), int(c)]
+            for a, b, c in zip(medias_x, medias_y, recuentos[ocupadas])]
+
+# ================ ANÁLISIS ================
+
+def _redondear(matriz, decimales=4):
+    return [[None if np.isnan(v) else round(float(v), decimales) for v in fila] for fila in matriz]
+
+def analizar(tablas, mascara=None, replicas=REPLICAS, nivel=NIVEL, procesos=1, semilla=0, celdas=CELDAS):
+    valores = matriz_valores(tablas, mascara)
+    r, n = correlacion_pares(valores)
+    if replicas and len(valores):
+        inferior, superior = bootstrap(valores, replicas, nivel, procesos, semilla)
+    else:
+        inferior = superior = np.full_like(r, np.nan)
+
+    etiquetas = list(METRICAS)
+    limites = [_limites(columna, valores[:, i]) for i, columna in enumerate(METRICAS.values())]
+    nubes = {}
+    for i, a in enumerate(etiquetas):
+        for j in range(i + 1, len(etiquetas)):
+            nubes[f'{a}|{etiquetas[j]}'] = nube_reducida(valores[:, i], valores[:, j], limites[i], limites[j], celdas)
+
+    return {
+        'formato': FORMATO, 'version': VERSION_CORRELACIONES,
+        'visitas': len(valores),
+        'metricas': etiquetas,
+        'columnas': list(METRICAS.values()),
+        'r': _redondear(r),
+        'n': n.astype(np.int64).tolist(),
+        'ic': {'nivel': nivel, 'replicas': replicas, 'semilla': semilla,
+               'inferior': _redondear(inferior), 'superior': _redondear(superior)},
+        'limites': {a: [round(b, 4), round(c, 4)] for a, (b, c) in zip(etiquetas, limites)},
+        'celdas': celdas,
+        'nubes': nubes,
+    }
+
+def ruta_correlaciones(libro):
+    return os.path.splitext(os.fspath(libro))[0] + '.correlaciones.json'
+
+def guardar(resultado, ruta):
+    """JSON, o script que asigna window.HubCorrelaciones si la ruta acaba en .js"""
+    contenido = json.dumps(resultado, ensure_ascii=False, separators=(',', ':'))
+    if ruta.lower().endswith('.js'):
+        contenido = f'window.HubCorrelaciones = {contenido};\n'
+    escribir_atomico(ruta, lambda f: f.write(contenido))
+
+# ================ CLI ================
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Correlaciones entre índices con IC bootstrap y nubes de puntos reducidas')
+    parser.add_argument('libro', nargs='?', default=LIBRO_MAESTRO)
+    parser.add_argument('--filtro', action='append', default=[], metavar='CLAVE=VALOR',
+                        help='Filtro de estadisticas.html (p. ej. pathology=ESPA, ttoType=biologicos)')
+    parser.add_argument('--bootstrap', type=int, default=REPLICAS, help=f'Réplicas bootstrap (por defecto {REPLICAS}; 0 = sin IC)')
+    parser.add_argument('--nivel', type=float, default=NIVEL, help='Nivel de confianza (por defecto 0.95)')
+    parser.add_argument('--semilla', type=int, default=0)
+    parser.add_argument('--celdas', type=int, default=CELDAS, help=f'Celdas por eje de la rejilla (por defecto {CELDAS})')
+    parser.add_argument('--procesos', type=int, default=0, help='Procesos para el bootstrap (0 = todos los núcleos)')
+    parser.add_argument('--salida', help='Resultado (por defecto <libro>.correlaciones.json; *.js para <script>)')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.procesos <= 0:
+        args.procesos = os.cpu_count() or 1
+    inicio = time.perf_counter()
+    tablas = cargar(args.libro, HOJAS_DATOS)
+    filtros = dict(filtro.split('=', 1) for filtro in args.filtro)
+    mascara = MotorCohortes(tablas).filtrar(filtros).mascara() if filtros else None
+    resultado = analizar(tablas, mascara, args.bootstrap, args.nivel, args.procesos, args.semilla, args.celdas)
+    resultado.update(libro=os.path.basename(args.libro), filtros=filtros)
+    salida = args.salida or ruta_correlaciones(args.libro)
+    guardar(resultado, salida)
+
+    print(f"{resultado['visitas']} visitas, {len(resultado['metricas'])} métricas, "
+          f"{args.bootstrap} réplicas bootstrap en {args.procesos} procesos ({time.perf_counter() - inicio:.1f}s)")
+    etiquetas = resultado['metricas']
+    for i, a in enumerate(etiquetas):
+        for j in range(i + 1, len(etiquetas)):
+            r = resultado['r'][i][j]
+            if r is None:
+                continue
+            ic = (resultado['ic']['inferior'][i][j], resultado['ic']['superior'][i][j])
+            intervalo = f" [{ic[0]:.3f}, {ic[1]:.3f}]" if None not in ic else ''
+            print(f"  {a} ~ {etiquetas[j]}: r = {r:.3f}{intervalo} (n = {resultado['n'][i][j]}, "
+                  f"{len(resultado['nubes'][f'{a}|{etiquetas[j]}'])} puntos)")
+    print(f"Resultado: {salida}")
+
+if __name__ == '__main__':
+    main()
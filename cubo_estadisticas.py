@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cubo de agregados poblacionales para estadisticas.html
+
+calculateRealKPIs y generateRealChartData (modules/dataManager.js) recorren todas las
+visitas cada vez que cambia un filtro. Este script precalcula, una vez por libro, un
+cubo patología × sexo × banda de edad × categoría de tratamiento × mes de visita con
+recuentos, sumas y buckets de actividad de BASDAI/ASDAS/HAQ/PASI/PCR/VSG, remisión y
+actividad alta, comorbilidades y manifestaciones extraarticulares. Una combinación de
+filtros sobre esas dimensiones se responde sumando celdas (consultar + kpis).
+
+Las categorías reproducen las de dataManager.js: getTreatmentCategory (el uso de
+biológico es la categoría 'biologic'), ACTIVITY_THRESHOLDS, COMORBIDITY_FIELDS y
+EXTRA_ARTICULAR_FIELDS. La edad sale de Edad o Fecha_Nacimiento si la hoja las tiene
+(getAgeValue); si no, la banda es 'sin_dato'.
+
+Como en calculateRealKPIs (parseFloat(x) || null), un 0 no cuenta en recuentos, medias,
+remisión ni actividad alta; sí cae en el bucket de remisión, como en generateRealChartData.
+Los KPIs redondean la mitad hacia arriba, como Math.round y toFixed.
+
+Uso:
+    python cubo_estadisticas.py Hub_Clinico_Maestro.xlsx
+"""
+
+import argparse
+import json
+import math
+import os
+import time
+from datetime import date, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+import numpy as np
+
+from column_schema import HOJAS_DATOS
+from columnar_cache import FECHA_NULA, a_dias, cargar, hash_libro
+from score_engine import a_numeros
+from tratamientos import CATEGORIAS_TRATAMIENTO, categoria_tratamiento
+from xlsx_reader import LIBRO_MAESTRO
+from xlsx_streaming import guardar_json
+
+VERSION_CUBO = 1
+SIN_DATO = 'sin_dato'
+
+# ================ CATEGORÍAS (dataManager.js) ================
+
+# ACTIVITY_THRESHOLDS (remission, low, moderate); PASI no tiene umbrales en dataManager.js:
+# se usan los habituales (≤1 blanqueamiento, >10 grave)
+UMBRALES_ACTIVIDAD = {
+    'BASDAI': (2, 4, 6),
+    'ASDAS': (1.3, 2.1, 3.5),
+    'HAQ': (0.5, 1.5, 2),
+    'PASI': (1, 5, 10),
+    'PCR': (5, 10, 20),
+    'VSG': (20, 40, 60),
+}
+BUCKETS_ACTIVIDAD = ('Remision', 'Baja Actividad', 'Moderada Actividad', 'Alta Actividad')
+
+COLUMNAS_METRICA = {
+    'BASDAI': 'BASDAI_Result',
+    'ASDAS': 'ASDAS_CRP_Result',
+    'HAQ': 'HAQ_Total',
+    'PASI': 'PASI_Score',
+    'PCR': 'PCR',
+    'VSG': 'VSG',
+}
+
+# calculateRealKPIs: métrica principal, remisión (<) y actividad alta (>=) por patología
+ACTIVIDAD_PATOLOGIA = {'ESPA': ('BASDAI', 2, 4), 'APS': ('HAQ', 0.5, 2)}
+
+COMORBILIDADES = ('HTA', 'DM', 'DLP', 'ECV', 'GASTRITIS', 'OBESIDAD', 'OSTEOPOROSIS', 'GOTA')
+EXTRAARTICULARES = ('DIGESTIVA', 'UVEITIS', 'PSORIASIS')
+COLUMNAS_FLAG = {
+    **{f'comorbilidad_{c}': f'Comorbilidad_{c.capitalize() if len(c) > 3 else c}' for c in COMORBILIDADES},
+    **{f'extraarticular_{e}': f'ExtraArticular_{e.capitalize()}' for e in EXTRAARTICULARES},
+}
+
+# Bandas de edad [desde, hasta) en años
+CORTES_EDAD = (18, 30, 40, 50, 60, 70)
+BANDAS_EDAD = ('<18', '18-29', '30-39', '40-49', '50-59', '60-69', '70+', SIN_DATO)
+
+DIMENSIONES = ('patologia', 'sexo', 'banda_edad', 'tratamiento', 'mes')
+
+def bucket_actividad(valores, umbrales):
+    """getActivityBucket vectorizado: índice en BUCKETS_ACTIVIDAD, -1 si el valor es NaN"""
+    valores = np.asarray(valores, dtype=np.float64)
+    return np.where(np.isnan(valores), -1, np.searchsorted(np.asarray(umbrales, dtype=np.float64), valores, side='right'))
+
+def por_categoria(tabla, columna, funcion):
+    """Aplica `funcion` a cada valor distinto de una columna de texto (no a cada visita)"""
+    if columna not in tabla:
+        return np.full(len(tabla), funcion(None), dtype=object)
+    valores = np.empty(len(tabla.categorias(columna)) + 1, dtype=object)
+    valores[:-1] = [funcion(v) for v in tabla.categorias(columna)]
+    valores[-1] = funcion(None)
+    return valores[tabla.codigos(columna)]
+
+def _edad(nacimiento, referencia):
+    """Años cumplidos en `referencia` de una fecha de nacimiento; NaN si no es una fecha"""
+    dias = a_dias(nacimiento)
+    if dias == FECHA_NULA:
+        return np.nan
+    nacimiento = date(1970, 1, 1) + timedelta(days=int(dias))
+    return referencia.year - nacimiento.year - ((referencia.month, referencia.day) < (nacimiento.month, nacimiento.day))
+
+def edades_visitas(tabla, referencia):
+    """Edad en años por visita (getAgeValue: Edad y, si falta, Fecha_Nacimiento); NaN sin dato"""
+    edades = np.full(len(tabla), np.nan)
+    if 'Edad' in tabla:
+        edades = a_numeros(tabla['Edad'])
+    for columna in ('Fecha_Nacimiento', 'fechaNacimiento', 'fecha_nacimiento', 'Nacimiento'):
+        if columna in tabla:
+            calculadas = por_categoria(tabla, columna, lambda v: _edad(v, referencia)).astype(np.float64)
+            edades = np.where(np.isnan(edades), calculadas, edades)
+    return edades
+
+# ================ CONSTRUCCIÓN ================
+
+def _dimensiones_hoja(hoja, tabla, referencia):
+    """{dimensión: array de etiquetas} de cada visita de la hoja"""
+    n = len(tabla)
+    sexo = por_categoria(tabla, 'Sexo', lambda v: (str(v).strip().lower() or SIN_DATO) if v is not None else SIN_DATO)
+    edades = edades_visitas(tabla, referencia)
+    bandas = np.asarray(BANDAS_EDAD, dtype=object)[
+        np.where(np.isnan(edades), len(BANDAS_EDAD) - 1, np.searchsorted(CORTES_EDAD, np.nan_to_num(edades), side='right'))]
+    tratamiento = por_categoria(tabla, 'Tratamiento_Actual', categoria_tratamiento)
+    if 'Fecha_Visita' in tabla:
+        dias = tabla['Fecha_Visita']
+        meses = np.where(dias == FECHA_NULA, SIN_DATO,
+                         dias.astype('datetime64[D]').astype('datetime64[M]').astype(str)).astype(object)
+    else:
+        meses = np.full(n, SIN_DATO, dtype=object)
+    return {'patologia': np.full(n, hoja, dtype=object), 'sexo': sexo, 'banda_edad': bandas,
+            'tratamiento': tratamiento, 'mes': meses}
+
+def _medidas_hoja(hoja, tabla):
+    """{medida: array por visita} (recuentos 0/1 y valores a sumar)"""
+    n = len(tabla)
+    medidas = {'n': np.ones(n)}
+    valores = {}
+    for metrica, columna in COLUMNAS_METRICA.items():
+        v = tabla[columna] if columna in tabla else np.full(n, np.nan)
+        valores[metrica] = v
+        validos = ~np.isnan(v) & (v != 0)  # parseFloat(x) || null
+        medidas[f'{metrica}_n'] = validos.astype(np.float64)
+        medidas[f'{metrica}_suma'] = np.where(validos, v, 0.0)
+        buckets = bucket_actividad(v, UMBRALES_ACTIVIDAD[metrica])
+        for i in range(len(BUCKETS_ACTIVIDAD)):
+            medidas[f'{metrica}_b{i}'] = (buckets == i).astype(np.float64)
+
+    metrica, remision, alta = ACTIVIDAD_PATOLOGIA.get(hoja, (None, np.nan, np.nan))
+    actividad = valores[metrica] if metrica else np.full(n, np.nan)
+    con_actividad = ~np.isnan(actividad) & (actividad != 0)
+    medidas['actividad_n'] = con_actividad.astype(np.float64)
+    medidas['actividad_suma'] = np.where(con_actividad, actividad, 0.0)
+    medidas['remision'] = (con_actividad & (actividad < remision)).astype(np.float64)
+    medidas['actividad_alta'] = (con_actividad & (actividad >= alta)).astype(np.float64)
+
+    for medida, columna in COLUMNAS_FLAG.items():
+        positivos = tabla[columna] & ~tabla.nulos(columna) if columna in tabla else np.zeros(n, dtype=bool)
+        medidas[medida] = positivos.astype(np.float64)
+    return medidas
+
+def construir_cubo(libro=LIBRO_MAESTRO, hojas=HOJAS_DATOS, referencia=None):
+    """Cubo {'dimensiones': {dim: etiquetas}, 'celdas': {dim: códigos, medida: valores}, ...}"""
+    referencia = referencia or date.today()
+    tablas = cargar(libro, hojas)
+    etiquetas = {dim: [] for dim in DIMENSIONES}
+    partes_dim = {dim: [] for dim in DIMENSIONES}
+    partes_medida = {}
+    for hoja, tabla in tablas.items():
+        for dim, valores in _dimensiones_hoja(hoja, tabla, referencia).items():
+            partes_dim[dim].append(valores)
+        for medida, valores in _medidas_hoja(hoja, tabla).items():
+            partes_medida.setdefault(medida, []).append(valores)
+
+    # Celda de cada visita = combinación de códigos de las cinco dimensiones
+    codigos = []
+    for dim in DIMENSIONES:
+        valores = np.concatenate(partes_dim[dim]) if partes_dim[dim] else np.empty(0, dtype=object)
+        orden = {'banda_edad': BANDAS_EDAD, 'tratamiento': CATEGORIAS_TRATAMIENTO}.get(dim)
+        presentes = set(valores.tolist())
+        etiquetas[dim] = [e for e in orden if e in presentes] if orden else sorted(presentes)
+        mapa = {e: i for i, e in enumerate(etiquetas[dim])}
+        codigos.append(np.fromiter((mapa[v] for v in valores), dtype=np.int64, count=len(valores)))
+    forma = tuple(max(len(etiquetas[dim]), 1) for dim in DIMENSIONES)
+    plano = np.ravel_multi_index(codigos, forma) if len(codigos[0]) else np.empty(0, dtype=np.int64)
+    celdas_planas, celda = np.unique(plano, return_inverse=True)
+
+    celdas = {dim: c.tolist() for dim, c in zip(DIMENSIONES, np.unravel_index(celdas_planas, forma))}
+    for medida, partes in partes_medida.items():
+        sumas = np.bincount(celda, weights=np.concatenate(partes), minlength=len(celdas_planas))
+        es_recuento = not medida.endswith('_suma')
+        celdas[medida] = sumas.astype(np.int64).tolist() if es_recuento else np.round(sumas, 6).tolist()
+
+    return {
+        'version': VERSION_CUBO,
+        'libro': os.path.basename(os.fspath(libro)),
+        'sha256': hash_libro(libro),
+        'fecha_referencia_edad': referencia.isoformat(),
+        'umbrales': {m: list(u) for m, u in UMBRALES_ACTIVIDAD.items()},
+        'buckets': list(BUCKETS_ACTIVIDAD),
+        'dimensiones': etiquetas,
+        'celdas': celdas,
+    }
+
+def ruta_cubo(libro):
+    return os.path.splitext(os.fspath(libro))[0] + '.cubo.json'
+
+def guardar_cubo(cubo, ruta):
+    guardar_json(cubo, ruta, separators=(',', ':'))
+
+def cargar_cubo(ruta):
+    with open(ruta, encoding='utf-8') as f:
+        cubo = json.load(f)
+    if cubo.get('version') != VERSION_CUBO:
+        raise ValueError(f"Versión de cubo no soportada en {ruta}: {cubo.get('version')}")
+    return cubo
+
+# ================ CONSULTA ================
+
+def consultar(cubo, desde=None, hasta=None, **filtros):
+    """
+    Suma las celdas que cumplen los filtros y devuelve {medida: total}.
+
+    Cada filtro es una dimensión (patologia, sexo, banda_edad, tratamiento, mes) con
+    un valor o una colección de valores; desde/hasta acotan el mes ('YYYY-MM', incluidos).
+    """
+    desconocidas = set(filtros) - set(DIMENSIONES)
+    if desconocidas:
+        raise ValueError(f"Dimensiones desconocidas: {sorted(desconocidas)}")
+    celdas = cubo['celdas']
+    seleccion = np.ones(len(celdas['n']), dtype=bool)
+    for dim, valor in filtros.items():
+        if valor is None:
+            continue
+        admitidos = {valor} if isinstance(valor, str) else set(valor)
+        codigos = [i for i, e in enumerate(cubo['dimensiones'][dim]) if e in admitidos]
+        seleccion &= np.isin(celdas[dim], codigos)
+    if desde or hasta:
+        meses = cubo['dimensiones']['mes']
+        codigos = [i for i, m in enumerate(meses)
+                   if m != SIN_DATO and (not desde or m >= desde) and (not hasta or m <= hasta)]
+        seleccion &= np.isin(celdas['mes'], codigos)
+    return {medida: float(np.asarray(valores)[seleccion].sum())
+            for medida, valores in celdas.items() if medida not in DIMENSIONES}
+
+def redondear(valor, decimales=0):
+    """Math.round (sin decimales) o toFixed de JS: la mitad hacia arriba, no al par como round()"""
+    if decimales == 0:
+        return int(math.floor(valor + 0.5))
+    return float(Decimal(valor).quantize(Decimal(1).scaleb(-decimales), rounding=ROUND_HALF_UP))
+
+def kpis(totales, biologicos):
+    """KPIs de calculateRealKPIs a partir de consultar(); `biologicos` = consultar(..., tratamiento='biologic')['n']"""
+    total, con_actividad = totales['n'], totales['actividad_n']
+    metricas = {m: redondear(totales[f'{m}_suma'] / totales[f'{m}_n'], 2) if totales[f'{m}_n'] else None
+                for m in COLUMNAS_METRICA}
+    return {
+        'totalPatients': int(total),
+        'remissionPercent': redondear(totales['remision'] / con_actividad * 100) if con_actividad else 0,
+        'highActivityPercent': redondear(totales['actividad_alta'] / con_actividad * 100) if con_actividad else 0,
+        'biologicPercent': redondear(biologicos / total * 100) if total else 0,
+        'avgActivity': redondear(totales['actividad_suma'] / con_actividad, 1) if con_actividad else 0,
+        'metrics': metricas,
+    }
+
+# ================ CLI ================
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Precalcula el cubo de agregados de estadisticas.html')
+    parser.add_argument('libro', nargs='?', default=LIBRO_MAESTRO)
+    parser.add_argument('--salida', help='Ruta del cubo JSON (por defecto <libro>.cubo.json)')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    inicio = time.perf_counter()
+    cubo = construir_cubo(args.libro)
+    salida = args.salida or ruta_cubo(args.libro)
+    guardar_cubo(cubo, salida)
+    tamanos = ' × '.join(f"{len(cubo['dimensiones'][dim])} {dim}" for dim in DIMENSIONES)
+    print(f"Cubo {salida}: {len(cubo['celdas']['n'])} celdas ocupadas ({tamanos}), "
+          f"{sum(cubo['celdas']['n'])} visitas ({time.perf_counter() - inicio:.1f}s)")
+
+if __name__ == '__main__':
+    main()
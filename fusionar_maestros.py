@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fusión de copias divergentes de Hub_Clinico_Maestro.xlsx
+
+El libro vive en una unidad compartida y acaban apareciendo varias copias (guardados
+locales, "copia en conflicto") que hay que reunir a mano. Este script fusiona N copias
+en un solo maestro en una pasada y con memoria acotada:
+
+1. Cada copia se lee en su propio proceso. Sus filas se decodifican por nombre de
+   columna, con las fechas normalizadas a YYYY-MM-DD, se reordenan a las columnas de la
+   primera copia y se codifican. Después se vuelcan en tramos ordenados por
+   (ID_Paciente, Fecha_Visita, Tipo_Visita).
+2. Los tramos de todas las copias se mezclan (heapq.merge, k vías) y se agrupan por
+   clave. Las filas idénticas se escriben una sola vez; como todas se codifican igual
+   (mismas columnas, fechas normalizadas), la huella es el blake2b de la fila codificada.
+3. Hay conflicto cuando las copias que tienen una clave no tienen las mismas versiones
+   de la fila. Se conserva la versión de la copia con más prioridad (el orden de los
+   argumentos) o, con --conflictos todas, todas las versiones distintas. Cada conflicto
+   se anota en <salida>.conflictos.json con las copias y filas de cada versión.
+
+Las columnas sin nombre o con nombre repetido no se pueden emparejar por nombre: sus
+celdas se copian por letra si la primera copia tiene en esa letra una columna igual de
+ambigua, y si no se descartan. Ambos casos se listan en el informe (columnas_por_letra y
+columnas_descartadas).
+
+El resto del libro (estilos, catálogos, hojas que no son de datos) sale de la primera copia.
+
+Uso:
+    python fusionar_maestros.py Hub_Clinico_Maestro.xlsx "Hub_Clinico_Maestro (copia en conflicto).xlsx" \\
+        --salida Hub_Clinico_Maestro_fusionado.xlsx
+    python fusionar_maestros.py a.xlsx b.xlsx c.xlsx --salida fusion.xlsx --conflictos todas
+"""
+
+import argparse
+import hashlib
+import heapq
+import os
+import pickle
+import sys
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import groupby
+
+from openpyxl.utils import column_index_from_string, get_column_letter
+
+from cambios_maestro import COLUMNAS_CLAVE
+from column_schema import HOJAS_DATOS, TIPOS
+from compactar_maestro import FECHA_ISO, normalizar_fecha
+from xlsx_reader import (NUM_FILA, LectorFilas, cabecera_xml, columnas_ambiguas, columnas_hoja, iter_filas_xml,
+                         leer_cadenas_compartidas, orden_columna)
+from xlsx_streaming import CodificadorFilas, escribir_libro_streaming, guardar_json, localizar_hojas
+
+# Filas por tramo ordenado en memoria antes de volcarlo a disco
+TAM_TRAMO = 50000
+
+# ================ VOLCADO DE CADA COPIA ================
+
+def _clave(id_paciente, fecha, tipo):
+    """Orden de compactar_maestro (sin ID al final, fechas no válidas al final del paciente) + tipo de visita"""
+    sin_id = id_paciente is None or str(id_paciente).strip() == ''
+    fecha_valida = isinstance(fecha, str) and bool(FECHA_ISO.match(fecha))
+    return (sin_id, '' if sin_id else str(id_paciente).strip(), not fecha_valida,
+            '' if fecha is None else str(fecha).strip(), '' if tipo is None else str(tipo).strip())
+
+def _volcar_tramo(registros, directorio, nombre):
+    registros.sort(key=lambda registro: registro[:3])
+    ruta = os.path.join(directorio, nombre)
+    with open(ruta, 'wb') as f:
+        for registro in registros:
+            pickle.dump(registro, f, pickle.HIGHEST_PROTOCOL)
+    registros.clear()
+    return ruta
+
+def _etiqueta(cabecera, ambiguas, letra):
+    """Etiqueta de una columna que no se puede direccionar por nombre; None si tiene nombre único"""
+    if letra not in cabecera:
+        return f'<col {letra}>'
+    return ambiguas.get(letra)
+
+def _volcar_copia(copia, libro, cabeceras, directorio, tam_tramo=TAM_TRAMO):
+    """
+    Vuelca las hojas de una copia en tramos ordenados de registros
+    (clave, copia, fila, huella, XML con MARCADOR_FILA). Devuelve
+    ({hoja: [rutas de tramos]}, {hoja: filas}, {hoja: columnas que no están en la primera copia},
+    {hoja: {etiqueta: celdas}} de las columnas sin nombre único copiadas por letra).
+    """
+    tramos, filas, descartadas, por_letra = {}, {}, {}, {}
+    codificador = CodificadorFilas()
+    with zipfile.ZipFile(libro) as zf:
+        rutas = localizar_hojas(zf)
+        compartidas = leer_cadenas_compartidas(zf)
+        lector = LectorFilas(compartidas)
+        for hoja, nombres in cabeceras.items():
+            tramos[hoja], filas[hoja] = [], 0
+            if hoja not in rutas:
+                continue
+            plantilla_letras = {get_column_letter(i + 1): nombre for i, nombre in enumerate(nombres)}
+            ambiguas_plantilla = columnas_ambiguas(plantilla_letras)
+            posicion = {nombre: i for i, (letra, nombre) in enumerate(plantilla_letras.items())
+                        if letra not in ambiguas_plantilla}
+            fechas = {i for nombre, i in posicion.items() if nombre in TIPOS and TIPOS[nombre].tipo == 'fecha'}
+            claves = [posicion[nombre] for nombre in COLUMNAS_CLAVE]
+            xml = iter_filas_xml(zf, rutas[hoja])
+            letras = cabecera_xml(xml, compartidas)
+            ambiguas = columnas_ambiguas(letras)
+            destino = {letra: posicion[nombre] for letra, nombre in letras.items()
+                       if letra not in ambiguas and nombre in posicion}
+            # Columnas con nombre único que no están en la primera copia
+            omitidas = {letra for letra in letras if letra not in ambiguas and letra not in destino}
+            columnas = {str(letras[letra]) for letra in omitidas}
+            # Columnas sin nombre único con datos: {letra: [etiqueta, celdas]} si se copian por letra
+            sueltas = {}
+            registros = []
+            for fila in xml:
+                if '</c>' not in fila:
+                    continue
+                valores = [None] * len(nombres)
+                for letra, valor in lector.todas(fila).items():
+                    if valor is None or valor == '':
+                        continue
+                    i = destino.get(letra)
+                    if i is None:
+                        if letra in omitidas:
+                            continue
+                        etiqueta = _etiqueta(letras, ambiguas, letra)
+                        if etiqueta is None or etiqueta != _etiqueta(plantilla_letras, ambiguas_plantilla, letra):
+                            if etiqueta is not None:
+                                columnas.add(etiqueta)
+                            omitidas.add(letra)
+                            continue
+                        i = destino[letra] = column_index_from_string(letra) - 1
+                        sueltas[letra] = [etiqueta, 0]
+                        nombre = letras.get(letra)
+                        if nombre in TIPOS and TIPOS[nombre].tipo == 'fecha':
+                            fechas.add(i)
+                    if letra in sueltas:
+                        sueltas[letra][1] += 1
+                    # 3.0 y 3 son la misma celda: así la fila codificada sirve de huella
+                    if valor.__class__ is float and valor.is_integer():
+                        valor = int(valor)
+                    if i >= len(valores):
+                        valores.extend([None] * (i + 1 - len(valores)))
+                    valores[i] = valor
+                if not any(valor is not None for valor in valores):
+                    continue
+                for i in fechas:
+                    if i < len(valores) and valores[i] is not None:
+                        valores[i] = normalizar_fecha(valores[i])
+                numero = NUM_FILA.match(fila)
+                plantilla = codificador.plantilla(valores)
+                registros.append((_clave(*(valores[i] for i in claves)), copia,
+                                  int(numero.group(1)) if numero else 0,
+                                  hashlib.blake2b(plantilla.encode('utf-8'), digest_size=8).hexdigest(), plantilla))
+                filas[hoja] += 1
+                if len(registros) >= tam_tramo:
+                    tramos[hoja].append(_volcar_tramo(registros, directorio, f'{copia}_{hoja}_{len(tramos[hoja])}'))
+            if registros:
+                tramos[hoja].append(_volcar_tramo(registros, directorio, f'{copia}_{hoja}_{len(tramos[hoja])}'))
+            descartadas[hoja] = sorted(columnas)
+            por_letra[hoja] = dict(sueltas[letra] for letra in sorted(sueltas, key=orden_columna))
+    return tramos, filas, descartadas, por_letra
+
+def _leer_tramo(ruta):
+    with open(ruta, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+# ================ FUSIÓN ================
+
+def _fusionar_hoja(hoja, tramos, copias, conflictos, resumen, todas=False):
+    """Filas fusionadas (XML con MARCADOR_FILA) de una hoja; anota conflictos y totales al vuelo"""
+    mezcla = heapq.merge(*(_leer_tramo(ruta) for ruta in tramos), key=lambda registro: registro[:3])
+    for clave, grupo in groupby(mezcla, key=lambda registro: registro[0]):
+        # {huella: [(copia, fila), ...]} en orden de prioridad; XML de la primera aparición
+        versiones, xml, por_copia = {}, {}, {}
+        for _, copia, fila, huella_fila, plantilla in grupo:
+            versiones.setdefault(huella_fila, []).append((copia, fila))
+            xml.setdefault(huella_fila, plantilla)
+            por_copia.setdefault(copia, set()).add(huella_fila)
+        # Sin ID no hay forma de emparejar filas entre copias: se conservan todas las versiones
+        if not clave[0] and len({frozenset(huellas) for huellas in por_copia.values()}) > 1:
+            primera = min(por_copia)
+            elegidas = list(versiones) if todas else [h for h in versiones if h in por_copia[primera]]
+            conflictos.append({
+                'hoja': hoja,
+                'ID_Paciente': clave[1], 'Fecha_Visita': clave[3], 'Tipo_Visita': clave[4],
+                'versiones': [{'huella': h, 'conservada': h in elegidas,
+                               'filas': [{'copia': copias[c], 'fila': f} for c, f in apariciones]}
+                              for h, apariciones in versiones.items()],
+            })
+        else:
+            elegidas = list(versiones)
+        resumen['duplicadas'] += sum(len(apariciones) for apariciones in versiones.values()) - len(versiones)
+        resumen['escritas'] += len(elegidas)
+        for h in elegidas:
+            yield xml[h]
+
+def ruta_conflictos(salida):
+    return os.path.splitext(salida)[0] + '.conflictos.json'
+
+def fusionar(copias, salida, informe=None, hojas=HOJAS_DATOS, todas=False, procesos=None, tam_tramo=TAM_TRAMO):
+    """
+    Fusiona las copias en `salida` (la primera copia da la plantilla y tiene prioridad en
+    los conflictos) y escribe el informe JSON. Devuelve el informe.
+    """
+    informe = informe or ruta_conflictos(salida)
+    plantilla = copias[0]
+    with zipfile.ZipFile(plantilla) as zf:
+        hojas = [hoja for hoja in hojas if hoja in localizar_hojas(zf)]
+    cabeceras = {hoja: columnas_hoja(hoja, plantilla) for hoja in hojas}
+    for hoja, nombres in cabeceras.items():
+        faltan = [nombre for nombre in COLUMNAS_CLAVE if nombre not in nombres]
+        if faltan:
+            raise ValueError(f"La hoja {hoja} de {plantilla} no tiene las columnas clave {faltan}")
+
+    conflictos = []
+    resumen = {hoja: {'leidas': 0, 'duplicadas': 0, 'escritas': 0} for hoja in hojas}
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(salida))) as directorio:
+        with ProcessPoolExecutor(max_workers=procesos or min(len(copias), os.cpu_count() or 1)) as executor:
+            volcados = list(executor.map(_volcar_copia, range(len(copias)), copias, [cabeceras] * len(copias),
+                                         [directorio] * len(copias), [tam_tramo] * len(copias)))
+        tramos = {hoja: [ruta for volcado, _, _, _ in volcados for ruta in volcado[hoja]] for hoja in hojas}
+        for _, filas, _, _ in volcados:
+            for hoja in hojas:
+                resumen[hoja]['leidas'] += filas[hoja]
+        escribir_libro_streaming(plantilla, salida, {
+            hoja: _fusionar_hoja(hoja, tramos[hoja], copias, conflictos, resumen[hoja], todas) for hoja in hojas})
+
+    contenido = {
+        'copias': [os.path.basename(copia) for copia in copias],
+        'salida': os.path.basename(salida),
+        'hojas': resumen,
+        'columnas_descartadas': {os.path.basename(copia): {hoja: columnas for hoja, columnas in descartadas.items()
+                                                           if columnas}
+                                 for copia, (_, _, descartadas, _) in zip(copias, volcados)
+                                 if any(descartadas.values())},
+        'columnas_por_letra': {os.path.basename(copia): {hoja: columnas for hoja, columnas in por_letra.items()
+                                                         if columnas}
+                               for copia, (_, _, _, por_letra) in zip(copias, volcados)
+                               if any(por_letra.values())},
+        'conflictos': conflictos,
+    }
+    guardar_json(contenido, informe, indent=1)
+    return contenido
+
+# ================ CLI ================
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Fusiona copias divergentes del libro maestro')
+    parser.add_argument('copias', nargs='+', help='Copias del libro, de más a menos prioridad')
+    parser.add_argument('--salida', required=True, help='Libro fusionado')
+    parser.add_argument('--informe', help='Informe JSON (por defecto <salida>.conflictos.json)')
+    parser.add_argument('--conflictos', choices=('primera', 'todas'), default='primera',
+                        help='En un conflicto, conservar la versión de la primera copia que la tiene o todas')
+    parser.add_argument('--procesos', type=int, help='Procesos de lectura (por defecto uno por copia)')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if os.path.abspath(args.salida) in {os.path.abspath(copia) for copia in args.copias}:
+        print("La salida no puede ser una de las copias")
+        return 1
+    inicio = time.perf_counter()
+    informe = fusionar(args.copias, args.salida, args.informe, todas=args.conflictos == 'todas',
+                       procesos=args.procesos)
+    for hoja, datos in informe['hojas'].items():
+        print(f"  {hoja}: {datos['leidas']} leídas, {datos['duplicadas']} duplicadas, {datos['escritas']} escritas")
+    for copia, hojas in informe['columnas_descartadas'].items():
+        for hoja, columnas in hojas.items():
+            print(f"  {copia} ({hoja}): columnas que no están en la primera copia: {', '.join(columnas)}")
+    for copia, hojas in informe['columnas_por_letra'].items():
+        for hoja, columnas in hojas.items():
+            for etiqueta, celdas in columnas.items():
+                print(f"  {copia} ({hoja}) {etiqueta}: {celdas} celdas sin nombre de columna único (copiadas por letra)")
+    print(f"{args.salida}: {len(informe['conflictos'])} conflictos en "
+          f"{args.informe or ruta_conflictos(args.salida)} ({time.perf_counter() - inicio:.1f}s)")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,17 +2,36 @@
 # -*- coding: utf-8 -*-
 """
 Script para generar datos ficticios realistas para Hub Clínico
-Crea 60 pacientes (30 ESPA + 30 APS) con 2-5 visitas cada uno
+Por defecto crea 60 pacientes (30 ESPA + 30 APS) con 2-5 visitas cada uno
 Total esperado: ~180-210 registros de visitas
+
+Uso para masters de carga (100k-1M visitas):
+    python generate_mock_data.py --espa 100000 --aps 100000 --visitas-espa 2-8 --streaming --vectorizado \
+        --procesos 0 --semilla 42 --salida Hub_Clinico_Maestro_carga.xlsx
 """
 
 import openpyxl
 from openpyxl.styles import Font, PatternFill, Alignment
 from openpyxl.utils import get_column_letter
+import argparse
+import os
 import random
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
+from functools import partial
+from itertools import islice
 import math
 
+from column_schema import (ARTICULACIONES, COLUMNAS_DACT, COLUMNAS_ENTESITIS, COLUMNAS_HAQ, COLUMNAS_LEI,
+                           COLUMNAS_NAD, COLUMNAS_NAT, DEDOS_DACTILITIS, HOJAS_DATOS, INDICE, indices,
+                           nueva_fila)
+from column_schema import NOMBRES as COLUMNAS_HOJA
+from id_pacientes import ANCHOS, ESQUEMA_ACTUAL, esquema_para, formatear_id, max_secuencia
+from tratamientos import parsear_componente, texto_dosis
+from xlsx_streaming import CodificadorFilas, escribir_libro_streaming
+
 # ================ CONSTANTES ================
 
 TOTAL_ESPA = 30
@@ -49,26 +68,9 @@ PROFESIONALES = [
     'Dra. Isabel Sánchez'
 ]
 
-# Articulaciones del homúnculo (mismo orden que en homunculus.js)
-ARTICULATIONS = [
-    'hombro-derecho', 'hombro-izquierdo', 'codo-derecho', 'codo-izquierdo',
-    'muneca-derecha', 'muneca-izquierda', 'rodilla-derecha', 'rodilla-izquierda',
-    'mcf1-derecha', 'mcf2-derecha', 'mcf3-derecha', 'mcf4-derecha', 'mcf5-derecha',
-    'mcf1-izquierda', 'mcf2-izquierda', 'mcf3-izquierda', 'mcf4-izquierda', 'mcf5-izquierda',
-    'ifp1-derecha', 'ifp2-derecha', 'ifp3-derecha', 'ifp4-derecha', 'ifp5-derecha',
-    'ifp1-izquierda', 'ifp2-izquierda', 'ifp3-izquierda', 'ifp4-izquierda', 'ifp5-izquierda'
-]
-
-DACTILITIS = [
-    'dactilitis-dedo1-mano-derecha', 'dactilitis-dedo2-mano-derecha', 'dactilitis-dedo3-mano-derecha',
-    'dactilitis-dedo4-mano-derecha', 'dactilitis-dedo5-mano-derecha',
-    'dactilitis-dedo1-mano-izquierda', 'dactilitis-dedo2-mano-izquierda', 'dactilitis-dedo3-mano-izquierda',
-    'dactilitis-dedo4-mano-izquierda', 'dactilitis-dedo5-mano-izquierda',
-    'dactilitis-dedo1-pie-derecho', 'dactilitis-dedo2-pie-derecho', 'dactilitis-dedo3-pie-derecho',
-    'dactilitis-dedo4-pie-derecho', 'dactilitis-dedo5-pie-derecho',
-    'dactilitis-dedo1-pie-izquierdo', 'dactilisis-dedo2-pie-izquierdo', 'dactilitis-dedo3-pie-izquierdo',
-    'dactilitis-dedo4-pie-izquierdo', 'dactilitis-dedo5-pie-izquierdo'
-]
+# Articulaciones del homúnculo y dedos con dactilitis (mismo orden que en homunculus.js)
+ARTICULATIONS = list(ARTICULACIONES)
+DACTILITIS = list(DEDOS_DACTILITIS)
 
 # Tratamientos por patología
 TRATAMIENTOS_ESPA = {
@@ -87,674 +89,730 @@ TRATAMIENTOS_APS = {
 
 # ================ FUNCIONES GENERADORAS ================
 
-def generar_fecha_nacimiento():
+def generar_fecha_nacimiento(rng=random):
     """Genera fecha de nacimiento realista (30-75 años en 2025)"""
-    year = random.randint(1950, 1995)
-    month = random.randint(1, 12)
-    day = random.randint(1, 28)
+    year = rng.randint(1950, 1995)
+    month = rng.randint(1, 12)
+    day = rng.randint(1, 28)
     return f"{year:04d}-{month:02d}-{day:02d}"
 
-def generar_nombre_completo():
+def generar_nombre_completo(rng=random):
     """Genera nombre y apellido españoles realistas"""
-    nombre = random.choice(NOMBRES)
-    apellido1 = random.choice(APELLIDOS)
-    apellido2 = random.choice(APELLIDOS)
+    nombre = rng.choice(NOMBRES)
+    apellido1 = rng.choice(APELLIDOS)
+    apellido2 = rng.choice(APELLIDOS)
     return f"{nombre} {apellido1} {apellido2}"
 
-def generar_id_paciente(pathology, index):
-    """Genera ID de paciente con mix 50%-50% 2024-2025"""
-    year = random.choice([2024, 2025])
-    path_code = 'ESP' if pathology == 'espa' else 'APS'
-    return f"{path_code}-{year}-{str(index+1).zfill(3)}"
+def generar_id_paciente(pathology, index, rng=random, esquema=ESQUEMA_ACTUAL):
+    """
+    Genera ID de paciente con mix 50%-50% 2024-2025. La secuencia es index + 1: cada
+    shard tiene su rango de índices, así que no hay colisiones entre procesos
+    (ver id_pacientes.py)
+    """
+    year = rng.choice([2024, 2025])
+    return formatear_id(pathology, year, index + 1, esquema)
 
-def generar_articulaciones(count_nad_max=12):
+def generar_articulaciones(count_nad_max=12, rng=random):
     """Genera array de articulaciones dolorosas realista (NAD)"""
-    count_nad = random.randint(0, count_nad_max)
-    nad = random.sample(ARTICULATIONS, count_nad) if count_nad > 0 else []
+    count_nad = rng.randint(0, count_nad_max)
+    nad = rng.sample(ARTICULATIONS, count_nad) if count_nad > 0 else []
 
     # NAT es subconjunto de NAD (0-66% de NAD)
     if len(nad) > 0:
-        count_nat = random.randint(0, int(len(nad) * 0.66))
-        nat = random.sample(nad, count_nat) if count_nat > 0 else []
+        count_nat = rng.randint(0, int(len(nad) * 0.66))
+        nat = rng.sample(nad, count_nat) if count_nat > 0 else []
     else:
         nat = []
 
     return nad, nat
 
-def generar_dactilitis():
+def generar_dactilitis(rng=random):
     """Genera dactilitis realista (0-3 dedos, más manos que pies)"""
-    count = random.randint(0, 3)
+    count = rng.randint(0, 3)
     if count == 0:
         return []
 
-    mano_count = random.randint(count // 2, count)
+    mano_count = rng.randint(count // 2, count)
     pie_count = count - mano_count
 
     dactilitis = []
     if mano_count > 0:
-        dactilitis.extend(random.sample(DACTILITIS[:10], mano_count))
+        dactilitis.extend(rng.sample(DACTILITIS[:10], mano_count))
     if pie_count > 0:
-        dactilitis.extend(random.sample(DACTILITIS[10:], pie_count))
+        dactilitis.extend(rng.sample(DACTILITIS[10:], pie_count))
 
     return dactilitis
 
-def generar_basdai_con_distribucion_normal(mejora=False):
+def generar_basdai_con_distribucion_normal(mejora=False, rng=random):
     """Genera BASDAI con distribución normal (media 3.5, sd 1.5)"""
-    basdai = random.gauss(3.5, 1.5)
+    basdai = rng.gauss(3.5, 1.5)
     basdai = max(1.0, min(10.0, basdai))  # Clamp entre 1 y 10
 
     # En seguimientos hay tendencia a mejorar 20-40%
     if mejora:
-        basdai *= random.uniform(0.6, 0.8)
+        basdai *= rng.uniform(0.6, 0.8)
 
     return round(basdai, 1)
 
-def generar_haq_con_distribucion_normal(mejora=False):
+def generar_haq_con_distribucion_normal(mejora=False, rng=random):
     """Genera HAQ con distribución normal (media 1.2, sd 0.7)"""
-    haq = random.gauss(1.2, 0.7)
+    haq = rng.gauss(1.2, 0.7)
     haq = max(0.0, min(3.0, haq))
 
     if mejora:
-        haq *= random.uniform(0.7, 0.85)
+        haq *= rng.uniform(0.7, 0.85)
 
     return round(haq, 2)
 
-def generar_pasi():
+def generar_pasi(rng=random):
     """Genera PASI realista para psoriasis (2-20)"""
-    return random.randint(2, 20)
+    return rng.randint(2, 20)
+
+# Índices de columna precalculados (column_schema.INDICE) para los bucles por visita
+IDX_NAD = indices(COLUMNAS_NAD)
+IDX_NAT = indices(COLUMNAS_NAT)
+IDX_DACT = indices(COLUMNAS_DACT)
+IDX_HAQ = indices(COLUMNAS_HAQ)
+IDX_LEI = indices(COLUMNAS_LEI)
+IDX_BASDAI = indices(f'BASDAI_P{pregunta}' for pregunta in range(1, 7))
+
+def probabilidades_si(*pares):
+    """Tabla ((índice de columna, prob. de SI), ...) a partir de pares (nombre, prob.)"""
+    return tuple((INDICE[columna], prob) for columna, prob in pares)
+
+def marcar_regiones(fila, indices_regiones, regiones, seleccion):
+    """Escribe SI/NO en la columna de cada región según esté o no en `seleccion`"""
+    for i, region in zip(indices_regiones, regiones):
+        fila[i] = 'SI' if region in seleccion else 'NO'
+
+def sortear_si_no(fila, probabilidades, rng=random):
+    """Sortea SI/NO en cada columna de una tabla de probabilidades_si"""
+    for i, prob in probabilidades:
+        fila[i] = 'SI' if rng.random() < prob else 'NO'
+
+def asignar(fila, **valores):
+    """Asigna valores por nombre de columna"""
+    for columna, valor in valores.items():
+        fila[INDICE[columna]] = valor
+
+IDX_ASDAS = indices(('ASDAS_Dolor_Espalda', 'ASDAS_Duracion_Rigidez', 'ASDAS_EVA_Global', 'NAD_Total', 'PCR', 'VSG'))
+IDX_MDA = indices(('NAT_Total', 'NAD_Total', 'PASI_Score', 'BSA_Percentage', 'EVA_Dolor', 'EVA_Global'))
+
+def _o_cero(valor):
+    """`parseFloat(x) || 0` sobre un valor de la fila (las filas generadas solo llevan números o vacíos)"""
+    if isinstance(valor, str):
+        try:
+            return float(valor)
+        except ValueError:
+            return 0.0
+    return 0.0 if valor is None or valor != valor else float(valor)
+
+def _log(x):
+    return math.log(x) if x > 0 else -math.inf if x == 0 else math.nan
+
+def _redondear_js(valor, decimales):
+    """score_engine.redondear_js sobre un escalar (Number.toFixed, mitades lejos de cero)"""
+    if valor != valor or valor == 0:
+        return float(valor)
+    factor = 10.0 ** decimales
+    return math.copysign(math.floor(abs(valor) * factor + 0.5) / factor, valor)
+
+def calcular_scores(fila):
+    """
+    Scores de la fila con las fórmulas de scoreCalculators.js, ya redondeados como los guarda
+    el formulario (MDA_Cumple como 'SI'/'NO'). Es score_engine.recalcular para una sola
+    visita, en Python puro: el camino por filas no depende de NumPy.
+    """
+    p1, p2, p3, p4, p5, p6 = (_o_cero(fila[i]) for i in IDX_BASDAI)
+    basdai = (p1 + p2 + p3 + p4 + (p5 + min(p6 / 2 * 10, 10)) / 2) / 5
+
+    dolor_espalda, duracion_rigidez, eva_asdas, nad, pcr, vsg = (_o_cero(fila[i]) for i in IDX_ASDAS)
+    asdas_crp = (0.121 * dolor_espalda + 0.058 * duracion_rigidez + 0.110 * eva_asdas
+                 + 0.073 * nad + 0.579 * _log(pcr + 1))
+    asdas_esr = (0.08 * dolor_espalda + 0.07 * duracion_rigidez + 0.11 * eva_asdas
+                 + 0.09 * nad + 0.29 * (math.sqrt(vsg) if vsg >= 0 else math.nan))
+
+    # Mismo orden de suma que calcular_haq (NumPy suma las 8 categorías por parejas)
+    h1, h2, h3, h4, h5, h6, h7, h8 = (_o_cero(fila[i]) for i in IDX_HAQ)
+    haq = (((h1 + h2) + (h3 + h4)) + ((h5 + h6) + (h7 + h8))) / 8
+    lei = sum(fila[i] == 'SI' or (not isinstance(fila[i], str) and fila[i] is not None and fila[i] > 0)
+              for i in IDX_LEI)
+    nat, nad_mda, pasi, bsa, eva_dolor, eva_global = (_o_cero(fila[i]) for i in IDX_MDA)
+    rapid3 = haq * 3.33 + eva_dolor + eva_global
+
+    criterios = ((nat <= 1) + (nad_mda <= 1) + (pasi <= 1 or bsa <= 3) + (lei <= 1)
+                 + (eva_dolor * 10 <= 15) + (eva_global * 10 <= 20) + (haq <= 0.5))
+    return {
+        'BASDAI_Result': _redondear_js(basdai, 2),
+        'ASDAS_CRP_Result': _redondear_js(asdas_crp, 2),
+        'ASDAS_ESR_Result': _redondear_js(asdas_esr, 2),
+        'HAQ_Total': _redondear_js(haq, 2),
+        'LEI_Score': _redondear_js(float(lei), 0),
+        'RAPID3_Score': _redondear_js(rapid3, 1),
+        'MDA_Cumple': 'SI' if criterios >= 5 else 'NO',
+        'RAPID3_Funcion': _redondear_js(haq * 3.33, 1),
+    }
 
-def expandir_articulaciones_a_columnas(array):
-    """Convierte array de articulaciones a SI/NO para cada columna"""
-    return ['SI' if art in array else 'NO' for art in ARTICULATIONS]
+# ================ GENERACIÓN DE VISITAS ================
 
-def expandir_dactilitis_a_columnas(array):
-    """Convierte array de dactilitis a SI/NO para cada columna"""
-    return ['SI' if dact in array else 'NO' for dact in DACTILITIS]
+PROB_COMORBILIDADES = probabilidades_si(('Comorbilidad_HTA', 0.35), ('Comorbilidad_DM', 0.2), ('Comorbilidad_DLP', 0.4),
+                                         ('Comorbilidad_ECV', 0.05), ('Comorbilidad_Gastritis', 0.1),
+                                         ('Comorbilidad_Obesidad', 0.3), ('Comorbilidad_Osteoporosis', 0.15),
+                                         ('Comorbilidad_Gota', 0.05))
 
-# ================ GENERACIÓN DE VISITAS ================
+PROB_COMORBILIDADES_SEGUIMIENTO = probabilidades_si(('Comorbilidad_Gastritis', 0.1), ('Comorbilidad_Obesidad', 0.3),
+                                                     ('Comorbilidad_Osteoporosis', 0.15), ('Comorbilidad_Gota', 0.05))
 
-def generar_primera_visita_espa(paciente_id, nombre, sexo, fecha_visita, datos_paciente):
-    """Genera fila completa de primera visita ESPA (220 columnas)"""
-
-    nad, nat = generar_articulaciones()
-    dactilitis = generar_dactilitis()
-
-    basdai = generar_basdai_con_distribucion_normal()
-    asdas = basdai * 0.8 + random.uniform(-0.5, 0.5)  # ASDAS correlacionado con BASDAI
-
-    fila = [
-        # Identificación (5)
-        paciente_id, nombre, sexo, fecha_visita.strftime('%Y-%m-%d'), 'Primera Visita',
-        # Profesional y diagnóstico (6)
-        datos_paciente['profesional'], 'ESPA', '',
-        datos_paciente['hla_b27'], '', '',
-        # Anamnesis inicial (7)
-        '2024-01' if random.random() < 0.5 else '2023-06',  # Inicio_Sintomas (mes-año)
-        '', 'SI' if random.random() < 0.4 else 'NO', '30', '45', 'SI' if random.random() < 0.6 else 'NO',
-        'SI' if random.random() < 0.7 else 'NO',
-        # NAD expandidas (30)
-        *expandir_articulaciones_a_columnas(nad),
-        # NAT expandidas (30)
-        *expandir_articulaciones_a_columnas(nat),
-        # Dactilitis expandidas (20)
-        *expandir_dactilitis_a_columnas(dactilitis),
-        # Totales (3)
-        len(nad), len(nat), len(dactilitis),
-        # Antropometría (4)
-        random.randint(60, 95), random.randint(160, 185),
-        round(70 / (1.75**2), 1), f"{random.randint(110, 140)}/{random.randint(70, 90)}",
-        # PROs - vacío en primera visita (5)
-        '', '', '', '', '',
-        # Psoriasis - vacío en ESPA (5)
-        '', '', '', '', '',
-        # ExtraArticular (3)
-        'SI' if random.random() < 0.1 else 'NO', 'SI' if random.random() < 0.15 else 'NO', 'NO',
-        # Comorbilidades (8)
-        'SI' if random.random() < 0.35 else 'NO', 'SI' if random.random() < 0.2 else 'NO',
-        'SI' if random.random() < 0.4 else 'NO', 'SI' if random.random() < 0.05 else 'NO',
-        'SI' if random.random() < 0.1 else 'NO', 'SI' if random.random() < 0.3 else 'NO',
-        'SI' if random.random() < 0.15 else 'NO', 'SI' if random.random() < 0.05 else 'NO',
-        # AF (4)
-        '', '', '', '',
-        # Tóxicos (6)
-        'SI' if random.random() < 0.3 else 'NO', '', 'SI' if random.random() < 0.2 else 'NO', '',
-        'SI' if random.random() < 0.1 else 'NO', '',
-        # Entesitis (11)
-        'SI' if random.random() < 0.2 else 'NO', 'SI' if random.random() < 0.15 else 'NO',
-        'SI' if random.random() < 0.1 else 'NO', 'SI' if random.random() < 0.08 else 'NO',
-        'SI' if random.random() < 0.05 else 'NO', 'SI' if random.random() < 0.2 else 'NO',
-        'SI' if random.random() < 0.15 else 'NO', 'SI' if random.random() < 0.1 else 'NO',
-        'SI' if random.random() < 0.08 else 'NO', 'SI' if random.random() < 0.05 else 'NO',
-        'SI' if random.random() < 0.1 else 'NO',
-        # Pruebas complementarias - vacío en primera (5)
-        '', '', '', '', '',
-        # BASDAI (7) - vacío en primera
-        '', '', '', '', '', '', '',
-        # ASDAS (5) - vacío en primera
-        '', '', '', '', '',
-        # Metrología (6) - vacío en primera
-        '', '', '', '', '', '',
-        # PASI (3) - vacío en ESPA
-        '', '', '',
-        # HAQ (9) - vacío en primera
-        '', '', '', '', '', '', '', '', '',
-        # LEI (7) - vacío en ESPA
-        '', '', '', '', '', '', '',
-        # MDA (8) - vacío en ESPA
-        '', '', '', '', '', '', '', '',
-        # RAPID3 (4) - vacío en ESPA
-        '', '', '', '',
-        # Tratamiento (3)
-        datos_paciente['tratamiento_inicial'], datos_paciente['fecha_inicio'], '',
-        # Continuar - vacío en primera (2)
-        '', '',
-        # Cambio - vacío en primera (12)
-        '', '', '', '', '', '', '', '', '', '', '', '',
-        # Decision_Terapeutica_SEG - vacío (1)
-        '',
-        # Tratamientos iniciales (6)
-        datos_paciente['trat_sistemico'], datos_paciente['trat_sistemico_dosis'],
-        datos_paciente['trat_fame'], datos_paciente['trat_fame_dosis'],
-        datos_paciente['trat_biologico'], datos_paciente['trat_biologico_dosis'],
-        # Fecha próxima revisión y comentarios (2)
-        (fecha_visita + timedelta(days=180)).strftime('%Y-%m-%d'), ''
-    ]
+PROB_TOXICOS = probabilidades_si(('Toxico_Tabaco', 0.3), ('Toxico_Alcohol', 0.2), ('Toxico_Drogas', 0.1))
 
+PROB_ENTESITIS = {
+    'espa': probabilidades_si(*zip(COLUMNAS_ENTESITIS, (0.2, 0.15, 0.1, 0.08, 0.05, 0.2, 0.15, 0.1, 0.08, 0.05))),
+    'aps': probabilidades_si(*zip(COLUMNAS_ENTESITIS, (0.2, 0.15, 0.15, 0.1, 0.08, 0.2, 0.15, 0.15, 0.1, 0.08))),
+}
+
+PROB_EXTRAARTICULAR = {
+    'espa': probabilidades_si(('ExtraArticular_Digestiva', 0.1), ('ExtraArticular_Uveitis', 0.15),
+                              ('ExtraArticular_Psoriasis', 0.0)),
+    'aps': probabilidades_si(('ExtraArticular_Digestiva', 0.1), ('ExtraArticular_Uveitis', 0.05),
+                             ('ExtraArticular_Psoriasis', 0.2)),
+}
+
+PROB_PSORIASIS = probabilidades_si(('Psoriasis_Cuero_Cabelludo', 0.7), ('Psoriasis_Ungueal', 0.4),
+                                   ('Psoriasis_Extensora', 0.6), ('Psoriasis_Pliegues', 0.3),
+                                   ('Psoriasis_Palmoplantar', 0.2))
+
+PROB_ANAMNESIS = {
+    'espa': probabilidades_si(('Dolor_Axial', 0.4), ('Irradiacion_Nalgas', 0.6), ('Clinica_Axial_Presente', 0.7)),
+    'aps': probabilidades_si(('Dolor_Axial', 0.3), ('Irradiacion_Nalgas', 0.4), ('Clinica_Axial_Presente', 0.5)),
+}
+
+PROB_CONTINUAR = probabilidades_si(('Continuar_Adherencia', 0.6), ('Continuar_Ajuste_Terapeutico', 0.3))
+PROB_AUTOANTICUERPOS = probabilidades_si(('FR', 0.3), ('APCC', 0.4))
+
+def _fila_visita(paciente_id, nombre, sexo, fecha_visita, tipo_visita, diagnostico, datos_paciente,
+                 nad, nat, dactilitis, talla_min, rng=random):
+    """Columnas comunes a todas las visitas: identificación, homúnculo, antropometría y revisión"""
+    fila = nueva_fila()
+    asignar(fila,
+            ID_Paciente=paciente_id, Nombre_Paciente=nombre, Sexo=sexo,
+            Fecha_Visita=fecha_visita.strftime('%Y-%m-%d'), Tipo_Visita=tipo_visita,
+            Profesional=datos_paciente['profesional'], Diagnostico_Primario=diagnostico,
+            HLA_B27=datos_paciente['hla_b27'])
+
+    marcar_regiones(fila, IDX_NAD, ARTICULATIONS, nad)
+    marcar_regiones(fila, IDX_NAT, ARTICULATIONS, nat)
+    marcar_regiones(fila, IDX_DACT, DACTILITIS, dactilitis)
+    asignar(fila, NAD_Total=len(nad), NAT_Total=len(nat), Dactilitis_Total=len(dactilitis))
+
+    asignar(fila,
+            Peso=rng.randint(talla_min[0], 95), Talla=rng.randint(talla_min[1], 185),
+            IMC=round(70 / (1.75**2), 1), TA=f"{rng.randint(110, 140)}/{rng.randint(70, 90)}",
+            Fecha_Proxima_Revision=(fecha_visita + timedelta(days=180)).strftime('%Y-%m-%d'))
     return fila
 
-def generar_seguimiento_espa(paciente_id, nombre, sexo, fecha_visita, datos_paciente, datos_previos):
-    """Genera fila completa de seguimiento ESPA (220 columnas)"""
-
-    nad, nat = generar_articulaciones()
-    dactilitis = generar_dactilitis()
-
-    basdai = generar_basdai_con_distribucion_normal(mejora=True)
-    asdas = basdai * 0.8 + random.uniform(-0.5, 0.5)
-
-    pcr = round(random.gauss(5, 3), 1)
-    pcr = max(0, pcr)
-    vsg = round(random.gauss(12, 8), 0)
-    vsg = max(1, vsg)
-
-    fila = [
-        # Identificación (5)
-        paciente_id, nombre, sexo, fecha_visita.strftime('%Y-%m-%d'), 'Seguimiento',
-        # Profesional y diagnóstico (6)
-        datos_paciente['profesional'], 'ESPA', '',
-        datos_paciente['hla_b27'], '', '',
-        # Anamnesis - vacío en seguimiento (7)
-        '', '', '', '', '', '', '',
-        # NAD expandidas (30)
-        *expandir_articulaciones_a_columnas(nad),
-        # NAT expandidas (30)
-        *expandir_articulaciones_a_columnas(nat),
-        # Dactilitis expandidas (20)
-        *expandir_dactilitis_a_columnas(dactilitis),
-        # Totales (3)
-        len(nad), len(nat), len(dactilitis),
-        # Antropometría (4)
-        random.randint(60, 95), random.randint(160, 185),
-        round(70 / (1.75**2), 1), f"{random.randint(110, 140)}/{random.randint(70, 90)}",
-        # PROs (5)
-        round(basdai, 1), round(basdai * 0.7, 1), round(basdai * 0.8, 1),
-        random.randint(10, 60), round(random.uniform(2, 8), 1),
-        # Psoriasis - vacío en ESPA (5)
-        '', '', '', '', '',
-        # ExtraArticular (3)
-        'SI' if random.random() < 0.1 else 'NO', 'SI' if random.random() < 0.15 else 'NO', 'NO',
-        # Comorbilidades (8)
-        datos_paciente['comorbilidades']['HTA'],
-        datos_paciente['comorbilidades']['DM'],
-        datos_paciente['comorbilidades']['DLP'],
-        'NO',  # ECV
-        'SI' if random.random() < 0.1 else 'NO',  # Gastritis
-        'SI' if random.random() < 0.3 else 'NO',  # Obesidad
-        'SI' if random.random() < 0.15 else 'NO',  # Osteoporosis
-        'SI' if random.random() < 0.05 else 'NO',  # Gota
-        # AF - vacío en seguimiento (4)
-        '', '', '', '',
-        # Tóxicos - vacío en seguimiento (6)
-        '', '', '', '', '', '',
-        # Entesitis - vacío en seguimiento (11)
-        '', '', '', '', '', '', '', '', '', '', '',
-        # Pruebas complementarias (5)
-        round(pcr, 1), int(vsg), '', '', '',
-        # BASDAI (7)
-        random.randint(1, 7), random.randint(1, 7), random.randint(1, 7),
-        random.randint(1, 7), random.randint(1, 7), random.randint(1, 7),
-        round(basdai, 1),
-        # ASDAS (5)
-        'dolor_espalda_' + str(random.randint(1, 10)),
-        random.randint(10, 180),
-        round(basdai, 1),
-        round(pcr, 1),
-        round(vsg, 1),
-        # Metrología (6)
-        round(random.uniform(3, 7), 1), random.randint(40, 80),
-        round(random.uniform(5, 25), 1), round(random.uniform(40, 80), 1),
-        round(random.uniform(2, 5), 1), random.randint(30, 50),
-        # PASI - vacío en ESPA (3)
-        '', '', '',
-        # HAQ - vacío en ESPA (9)
-        '', '', '', '', '', '', '', '', '',
-        # LEI - vacío en ESPA (7)
-        '', '', '', '', '', '', '',
-        # MDA - vacío en ESPA (8)
-        '', '', '', '', '', '', '', '',
-        # RAPID3 - vacío en ESPA (4)
-        '', '', '', '',
-        # Tratamiento (3)
-        datos_paciente['tratamiento_actual'], datos_paciente['fecha_inicio'], '',
-        # Continuar (2)
-        'SI' if random.random() < 0.6 else 'NO', 'SI' if random.random() < 0.3 else 'NO',
-        # Cambio (12)
-        '', '', '', '', '', '', '', '', '', '', '', '',
-        # Decision_Terapeutica_SEG (1)
-        'CONTINUAR' if random.random() < 0.6 else random.choice(['AUMENTAR_DOSIS', 'CAMBIAR']),
-        # Tratamientos iniciales - vacío en seguimiento (6)
-        '', '', '', '', '', '',
-        # Fecha próxima revisión y comentarios (2)
-        (fecha_visita + timedelta(days=180)).strftime('%Y-%m-%d'), ''
-    ]
+def _primera_visita_comun(fila, pathology, datos_paciente, rng=random):
+    """Antecedentes que solo se recogen en la primera visita y tratamientos iniciales"""
+    sortear_si_no(fila, PROB_EXTRAARTICULAR[pathology], rng=rng)
+    sortear_si_no(fila, PROB_COMORBILIDADES, rng=rng)
+    sortear_si_no(fila, PROB_TOXICOS, rng=rng)
+    sortear_si_no(fila, PROB_ENTESITIS[pathology], rng=rng)
+    asignar(fila,
+            Tratamiento_Actual=datos_paciente['tratamiento_inicial'],
+            Fecha_Inicio_Tratamiento=datos_paciente['fecha_inicio'],
+            Trat_Sistemico=datos_paciente['trat_sistemico'],
+            Trat_Sistemico_Dosis=datos_paciente['trat_sistemico_dosis'],
+            Trat_FAME=datos_paciente['trat_fame'], Trat_FAME_Dosis=datos_paciente['trat_fame_dosis'],
+            Trat_Biologico=datos_paciente['trat_biologico'],
+            Trat_Biologico_Dosis=datos_paciente['trat_biologico_dosis'])
+
+def _seguimiento_comun(fila, pathology, datos_paciente, rng=random):
+    """Comorbilidades del paciente, analítica, tratamiento vigente y decisión terapéutica"""
+    sortear_si_no(fila, PROB_EXTRAARTICULAR[pathology], rng=rng)
+    comorbilidades = datos_paciente['comorbilidades']
+    asignar(fila, Comorbilidad_HTA=comorbilidades['HTA'], Comorbilidad_DM=comorbilidades['DM'],
+            Comorbilidad_DLP=comorbilidades['DLP'], Comorbilidad_ECV='NO')
+    sortear_si_no(fila, PROB_COMORBILIDADES_SEGUIMIENTO, rng=rng)
+
+    pcr = max(0, round(rng.gauss(5, 3), 1))
+    vsg = max(1, round(rng.gauss(12, 8), 0))
+    asignar(fila, PCR=round(pcr, 1), VSG=int(vsg),
+            Tratamiento_Actual=datos_paciente['tratamiento_actual'],
+            Fecha_Inicio_Tratamiento=datos_paciente['fecha_inicio'])
+    sortear_si_no(fila, PROB_CONTINUAR, rng=rng)
+    asignar(fila, Decision_Terapeutica_SEG='CONTINUAR' if rng.random() < 0.6
+            else rng.choice(['AUMENTAR_DOSIS', 'CAMBIAR']))
+    return pcr, vsg
+
+def generar_primera_visita_espa(paciente_id, nombre, sexo, fecha_visita, datos_paciente, rng=random):
+    """Genera fila completa de primera visita ESPA (columnas de column_schema)"""
+
+    nad, nat = generar_articulaciones(rng=rng)
+    dactilitis = generar_dactilitis(rng=rng)
+
+    fila = _fila_visita(paciente_id, nombre, sexo, fecha_visita, 'Primera Visita', 'ESPA', datos_paciente,
+                        nad, nat, dactilitis, (60, 160), rng=rng)
+
+    # Anamnesis inicial
+    asignar(fila, Inicio_Sintomas='2024-01' if rng.random() < 0.5 else '2023-06',
+            Rigidez_Matutina='30', Duracion_Rigidez='45')
+    sortear_si_no(fila, PROB_ANAMNESIS['espa'], rng=rng)
+
+    _primera_visita_comun(fila, 'espa', datos_paciente, rng=rng)
+    return fila
+
+def generar_seguimiento_espa(paciente_id, nombre, sexo, fecha_visita, datos_paciente, datos_previos, rng=random):
+    """Genera fila completa de seguimiento ESPA (columnas de column_schema)"""
+
+    nad, nat = generar_articulaciones(rng=rng)
+    dactilitis = generar_dactilitis(rng=rng)
+
+    basdai = generar_basdai_con_distribucion_normal(mejora=True, rng=rng)
+
+    fila = _fila_visita(paciente_id, nombre, sexo, fecha_visita, 'Seguimiento', 'ESPA', datos_paciente,
+                        nad, nat, dactilitis, (60, 160), rng=rng)
+
+    # PROs
+    asignar(fila, EVA_Global=round(basdai, 1), EVA_Dolor=round(basdai * 0.7, 1),
+            EVA_Fatiga=round(basdai * 0.8, 1), Rigidez_Matutina_Min=rng.randint(10, 60),
+            Dolor_Nocturno=round(rng.uniform(2, 8), 1))
+
+    _seguimiento_comun(fila, 'espa', datos_paciente, rng=rng)
+
+    # BASDAI y ASDAS (resultados calculados a partir de los ítems de la fila)
+    for i in IDX_BASDAI:
+        fila[i] = rng.randint(1, 7)
+    asignar(fila, ASDAS_Dolor_Espalda=rng.randint(1, 10), ASDAS_Duracion_Rigidez=rng.randint(1, 10),
+            ASDAS_EVA_Global=round(basdai, 1))
+    scores = calcular_scores(fila)
+    asignar(fila, BASDAI_Result=scores['BASDAI_Result'], ASDAS_CRP_Result=scores['ASDAS_CRP_Result'],
+            ASDAS_ESR_Result=scores['ASDAS_ESR_Result'])
+
+    # Metrología
+    asignar(fila, Schober=round(rng.uniform(3, 7), 1), Rotacion_Cervical=rng.randint(40, 80),
+            Distancia_OP=round(rng.uniform(5, 25), 1), Distancia_TP=round(rng.uniform(40, 80), 1),
+            Expansion_Toracica=round(rng.uniform(2, 5), 1), Distancia_Intermaleolar=rng.randint(30, 50))
 
     return fila
 
 # ================ GENERACIÓN DE VISITAS APS ================
 
-def generar_primera_visita_aps(paciente_id, nombre, sexo, fecha_visita, datos_paciente):
-    """Genera fila completa de primera visita APS (220 columnas)"""
-
-    nad, nat = generar_articulaciones(count_nad_max=10)  # Menos articulaciones en APS
-    dactilitis = generar_dactilitis()
-
-    haq = generar_haq_con_distribucion_normal()
-    pasi = generar_pasi()
-
-    fila = [
-        # Identificación (5)
-        paciente_id, nombre, sexo, fecha_visita.strftime('%Y-%m-%d'), 'Primera Visita',
-        # Profesional y diagnóstico (6)
-        datos_paciente['profesional'], 'APS', '',
-        'NO' if random.random() < 0.7 else 'SI',
-        'SI' if random.random() < 0.3 else 'NO',
-        'SI' if random.random() < 0.4 else 'NO',
-        # Anamnesis (7)
-        '2024-01' if random.random() < 0.5 else '2023-06',
-        '2023-06' if random.random() < 0.7 else '2022-12',  # Inicio_Psoriasis
-        'SI' if random.random() < 0.3 else 'NO',
-        '30', '45', 'SI' if random.random() < 0.4 else 'NO',
-        'SI' if random.random() < 0.5 else 'NO',
-        # NAD expandidas (30)
-        *expandir_articulaciones_a_columnas(nad),
-        # NAT expandidas (30)
-        *expandir_articulaciones_a_columnas(nat),
-        # Dactilitis expandidas (20)
-        *expandir_dactilitis_a_columnas(dactilitis),
-        # Totales (3)
-        len(nad), len(nat), len(dactilitis),
-        # Antropometría (4)
-        random.randint(55, 95), random.randint(155, 185),
-        round(70 / (1.75**2), 1), f"{random.randint(110, 140)}/{random.randint(70, 90)}",
-        # PROs - vacío en primera (5)
-        '', '', '', '', '',
-        # Psoriasis (5)
-        'SI' if random.random() < 0.7 else 'NO',
-        'SI' if random.random() < 0.4 else 'NO',
-        'SI' if random.random() < 0.6 else 'NO',
-        'SI' if random.random() < 0.3 else 'NO',
-        'SI' if random.random() < 0.2 else 'NO',
-        # ExtraArticular (3)
-        'SI' if random.random() < 0.1 else 'NO',
-        'SI' if random.random() < 0.05 else 'NO',
-        'SI' if random.random() < 0.2 else 'NO',
-        # Comorbilidades (8)
-        'SI' if random.random() < 0.35 else 'NO', 'SI' if random.random() < 0.2 else 'NO',
-        'SI' if random.random() < 0.4 else 'NO', 'SI' if random.random() < 0.05 else 'NO',
-        'SI' if random.random() < 0.1 else 'NO', 'SI' if random.random() < 0.3 else 'NO',
-        'SI' if random.random() < 0.15 else 'NO', 'SI' if random.random() < 0.05 else 'NO',
-        # AF (4)
-        '', '', '', '',
-        # Tóxicos (6)
-        'SI' if random.random() < 0.3 else 'NO', '', 'SI' if random.random() < 0.2 else 'NO', '',
-        'SI' if random.random() < 0.1 else 'NO', '',
-        # Entesitis (11)
-        'SI' if random.random() < 0.2 else 'NO', 'SI' if random.random() < 0.15 else 'NO',
-        'SI' if random.random() < 0.15 else 'NO', 'SI' if random.random() < 0.1 else 'NO',
-        'SI' if random.random() < 0.08 else 'NO', 'SI' if random.random() < 0.2 else 'NO',
-        'SI' if random.random() < 0.15 else 'NO', 'SI' if random.random() < 0.15 else 'NO',
-        'SI' if random.random() < 0.1 else 'NO', 'SI' if random.random() < 0.08 else 'NO',
-        'SI' if random.random() < 0.1 else 'NO',
-        # Pruebas - vacío en primera (5)
-        '', '', '', '', '',
-        # BASDAI - vacío en APS (7)
-        '', '', '', '', '', '', '',
-        # ASDAS - vacío en primera (5)
-        '', '', '', '', '',
-        # Metrología - vacío en APS (6)
-        '', '', '', '', '', '',
-        # PASI (3)
-        pasi, round(len(nad) * 2, 1), f"Afectación {'leve' if pasi < 10 else 'moderada' if pasi < 15 else 'grave'}",
-        # HAQ - vacío en primera (9)
-        '', '', '', '', '', '', '', '', '',
-        # LEI - vacío en primera (7)
-        '', '', '', '', '', '', '',
-        # MDA - vacío en primera (8)
-        '', '', '', '', '', '', '', '',
-        # RAPID3 - vacío en primera (4)
-        '', '', '', '',
-        # Tratamiento (3)
-        datos_paciente['tratamiento_inicial'], datos_paciente['fecha_inicio'], '',
-        # Continuar - vacío (2)
-        '', '',
-        # Cambio - vacío (12)
-        '', '', '', '', '', '', '', '', '', '', '', '',
-        # Decision_Terapeutica_SEG - vacío (1)
-        '',
-        # Tratamientos iniciales (6)
-        datos_paciente['trat_sistemico'], datos_paciente['trat_sistemico_dosis'],
-        datos_paciente['trat_fame'], datos_paciente['trat_fame_dosis'],
-        datos_paciente['trat_biologico'], datos_paciente['trat_biologico_dosis'],
-        # Fecha próxima revisión y comentarios (2)
-        (fecha_visita + timedelta(days=180)).strftime('%Y-%m-%d'), ''
-    ]
+def _descripcion_pasi(pasi):
+    return f"Afectación {'leve' if pasi < 10 else 'moderada' if pasi < 15 else 'grave'}"
+
+def generar_primera_visita_aps(paciente_id, nombre, sexo, fecha_visita, datos_paciente, rng=random):
+    """Genera fila completa de primera visita APS (columnas de column_schema)"""
+
+    nad, nat = generar_articulaciones(count_nad_max=10, rng=rng)  # Menos articulaciones en APS
+    dactilitis = generar_dactilitis(rng=rng)
+
+    pasi = generar_pasi(rng=rng)
+
+    fila = _fila_visita(paciente_id, nombre, sexo, fecha_visita, 'Primera Visita', 'APS', datos_paciente,
+                        nad, nat, dactilitis, (55, 155), rng=rng)
+    sortear_si_no(fila, PROB_AUTOANTICUERPOS, rng=rng)
+
+    # Anamnesis
+    asignar(fila, Inicio_Sintomas='2024-01' if rng.random() < 0.5 else '2023-06',
+            Inicio_Psoriasis='2023-06' if rng.random() < 0.7 else '2022-12',
+            Rigidez_Matutina='30', Duracion_Rigidez='45')
+    sortear_si_no(fila, PROB_ANAMNESIS['aps'], rng=rng)
+
+    sortear_si_no(fila, PROB_PSORIASIS, rng=rng)
+    _primera_visita_comun(fila, 'aps', datos_paciente, rng=rng)
+
+    # Evaluación psoriasis
+    asignar(fila, PASI_Score=pasi, BSA_Percentage=round(len(nad) * 2, 1), Psoriasis_Descripcion=_descripcion_pasi(pasi))
 
     return fila
 
-def generar_seguimiento_aps(paciente_id, nombre, sexo, fecha_visita, datos_paciente, datos_previos):
-    """Genera fila completa de seguimiento APS (220 columnas)"""
-
-    nad, nat = generar_articulaciones(count_nad_max=10)
-    dactilitis = generar_dactilitis()
-
-    haq = generar_haq_con_distribucion_normal(mejora=True)
-    pasi = max(1, generar_pasi() - random.randint(0, 5))
-
-    pcr = round(random.gauss(5, 3), 1)
-    pcr = max(0, pcr)
-    vsg = round(random.gauss(12, 8), 0)
-    vsg = max(1, vsg)
-
-    # LEI (7 columnas) - solo APS
-    lei_campos = [
-        round(random.uniform(0, 2), 0),  # LEI_Epicondilo_Lat_Izq
-        round(random.uniform(0, 2), 0),  # LEI_Epicondilo_Lat_Der
-        round(random.uniform(0, 2), 0),  # LEI_Epicondilo_Med_Izq
-        round(random.uniform(0, 2), 0),  # LEI_Epicondilo_Med_Der
-        round(random.uniform(0, 2), 0),  # LEI_Aquiles_Izq
-        round(random.uniform(0, 2), 0),  # LEI_Aquiles_Der
-        sum([random.randint(0, 2) for _ in range(7)]) // 7  # LEI_Score
-    ]
-
-    # MDA (8 columnas) - solo APS
-    mda_cumple = len(nad) <= 4 and haq <= 1.5 and len(dactilitis) == 0 and pasi <= 10
-
-    fila = [
-        # Identificación (5)
-        paciente_id, nombre, sexo, fecha_visita.strftime('%Y-%m-%d'), 'Seguimiento',
-        # Profesional y diagnóstico (6)
-        datos_paciente['profesional'], 'APS', '',
-        'NO' if random.random() < 0.7 else 'SI',
-        'SI' if random.random() < 0.3 else 'NO',
-        'SI' if random.random() < 0.4 else 'NO',
-        # Anamnesis - vacío (7)
-        '', '', '', '', '', '', '',
-        # NAD expandidas (30)
-        *expandir_articulaciones_a_columnas(nad),
-        # NAT expandidas (30)
-        *expandir_articulaciones_a_columnas(nat),
-        # Dactilitis expandidas (20)
-        *expandir_dactilitis_a_columnas(dactilitis),
-        # Totales (3)
-        len(nad), len(nat), len(dactilitis),
-        # Antropometría (4)
-        random.randint(55, 95), random.randint(155, 185),
-        round(70 / (1.75**2), 1), f"{random.randint(110, 140)}/{random.randint(70, 90)}",
-        # PROs (5)
-        round(haq * 1.2, 1), round(haq, 1), round(haq * 0.8, 1),
-        random.randint(10, 60), round(random.uniform(2, 8), 1),
-        # Psoriasis - vacío en seguimiento (5)
-        '', '', '', '', '',
-        # ExtraArticular (3)
-        'SI' if random.random() < 0.1 else 'NO',
-        'SI' if random.random() < 0.05 else 'NO',
-        'SI' if random.random() < 0.2 else 'NO',
-        # Comorbilidades (8)
-        datos_paciente['comorbilidades']['HTA'],
-        datos_paciente['comorbilidades']['DM'],
-        datos_paciente['comorbilidades']['DLP'],
-        'NO',
-        'SI' if random.random() < 0.1 else 'NO',
-        'SI' if random.random() < 0.3 else 'NO',
-        'SI' if random.random() < 0.15 else 'NO',
-        'SI' if random.random() < 0.05 else 'NO',
-        # AF - vacío (4)
-        '', '', '', '',
-        # Tóxicos - vacío (6)
-        '', '', '', '', '', '',
-        # Entesitis - vacío (11)
-        '', '', '', '', '', '', '', '', '', '', '',
-        # Pruebas (5)
-        round(pcr, 1), int(vsg), '', '', '',
-        # BASDAI - vacío en APS (7)
-        '', '', '', '', '', '', '',
-        # ASDAS - vacío en seguimiento (5)
-        '', '', '', '', '',
-        # Metrología - vacío en APS (6)
-        '', '', '', '', '', '',
-        # PASI (3)
-        pasi, round(len(nad) * 1.5, 1), f"Afectación {'leve' if pasi < 10 else 'moderada' if pasi < 15 else 'grave'}",
-        # HAQ (9)
-        round(haq, 2), round(haq * 0.9, 2), round(haq * 1.1, 2), round(haq * 0.8, 2),
-        round(haq * 0.95, 2), round(haq * 1.05, 2), round(haq * 0.85, 2),
-        round(haq * 1.15, 2), round(haq, 2),
-        # LEI (7)
-        *lei_campos,
-        # MDA (8)
-        len(nad), len(nat), pasi, round(haq, 1), 'SI' if mda_cumple else 'NO',
-        len(dactilitis), 'SI' if mda_cumple else 'NO', 'SI' if mda_cumple else 'NO',
-        # RAPID3 (4)
-        round(haq * 10, 1), round(haq * 8, 1), round(haq * 9, 1), round(haq * 25, 1),
-        # Tratamiento (3)
-        datos_paciente['tratamiento_actual'], datos_paciente['fecha_inicio'], '',
-        # Continuar (2)
-        'SI' if random.random() < 0.6 else 'NO',
-        'SI' if random.random() < 0.3 else 'NO',
-        # Cambio (12)
-        '', '', '', '', '', '', '', '', '', '', '', '',
-        # Decision_Terapeutica_SEG (1)
-        'CONTINUAR' if random.random() < 0.6 else random.choice(['AUMENTAR_DOSIS', 'CAMBIAR']),
-        # Tratamientos iniciales - vacío (6)
-        '', '', '', '', '', '',
-        # Fecha próxima revisión y comentarios (2)
-        (fecha_visita + timedelta(days=180)).strftime('%Y-%m-%d'), ''
-    ]
+def generar_seguimiento_aps(paciente_id, nombre, sexo, fecha_visita, datos_paciente, datos_previos, rng=random):
+    """Genera fila completa de seguimiento APS (columnas de column_schema)"""
+
+    nad, nat = generar_articulaciones(count_nad_max=10, rng=rng)
+    dactilitis = generar_dactilitis(rng=rng)
+
+    haq = generar_haq_con_distribucion_normal(mejora=True, rng=rng)
+    pasi = max(1, generar_pasi(rng=rng) - rng.randint(0, 5))
+
+    fila = _fila_visita(paciente_id, nombre, sexo, fecha_visita, 'Seguimiento', 'APS', datos_paciente,
+                        nad, nat, dactilitis, (55, 155), rng=rng)
+    sortear_si_no(fila, PROB_AUTOANTICUERPOS, rng=rng)
+
+    # PROs
+    eva_global, eva_dolor = round(haq * 1.2, 1), round(haq, 1)
+    asignar(fila, EVA_Global=eva_global, EVA_Dolor=eva_dolor, EVA_Fatiga=round(haq * 0.8, 1),
+            Rigidez_Matutina_Min=rng.randint(10, 60), Dolor_Nocturno=round(rng.uniform(2, 8), 1))
+
+    _seguimiento_comun(fila, 'aps', datos_paciente, rng=rng)
+
+    # Evaluación psoriasis
+    asignar(fila, PASI_Score=pasi, BSA_Percentage=round(len(nad) * 1.5, 1), Psoriasis_Descripcion=_descripcion_pasi(pasi))
+
+    # HAQ-DI
+    for i, factor in zip(IDX_HAQ, (1.0, 0.9, 1.1, 0.8, 0.95, 1.05, 0.85, 1.15)):
+        fila[i] = round(haq * factor, 2)
+
+    # LEI - solo APS
+    lei = [rng.randint(0, 1) for _ in IDX_LEI]
+    for i, valor in zip(IDX_LEI, lei):
+        fila[i] = valor
+    asignar(fila, LEI_Score=sum(lei))
+
+    # HAQ_Total, MDA y RAPID3 calculados a partir de los componentes de la fila
+    scores = calcular_scores(fila)
+    asignar(fila, HAQ_Total=scores['HAQ_Total'], MDA_NAT=len(nat), MDA_NAD=len(nad),
+            MDA_PASI=pasi, MDA_Dolor=eva_dolor, MDA_Global=eva_global, MDA_HAQ=scores['HAQ_Total'],
+            MDA_Entesitis=sum(lei), MDA_Cumple=scores['MDA_Cumple'])
+    asignar(fila, RAPID3_Funcion=scores['RAPID3_Funcion'], RAPID3_Dolor=eva_dolor, RAPID3_Global=eva_global,
+            RAPID3_Score=scores['RAPID3_Score'])
 
     return fila
 
-# ================ FUNCIÓN PRINCIPAL ================
+# ================ DATOS DE PACIENTE ================
 
-def generar_base_datos():
-    """Genera Hub_Clinico_Maestro.xlsx con 60 pacientes ficticios"""
-
-    print("Cargando Hub_Clinico_Maestro.xlsx...")
-    wb = openpyxl.load_workbook('Hub_Clinico_Maestro.xlsx')
-    ws_espa = wb['ESPA']
-    ws_aps = wb['APS']
-
-    row_espa = 2
-    row_aps = 2
-
-    total_visitas_espa = 0
-    total_visitas_aps = 0
-
-    # ========== GENERAR 30 PACIENTES ESPA ==========
-    print("Generando 30 pacientes ESPA...")
-
-    for i in range(TOTAL_ESPA):
-        paciente_id = generar_id_paciente('espa', i)
-        nombre = generar_nombre_completo()
-        sexo = random.choice(['Hombre', 'Mujer'])
-        num_visitas = random.randint(MIN_VISITS, MAX_VISITS)
-        fecha_primera = datetime(2024, 1, 1) + timedelta(days=random.randint(0, 365))
-
-        # Datos constantes del paciente
-        datos_paciente = {
-            'profesional': random.choice(PROFESIONALES),
-            'hla_b27': 'Positivo' if random.random() < 0.8 else 'Negativo',
-            'comorbilidades': {
-                'HTA': 'SI' if random.random() < 0.35 else 'NO',
-                'DM': 'SI' if random.random() < 0.2 else 'NO',
-                'DLP': 'SI' if random.random() < 0.4 else 'NO'
-            }
+def _dosis_fame(fame):
+    if 'Sulfasalazina' in fame:
+        return '2g/día'
+    if 'Leflunomida' in fame:
+        return '20mg/día'
+    return '15mg/sem'
+
+def generar_datos_paciente(pathology, fecha_primera, rng=random):
+    """Genera los datos constantes del paciente y su escalada terapéutica inicial"""
+    tratamientos = TRATAMIENTOS_ESPA if pathology == 'espa' else TRATAMIENTOS_APS
+
+    if pathology == 'espa':
+        hla_b27 = 'Positivo' if rng.random() < 0.8 else 'Negativo'
+    else:
+        hla_b27 = 'Negativo' if rng.random() < 0.7 else 'Positivo'
+
+    datos_paciente = {
+        'profesional': rng.choice(PROFESIONALES),
+        'hla_b27': hla_b27,
+        'comorbilidades': {
+            'HTA': 'SI' if rng.random() < 0.35 else 'NO',
+            'DM': 'SI' if rng.random() < 0.2 else 'NO',
+            'DLP': 'SI' if rng.random() < 0.4 else 'NO'
         }
+    }
+
+    # Escalada terapéutica
+    escalada = rng.random()
+    if escalada < 0.4:
+        datos_paciente['tratamiento_inicial'] = rng.choice(tratamientos['AINEs'])
+        datos_paciente['trat_sistemico'] = rng.choice(tratamientos['AINEs'])
+        datos_paciente['trat_sistemico_dosis'] = '500mg/12h'
+        datos_paciente['trat_fame'] = ''
+        datos_paciente['trat_fame_dosis'] = ''
+        datos_paciente['trat_biologico'] = ''
+        datos_paciente['trat_biologico_dosis'] = ''
+    elif escalada < 0.7:
+        aine = rng.choice(tratamientos['AINEs'])
+        fame = rng.choice(tratamientos['FAMEs'])
+        datos_paciente['tratamiento_inicial'] = f"{aine} + {fame}"
+        datos_paciente['trat_sistemico'] = aine
+        datos_paciente['trat_sistemico_dosis'] = '500mg/12h'
+        datos_paciente['trat_fame'] = fame
+        datos_paciente['trat_fame_dosis'] = _dosis_fame(fame)
+        datos_paciente['trat_biologico'] = ''
+        datos_paciente['trat_biologico_dosis'] = ''
+    else:
+        aine = rng.choice(tratamientos['AINEs'])
+        bio = rng.choice(tratamientos['Biológicos'])
+        datos_paciente['tratamiento_inicial'] = f"{aine} + {bio}"
+        datos_paciente['trat_sistemico'] = aine
+        datos_paciente['trat_sistemico_dosis'] = '500mg/12h'
+        datos_paciente['trat_fame'] = ''
+        datos_paciente['trat_fame_dosis'] = ''
+        componente = parsear_componente(bio)
+        datos_paciente['trat_biologico'] = componente.farmaco
+        datos_paciente['trat_biologico_dosis'] = texto_dosis(componente)
+
+    datos_paciente['fecha_inicio'] = fecha_primera.strftime('%Y-%m-%d')
+    return datos_paciente
+
+def generar_visitas_paciente(pathology, index, min_visitas=MIN_VISITS, max_visitas=MAX_VISITS, rng=random,
+                             esquema_id=ESQUEMA_ACTUAL):
+    """Genera las filas (primera visita + seguimientos) de un paciente, en orden cronológico"""
+    if pathology == 'espa':
+        generar_primera, generar_seguimiento = generar_primera_visita_espa, generar_seguimiento_espa
+        biologicos = TRATAMIENTOS_ESPA['Biológicos']
+    else:
+        generar_primera, generar_seguimiento = generar_primera_visita_aps, generar_seguimiento_aps
+        biologicos = TRATAMIENTOS_APS['Biológicos']
+
+    paciente_id = generar_id_paciente(pathology, index, rng=rng, esquema=esquema_id)
+    nombre = generar_nombre_completo(rng=rng)
+    sexo = rng.choice(['Hombre', 'Mujer'])
+    num_visitas = rng.randint(min_visitas, max_visitas)
+    fecha_primera = datetime(2024, 1, 1) + timedelta(days=rng.randint(0, 365))
+
+    datos_paciente = generar_datos_paciente(pathology, fecha_primera, rng=rng)
+
+    # Primera visita
+    yield generar_primera(paciente_id, nombre, sexo, fecha_primera, datos_paciente, rng=rng)
+
+    # Cambio de tratamiento en algunos pacientes para seguimientos
+    cambio_prob = 0.4
+
+    # Visitas de seguimiento
+    for v in range(1, num_visitas):
+        fecha_visita = fecha_primera + timedelta(days=rng.randint(90 + v*90, 180 + v*90))
 
-        # Escalada terapéutica
-        escalada = random.random()
-        if escalada < 0.4:
-            datos_paciente['tratamiento_inicial'] = random.choice(TRATAMIENTOS_ESPA['AINEs'])
-            datos_paciente['trat_sistemico'] = random.choice(TRATAMIENTOS_ESPA['AINEs'])
-            datos_paciente['trat_sistemico_dosis'] = '500mg/12h'
-            datos_paciente['trat_fame'] = ''
-            datos_paciente['trat_fame_dosis'] = ''
-            datos_paciente['trat_biologico'] = ''
-            datos_paciente['trat_biologico_dosis'] = ''
-        elif escalada < 0.7:
-            aine = random.choice(TRATAMIENTOS_ESPA['AINEs'])
-            fame = random.choice(TRATAMIENTOS_ESPA['FAMEs'])
-            datos_paciente['tratamiento_inicial'] = f"{aine} + {fame}"
-            datos_paciente['trat_sistemico'] = aine
-            datos_paciente['trat_sistemico_dosis'] = '500mg/12h'
-            datos_paciente['trat_fame'] = fame
-            datos_paciente['trat_fame_dosis'] = '2g/día' if 'Sulfasalazina' in fame else '15mg/sem'
-            datos_paciente['trat_biologico'] = ''
-            datos_paciente['trat_biologico_dosis'] = ''
+        # Algunos pacientes cambian de tratamiento en seguimientos
+        if rng.random() < cambio_prob:
+            datos_paciente['tratamiento_actual'] = rng.choice(biologicos)
         else:
-            aine = random.choice(TRATAMIENTOS_ESPA['AINEs'])
-            bio = random.choice(TRATAMIENTOS_ESPA['Biológicos'])
-            datos_paciente['tratamiento_inicial'] = f"{aine} + {bio}"
-            datos_paciente['trat_sistemico'] = aine
-            datos_paciente['trat_sistemico_dosis'] = '500mg/12h'
-            datos_paciente['trat_fame'] = ''
-            datos_paciente['trat_fame_dosis'] = ''
-            datos_paciente['trat_biologico'] = bio.split()[0]
-            datos_paciente['trat_biologico_dosis'] = ' '.join(bio.split()[1:])
-
-        datos_paciente['fecha_inicio'] = fecha_primera.strftime('%Y-%m-%d')
-
-        # Primera visita
-        fila = generar_primera_visita_espa(paciente_id, nombre, sexo, fecha_primera, datos_paciente)
-        for col, valor in enumerate(fila, 1):
-            ws_espa.cell(row=row_espa, column=col, value=valor)
-        row_espa += 1
-        total_visitas_espa += 1
-
-        # Cambio de tratamiento en algunos pacientes para seguimientos
-        cambio_prob = 0.4
-
-        # Visitas de seguimiento
-        for v in range(1, num_visitas):
-            fecha_visita = fecha_primera + timedelta(days=random.randint(90 + v*90, 180 + v*90))
-
-            # Algunos pacientes cambian de tratamiento en seguimientos
-            if random.random() < cambio_prob:
-                nuevo_trat = random.choice(TRATAMIENTOS_ESPA['Biológicos'])
-                datos_paciente['tratamiento_actual'] = nuevo_trat
-            else:
-                datos_paciente['tratamiento_actual'] = datos_paciente['tratamiento_inicial']
-
-            fila = generar_seguimiento_espa(paciente_id, nombre, sexo, fecha_visita, datos_paciente, None)
-            for col, valor in enumerate(fila, 1):
-                ws_espa.cell(row=row_espa, column=col, value=valor)
-            row_espa += 1
-            total_visitas_espa += 1
-
-    # ========== GENERAR 30 PACIENTES APS ==========
-    print("Generando 30 pacientes APS...")
-
-    for i in range(TOTAL_APS):
-        paciente_id = generar_id_paciente('aps', i)
-        nombre = generar_nombre_completo()
-        sexo = random.choice(['Hombre', 'Mujer'])
-        num_visitas = random.randint(MIN_VISITS, MAX_VISITS)
-        fecha_primera = datetime(2024, 1, 1) + timedelta(days=random.randint(0, 365))
-
-        datos_paciente = {
-            'profesional': random.choice(PROFESIONALES),
-            'hla_b27': 'Negativo' if random.random() < 0.7 else 'Positivo',
-            'comorbilidades': {
-                'HTA': 'SI' if random.random() < 0.35 else 'NO',
-                'DM': 'SI' if random.random() < 0.2 else 'NO',
-                'DLP': 'SI' if random.random() < 0.4 else 'NO'
-            }
-        }
+            datos_paciente['tratamiento_actual'] = datos_paciente['tratamiento_inicial']
+
+        yield generar_seguimiento(paciente_id, nombre, sexo, fecha_visita, datos_paciente, None, rng=rng)
+
+def generar_filas(pathology, total_pacientes, min_visitas=MIN_VISITS, max_visitas=MAX_VISITS, rng=random,
+                  esquema_id=None):
+    """Genera todas las filas de una patología, paciente a paciente (esquema de ID: el que admite el total)"""
+    esquema_id = esquema_id or esquema_para(max(total_pacientes, 1))
+    for i in range(total_pacientes):
+        yield from generar_visitas_paciente(pathology, i, min_visitas, max_visitas, rng=rng, esquema_id=esquema_id)
+
+# ================ GENERACIÓN PARALELA POR SHARDS ================
+
+PACIENTES_POR_SHARD = 2000
+
+def planificar_shards(pathology, total_pacientes, pacientes_por_shard=PACIENTES_POR_SHARD):
+    """Divide los índices de paciente en rangos fijos: el reparto no depende del número de procesos"""
+    return [(pathology, inicio, min(inicio + pacientes_por_shard, total_pacientes))
+            for inicio in range(0, total_pacientes, pacientes_por_shard)]
+
+def semilla_shard(semilla, pathology, inicio):
+    """Semilla propia de cada shard (random.Random siembra las cadenas con SHA-512: estable entre ejecuciones)"""
+    return f"hub-clinico:{semilla}:{pathology}:{inicio}"
+
+def generar_shard(semilla, pathology, inicio, fin, min_visitas, max_visitas, codificar=False, esquema_id=None):
+    """
+    Genera el lote de filas de los pacientes [inicio, fin) con su propio random.Random.
+    Con codificar=True las filas salen ya serializadas (CodificadorFilas.plantilla) para
+    que el proceso trabajador haga también el XML y el escritor solo numere y comprima.
+    Sin `esquema_id` se usa el que admite `fin`; generar_dataset pasa el de todo el libro.
+    """
+    esquema_id = esquema_id or esquema_para(max(fin, 1))
+    rng = random.Random(semilla_shard(semilla, pathology, inicio))
+    codificador = CodificadorFilas() if codificar else None
+    lote = []
+    for i in range(inicio, fin):
+        for fila in generar_visitas_paciente(pathology, i, min_visitas, max_visitas, rng=rng, esquema_id=esquema_id):
+            lote.append(codificador.plantilla(fila) if codificar else fila)
+    return lote
+
+def generar_filas_por_shards(pathology, total_pacientes, min_visitas, max_visitas, semilla,
+                             executor=None, en_vuelo=4, codificar=False, generador=generar_shard):
+    """
+    Recorre los shards de una patología en orden y devuelve sus filas una a una.
+    Con un executor se mantienen `en_vuelo` shards en cola: los procesos generan en
+    paralelo, el orden de salida es siempre el de los shards y la memoria queda acotada.
+    `generador` produce el lote de un shard (generar_shard o su versión vectorizada).
+    """
+    shards = planificar_shards(pathology, total_pacientes)
+
+    if executor is None:
+        for _, inicio, fin in shards:
+            yield from generador(semilla, pathology, inicio, fin, min_visitas, max_visitas, codificar)
+        return
+
+    pendientes = deque()
+    siguientes = iter(shards)
+    for _, inicio, fin in islice(siguientes, en_vuelo):
+        pendientes.append(executor.submit(generador, semilla, pathology, inicio, fin,
+                                          min_visitas, max_visitas, codificar))
+    while pendientes:
+        lote = pendientes.popleft().result()
+        for _, inicio, fin in islice(siguientes, 1):
+            pendientes.append(executor.submit(generador, semilla, pathology, inicio, fin,
+                                              min_visitas, max_visitas, codificar))
+        yield from lote
+
+# ================ ESCRITURA DEL LIBRO ================
+
+def leer_cabecera(ruta_plantilla, nombre_hoja):
+    """Nombres de columna de la fila 1 de una hoja de la plantilla (sin celdas vacías finales)"""
+    wb = openpyxl.load_workbook(ruta_plantilla, read_only=True)
+    try:
+        cabecera = list(next(wb[nombre_hoja].iter_rows(min_row=1, max_row=1, values_only=True), ()))
+    finally:
+        wb.close()
+    while cabecera and cabecera[-1] is None:
+        cabecera.pop()
+    return cabecera
+
+def comprobar_plantilla(ruta_plantilla):
+    """Comprueba que las hojas de datos de la plantilla tienen las columnas de column_schema"""
+    for nombre_hoja in HOJAS_DATOS:
+        cabecera = tuple(leer_cabecera(ruta_plantilla, nombre_hoja))
+        if cabecera != COLUMNAS_HOJA:
+            faltan = [nombre for nombre in COLUMNAS_HOJA if nombre not in cabecera]
+            sobran = [nombre for nombre in cabecera if nombre not in INDICE]
+            raise ValueError(f"La hoja {nombre_hoja} de {ruta_plantilla} no sigue column_schema.py "
+                             f"(faltan {faltan[:5]}, sobran {sobran[:5]}, o el orden es distinto); "
+                             f"regenera la plantilla con create_excel.py")
+
+def _celda_vacia_a_none(fila):
+    """Las celdas '' se omiten al guardar: se leen igual (vacías) y el XML es mucho menor"""
+    return [None if valor == '' else valor for valor in fila]
+
+def escribir_en_memoria(ruta_plantilla, salida, filas_espa, filas_aps):
+    """Modo clásico: carga la plantilla completa, sustituye los datos y guarda"""
+    wb = openpyxl.load_workbook(ruta_plantilla)
+    totales = {}
+
+    for nombre_hoja, filas in (('ESPA', filas_espa), ('APS', filas_aps)):
+        ws = wb[nombre_hoja]
+        if ws.max_row > 1:
+            ws.delete_rows(2, ws.max_row - 1)
+        total = 0
+        for fila in filas:
+            ws.append(_celda_vacia_a_none(fila))
+            total += 1
+        totales[nombre_hoja] = total
+
+    print(f"Guardando {salida}...")
+    wb.save(salida)
+    return totales
+
+def escribir_streaming(ruta_plantilla, salida, filas_espa, filas_aps, progreso_cada=50000):
+    """
+    Modo streaming: copia la plantilla (cabeceras, estilos y catálogos intactos) y añade
+    las filas completas una a una sin retenerlas en memoria (ver xlsx_streaming.py)
+    """
+    print(f"Escribiendo {salida} en modo streaming...")
+    return escribir_libro_streaming(ruta_plantilla, salida, {'ESPA': filas_espa, 'APS': filas_aps},
+                                    progreso_cada=progreso_cada)
+
+# ================ FUNCIÓN PRINCIPAL ================
 
-        # Escalada terapéutica (similar a ESPA)
-        escalada = random.random()
-        if escalada < 0.4:
-            datos_paciente['tratamiento_inicial'] = random.choice(TRATAMIENTOS_APS['AINEs'])
-            datos_paciente['trat_sistemico'] = random.choice(TRATAMIENTOS_APS['AINEs'])
-            datos_paciente['trat_sistemico_dosis'] = '500mg/12h'
-            datos_paciente['trat_fame'] = ''
-            datos_paciente['trat_fame_dosis'] = ''
-            datos_paciente['trat_biologico'] = ''
-            datos_paciente['trat_biologico_dosis'] = ''
-        elif escalada < 0.7:
-            aine = random.choice(TRATAMIENTOS_APS['AINEs'])
-            fame = random.choice(TRATAMIENTOS_APS['FAMEs'])
-            datos_paciente['tratamiento_inicial'] = f"{aine} + {fame}"
-            datos_paciente['trat_sistemico'] = aine
-            datos_paciente['trat_sistemico_dosis'] = '500mg/12h'
-            datos_paciente['trat_fame'] = fame
-            datos_paciente['trat_fame_dosis'] = '20mg/día' if 'Leflunomida' in fame else '15mg/sem'
-            datos_paciente['trat_biologico'] = ''
-            datos_paciente['trat_biologico_dosis'] = ''
+def generar_base_datos(total_espa=TOTAL_ESPA, total_aps=TOTAL_APS,
+                       visitas_espa=(MIN_VISITS, MAX_VISITS), visitas_aps=(MIN_VISITS, MAX_VISITS),
+                       plantilla='Hub_Clinico_Maestro.xlsx', salida=None, streaming=False,
+                       semilla=None, procesos=1, vectorizado=False, esquema_id=None):
+    """
+    Genera Hub_Clinico_Maestro.xlsx con pacientes ficticios (por defecto 30 ESPA + 30 APS).
+
+    Con `semilla` o `procesos` > 1 los pacientes se generan por shards con un
+    random.Random sembrado por shard: la misma semilla produce el mismo libro
+    con cualquier número de procesos. Con `vectorizado` cada shard se sortea por
+    columnas con NumPy (vectorized_mock_data.py). En todos los modos las filas
+    siguen column_schema.py y la cabecera de la plantilla debe coincidir.
+
+    `esquema_id` es la versión del esquema de ID_Paciente (id_pacientes.py); por defecto
+    el 1 (ESP-AAAA-NNN) mientras quepa y el 2 (6 dígitos) a partir de 1000 pacientes.
+    """
+
+    salida = salida or plantilla
+    inicio = time.perf_counter()
+    comprobar_plantilla(plantilla)
+    mayor = max(total_espa, total_aps, 1)
+    esquema_id = esquema_id or esquema_para(mayor)
+    if mayor > max_secuencia(esquema_id):
+        raise ValueError(f"El esquema de ID {esquema_id} admite como mucho {max_secuencia(esquema_id)} "
+                         f"pacientes por patología; usa --esquema-id {esquema_para(mayor)}")
+    por_shards = semilla is not None or procesos > 1 or vectorizado
+    if por_shards and semilla is None:
+        semilla = int.from_bytes(os.urandom(4), 'big')
+
+    modo = 'streaming' if streaming else 'en memoria'
+    if vectorizado:
+        modo += ', vectorizado'
+    if por_shards:
+        modo += f', {procesos} proceso(s), semilla {semilla}'
+    print(f"Generando {total_espa} pacientes ESPA y {total_aps} pacientes APS "
+          f"({modo}) a partir de {plantilla}...")
+
+    executor = ProcessPoolExecutor(max_workers=procesos) if procesos > 1 else None
+    try:
+        if por_shards:
+            en_vuelo = 2 * procesos
+            generador = generar_shard
+            if vectorizado:
+                # NumPy solo se importa en este modo
+                from vectorized_mock_data import generar_shard_vectorizado
+                generador = partial(generar_shard_vectorizado, COLUMNAS_HOJA)
+            generador = partial(generador, esquema_id=esquema_id)
+            filas_espa = generar_filas_por_shards('espa', total_espa, *visitas_espa, semilla,
+                                                  executor, en_vuelo, codificar=streaming,
+                                                  generador=generador)
+            filas_aps = generar_filas_por_shards('aps', total_aps, *visitas_aps, semilla,
+                                                 executor, en_vuelo, codificar=streaming,
+                                                 generador=generador)
         else:
-            aine = random.choice(TRATAMIENTOS_APS['AINEs'])
-            bio = random.choice(TRATAMIENTOS_APS['Biológicos'])
-            datos_paciente['tratamiento_inicial'] = f"{aine} + {bio}"
-            datos_paciente['trat_sistemico'] = aine
-            datos_paciente['trat_sistemico_dosis'] = '500mg/12h'
-            datos_paciente['trat_fame'] = ''
-            datos_paciente['trat_fame_dosis'] = ''
-            datos_paciente['trat_biologico'] = bio.split()[0]
-            datos_paciente['trat_biologico_dosis'] = ' '.join(bio.split()[1:])
-
-        datos_paciente['fecha_inicio'] = fecha_primera.strftime('%Y-%m-%d')
-
-        # Primera visita
-        fila = generar_primera_visita_aps(paciente_id, nombre, sexo, fecha_primera, datos_paciente)
-        for col, valor in enumerate(fila, 1):
-            ws_aps.cell(row=row_aps, column=col, value=valor)
-        row_aps += 1
-        total_visitas_aps += 1
-
-        # Visitas de seguimiento
-        for v in range(1, num_visitas):
-            fecha_visita = fecha_primera + timedelta(days=random.randint(90 + v*90, 180 + v*90))
-
-            if random.random() < cambio_prob:
-                nuevo_trat = random.choice(TRATAMIENTOS_APS['Biológicos'])
-                datos_paciente['tratamiento_actual'] = nuevo_trat
-            else:
-                datos_paciente['tratamiento_actual'] = datos_paciente['tratamiento_inicial']
-
-            fila = generar_seguimiento_aps(paciente_id, nombre, sexo, fecha_visita, datos_paciente, None)
-            for col, valor in enumerate(fila, 1):
-                ws_aps.cell(row=row_aps, column=col, value=valor)
-            row_aps += 1
-            total_visitas_aps += 1
-
-    # Guardar archivo
-    print(f"Guardando Hub_Clinico_Maestro.xlsx...")
-    wb.save('Hub_Clinico_Maestro.xlsx')
+            filas_espa = generar_filas('espa', total_espa, *visitas_espa, esquema_id=esquema_id)
+            filas_aps = generar_filas('aps', total_aps, *visitas_aps, esquema_id=esquema_id)
+
+        if streaming:
+            totales = escribir_streaming(plantilla, salida, filas_espa, filas_aps)
+        else:
+            totales = escribir_en_memoria(plantilla, salida, filas_espa, filas_aps)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+
+    total_visitas_espa = totales['ESPA']
+    total_visitas_aps = totales['APS']
+    total_visitas = total_visitas_espa + total_visitas_aps
+    transcurrido = time.perf_counter() - inicio
 
     print("\n" + "="*60)
     print("✅ ÉXITO: Base de datos generada correctamente")
     print("="*60)
-    print(f"ESPA: {TOTAL_ESPA} pacientes, {total_visitas_espa} visitas")
-    print(f"APS:  {TOTAL_APS} pacientes, {total_visitas_aps} visitas")
-    print(f"TOTAL: {TOTAL_ESPA + TOTAL_APS} pacientes, {total_visitas_espa + total_visitas_aps} visitas")
+    print(f"ESPA: {total_espa} pacientes, {total_visitas_espa} visitas")
+    print(f"APS:  {total_aps} pacientes, {total_visitas_aps} visitas")
+    print(f"TOTAL: {total_espa + total_aps} pacientes, {total_visitas} visitas")
+    print(f"Tiempo: {transcurrido:.1f}s ({total_visitas / max(transcurrido, 1e-9):,.0f} visitas/s)")
     print("="*60)
 
+def _rango_visitas(valor):
+    """Parsea 'MIN-MAX' (o un único número) como rango de visitas por paciente"""
+    partes = valor.split('-')
+    try:
+        minimo, maximo = (int(partes[0]), int(partes[-1]))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Rango de visitas no válido: {valor!r} (formato MIN-MAX)")
+    if len(partes) > 2 or minimo < 1 or maximo < minimo:
+        raise argparse.ArgumentTypeError(f"Rango de visitas no válido: {valor!r} (formato MIN-MAX)")
+    return minimo, maximo
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Genera pacientes ficticios en Hub_Clinico_Maestro.xlsx (hojas ESPA y APS).')
+    parser.add_argument('--espa', type=int, default=TOTAL_ESPA,
+                        help=f'Número de pacientes ESPA (por defecto {TOTAL_ESPA})')
+    parser.add_argument('--aps', type=int, default=TOTAL_APS,
+                        help=f'Número de pacientes APS (por defecto {TOTAL_APS})')
+    parser.add_argument('--visitas-espa', type=_rango_visitas, default=(MIN_VISITS, MAX_VISITS), metavar='MIN-MAX',
+                        help=f'Visitas por paciente ESPA (por defecto {MIN_VISITS}-{MAX_VISITS})')
+    parser.add_argument('--visitas-aps', type=_rango_visitas, default=(MIN_VISITS, MAX_VISITS), metavar='MIN-MAX',
+                        help=f'Visitas por paciente APS (por defecto {MIN_VISITS}-{MAX_VISITS})')
+    parser.add_argument('--plantilla', default='Hub_Clinico_Maestro.xlsx',
+                        help='Libro con las cabeceras y catálogos (creado con create_excel.py)')
+    parser.add_argument('--salida', default=None,
+                        help='Ruta del libro generado (por defecto sobrescribe la plantilla)')
+    parser.add_argument('--streaming', action='store_true',
+                        help='Escritura write-only fila a fila con memoria constante (para 100k-1M visitas)')
+    parser.add_argument('--semilla', type=int, default=None,
+                        help='Semilla para una generación reproducible (mismo libro con cualquier nº de procesos)')
+    parser.add_argument('--procesos', type=int, default=1,
+                        help='Procesos generadores en paralelo (0 = todos los núcleos)')
+    parser.add_argument('--vectorizado', action='store_true',
+                        help='Sortea cada shard por columnas con NumPy (mucho más rápido; requiere numpy)')
+    parser.add_argument('--esquema-id', type=int, choices=sorted(ANCHOS), default=None,
+                        help='Esquema de ID_Paciente: 1 = ESP-AAAA-NNN, 2 = ESP-AAAA-NNNNNN '
+                             '(por defecto 1 hasta 999 pacientes por patología y 2 a partir de ahí)')
+    args = parser.parse_args(argv)
+    if args.procesos <= 0:
+        args.procesos = os.cpu_count() or 1
+    return args
+
 if __name__ == '__main__':
-    generar_base_datos()
+    args = parse_args()
+    generar_base_datos(total_espa=args.espa, total_aps=args.aps,
+                       visitas_espa=args.visitas_espa, visitas_aps=args.visitas_aps,
+                       plantilla=args.plantilla, salida=args.salida, streaming=args.streaming,
+                       semilla=args.semilla, procesos=args.procesos, vectorizado=args.vectorizado,
+                       esquema_id=args.esquema_id)
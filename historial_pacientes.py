@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Historial de tratamientos y eventos clave de todos los pacientes en una sola pasada
+
+El dashboard llama a extractTreatmentHistory y extractKeyEvents (modules/dataManager.js)
+paciente a paciente, y cada llamada necesita antes getPatientHistory: filtrar la hoja
+completa y ordenar con parseVisitDate, O(pacientes × visitas). Este script ordena todas
+las visitas una vez por (paciente, fecha), calcula las comparaciones entre visitas
+consecutivas por columnas y recorre los grupos en una única pasada lineal, O(n log n).
+
+La semántica es la de dataManager.js (incluido que la visita más reciente no se compara
+con la anterior y que un 0 en `x || alias` cuenta como vacío); los alias de formulario
+(biologicoSelect, motivoCambio, efectosAdversos, RAPID3...) se resuelven con sus columnas
+del Excel (Trat_Biologico, Cambio_Motivo, Cambio_Descripcion_Efectos, RAPID3_Score...).
+
+Uso:
+    python historial_pacientes.py Hub_Clinico_Maestro.xlsx
+    python historial_pacientes.py Hub_Clinico_Maestro.xlsx --paciente ESP-2024-003
+"""
+
+import argparse
+import json
+import os
+import time
+from decimal import ROUND_HALF_UP, Decimal
+
+import numpy as np
+
+from column_schema import HOJAS_DATOS
+from columnar_cache import FECHA_NULA, cargar, hash_libro
+from score_engine import CORTES, a_numeros
+from xlsx_reader import LIBRO_MAESTRO
+from xlsx_streaming import guardar_json
+
+VERSION_HISTORIAL = 1
+
+# ================ ALIAS (dataManager.js → Excel) ================
+
+# tratamientoActual || biologicoSelect || fameSelect || sistemicoSelect
+ALIAS_TRATAMIENTO = ('Tratamiento_Actual', 'Trat_Biologico', 'Trat_FAME', 'Trat_Sistemico')
+# biologicoSelect || fameSelect || sistemicoSelect (cambios de tratamiento)
+ALIAS_CAMBIO = ('Trat_Biologico', 'Trat_FAME', 'Trat_Sistemico')
+# motivoCambio || comentariosAdicionales
+ALIAS_MOTIVO = ('Cambio_Motivo', 'Comentarios_Adicionales')
+# efectosAdversos
+ALIAS_EFECTOS = ('Cambio_Descripcion_Efectos',)
+MOTIVO_POR_DEFECTO = 'Tratamiento activo'
+
+# Brotes por patología, en el orden en que los prueba extractKeyEvents:
+# (columna, subida mínima respecto a la visita anterior, decimales, etiqueta)
+REGLAS_BROTE = {
+    'espa': (('BASDAI_Result', 2, 1, 'BASDAI'), ('ASDAS_CRP_Result', 0.8, 2, 'ASDAS')),
+    'aps': (('HAQ_Total', 0.5, 2, 'HAQ'), ('RAPID3_Score', 2, 1, 'RAPID3')),
+}
+# Remisión: (columna, corte de activityCutoffs, decimales, texto)
+REGLAS_REMISION = {
+    'espa': ('BASDAI_Result', CORTES['basdai']['remission'], 1, 'BASDAI baja'),
+    'aps': ('HAQ_Total', CORTES['haq']['remission'], 2, 'HAQ en remisión'),
+}
+
+# ================ COLUMNAS ================
+
+def _primero(tabla, columnas):
+    """`a || b || ...` por visita sobre columnas de texto (None si todas están vacías)"""
+    resultado = np.full(len(tabla), None, dtype=object)
+    for columna in reversed(columnas):
+        if columna in tabla:
+            valores = tabla[columna]
+            llenos = (tabla.codigos(columna) >= 0) & (valores != '')
+            resultado[llenos] = valores[llenos]
+    return resultado
+
+def _numero(tabla, columna):
+    """parseFloat(x || alias): NaN en vacíos, textos no numéricos y ceros"""
+    if columna not in tabla:
+        return np.full(len(tabla), np.nan)
+    valores = a_numeros(tabla[columna]).copy()
+    valores[valores == 0] = np.nan
+    return valores
+
+def _fijo(valor, decimales):
+    """Number.toFixed: redondeo del valor binario exacto, con las mitades hacia arriba"""
+    return str(Decimal(float(valor)).quantize(Decimal(1).scaleb(-decimales), ROUND_HALF_UP))
+
+# ================ EXTRACCIÓN ================
+
+def extraer(tablas, hoy=None):
+    """
+    {ID_Paciente: {pathology, visitas, firstVisit, latestVisit, treatmentHistory, keyEvents}}
+    a partir de {hoja: TablaColumnar}. Las visitas sin fecha se ordenan como si fueran de
+    hoy (parseVisitDate devuelve new Date()).
+    """
+    hoy = np.datetime64(hoy or 'today', 'D').astype(np.int64)
+    columnas = {'id': [], 'dias': [], 'hoja': [], 'tratamiento': [], 'cambio': [], 'motivo': [], 'efectos': []}
+    numeros = {columna: [] for reglas in REGLAS_BROTE.values() for columna, *_ in reglas}
+    for n_hoja, (hoja, tabla) in enumerate(tablas.items()):
+        columnas['id'].append(tabla['ID_Paciente'])
+        columnas['dias'].append(tabla['Fecha_Visita'] if 'Fecha_Visita' in tabla
+                                else np.full(len(tabla), FECHA_NULA, dtype=np.int32))
+        columnas['hoja'].append(np.full(len(tabla), n_hoja, dtype=np.int8))
+        columnas['tratamiento'].append(_primero(tabla, ALIAS_TRATAMIENTO))
+        columnas['cambio'].append(_primero(tabla, ALIAS_CAMBIO))
+        columnas['motivo'].append(_primero(tabla, ALIAS_MOTIVO))
+        columnas['efectos'].append(_primero(tabla, ALIAS_EFECTOS))
+        for columna in numeros:
+            numeros[columna].append(_numero(tabla, columna))
+    nombres_hoja = [hoja.lower() for hoja in tablas]
+    if not nombres_hoja:
+        return {}
+    columnas = {clave: np.concatenate(partes) for clave, partes in columnas.items()}
+    numeros = {clave: np.concatenate(partes) for clave, partes in numeros.items()}
+
+    # Orden único por (paciente, fecha); con fechas iguales, el orden inverso al de la
+    # hoja, que es como quedan tras el sort estable descendente de getPatientHistory
+    con_id = np.flatnonzero((columnas['id'] != None) & (columnas['id'] != ''))  # noqa: E711
+    ids, codigo_id = np.unique(columnas['id'][con_id].astype(str), return_inverse=True)
+    dias = columnas['dias'][con_id].astype(np.int64)
+    dias[dias == FECHA_NULA] = hoy
+    orden = np.lexsort((-con_id, dias, codigo_id))
+    filas = con_id[orden]
+    paciente = codigo_id[orden]
+    dias = dias[orden]
+    n = len(filas)
+
+    inicio_grupo = np.ones(n, dtype=bool)
+    inicio_grupo[1:] = paciente[1:] != paciente[:-1]
+    fin_grupo = np.ones(n, dtype=bool)
+    fin_grupo[:-1] = inicio_grupo[1:]
+    inicios = np.flatnonzero(inicio_grupo)
+    tamanos = np.diff(np.append(inicios, n))
+    # getPatientHistory: la patología es la de la primera hoja con visitas del paciente
+    patologia_paciente = np.full(len(ids), len(nombres_hoja), dtype=np.int8)
+    np.minimum.at(patologia_paciente, paciente, columnas['hoja'][filas])
+    patologia = patologia_paciente[paciente]
+    # extractKeyEvents compara visits[i] con visits[i + 1] solo para i > 0: ni la primera
+    # ni la última visita cronológica tienen "visita anterior"
+    compara = ~inicio_grupo & ~fin_grupo
+    con_eventos = np.repeat(tamanos >= 2, tamanos)
+
+    def anterior(valores):
+        previo = np.empty_like(valores)
+        previo[1:] = valores[:-1]
+        previo[:1] = valores[:1]
+        return previo
+
+    cambio = columnas['cambio'][filas]
+    cambio_previo = anterior(cambio)
+    es_cambio = compara & (cambio != None) & (cambio_previo != None) & (cambio != cambio_previo)  # noqa: E711
+    efectos = columnas['efectos'][filas]
+    es_adverso = con_eventos & (efectos != None)  # noqa: E711
+
+    brote = np.full(n, -1, dtype=np.int8)
+    remision = np.zeros(n, dtype=bool)
+    valores = {columna: numeros[columna][filas] for columna in numeros}
+    previos = {columna: anterior(valores[columna]) for columna in valores}
+    for n_hoja, nombre in enumerate(nombres_hoja):
+        de_hoja = compara & (patologia == n_hoja)
+        for n_regla, (columna, subida, _, _) in enumerate(REGLAS_BROTE.get(nombre, ())):
+            with np.errstate(invalid='ignore'):
+                sube = valores[columna] > previos[columna] + subida
+            brote[de_hoja & (brote < 0) & sube] = n_regla
+        if nombre in REGLAS_REMISION:
+            columna, corte, _, _ = REGLAS_REMISION[nombre]
+            with np.errstate(invalid='ignore'):
+                remision |= de_hoja & (valores[columna] < corte) & (previos[columna] >= corte)
+
+    # Primera aparición de cada (paciente, tratamiento) en orden cronológico
+    tratamiento = columnas['tratamiento'][filas]
+    con_tratamiento = np.flatnonzero(tratamiento != None)  # noqa: E711
+    _, codigo_tratamiento = np.unique(tratamiento[con_tratamiento].astype(str), return_inverse=True)
+    clave = paciente[con_tratamiento].astype(np.int64) * (int(codigo_tratamiento.max(initial=0)) + 1) + codigo_tratamiento
+    _, primeras = np.unique(clave, return_index=True)
+    inicio_tratamiento = np.zeros(n, dtype=bool)
+    inicio_tratamiento[con_tratamiento[primeras]] = True
+
+    fechas = np.where(columnas['dias'][filas] == FECHA_NULA, None,
+                      dias.astype('datetime64[D]').astype(str).astype(object))
+    motivos = columnas['motivo'][filas]
+    historial = {}
+    for inicio, tamano in zip(inicios.tolist(), tamanos.tolist()):
+        historial[str(ids[paciente[inicio]])] = {
+            'pathology': nombres_hoja[patologia[inicio]],
+            'visitas': tamano,
+            'firstVisit': fechas[inicio],
+            'latestVisit': fechas[inicio + tamano - 1],
+            'treatmentHistory': [],
+            'keyEvents': [],
+        }
+
+    # Única pasada por las visitas que aportan algo al historial o a los eventos
+    actual = None
+    for i in np.flatnonzero(inicio_tratamiento | es_cambio | es_adverso | (brote >= 0) | remision).tolist():
+        if actual is None or paciente[i] != paciente[actual]:
+            registro = historial[str(ids[paciente[i]])]
+            actual = i
+        fecha = fechas[i]
+        if inicio_tratamiento[i]:
+            registro['treatmentHistory'].append({'startDate': fecha, 'name': tratamiento[i],
+                                                 'reason': motivos[i] or MOTIVO_POR_DEFECTO})
+        eventos = registro['keyEvents']
+        if es_cambio[i]:
+            eventos.append({'date': fecha, 'type': 'treatment',
+                            'description': f'Cambio de tratamiento: {cambio_previo[i]} → {cambio[i]}'})
+        if es_adverso[i]:
+            eventos.append({'date': fecha, 'type': 'adverse', 'description': efectos[i]})
+        nombre = nombres_hoja[patologia[i]]
+        if brote[i] >= 0:
+            columna, _, decimales, etiqueta = REGLAS_BROTE[nombre][int(brote[i])]
+            eventos.append({'date': fecha, 'type': 'flare',
+                            'description': f'Brote clínico detectado: {etiqueta} ↑ '
+                                           f'({_fijo(previos[columna][i], decimales)} → '
+                                           f'{_fijo(valores[columna][i], decimales)})'})
+        if remision[i]:
+            columna, _, decimales, texto = REGLAS_REMISION[nombre]
+            eventos.append({'date': fecha, 'type': 'remission',
+                            'description': f'Remisión clínica alcanzada: {texto} '
+                                           f'({_fijo(valores[columna][i], decimales)})'})
+    return historial
+
+# ================ ARTEFACTO ================
+
+def ruta_historial(libro):
+    return os.path.splitext(os.fspath(libro))[0] + '.historial.json'
+
+def construir_historial(libro=LIBRO_MAESTRO, hojas=HOJAS_DATOS, hoy=None):
+    tablas = cargar(libro, hojas)
+    return {
+        'version': VERSION_HISTORIAL,
+        'libro': os.path.basename(libro),
+        'sha256': hash_libro(libro),
+        'pacientes': extraer(tablas, hoy),
+    }
+
+def guardar_historial(contenido, ruta):
+    guardar_json(contenido, ruta, separators=(',', ':'))
+
+def cargar_historial(ruta, libro=None):
+    """Lee el artefacto; con `libro` comprueba además que corresponde a ese libro (sha256)"""
+    with open(ruta, encoding='utf-8') as f:
+        contenido = json.load(f)
+    if contenido.get('version') != VERSION_HISTORIAL:
+        raise ValueError(f"Versión de historial no soportada en {ruta}: {contenido.get('version')}")
+    if libro is not None and hash_libro(libro) != contenido['sha256']:
+        raise ValueError(f"El historial {ruta} no corresponde a {libro}: vuelve a generarlo")
+    return contenido
+
+# ================ CLI ================
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Precalcula historial de tratamientos y eventos clave de todos los pacientes')
+    parser.add_argument('libro', nargs='?', default=LIBRO_MAESTRO)
+    parser.add_argument('--salida', help='Ruta del JSON (por defecto <libro>.historial.json)')
+    parser.add_argument('--paciente', help='Muestra el historial de un paciente')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    inicio = time.perf_counter()
+    contenido = construir_historial(args.libro)
+    salida = args.salida or ruta_historial(args.libro)
+    guardar_historial(contenido, salida)
+    pacientes = contenido['pacientes']
+    eventos = {}
+    for registro in pacientes.values():
+        for evento in registro['keyEvents']:
+            eventos[evento['type']] = eventos.get(evento['type'], 0) + 1
+    resumen = ', '.join(f'{tipo}: {total}' for tipo, total in sorted(eventos.items())) or 'ninguno'
+    print(f"{salida}: {len(pacientes)} pacientes, eventos {resumen} ({time.perf_counter() - inicio:.1f}s)")
+    if args.paciente:
+        print(json.dumps(pacientes.get(args.paciente), ensure_ascii=False, indent=2))
+
+if __name__ == '__main__':
+    main()
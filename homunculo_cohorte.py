@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Matriz de afectación articular empaquetada en bits y mapa de calor del homúnculo por cohorte
+
+Cada visita guarda la afectación como SI/NO en 28 columnas NAD_*, 28 NAT_* y 20 DACT_*
+(expandirArticulaciones / expandirDactilitis en exportManager.js), y contarlas exige
+una comprobación por región y visita. Aquí cada modo (nad, nat, dactilitis) es una
+matriz regiones × visitas de bits empaquetados (un bitmap por región, con la misma
+numeración global que MotorCohortes: ESPA primero y después APS) en el orden de ARTICULATIONS / DACTILITIS de generate_mock_data.py, que es también el
+de HOMUNCULUS_ARTICULATIONS y los data-region-id del SVG.
+
+Los totales por visita (NAD/NAT/dactilitis) salen al construir la matriz. La frecuencia
+de cada región en una cohorte es popcount(bitmap de la región & bitmap de la cohorte):
+una operación vectorizada sobre n/8 bytes por región, así que cambiar de filtro solo
+repite esa pasada. Las regiones del SVG sin columna en el libro (caderas, tobillos) no
+aparecen en el resultado.
+
+El resultado se guarda como JSON, o como script (window.HubHomunculusOverlay = {...};)
+con --salida *.js, que estadisticas.html carga si existe y pinta con
+HubTools.homunculus.applyCohortOverlay en un homúnculo de solo lectura.
+
+Uso:
+    python homunculo_cohorte.py Hub_Clinico_Maestro.xlsx
+    python homunculo_cohorte.py Hub_Clinico_Maestro.xlsx --filtro pathology=APS --salida homunculo_cohorte.js
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from column_schema import COLUMNAS_DACT, COLUMNAS_NAD, COLUMNAS_NAT, HOJAS_DATOS
+from columnar_cache import cargar
+from generate_mock_data import ARTICULATIONS, DACTILITIS
+from motor_cohortes import Cohorte, MotorCohortes
+from xlsx_reader import LIBRO_MAESTRO
+from xlsx_streaming import escribir_atomico
+
+FORMATO = 'hub-homunculo'
+VERSION_OVERLAY = 1
+
+# Modo del homúnculo → (data-region-id, columna del libro), en el orden de homunculus.js
+MODOS = {
+    'nad': tuple(zip(ARTICULATIONS, COLUMNAS_NAD)),
+    'nat': tuple(zip(ARTICULATIONS, COLUMNAS_NAT)),
+    'dactilitis': tuple(zip(DACTILITIS, COLUMNAS_DACT)),
+}
+# Columna de total que guarda el libro para cada modo
+COLUMNAS_TOTAL = {'nad': 'NAD_Total', 'nat': 'NAT_Total', 'dactilitis': 'Dactilitis_Total'}
+
+_BITS_BYTE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+def popcount(bits, axis=None):
+    """Bits a 1 de un array uint8 (sumados a lo largo de `axis`)"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(bits).sum(axis=axis, dtype=np.int64)
+    return _BITS_BYTE[bits].sum(axis=axis, dtype=np.int64)
+
+# ================ MATRIZ ================
+
+class MatrizArticular:
+    """Bitmaps por región de NAD, NAT y dactilitis sobre las visitas de ESPA y APS"""
+
+    def __init__(self, tablas):
+        self.hojas = []
+        inicio = 0
+        for hoja, tabla in tablas.items():
+            self.hojas.append((hoja, inicio, inicio + len(tabla)))
+            inicio += len(tabla)
+        self.n = inicio
+        self.bits = {}
+        self.totales = {}
+        self.discrepancias = {}
+        for modo, regiones in MODOS.items():
+            marcas = np.zeros((len(regiones), self.n), dtype=bool)
+            for tabla, (_, desde, hasta) in zip(tablas.values(), self.hojas):
+                for fila, (_, columna) in enumerate(regiones):
+                    if columna in tabla:
+                        marcas[fila, desde:hasta] = tabla[columna]
+            self.bits[modo] = np.packbits(marcas, axis=1, bitorder='little')
+            self.totales[modo] = marcas.sum(axis=0, dtype=np.int16)
+            self.discrepancias[modo] = self._discrepancias(tablas, COLUMNAS_TOTAL[modo], self.totales[modo])
+
+    @classmethod
+    def desde_libro(cls, libro=LIBRO_MAESTRO, hojas=HOJAS_DATOS):
+        return cls(cargar(libro, hojas))
+
+    def _discrepancias(self, tablas, columna, totales):
+        """Visitas cuyo total guardado en el libro no coincide con las regiones marcadas"""
+        guardados = np.concatenate([tabla[columna] if columna in tabla else np.full(len(tabla), np.nan)
+                                    for tabla in tablas.values()] or [np.empty(0)])
+        return int(np.count_nonzero(~np.isnan(guardados) & (guardados != totales)))
+
+    def _bitmap(self, cohorte):
+        """Bitmap empaquetado de una Cohorte, una máscara booleana o un bitmap ya empaquetado (None = todas)"""
+        if cohorte is None:
+            return None
+        if isinstance(cohorte, Cohorte):
+            return cohorte.bitmap
+        cohorte = np.asarray(cohorte)
+        if cohorte.dtype == bool:
+            return np.packbits(cohorte, bitorder='little')
+        return cohorte.astype(np.uint8, copy=False)
+
+    def _mascara(self, bitmap):
+        if bitmap is None:
+            return np.ones(self.n, dtype=bool)
+        return np.unpackbits(bitmap, count=self.n, bitorder='little').astype(bool)
+
+    def recuentos(self, modo, cohorte=None):
+        """Visitas de la cohorte con cada región marcada (popcount de bitmap & cohorte por región)"""
+        bitmap = self._bitmap(cohorte)
+        bits = self.bits[modo] if bitmap is None else self.bits[modo] & bitmap
+        return popcount(bits, axis=1)
+
+    def mapa_calor(self, cohorte=None):
+        """
+        {modo: {'regiones', 'recuentos', 'frecuencias', 'media', 'histograma'}} de la cohorte;
+        histograma[k] = visitas con k regiones marcadas
+        """
+        bitmap = self._bitmap(cohorte)
+        visitas = self.n if bitmap is None else int(popcount(bitmap))
+        mascara = self._mascara(bitmap)
+        resultado = {}
+        for modo, regiones in MODOS.items():
+            recuentos = self.recuentos(modo, bitmap)
+            totales = self.totales[modo][mascara]
+            resultado[modo] = {
+                'regiones': [region for region, _ in regiones],
+                'recuentos': recuentos.tolist(),
+                'frecuencias': np.round(recuentos / visitas, 4).tolist() if visitas else [0.0] * len(regiones),
+                'media': round(float(totales.mean()), 3) if visitas else None,
+                'histograma': np.bincount(totales, minlength=len(regiones) + 1).tolist(),
+            }
+        return resultado, visitas
+
+# ================ OVERLAY ================
+
+def construir_overlay(matriz, cohorte=None, filtros=None, libro=None):
+    modos, visitas = matriz.mapa_calor(cohorte)
+    return {
+        'formato': FORMATO, 'version': VERSION_OVERLAY,
+        'libro': os.path.basename(os.fspath(libro)) if libro else None,
+        'filtros': filtros or {},
+        'visitas': visitas,
+        'modos': modos,
+    }
+
+def ruta_overlay(libro):
+    return os.path.splitext(os.fspath(libro))[0] + '.homunculo.json'
+
+def guardar_overlay(overlay, ruta):
+    """JSON, o script que asigna window.HubHomunculusOverlay si la ruta acaba en .js"""
+    contenido = json.dumps(overlay, ensure_ascii=False, separators=(',', ':'))
+    if ruta.lower().endswith('.js'):
+        contenido = f'window.HubHomunculusOverlay = {contenido};\n'
+    escribir_atomico(ruta, lambda f: f.write(contenido))
+
+# ================ CLI ================
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Mapa de calor del homúnculo (NAD, NAT, dactilitis) de una cohorte')
+    parser.add_argument('libro', nargs='?', default=LIBRO_MAESTRO)
+    parser.add_argument('--filtro', action='append', default=[], metavar='CLAVE=VALOR',
+                        help='Filtro de estadisticas.html (p. ej. pathology=APS, ttoType=biologicos)')
+    parser.add_argument('--salida', help='Overlay (por defecto <libro>.homunculo.json; *.js para <script>)')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    inicio = time.perf_counter()
+    tablas = cargar(args.libro, HOJAS_DATOS)
+    matriz = MatrizArticular(tablas)
+    filtros = dict(filtro.split('=', 1) for filtro in args.filtro)
+    cohorte = MotorCohortes(tablas).filtrar(filtros) if filtros else None
+    construido = time.perf_counter()
+    overlay = construir_overlay(matriz, cohorte, filtros, args.libro)
+    calculado = time.perf_counter()
+    salida = args.salida or ruta_overlay(args.libro)
+    guardar_overlay(overlay, salida)
+
+    print(f"Matriz de {matriz.n} visitas × {sum(len(r) for r in MODOS.values())} regiones "
+          f"({sum(b.nbytes for b in matriz.bits.values()) / 1024:,.0f}KB) en {construido - inicio:.2f}s")
+    print(f"Cohorte: {overlay['visitas']} visitas, mapa de calor en {(calculado - construido) * 1000:.1f}ms")
+    for modo, datos in overlay['modos'].items():
+        mas_frecuente = max(range(len(datos['regiones'])), key=datos['recuentos'].__getitem__)
+        print(f"  {modo}: media {datos['media']}, más frecuente {datos['regiones'][mas_frecuente]} "
+              f"({datos['frecuencias'][mas_frecuente]:.1%})")
+        if matriz.discrepancias[modo]:
+            print(f"    {matriz.discrepancias[modo]} visitas con {COLUMNAS_TOTAL[modo]} distinto de las regiones marcadas")
+    print(f"Overlay: {salida}")
+
+if __name__ == '__main__':
+    main()
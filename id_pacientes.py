@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Esquema versionado de ID_Paciente: <ESP|APS>-<AAAA>-<secuencia>
+
+Esquema 1 (el original): secuencia de 3 dígitos, como mucho 999 pacientes por patología
+y año. Esquema 2: secuencia de 6 dígitos con ceros a la izquierda (hasta 999.999), de
+ancho fijo para que los ID sigan ordenándose bien como texto. Los dos esquemas conviven:
+PATRON_ID acepta ambos y es el mismo patrón que PATIENT_ID_REGEX en
+scripts/script_dashboard_search.js.
+
+generate_mock_data asigna la secuencia a partir del índice del paciente (índice + 1).
+Cada shard genera un rango de índices distinto, así que los ID no colisionan aunque los
+shards se generen en procesos separados y sin coordinación. AsignadorIds da secuencias
+libres por (código, año) para los ID que hay que crear o migrar en un libro existente.
+"""
+
+import re
+
+CODIGOS = {'espa': 'ESP', 'aps': 'APS'}
+# Dígitos de la secuencia por versión del esquema
+ANCHOS = {1: 3, 2: 6}
+ESQUEMA_ACTUAL = 2
+
+PATRON_ID = re.compile(r'^(ESP|APS)-(\d{4})-(\d{3}|\d{6})$', re.IGNORECASE)
+# ID con el prefijo y el año reconocibles pero secuencia de cualquier ancho (p. ej. ESP-2024-1234)
+_PATRON_LAXO = re.compile(r'^\s*(ESP|APS)-(\d{4})-(\d+)\s*$', re.IGNORECASE)
+
+def max_secuencia(esquema):
+    return 10 ** ANCHOS[esquema] - 1
+
+def esquema_para(secuencia_maxima):
+    """Esquema más antiguo en el que cabe la secuencia (1 mientras no pase de 999)"""
+    for esquema in sorted(ANCHOS):
+        if secuencia_maxima <= max_secuencia(esquema):
+            return esquema
+    raise ValueError(f"Ningún esquema de ID admite la secuencia {secuencia_maxima}")
+
+def formatear_id(codigo, anio, secuencia, esquema=ESQUEMA_ACTUAL):
+    """ID de paciente; `codigo` es ESP/APS o la patología (espa/aps)"""
+    codigo = CODIGOS.get(codigo, codigo)
+    if not 1 <= secuencia <= max_secuencia(esquema):
+        raise ValueError(f"La secuencia {secuencia} no cabe en el esquema de ID {esquema} "
+                         f"(1-{max_secuencia(esquema)})")
+    return f"{codigo}-{anio:04d}-{secuencia:0{ANCHOS[esquema]}d}"
+
+def analizar_id(texto):
+    """(codigo, anio, secuencia, esquema) de un ID válido; None si no sigue ningún esquema"""
+    coincidencia = PATRON_ID.match(str(texto or '').strip())
+    if not coincidencia:
+        return None
+    codigo, anio, secuencia = coincidencia.groups()
+    esquema = next(e for e, ancho in ANCHOS.items() if ancho == len(secuencia))
+    return codigo.upper(), int(anio), int(secuencia), esquema
+
+def analizar_id_laxo(texto):
+    """(codigo, anio, secuencia) también para secuencias de otro ancho; None si no hay prefijo y año"""
+    coincidencia = _PATRON_LAXO.match(str(texto or ''))
+    if not coincidencia:
+        return None
+    codigo, anio, secuencia = coincidencia.groups()
+    return codigo.upper(), int(anio), int(secuencia)
+
+class AsignadorIds:
+    """
+    Secuencias libres por (código, año). Se reservan primero los ID existentes y
+    `siguiente` devuelve después la secuencia libre más baja.
+    """
+
+    def __init__(self, esquema=ESQUEMA_ACTUAL):
+        self.esquema = esquema
+        self.usadas = {}
+        self.proximas = {}
+
+    def reservar(self, codigo, anio, secuencia):
+        """True si la secuencia estaba libre"""
+        usadas = self.usadas.setdefault((codigo, anio), set())
+        if secuencia in usadas:
+            return False
+        usadas.add(secuencia)
+        return True
+
+    def siguiente(self, codigo, anio):
+        clave = (codigo, anio)
+        usadas = self.usadas.setdefault(clave, set())
+        secuencia = self.proximas.get(clave, 1)
+        while secuencia in usadas:
+            secuencia += 1
+        if secuencia > max_secuencia(self.esquema):
+            raise ValueError(f"No quedan ID libres para {codigo}-{anio} en el esquema {self.esquema}")
+        usadas.add(secuencia)
+        self.proximas[clave] = secuencia + 1
+        return formatear_id(codigo, anio, secuencia, self.esquema)
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Índice de búsqueda de pacientes para dashboard_search
+
+addPatientToIndex (scripts/script_dashboard_search.js) recibe cada visita de
+getAllPatients y, para descartar duplicados, normaliza de nuevo el ID de todas las
+entradas ya indexadas: construir el índice es cuadrático en el número de visitas.
+Este script genera el índice ya hecho, con una entrada por paciente, las claves ya
+normalizadas (igual que normalize() en JS) y un índice de trigramas para buscar
+fragmentos de nombre o ID sin recorrer todos los pacientes.
+
+Contrato (versión 1):
+    {"formato": "hub-busqueda", "version": 1, "libro": ..., "sha256": ..., "pacientes": n,
+     "ids": [...], "nombres": [...], "patologias": ['espa'|'aps'|null, ...],
+     "claves_id": [...], "claves_nombre": [...],                  # normalize(id), normalize(nombre)
+     "ngramas": {"n": 3, "listas": {trigrama: base64}}}
+
+Los pacientes van ordenados por ID. Cada lista son las posiciones de los pacientes
+cuyo ID o nombre normalizado contiene el trigrama, en orden creciente, como
+diferencias con la anterior (la primera con 0), en zigzag + varint LEB128 (el mismo
+formato que las columnas numéricas de paquete_compacto.py) y en base64. Las
+coincidencias de una consulta de 3 o más caracteres están en la intersección de las
+listas de sus trigramas; hay que confirmarlas contra las claves.
+
+Con --salida *.js se escribe como script (window.HubSearchIndex = {...};) para cargarlo
+con <script> desde dashboard_search.html también al abrirlo como file://.
+
+Uso:
+    python indice_busqueda.py Hub_Clinico_Maestro.xlsx
+    python indice_busqueda.py Hub_Clinico_Maestro.xlsx --salida busqueda_pacientes.js
+    python indice_busqueda.py Hub_Clinico_Maestro.xlsx --buscar "garcia"
+"""
+
+import argparse
+import base64
+import json
+import os
+import re
+import time
+import unicodedata
+import zipfile
+
+from column_schema import HOJAS_DATOS
+from columnar_cache import hash_libro
+from compactar_maestro import normalizar_fecha
+from paquete_compacto import codificar_varint, decodificar_varint
+from xlsx_reader import LIBRO_MAESTRO, iter_visits
+from xlsx_streaming import escribir_atomico, localizar_hojas
+
+FORMATO = 'hub-busqueda'
+VERSION_INDICE = 1
+NGRAMA = 3
+
+_DIACRITICOS = re.compile('[\u0300-\u036f]')
+_NO_ALFANUMERICO = re.compile('[^a-z0-9]')
+
+# ================ NORMALIZACIÓN ================
+
+def normalizar(texto):
+    """Equivalente de normalize() en script_dashboard_search.js"""
+    texto = unicodedata.normalize('NFD', str(texto or '').lower())
+    return _NO_ALFANUMERICO.sub('', _DIACRITICOS.sub('', texto))
+
+def trigramas(clave, n=NGRAMA):
+    return {clave[i:i + n] for i in range(len(clave) - n + 1)}
+
+# ================ CONSTRUCCIÓN ================
+
+def _pacientes(libro, hojas):
+    """{clave_id: (id, nombre, patologia)}; el nombre es el de la visita más reciente que lo tiene"""
+    pacientes = {}
+    fechas = {}
+    for hoja in hojas:
+        columnas = ['ID_Paciente', 'Nombre_Paciente', 'Diagnostico_Primario', 'Fecha_Visita']
+        for id_paciente, nombre, diagnostico, fecha in iter_visits(hoja, columnas, workbook=libro):
+            clave = normalizar(id_paciente)
+            if not clave:
+                continue
+            id_paciente = str(id_paciente).strip()
+            nombre = str(nombre).strip() if nombre not in (None, '') else ''
+            patologia = str(diagnostico or hoja).strip().lower() or None
+            fecha = str(normalizar_fecha(fecha)) if fecha not in (None, '') else ''
+            actual = pacientes.get(clave)
+            if actual is None:
+                pacientes[clave] = (id_paciente, nombre, patologia)
+                fechas[clave] = fecha if nombre else ''
+            elif nombre and (not actual[1] or fecha >= fechas[clave]):
+                pacientes[clave] = (actual[0], nombre, actual[2] or patologia)
+                fechas[clave] = fecha
+    return pacientes
+
+def construir_indice(libro=LIBRO_MAESTRO, hojas=HOJAS_DATOS):
+    with zipfile.ZipFile(libro) as zf:
+        disponibles = localizar_hojas(zf)
+    pacientes = _pacientes(libro, [hoja for hoja in hojas if hoja in disponibles])
+    orden = sorted(pacientes.values(), key=lambda paciente: paciente[0])
+    claves_id = [normalizar(id_paciente) for id_paciente, _, _ in orden]
+    claves_nombre = [normalizar(nombre) for _, nombre, _ in orden]
+
+    listas = {}
+    for posicion, (clave_id, clave_nombre) in enumerate(zip(claves_id, claves_nombre)):
+        for trigrama in trigramas(clave_id) | trigramas(clave_nombre):
+            listas.setdefault(trigrama, []).append(posicion)
+    codificadas = {}
+    for trigrama in sorted(listas):
+        posiciones = listas[trigrama]
+        deltas = [posiciones[0]] + [b - a for a, b in zip(posiciones, posiciones[1:])]
+        codificadas[trigrama] = base64.b64encode(codificar_varint(deltas)).decode('ascii')
+
+    return {
+        'formato': FORMATO, 'version': VERSION_INDICE,
+        'libro': os.path.basename(os.fspath(libro)), 'sha256': hash_libro(libro),
+        'pacientes': len(orden),
+        'ids': [id_paciente for id_paciente, _, _ in orden],
+        'nombres': [nombre or 'Paciente sin nombre' for _, nombre, _ in orden],
+        'patologias': [patologia for _, _, patologia in orden],
+        'claves_id': claves_id,
+        'claves_nombre': claves_nombre,
+        'ngramas': {'n': NGRAMA, 'listas': codificadas},
+    }
+
+def ruta_indice(libro):
+    return os.path.splitext(os.fspath(libro))[0] + '.busqueda.json'
+
+def guardar_indice(indice, ruta):
+    """JSON, o script que asigna window.HubSearchIndex si la ruta acaba en .js"""
+    contenido = json.dumps(indice, ensure_ascii=False, separators=(',', ':'))
+    if ruta.lower().endswith('.js'):
+        contenido = f'window.HubSearchIndex = {contenido};\n'
+    escribir_atomico(ruta, lambda f: f.write(contenido))
+
+# ================ CONSULTA ================
+
+def _posiciones(indice, trigrama):
+    texto = indice['ngramas']['listas'].get(trigrama)
+    if texto is None:
+        return []
+    datos = base64.b64decode(texto)
+    # Cada varint termina en un byte < 0x80
+    deltas = decodificar_varint(datos, sum(1 for byte in datos if byte < 0x80))
+    posiciones, actual = [], 0
+    for delta in deltas:
+        actual += int(delta)
+        posiciones.append(actual)
+    return posiciones
+
+def buscar(indice, termino, limite=10):
+    """
+    Referencia de la búsqueda de dashboard_search: posiciones de los pacientes cuyo ID o
+    nombre normalizado contiene el término, primero el ID exacto, después los prefijos de
+    ID y de nombre y al final el resto, cada grupo por ID
+    """
+    consulta = normalizar(termino)
+    if not consulta:
+        return []
+    n = indice['ngramas']['n']
+    if len(consulta) >= n:
+        candidatas = None
+        for lista in sorted((_posiciones(indice, t) for t in trigramas(consulta, n)), key=len):
+            candidatas = set(lista) if candidatas is None else candidatas & set(lista)
+            if not candidatas:
+                return []
+        candidatas = sorted(candidatas)
+    else:
+        candidatas = range(indice['pacientes'])
+    resultados = []
+    for posicion in candidatas:
+        clave_id, clave_nombre = indice['claves_id'][posicion], indice['claves_nombre'][posicion]
+        if clave_id == consulta:
+            rango = 0
+        elif clave_id.startswith(consulta):
+            rango = 1
+        elif clave_nombre.startswith(consulta):
+            rango = 2
+        elif consulta in clave_id or consulta in clave_nombre:
+            rango = 3
+        else:
+            continue
+        resultados.append((rango, posicion))
+    resultados.sort()
+    return [posicion for _, posicion in resultados[:limite]]
+
+# ================ CLI ================
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Genera el índice de búsqueda de pacientes de dashboard_search')
+    parser.add_argument('libro', nargs='?', default=LIBRO_MAESTRO)
+    parser.add_argument('--salida', help='Ruta del índice (por defecto <libro>.busqueda.json; *.js para <script>)')
+    parser.add_argument('--buscar', help='Muestra las coincidencias de un término con el índice generado')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    inicio = time.perf_counter()
+    indice = construir_indice(args.libro)
+    salida = args.salida or ruta_indice(args.libro)
+    guardar_indice(indice, salida)
+    print(f"Índice {salida}: {indice['pacientes']} pacientes, {len(indice['ngramas']['listas'])} trigramas, "
+          f"{os.path.getsize(salida) / 1024:,.0f}KB ({time.perf_counter() - inicio:.1f}s)")
+    if args.buscar:
+        inicio = time.perf_counter()
+        posiciones = buscar(indice, args.buscar)
+        print(f"  '{args.buscar}': {len(posiciones)} coincidencias ({(time.perf_counter() - inicio) * 1000:.1f}ms)")
+        for posicion in posiciones:
+            print(f"    {indice['ids'][posicion]} · {indice['nombres'][posicion]} ({indice['patologias'][posicion]})")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,468 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Ingesta de solo anexado de las filas CSV exportadas desde el formulario
+
+exportarYCopiarCSV (modules/exportManager.js) copia una fila separada por tabuladores
+que hasta ahora se pegaba a mano en la primera fila vacía de ESPA o APS, abriendo y
+guardando el libro completo en Excel. Aquí las filas (de ficheros o de stdin) se
+enrutan a su hoja por Diagnostico_Primario y se añaden a un segmento de anexado por
+hoja (<libro>.anexo/ESPA.tsv, APS.tsv): el coste de cada ingesta es el de escribir sus
+propias líneas, sin depender del tamaño del maestro. La compactación vuelca los
+segmentos al final de <sheetData> copiando el XML existente sin decodificarlo y se
+puede lanzar en segundo plano.
+
+Los segmentos son un diario de escritura anticipada compartido: varios escritores (p. ej.
+en una unidad de red) añaden sus lotes bajo un bloqueo consultivo de fichero, y un único
+confirmador (--compactar --cada N) los vuelca al libro cada N segundos, de modo que ningún
+escritor espera a que se guarde el libro.
+
+Las filas de generarFilaCSV_* no incluyen Decision_Terapeutica_SEG (219 campos en vez
+de 220); en ese caso se inserta vacía para no desplazar las columnas siguientes.
+
+Uso:
+    python ingesta_csv.py Hub_Clinico_Maestro.xlsx filas.tsv          # añade al segmento
+    pbpaste | python ingesta_csv.py Hub_Clinico_Maestro.xlsx -        # desde stdin
+    python ingesta_csv.py Hub_Clinico_Maestro.xlsx filas.tsv --compactar-desde 500
+    python ingesta_csv.py Hub_Clinico_Maestro.xlsx --compactar        # vuelca los segmentos al libro
+    python ingesta_csv.py Hub_Clinico_Maestro.xlsx --compactar --cada 60   # confirmador periódico
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from contextlib import contextmanager
+
+from openpyxl.utils import get_column_letter
+
+from column_schema import ANCHO, HOJAS_DATOS, INDICE, NOMBRES, TIPOS
+from validar_contrato import comprobar_valor, regla_columna
+from xlsx_reader import LIBRO_MAESTRO, columnas_hoja
+from xlsx_streaming import (DIMENSION, TAM_BLOQUE, CodificadorFilas, ampliar_dimension, escribir_atomico,
+                            localizar_hojas, sustituir_archivo)
+
+TIPOS_VISITA = ('Primera Visita', 'Seguimiento')
+# Prefijo de ID_Paciente de generate_mock_data (path_code) cuando falta el diagnóstico
+PREFIJOS_ID = {'ESP': 'ESPA', 'APS': 'APS'}
+COLUMNA_OMITIDA = INDICE['Decision_Terapeutica_SEG']
+
+_SIN_DATOS = re.compile(rb'<sheetData\s*/>')
+_FILA = re.compile(rb'<row r="(\d+)"')
+_FIN_DATOS = b'</sheetData>'
+# Solapamiento entre bloques: cubre un '<row r="nnnnnnn"' o un '</sheetData>' partidos
+_SOLAPE = 32
+
+# ================ RUTAS ================
+
+def ruta_anexo(libro):
+    """Directorio de segmentos de anexado del libro"""
+    return os.path.splitext(libro)[0] + '.anexo'
+
+def ruta_segmento(libro, hoja):
+    return os.path.join(ruta_anexo(libro), f'{hoja}.tsv')
+
+def _ruta_compactacion(libro):
+    return os.path.join(ruta_anexo(libro), 'compactacion.json')
+
+def _ruta_bloqueo_diario(libro):
+    return os.path.join(ruta_anexo(libro), 'diario.lock')
+
+def _ruta_bloqueo_compactacion(libro):
+    return os.path.join(ruta_anexo(libro), 'compactacion.lock')
+
+# ================ BLOQUEO ================
+
+if os.name == 'nt':
+    import msvcrt
+
+    def _adquirir(fd, esperar):
+        while True:
+            try:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError:
+                if not esperar:
+                    return False
+                time.sleep(0.01)
+
+    def _liberar(fd):
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+else:
+    import fcntl
+
+    def _adquirir(fd, esperar):
+        try:
+            fcntl.lockf(fd, fcntl.LOCK_EX if esperar else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except (BlockingIOError, PermissionError):
+            return False
+
+    def _liberar(fd):
+        fcntl.lockf(fd, fcntl.LOCK_UN)
+
+@contextmanager
+def bloqueo_fichero(ruta, esperar=True):
+    """
+    Bloqueo consultivo exclusivo sobre `ruta` (se crea si no existe): fcntl.lockf en POSIX,
+    que también respetan los clientes NFS, y msvcrt.locking en Windows/SMB. Se libera al
+    salir o si el proceso muere. Con esperar=False produce False si lo tiene otro proceso.
+    """
+    fd = os.open(ruta, os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        if not _adquirir(fd, esperar):
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            _liberar(fd)
+    finally:
+        os.close(fd)
+
+# ================ FILAS ================
+
+def hoja_destino(campos):
+    """ESPA o APS según Diagnostico_Primario ('espa'/'aps' en el formulario) o el prefijo del ID"""
+    diagnostico = campos[INDICE['Diagnostico_Primario']].strip().upper()
+    if diagnostico in HOJAS_DATOS:
+        return diagnostico
+    return PREFIJOS_ID.get(campos[INDICE['ID_Paciente']].strip()[:3].upper())
+
+def preparar_fila(linea):
+    """
+    (hoja, campos, avisos) de una línea exportada; lanza ValueError si no se puede enrutar.
+    Diagnostico_Primario se guarda en mayúsculas como en el libro.
+    """
+    campos = linea.rstrip('\r\n').split('\t')
+    if len(campos) == ANCHO - 1:
+        campos.insert(COLUMNA_OMITIDA, '')
+    if len(campos) != ANCHO:
+        raise ValueError(f'{len(campos)} campos; se esperaban {ANCHO} (o {ANCHO - 1} de exportarYCopiarCSV)')
+    for nombre in ('ID_Paciente', 'Fecha_Visita'):
+        if not campos[INDICE[nombre]].strip():
+            raise ValueError(f'falta {nombre}')
+    if campos[INDICE['Tipo_Visita']] not in TIPOS_VISITA:
+        raise ValueError(f"Tipo_Visita debe ser {' o '.join(TIPOS_VISITA)}")
+    hoja = hoja_destino(campos)
+    if hoja is None:
+        raise ValueError('no se puede deducir la hoja (Diagnostico_Primario vacío y prefijo de ID desconocido)')
+    campos[INDICE['Diagnostico_Primario']] = hoja
+
+    avisos = []
+    for nombre, valor in zip(NOMBRES, campos):
+        resultado = comprobar_valor(regla_columna(nombre), valor)
+        if resultado:
+            avisos.append(resultado)
+    return hoja, campos, avisos
+
+def valores_fila(campos):
+    """Campos de texto → valores de celda: números en las columnas numéricas, None si vacío"""
+    valores = []
+    for nombre, campo in zip(NOMBRES, campos):
+        if campo == '':
+            valores.append(None)
+        elif TIPOS[nombre].tipo == 'numero':
+            try:
+                numero = float(campo.replace(',', '.'))
+                valores.append(int(numero) if numero.is_integer() and '.' not in campo else numero)
+            except ValueError:
+                valores.append(campo)
+        else:
+            valores.append(campo)
+    return valores
+
+# ================ ANEXADO ================
+
+def anexar(libro, lineas, estricto=False):
+    """
+    Añade las líneas válidas a los segmentos de su hoja: todo el lote se escribe bajo el
+    bloqueo del diario (una escritura + fsync por hoja), así que los lotes de escritores
+    concurrentes nunca se intercalan.
+    Devuelve ({hoja: filas añadidas}, rechazadas, incidencias); las dos últimas son listas
+    de (nº de línea, motivo) y las incidencias de contrato solo rechazan la fila si `estricto`.
+    """
+    por_hoja = {hoja: [] for hoja in HOJAS_DATOS}
+    rechazadas, incidencias = [], []
+    for numero, linea in enumerate(lineas, 1):
+        if not linea.strip() or linea.startswith('ID_Paciente\t'):
+            continue
+        try:
+            hoja, campos, avisos = preparar_fila(linea)
+        except ValueError as e:
+            rechazadas.append((numero, str(e)))
+            continue
+        errores = [mensaje for severidad, _, mensaje in avisos if severidad == 'error']
+        if errores:
+            (rechazadas if estricto else incidencias).append((numero, '; '.join(errores)))
+            if estricto:
+                continue
+        por_hoja[hoja].append('\t'.join(campos) + '\n')
+
+    os.makedirs(ruta_anexo(libro), exist_ok=True)
+    anexadas = {hoja: len(filas) for hoja, filas in por_hoja.items() if filas}
+    if anexadas:
+        with bloqueo_fichero(_ruta_bloqueo_diario(libro)):
+            for hoja in anexadas:
+                with open(ruta_segmento(libro, hoja), 'ab') as f:
+                    _reparar_cola(f)
+                    f.write(''.join(por_hoja[hoja]).encode('utf-8'))
+                    f.flush()
+                    os.fsync(f.fileno())
+    return anexadas, rechazadas, incidencias
+
+def _reparar_cola(f):
+    """
+    Descarta una última línea incompleta (escritor interrumpido a mitad de lote): busca
+    hacia atrás, bloque a bloque, el último salto de línea y trunca justo después
+    """
+    tam = fin = f.seek(0, os.SEEK_END)
+    with open(f.name, 'rb') as lector:
+        while fin:
+            inicio = max(0, fin - TAM_BLOQUE)
+            lector.seek(inicio)
+            salto = lector.read(fin - inicio).rfind(b'\n')
+            if salto != -1:
+                fin = inicio + salto + 1
+                break
+            fin = inicio
+    if fin != tam:
+        f.truncate(fin)
+
+def _filas_segmento(ruta):
+    with open(ruta, encoding='utf-8', newline='') as f:
+        for linea in f:
+            # Una última línea sin salto es un lote interrumpido que aún no se ha reparado
+            if linea.endswith('\n'):
+                yield valores_fila(linea[:-1].split('\t'))
+
+def filas_pendientes(libro, hoja):
+    """Filas (valores de celda) de los segmentos de una hoja que aún no están en el libro"""
+    for ruta in (ruta_segmento(libro, hoja) + '.compactando', ruta_segmento(libro, hoja)):
+        if os.path.exists(ruta):
+            yield from _filas_segmento(ruta)
+
+def contar_pendientes(libro):
+    total = 0
+    for hoja in HOJAS_DATOS:
+        for ruta in (ruta_segmento(libro, hoja) + '.compactando', ruta_segmento(libro, hoja)):
+            if os.path.exists(ruta):
+                with open(ruta, 'rb') as f:
+                    total += sum(bloque.count(b'\n') for bloque in iter(lambda: f.read(TAM_BLOQUE), b''))
+    return total
+
+# ================ COMPACTACIÓN ================
+
+def _copiar_datos(origen, cuerpo):
+    """
+    Copia a `cuerpo` las filas existentes de la hoja (XML sin decodificar) y devuelve
+    (prefijo, sufijo, última fila): el prefijo termina en <sheetData> y el sufijo
+    empieza en </sheetData>.
+    """
+    buffer = b''
+    while True:
+        bloque = origen.read(TAM_BLOQUE)
+        buffer += bloque
+        vacia = _SIN_DATOS.search(buffer)
+        if vacia:
+            return buffer[:vacia.start()] + b'<sheetData>', _FIN_DATOS + buffer[vacia.end():] + origen.read(), 0
+        inicio = buffer.find(b'<sheetData>')
+        if inicio != -1:
+            prefijo, buffer = buffer[:inicio + len(b'<sheetData>')], buffer[inicio + len(b'<sheetData>'):]
+            break
+        if not bloque:
+            raise ValueError('XML de hoja sin <sheetData> reconocible')
+
+    ultima = 0
+    while True:
+        fin = buffer.find(_FIN_DATOS)
+        datos = buffer if fin == -1 else buffer[:fin]
+        for coincidencia in _FILA.finditer(datos):
+            ultima = int(coincidencia.group(1))
+        if fin != -1:
+            cuerpo.write(datos)
+            return prefijo, buffer[fin:] + origen.read(), ultima
+        cuerpo.write(buffer[:-_SOLAPE])
+        buffer = buffer[-_SOLAPE:]
+        bloque = origen.read(TAM_BLOQUE)
+        if not bloque:
+            raise ValueError('XML de hoja sin </sheetData>')
+        buffer += bloque
+
+def _orden_columnas(libro, hoja):
+    """Índice en NOMBRES de cada columna de la cabecera de la hoja (None si no está en el esquema)"""
+    return [INDICE.get(nombre) for nombre in columnas_hoja(hoja, libro)]
+
+def compactar(libro=LIBRO_MAESTRO, nivel_compresion=1):
+    """
+    Vuelca los segmentos al final de las hojas de datos del libro. Los segmentos se
+    renombran a *.compactando bajo el bloqueo del diario (los escritores solo esperan a
+    ese renombrado y luego crean segmentos nuevos) y se borran tras reemplazar el libro;
+    compactacion.json guarda la última fila esperada de cada hoja para no duplicar filas
+    si se interrumpe entre ambos pasos. Devuelve {hoja: filas añadidas}, o None si ya hay
+    otra compactación en curso.
+    """
+    os.makedirs(ruta_anexo(libro), exist_ok=True)
+    with bloqueo_fichero(_ruta_bloqueo_compactacion(libro), esperar=False) as adquirido:
+        if not adquirido:
+            return None
+        return _compactar(libro, nivel_compresion)
+
+def _compactar(libro, nivel_compresion):
+    estado = {}
+    if os.path.exists(_ruta_compactacion(libro)):
+        with open(_ruta_compactacion(libro), encoding='utf-8') as f:
+            estado = json.load(f)
+    pendientes = {}
+    with bloqueo_fichero(_ruta_bloqueo_diario(libro)):
+        for hoja in HOJAS_DATOS:
+            segmento = ruta_segmento(libro, hoja)
+            if os.path.exists(segmento) and not os.path.exists(segmento + '.compactando'):
+                os.replace(segmento, segmento + '.compactando')
+            if os.path.exists(segmento + '.compactando'):
+                pendientes[hoja] = segmento + '.compactando'
+    if not pendientes:
+        return {}
+
+    directorio = os.path.dirname(os.path.abspath(libro))
+    fd, temporal = tempfile.mkstemp(suffix='.xlsx', dir=directorio)
+    os.close(fd)
+    anadidas, esperadas = {}, {}
+    try:
+        with zipfile.ZipFile(libro) as zin, \
+                zipfile.ZipFile(temporal, 'w', zipfile.ZIP_DEFLATED, compresslevel=nivel_compresion) as zout:
+            rutas = {ruta: hoja for hoja, ruta in localizar_hojas(zin).items() if hoja in pendientes}
+            for info in zin.infolist():
+                hoja = rutas.get(info.filename)
+                if hoja is None:
+                    zout.writestr(info, zin.read(info))
+                    continue
+                orden = _orden_columnas(zin, hoja)
+                codificador = CodificadorFilas()
+                with zin.open(info) as origen, tempfile.TemporaryFile(dir=directorio) as cuerpo:
+                    prefijo, sufijo, ultima = _copiar_datos(origen, cuerpo)
+                    num_fila = max(ultima, 1)
+                    if estado.get(hoja) != ultima:
+                        # El libro aún no tiene las filas del segmento (no es un reintento ya aplicado)
+                        for valores in _filas_segmento(pendientes[hoja]):
+                            num_fila += 1
+                            fila = [None if i is None else valores[i] for i in orden]
+                            cuerpo.write(codificador.fila(num_fila, fila).encode('utf-8'))
+                    anadidas[hoja] = num_fila - max(ultima, 1)
+                    esperadas[hoja] = num_fila
+                    dimension = f'<dimension ref="A1:{get_column_letter(len(orden) or 1)}{num_fila}"/>'.encode('utf-8')
+                    prefijo = DIMENSION.sub(lambda m: ampliar_dimension(m.group(0), dimension), prefijo, count=1)
+                    with zout.open(info.filename, 'w', force_zip64=True) as destino:
+                        destino.write(prefijo)
+                        cuerpo.seek(0)
+                        shutil.copyfileobj(cuerpo, destino, TAM_BLOQUE)
+                        destino.write(sufijo)
+
+        _guardar_estado(libro, esperadas)
+        sustituir_archivo(temporal, libro)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+    for ruta in pendientes.values():
+        os.remove(ruta)
+    os.remove(_ruta_compactacion(libro))
+    return anadidas
+
+def _guardar_estado(libro, esperadas):
+    def escribir(f):
+        json.dump(esperadas, f)
+        f.flush()
+        os.fsync(f.fileno())
+    escribir_atomico(_ruta_compactacion(libro), escribir)
+
+def confirmar_periodicamente(libro, cada, parar=None):
+    """
+    Confirmador único: compacta el diario cada `cada` segundos hasta que se active el
+    evento `parar`. Un fallo de un ciclo (p. ej. el libro abierto en Excel en Windows)
+    se reintenta en el siguiente con los mismos *.compactando.
+    """
+    parar = parar or threading.Event()
+    while True:
+        inicio = time.monotonic()
+        try:
+            anadidas = compactar(libro)
+        except OSError as e:
+            print(f"{time.strftime('%H:%M:%S')} compactación fallida, se reintenta: {e}")
+        else:
+            if anadidas is None:
+                print(f"{time.strftime('%H:%M:%S')} otra compactación en curso")
+            elif any(anadidas.values()):
+                print(f"{time.strftime('%H:%M:%S')} confirmadas " + ', '.join(f'{h}: +{n}' for h, n in anadidas.items()))
+        if parar.wait(max(0.0, cada - (time.monotonic() - inicio))):
+            return
+
+def compactar_en_segundo_plano(libro):
+    """Lanza `ingesta_csv.py <libro> --compactar` desacoplado de este proceso"""
+    opciones = {'start_new_session': True} if os.name == 'posix' else \
+        {'creationflags': subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP}
+    return subprocess.Popen([sys.executable, os.path.abspath(__file__), libro, '--compactar'],
+                            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                            **opciones)
+
+# ================ CLI ================
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Añade filas exportadas por el formulario al libro maestro')
+    parser.add_argument('libro', nargs='?', default=LIBRO_MAESTRO)
+    parser.add_argument('ficheros', nargs='*', help="Ficheros con filas separadas por tabuladores ('-' = stdin)")
+    parser.add_argument('--estricto', action='store_true', help='Rechaza las filas con errores de contrato')
+    parser.add_argument('--compactar', action='store_true', help='Vuelca los segmentos pendientes al libro')
+    parser.add_argument('--compactar-desde', type=int, default=0, metavar='N',
+                        help='Compacta en segundo plano cuando haya N o más filas pendientes')
+    parser.add_argument('--cada', type=float, default=0, metavar='SEGUNDOS',
+                        help='Con --compactar, repite la compactación cada SEGUNDOS (confirmador del diario)')
+    return parser.parse_args(argv)
+
+def _lineas(ficheros):
+    for nombre in ficheros:
+        if nombre == '-':
+            yield from sys.stdin
+        else:
+            with open(nombre, encoding='utf-8-sig', newline='') as f:
+                yield from f
+
+def main(argv=None):
+    args = parse_args(argv)
+    ficheros = args.ficheros or ([] if args.compactar else ['-'])
+    if ficheros:
+        anexadas, rechazadas, incidencias = anexar(args.libro, _lineas(ficheros), args.estricto)
+        for numero, motivo in rechazadas:
+            print(f"Línea {numero} rechazada: {motivo}")
+        for numero, motivo in incidencias:
+            print(f"Línea {numero} añadida con errores de contrato: {motivo}")
+        resumen = ', '.join(f'{hoja}: {n}' for hoja, n in anexadas.items()) or 'ninguna fila'
+        print(f"Añadidas al anexo de {args.libro}: {resumen}")
+
+    if args.compactar and args.cada:
+        try:
+            confirmar_periodicamente(args.libro, args.cada)
+        except KeyboardInterrupt:
+            pass
+    elif args.compactar:
+        anadidas = compactar(args.libro)
+        if anadidas is None:
+            print("Ya hay una compactación en curso")
+        else:
+            print(f"Compactado {args.libro}: " + (', '.join(f'{h}: +{n}' for h, n in anadidas.items()) or 'sin cambios'))
+    elif args.compactar_desde and contar_pendientes(args.libro) >= args.compactar_desde:
+        compactar_en_segundo_plano(args.libro)
+        print("Compactación lanzada en segundo plano")
+    return 1 if ficheros and rechazadas else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Migración de ID_Paciente de un libro maestro al esquema de ID actual (id_pacientes.py)
+
+Primera pasada: se leen solo los ID de ESPA y APS y se calcula el ID nuevo de cada
+paciente. Se conservan el código, el año y la secuencia, y solo cambia el ancho
+(ESP-2024-003 → ESP-2024-000003). Los ID que ya siguen el esquema de destino reservan su
+secuencia antes que el resto. Si dos ID distintos acaban en la misma secuencia (p. ej.
+ESP-2024-03 y ESP-2024-003), o la secuencia no cabe, el segundo recibe la siguiente
+secuencia libre de su código y año. Los ID sin prefijo ESP/APS y año no se tocan.
+
+Segunda pasada: se copia el XML de cada fila tal cual y solo se sustituye la celda de
+ID_Paciente (como texto en línea). El resto del libro pasa sin cambios por
+xlsx_streaming, con memoria constante. El mapa {ID anterior: ID nuevo} se guarda en
+<salida>.ids.json para migrar también otros ficheros que guarden ID.
+
+Uso:
+    python migrar_ids.py Hub_Clinico_Maestro.xlsx --salida migrado.xlsx --esquema 2
+    python migrar_ids.py Hub_Clinico_Maestro.xlsx --en-sitio            # sustituye el propio libro
+"""
+
+import argparse
+import os
+import re
+import time
+import zipfile
+
+from column_schema import HOJAS_DATOS
+from id_pacientes import (ANCHOS, ESQUEMA_ACTUAL, AsignadorIds, analizar_id, analizar_id_laxo, formatear_id,
+                          max_secuencia)
+from particionar_maestro import letras_cabecera, plantilla_fila
+from xlsx_reader import LIBRO_MAESTRO, NUM_FILA, LectorFilas, iter_filas_xml, iter_visits, leer_cadenas_compartidas
+from xlsx_streaming import escribir_libro_streaming, guardar_json, localizar_hojas, texto_xml
+
+_ATRIBUTO_TIPO = re.compile(r'\s+t="[^"]*"')
+
+# ================ MAPA DE ID ================
+
+def _identidad(id_paciente):
+    # Mismo paciente para el buscador (normalize() ignora mayúsculas y espacios)
+    return str(id_paciente).strip().upper()
+
+def calcular_mapa(ids, esquema=ESQUEMA_ACTUAL):
+    """
+    ({ID anterior: ID nuevo} solo de los que cambian, [ID no reconocidos], {ID reasignado
+    a otra secuencia: ID nuevo}) para los ID en orden de aparición
+    """
+    asignador = AsignadorIds(esquema)
+    destinos, no_reconocidos, pendientes = {}, [], []
+    distintos = list(dict.fromkeys(str(id_paciente) for id_paciente in ids if id_paciente not in (None, '')))
+    identidades = list(dict.fromkeys(_identidad(id_paciente) for id_paciente in distintos))
+    # Los que ya siguen el esquema de destino reservan antes su secuencia
+    actuales = {i for i in identidades if (analizar_id(i) or (None,) * 4)[3] == esquema}
+    for identidad in sorted(identidades, key=lambda i: i not in actuales):
+        partes = analizar_id_laxo(identidad)
+        if partes is None:
+            no_reconocidos.append(identidad)
+        elif partes[2] <= max_secuencia(esquema) and partes[2] >= 1 and asignador.reservar(*partes):
+            destinos[identidad] = formatear_id(*partes, esquema)
+        else:
+            pendientes.append((identidad, partes))
+    for identidad, (codigo, anio, _) in pendientes:
+        destinos[identidad] = asignador.siguiente(codigo, anio)
+
+    mapa = {}
+    for id_paciente in distintos:
+        nuevo = destinos.get(_identidad(id_paciente))
+        if nuevo is not None and nuevo != id_paciente:
+            mapa[id_paciente] = nuevo
+    return mapa, no_reconocidos, {identidad: destinos[identidad] for identidad, _ in pendientes}
+
+# ================ REESCRITURA ================
+
+def _filas_migradas(zf, ruta, compartidas, mapa, contador):
+    """XML (con MARCADOR_FILA) de cada fila de datos con la celda de ID_Paciente sustituida"""
+    letra, = letras_cabecera(zf, ruta, compartidas, ('ID_Paciente',))
+    celda_id = re.compile(r'<c r="' + letra + r'(\d+)"([^>]*?)(?:/>|>.*?</c>)', re.S)
+    lector = LectorFilas(compartidas)
+    filas = iter_filas_xml(zf, ruta)
+    for fila in filas:
+        if '<c' in fila:
+            break
+    for fila in filas:
+        if '</c>' not in fila:
+            continue
+        numero = NUM_FILA.match(fila)
+        num_fila = numero.group(1) if numero else ''
+        id_paciente, = lector.valores(fila, num_fila, [letra])
+        nuevo = mapa.get(str(id_paciente)) if id_paciente not in (None, '') else None
+        if nuevo is not None:
+            celda = celda_id.search(fila)
+            atributos = _ATRIBUTO_TIPO.sub('', celda.group(2))
+            fila = (fila[:celda.start()] + f'<c r="{letra}{celda.group(1)}"{atributos} t="inlineStr">'
+                    + texto_xml(nuevo) + '</c>' + fila[celda.end():])
+            contador[0] += 1
+        yield plantilla_fila(fila, num_fila) + '</row>'
+
+def ruta_mapa(salida):
+    return os.path.splitext(os.fspath(salida))[0] + '.ids.json'
+
+def migrar(libro, salida, esquema=ESQUEMA_ACTUAL, mapa_salida=None, hojas=HOJAS_DATOS):
+    """Reescribe los ID de `libro` en `salida` (puede ser el propio libro) y guarda el mapa. Devuelve el informe."""
+    mapa_salida = mapa_salida or ruta_mapa(salida)
+    with zipfile.ZipFile(libro) as zf:
+        rutas = localizar_hojas(zf)
+    hojas = [hoja for hoja in hojas if hoja in rutas]
+    ids = (fila[0] for hoja in hojas for fila in iter_visits(hoja, ['ID_Paciente'], workbook=libro))
+    mapa, no_reconocidos, reasignados = calcular_mapa(ids, esquema)
+
+    filas = {}
+    if mapa:
+        contadores = {hoja: [0] for hoja in hojas}
+        with zipfile.ZipFile(libro) as zf:
+            compartidas = leer_cadenas_compartidas(zf)
+            escribir_libro_streaming(libro, salida, {
+                hoja: _filas_migradas(zf, rutas[hoja], compartidas, mapa, contadores[hoja]) for hoja in hojas})
+        filas = {hoja: contador[0] for hoja, contador in contadores.items()}
+
+    informe = {
+        'libro': os.path.basename(os.fspath(libro)),
+        'salida': os.path.basename(os.fspath(salida)),
+        'esquema': esquema,
+        'filas': filas,
+        'no_reconocidos': no_reconocidos,
+        'reasignados': reasignados,
+        'cambios': mapa,
+    }
+    if not mapa:
+        # Sin cambios no se pisa el mapa de una migración anterior
+        return informe
+    guardar_json(informe, mapa_salida, indent=1)
+    return informe
+
+# ================ CLI ================
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Migra los ID_Paciente del libro maestro a otro esquema de ID')
+    parser.add_argument('libro', nargs='?', default=LIBRO_MAESTRO)
+    destino = parser.add_mutually_exclusive_group(required=True)
+    destino.add_argument('--salida', help='Libro migrado')
+    destino.add_argument('--en-sitio', action='store_true', help='Sustituye el propio libro')
+    parser.add_argument('--esquema', type=int, choices=sorted(ANCHOS), default=ESQUEMA_ACTUAL,
+                        help=f'Esquema de destino (por defecto {ESQUEMA_ACTUAL})')
+    parser.add_argument('--mapa', help='Mapa de ID en JSON (por defecto <salida>.ids.json)')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    inicio = time.perf_counter()
+    salida = args.libro if args.en_sitio else args.salida
+    informe = migrar(args.libro, salida, args.esquema, args.mapa)
+    if not informe['cambios']:
+        print(f"{args.libro}: todos los ID siguen ya el esquema {args.esquema}")
+    else:
+        print(f"{salida}: {len(informe['cambios'])} ID migrados al esquema {args.esquema}, "
+              + ', '.join(f'{hoja} {filas} filas' for hoja, filas in informe['filas'].items())
+              + f" ({time.perf_counter() - inicio:.1f}s)")
+    if informe['reasignados']:
+        print(f"  {len(informe['reasignados'])} ID con secuencia repetida o fuera de rango reasignados")
+    if informe['no_reconocidos']:
+        print(f"  {len(informe['no_reconocidos'])} ID sin prefijo ESP/APS y año se dejan igual: "
+              + ', '.join(informe['no_reconocidos'][:5]))
+    if informe['cambios']:
+        print(f"Mapa: {args.mapa or ruta_mapa(salida)}")
+
+if __name__ == '__main__':
+    main()
@@ -1,10 +1,59 @@
 ﻿// /modules/dataManager.js
 // ACTUALIZACIÓN: Patrón clásico (sin import/export) + funciones adicionales para Fase 2
-let appState = { isLoaded: false, db: null };
+let appState = { isLoaded: false, db: null, compactBundle: null };
+
+// =====================================
+// PAQUETE COMPACTO EN INDEXEDDB
+// =====================================
+
+// localStorage admite unos 5MB; un paquete mayor (200k visitas ≈ 39MB) se guarda en IndexedDB
+// y localStorage solo conserva la marca 'hubClinicoDB_indexedDB'
+const BUNDLE_DB_NAME = 'hubClinico';
+const BUNDLE_STORE = 'paquetes';
+const BUNDLE_KEY = 'hubClinicoDB';
+const BUNDLE_FLAG = 'hubClinicoDB_indexedDB';
+let pendingBundleLoad = null;
+
+function openBundleDatabase() {
+    return new Promise((resolve, reject) => {
+        const request = indexedDB.open(BUNDLE_DB_NAME, 1);
+        request.onupgradeneeded = () => request.result.createObjectStore(BUNDLE_STORE);
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+}
+
+async function saveBundleToIndexedDB(text) {
+    const db = await openBundleDatabase();
+    try {
+        await new Promise((resolve, reject) => {
+            const tx = db.transaction(BUNDLE_STORE, 'readwrite');
+            tx.objectStore(BUNDLE_STORE).put(text, BUNDLE_KEY);
+            tx.oncomplete = () => resolve();
+            tx.onerror = tx.onabort = () => reject(tx.error);
+        });
+    } finally {
+        db.close();
+    }
+}
+
+async function loadBundleFromIndexedDB() {
+    const db = await openBundleDatabase();
+    try {
+        return await new Promise((resolve, reject) => {
+            const request = db.transaction(BUNDLE_STORE, 'readonly').objectStore(BUNDLE_STORE).get(BUNDLE_KEY);
+            request.onsuccess = () => resolve(request.result ?? null);
+            request.onerror = () => reject(request.error);
+        });
+    } finally {
+        db.close();
+    }
+}
 
 /**
  * Guarda la base de datos en localStorage con manejo inteligente de tamaño
  * Si la BD es demasiado grande, guarda solo una versión limitada
+ * (el paquete compacto que no cabe va completo a IndexedDB)
  */
 function saveToSessionStorage() {
     try {
@@ -12,6 +61,38 @@ function saveToSessionStorage() {
         const sizeBytes = new Blob([data]).size;
         const sizeKB = sizeBytes / 1024;
         const sizeMB = sizeKB / 1024;
+        localStorage.removeItem(BUNDLE_FLAG);
+
+        // Paquete compacto (paquete_compacto.py): se guarda tal cual, sin recortar visitas
+        if (appState.compactBundle) {
+            const bundleKB = new Blob([appState.compactBundle]).size / 1024;
+            if (bundleKB <= 4096) {
+                localStorage.setItem('hubClinicoDB', appState.compactBundle);
+                localStorage.removeItem('hubClinicoDB_limited');
+                console.log(`✓ Paquete compacto completo guardado en localStorage (${bundleKB.toFixed(0)}KB, ${sizeKB.toFixed(0)}KB sin compactar).`);
+                return;
+            }
+            if (typeof indexedDB !== 'undefined') {
+                localStorage.removeItem('hubClinicoDB');
+                localStorage.removeItem('hubClinicoDB_limited');
+                saveBundleToIndexedDB(appState.compactBundle)
+                    .then(() => {
+                        localStorage.setItem(BUNDLE_FLAG, 'true');
+                        console.log(`✓ Paquete compacto completo guardado en IndexedDB (${(bundleKB / 1024).toFixed(2)}MB).`);
+                    })
+                    .catch(e => {
+                        console.error('❌ Error al guardar el paquete compacto en IndexedDB:', e);
+                        if (typeof HubTools?.utils?.mostrarNotificacion === 'function') {
+                            HubTools.utils.mostrarNotificacion(
+                                'Error: no se pudo guardar el paquete en el navegador. Funcionalidad limitada entre páginas.',
+                                'error'
+                            );
+                        }
+                    });
+                return;
+            }
+            console.warn(`⚠️ Paquete compacto demasiado grande (${(bundleKB / 1024).toFixed(2)}MB).`);
+        }
 
         // Límite conservador de 4MB (localStorage típicamente 5-10MB)
         if (sizeKB > 4096) {
@@ -59,8 +140,154 @@ function saveToSessionStorage() {
     }
 }
 
+// =====================================
+// PAQUETE COMPACTO (paquete_compacto.py)
+// =====================================
+
+const COMPACT_BUNDLE_FORMAT = 'hub-compacto';
+const COMPACT_BUNDLE_VERSION = 1;
+
+function decodeBase64Bytes(text) {
+    const binary = atob(text || '');
+    const bytes = new Uint8Array(binary.length);
+    for (let i = 0; i < binary.length; i++) {
+        bytes[i] = binary.charCodeAt(i);
+    }
+    return bytes;
+}
+
+function readBit(bytes, index) {
+    return (bytes[index >> 3] >> (index & 7)) & 1;
+}
+
+/**
+ * Decodifica enteros zigzag + varint LEB128 (con aritmética de Number: hasta 2^53)
+ */
+function decodeVarints(bytes, count) {
+    const values = new Array(count);
+    let position = 0;
+    for (let i = 0; i < count; i++) {
+        let result = 0;
+        let multiplier = 1;
+        let byte;
+        do {
+            byte = bytes[position++];
+            result += (byte & 0x7f) * multiplier;
+            multiplier *= 128;
+        } while (byte >= 0x80);
+        values[i] = result % 2 === 0 ? result / 2 : -(result + 1) / 2;
+    }
+    return values;
+}
+
+/**
+ * Escribe en cada fila el valor de una columna del paquete (las celdas vacías no crean clave)
+ */
+function decodeCompactColumn(column, rows) {
+    const total = rows.length;
+    const name = column.nombre;
+
+    if (column.tipo === 'bits') {
+        const present = decodeBase64Bytes(column.presentes);
+        const yes = decodeBase64Bytes(column.valores);
+        for (let i = 0; i < total; i++) {
+            if (readBit(present, i)) rows[i][name] = readBit(yes, i) ? 'SI' : 'NO';
+        }
+    } else if (column.tipo === 'num') {
+        const present = decodeBase64Bytes(column.presentes);
+        let presentCount = 0;
+        for (let i = 0; i < total; i++) presentCount += readBit(present, i);
+        const deltas = decodeVarints(decodeBase64Bytes(column.deltas), presentCount);
+        const scale = Math.pow(10, column.decimales);
+        let current = 0;
+        let next = 0;
+        for (let i = 0; i < total; i++) {
+            if (!readBit(present, i)) continue;
+            current += deltas[next++];
+            rows[i][name] = scale === 1 ? current : current / scale;
+        }
+    } else if (column.tipo === 'dic') {
+        const bytes = decodeBase64Bytes(column.codigos);
+        const view = new DataView(bytes.buffer);
+        const dictionary = column.diccionario;
+        for (let i = 0; i < total; i++) {
+            const code = column.ancho === 1 ? bytes[i]
+                : column.ancho === 2 ? view.getUint16(i * 2, true) : view.getUint32(i * 4, true);
+            if (code !== 0) rows[i][name] = dictionary[code - 1];
+        }
+    } else {
+        throw new Error(`Tipo de columna desconocido en el paquete compacto: ${column.tipo}`);
+    }
+}
+
+function isCompactBundle(data) {
+    return !!data && data.formato === COMPACT_BUNDLE_FORMAT;
+}
+
+/**
+ * Reconstruye appState.db (ESPA, APS, Profesionales y Fármacos) a partir de un paquete compacto
+ * @param {Object} bundle - Paquete generado por paquete_compacto.py
+ * @returns {Object} - Misma estructura que construye loadDatabase desde el xlsx
+ */
+function decodeCompactBundle(bundle) {
+    if (!isCompactBundle(bundle) || bundle.version !== COMPACT_BUNDLE_VERSION) {
+        throw new Error(`Paquete compacto no soportado: ${bundle?.formato} v${bundle?.version}`);
+    }
+
+    const dbData = {};
+    Object.entries(bundle.hojas || {}).forEach(([sheetName, sheet]) => {
+        const rows = Array.from({ length: sheet.filas }, () => ({}));
+        sheet.columnas.forEach(column => decodeCompactColumn(column, rows));
+        dbData[sheetName] = rows;
+    });
+    if (bundle.Profesionales) {
+        dbData.Profesionales = bundle.Profesionales.map(row => normalizeProfessionalRow({ ...row }));
+    }
+    if (bundle['Fármacos']) {
+        dbData['Fármacos'] = bundle['Fármacos'];
+    }
+    return dbData;
+}
+
+/**
+ * Normaliza las columnas de cargo y nombre de una fila de la hoja Profesionales
+ */
+function normalizeProfessionalRow(row) {
+    // ============================================================
+    // Normalizar columna de CARGO
+    // ============================================================
+    const cargoKey = Object.keys(row).find(key => key.toLowerCase() === 'cargo' || key.toLowerCase() === 'rol');
+    if (cargoKey && row[cargoKey] !== undefined && !row.cargo) {
+        row.cargo = row[cargoKey];
+        if (cargoKey !== 'cargo') { // Only delete if it's not already 'cargo'
+            delete row[cargoKey];
+        }
+    }
+
+    // ============================================================
+    // Normalizar columna de NOMBRE
+    // ============================================================
+    const nombreKey = Object.keys(row).find(key => {
+        const keyLower = key.toLowerCase();
+        return keyLower.includes('nombre') ||
+               keyLower === 'name' ||
+               keyLower === 'profesional';
+    });
+
+    if (nombreKey && row[nombreKey] !== undefined && !row.Nombre_Completo) {
+        row.Nombre_Completo = row[nombreKey];
+        // Eliminar la clave original solo si es diferente
+        if (nombreKey !== 'Nombre_Completo') {
+            delete row[nombreKey];
+        }
+    }
+
+    return row;
+}
+
 /**
  * Carga un archivo .xlsx, lo procesa con SheetJS y lo guarda en el estado de la aplicación.
+ * También acepta el paquete compacto .json generado por paquete_compacto.py.
  * Es el corazón del dataManager y la única función que interactúa directamente con el archivo.
  * @param {File} file - El objeto File seleccionado por el usuario desde un <input type="file">.
  * @returns {Promise<boolean>} - Devuelve 'true' si la carga fue exitosa, 'false' si falló.
@@ -68,6 +295,19 @@ function saveToSessionStorage() {
 async function loadDatabase(file) {
     // Usamos un bloque try...catch para manejar cualquier posible error durante la lectura o parseo del archivo.
     try {
+        // 0. Paquete compacto: se decodifica sin SheetJS y se conserva para localStorage.
+        if (file.name && file.name.toLowerCase().endsWith('.json')) {
+            const text = await file.text();
+            appState.db = decodeCompactBundle(JSON.parse(text));
+            appState.compactBundle = text;
+            appState.isLoaded = true;
+            console.log("Paquete compacto cargado con éxito:", appState.db);
+            window.dispatchEvent(new CustomEvent('databaseLoaded', { detail: appState.db }));
+            saveToSessionStorage();
+            return true;
+        }
+        appState.compactBundle = null;
+
         // 1. Lee el archivo como un ArrayBuffer, que es el formato que SheetJS necesita.
         const data = await file.arrayBuffer();
         
@@ -81,38 +321,7 @@ async function loadDatabase(file) {
             if (workbook.Sheets[sheetName]) {
                 let sheetData = XLSX.utils.sheet_to_json(workbook.Sheets[sheetName]);
                 if (sheetName === 'Profesionales') {
-                    sheetData = sheetData.map(row => {
-                        // ============================================================
-                        // Normalizar columna de CARGO
-                        // ============================================================
-                        const cargoKey = Object.keys(row).find(key => key.toLowerCase() === 'cargo' || key.toLowerCase() === 'rol');
-                        if (cargoKey && row[cargoKey] !== undefined && !row.cargo) {
-                            row.cargo = row[cargoKey];
-                            if (cargoKey !== 'cargo') { // Only delete if it's not already 'cargo'
-                                delete row[cargoKey];
-                            }
-                        }
-
-                        // ============================================================
-                        // Normalizar columna de NOMBRE
-                        // ============================================================
-                        const nombreKey = Object.keys(row).find(key => {
-                            const keyLower = key.toLowerCase();
-                            return keyLower.includes('nombre') ||
-                                   keyLower === 'name' ||
-                                   keyLower === 'profesional';
-                        });
-
-                        if (nombreKey && row[nombreKey] !== undefined && !row.Nombre_Completo) {
-                            row.Nombre_Completo = row[nombreKey];
-                            // Eliminar la clave original solo si es diferente
-                            if (nombreKey !== 'Nombre_Completo') {
-                                delete row[nombreKey];
-                            }
-                        }
-
-                        return row;
-                    });
+                    sheetData = sheetData.map(normalizeProfessionalRow);
                 }
                 dbData[sheetName] = sheetData;
             }
@@ -174,6 +383,7 @@ async function loadDatabase(file) {
         // Reseteamos el estado para evitar que la aplicación trabaje con datos corruptos.
         appState.isLoaded = false;
         appState.db = null;
+        appState.compactBundle = null;
         
         // 7. Devuelve 'false' para indicar que la operación falló.
         return false;
@@ -570,6 +780,8 @@ function extractKeyEvents(visits, pathology) {
 
 /**
  * Intenta inicializar la base de datos desde localStorage al cargar la página.
+ * Si el paquete compacto está en IndexedDB, la carga es asíncrona: devuelve 'false' y
+ * dispara 'databaseLoaded' cuando termina.
  * @returns {boolean} - Devuelve 'true' si la carga fue exitosa, 'false' si no.
  */
 function initDatabaseFromStorage() {
@@ -578,10 +790,31 @@ function initDatabaseFromStorage() {
         return true;
     }
 
+    if (localStorage.getItem(BUNDLE_FLAG) === 'true' && typeof indexedDB !== 'undefined') {
+        pendingBundleLoad = pendingBundleLoad || loadBundleFromIndexedDB()
+            .then(text => {
+                if (!text || appState.isLoaded) return;
+                appState.db = decodeCompactBundle(JSON.parse(text));
+                appState.compactBundle = text;
+                appState.isLoaded = true;
+                console.log('✓ Paquete compacto cargado desde IndexedDB.');
+                window.dispatchEvent(new CustomEvent('databaseLoaded', { detail: appState.db }));
+            })
+            .catch(e => {
+                console.error('❌ Error al cargar el paquete compacto desde IndexedDB:', e);
+                localStorage.removeItem(BUNDLE_FLAG);
+            });
+        return false;
+    }
+
     try {
         const storedDb = localStorage.getItem('hubClinicoDB');
         if (storedDb) {
-            const dbData = JSON.parse(storedDb);
+            let dbData = JSON.parse(storedDb);
+            if (isCompactBundle(dbData)) {
+                dbData = decodeCompactBundle(dbData);
+                appState.compactBundle = storedDb;
+            }
             appState.db = dbData;
             appState.isLoaded = true;
             console.log('✓ Base de datos cargada desde localStorage.');
@@ -1435,6 +1668,7 @@ if (typeof HubTools !== 'undefined') {
 
     HubTools.data.initDatabaseFromStorage = initDatabaseFromStorage;
     HubTools.data.loadDatabase = loadDatabase;
+    HubTools.data.decodeCompactBundle = decodeCompactBundle;
 
     HubTools.data.getProfesionales = getProfesionales;
 
@@ -274,6 +274,53 @@ function setHomunculusData(data) {
     updateScores();
 }
 
+/**
+ * Pinta la frecuencia de cada región en una cohorte sobre el homúnculo de solo lectura de
+ * estadisticas.html (#cohortHomunculusSvg); el de los formularios de visita no se toca.
+ * `overlay` es el resultado de homunculo_cohorte.py (window.HubHomunculusOverlay):
+ * overlay.modos[mode] = { regiones, recuentos, frecuencias, media, histograma }.
+ * La intensidad es relativa a la región más frecuente; las regiones sin datos quedan sin pintar.
+ */
+function applyCohortOverlay(overlay, mode = 'nad', svg = null) {
+    const root = svg || document.getElementById('cohortHomunculusSvg');
+    const datos = overlay && overlay.modos ? overlay.modos[mode] : null;
+    if (!root || !datos) return;
+
+    const COLORES = { nad: '255, 193, 7', nat: '220, 53, 69', dactilitis: '40, 167, 69' };
+    const frecuencias = new Map(datos.regiones.map((regionId, i) => [regionId, datos.frecuencias[i]]));
+    const maxima = Math.max(0, ...datos.frecuencias) || 1;
+
+    root.querySelectorAll('.body-region').forEach(region => {
+        const frecuencia = frecuencias.get(region.dataset.regionId);
+        if (frecuencia === undefined) {
+            clearRegionOverlay(region);
+            return;
+        }
+        const intensidad = 0.1 + 0.9 * (frecuencia / maxima);
+        // El color va en una variable CSS que aplica .cohort-overlay (style_estadisticas.css)
+        region.classList.add('cohort-overlay');
+        region.style.setProperty('--cohort-fill', `rgba(${COLORES[mode] || COLORES.nad}, ${intensidad.toFixed(3)})`);
+        region.dataset.cohortFrequency = frecuencia;
+        region.setAttribute('aria-label', `${region.dataset.regionId}: ${(frecuencia * 100).toFixed(1)}%`);
+    });
+}
+
+function clearRegionOverlay(region) {
+    region.classList.remove('cohort-overlay');
+    region.style.removeProperty('--cohort-fill');
+    delete region.dataset.cohortFrequency;
+    region.removeAttribute('aria-label');
+}
+
+/**
+ * Quita el mapa de calor de cohorte y deja el homúnculo como estaba
+ */
+function clearCohortOverlay(svg = null) {
+    const root = svg || document.getElementById('cohortHomunculusSvg');
+    if (!root) return;
+    root.querySelectorAll('.body-region.cohort-overlay').forEach(clearRegionOverlay);
+}
+
 // =====================================
 // EXPOSICIÓN AL NAMESPACE HUBTOOLS
 // =====================================
@@ -284,6 +331,8 @@ if (typeof HubTools !== 'undefined') {
     HubTools.homunculus.getHomunculusData = getHomunculusData;
     HubTools.homunculus.clearHomunculus = clearHomunculus;
     HubTools.homunculus.setHomunculusData = setHomunculusData;
+    HubTools.homunculus.applyCohortOverlay = applyCohortOverlay;
+    HubTools.homunculus.clearCohortOverlay = clearCohortOverlay;
 
     // Exponer constantes críticas para validación y uso externo
     HubTools.homunculus.ARTICULATIONS = HOMUNCULUS_ARTICULATIONS;
@@ -455,6 +455,31 @@ function createHomunculusMap(allRegions, markedRegionsArray) {
     return map;
 }
 
+// =====================================
+// SCRIPTS OPCIONALES
+// =====================================
+
+/**
+ * Carga un script generado por los procesos por lotes (no versionado: busqueda_pacientes.js,
+ * correlaciones.js, homunculo_cohorte.js...) si existe.
+ *
+ * @param {string} src - Ruta del script relativa a la página.
+ * @returns {Promise<boolean>} true si se ha cargado, false si no existe o falla (sin lanzar).
+ */
+function cargarScriptOpcional(src) {
+    return new Promise(resolve => {
+        const script = document.createElement('script');
+        script.src = src;
+        script.async = false;
+        script.onload = () => resolve(true);
+        script.onerror = () => {
+            script.remove();
+            resolve(false);
+        };
+        document.head.appendChild(script);
+    });
+}
+
 // =====================================
 // EXPOSICIÓN AL NAMESPACE HUBTOOLS
 // =====================================
@@ -495,6 +520,9 @@ if (typeof HubTools !== 'undefined') {
     // Utilidades del homúnculo
     HubTools.utils.createHomunculusMap = createHomunculusMap;
 
+    // Scripts opcionales generados por los procesos por lotes
+    HubTools.utils.cargarScriptOpcional = cargarScriptOpcional;
+
     console.log('✅ Módulo utils cargado');
 } else {
     console.error('❌ Error: HubTools namespace no encontrado. Asegúrate de cargar hubTools.js primero.');
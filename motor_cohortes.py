@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Motor de cohortes con índices bitmap (mismo resultado que applyFiltersToPatients)
+
+applyFiltersToPatients (modules/dataManager.js) evalúa visita a visita una cadena de
+comprobaciones (normalizeString, parseFilterDate, getAgeValue, getTreatmentCategory,
+alias de COMORBIDITY_FIELDS...) cada vez que cambia un filtro. Aquí esas condiciones se
+precalculan una vez sobre la caché columnar: un bitmap (bits empaquetados, uno por
+visita) por patología, sexo, categoría de tratamiento, biomarcador, bucket de
+actividad, comorbilidad, manifestación extraarticular y efecto adverso, e índices
+ordenados para fecha de visita, edad y EVA. Cualquier combinación de filtros es un AND
+de bitmaps; los rangos se resuelven con búsqueda binaria sobre los índices ordenados.
+
+Uso:
+    motor = MotorCohortes.desde_libro('Hub_Clinico_Maestro.xlsx')
+    cohorte = motor.filtrar({'pathology': 'ESPA', 'sex': 'Mujer', 'ttoType': 'biologicos',
+                             'dateFrom': '2024-01-01', 'comorbidity': 'HTA'})
+    len(cohorte), cohorte.por_hoja()
+"""
+
+import argparse
+import math
+import time
+from datetime import date
+
+import numpy as np
+
+from column_schema import HOJAS_DATOS
+from columnar_cache import FECHA_NULA, a_dias, cargar, normalizar_si_no, normalizar_texto
+from compactar_maestro import normalizar_fecha
+from cubo_estadisticas import (BUCKETS_ACTIVIDAD, CATEGORIAS_TRATAMIENTO, COMORBILIDADES, EXTRAARTICULARES,
+                               UMBRALES_ACTIVIDAD, bucket_actividad, categoria_tratamiento, edades_visitas,
+                               por_categoria)
+from score_engine import a_numeros
+from xlsx_reader import LIBRO_MAESTRO
+
+# ================ SEMÁNTICA DE dataManager.js ================
+
+# getBiomarkerStatus: clave del filtro → columnas alternativas (vale la primera con valor)
+COLUMNAS_BIOMARCADOR = {'hla': ('HLA_B27', 'HLA-B27', 'hlaB27', 'hla'), 'fr': ('FR', 'fr'),
+                        'apcc': ('APCC', 'aPCC', 'apcc')}
+
+# METRIC_FIELDS (primera columna, la del libro); ACTIVITY_THRESHOLDS no tiene EVA
+COLUMNAS_METRICA = {
+    'BASDAI': 'BASDAI_Result', 'ASDAS': 'ASDAS_CRP_Result', 'HAQ': 'HAQ_Total',
+    'PCR': 'PCR', 'VSG': 'VSG', 'EVA_DOLOR': 'EVA_Dolor', 'EVA_GLOBAL': 'EVA_Global',
+}
+METRICAS_ACTIVIDAD = ('BASDAI', 'ASDAS', 'HAQ', 'PCR', 'VSG')
+
+TIPOS_TRATAMIENTO = {'fames': 'fame', 'biologicos': 'biologic', 'sistemicos': 'systemic'}
+
+# COMORBIDITY_FIELDS, EXTRA_ARTICULAR_FIELDS y hasAdverseEffect
+COLUMNAS_COMORBILIDAD = {c: (f'Comorbilidad_{c.capitalize() if len(c) > 3 else c}', f'comorbilidad_{c.lower()}')
+                         for c in COMORBILIDADES}
+COLUMNAS_EXTRAARTICULAR = {e: (f'ExtraArticular_{e.capitalize()}', f'extraArticular{e.capitalize()}')
+                           for e in EXTRAARTICULARES}
+COLUMNAS_EFECTO_ADVERSO = ('Cambio_Efectos_Adversos', 'efectosAdversos', 'adverseEvents')
+COLUMNAS_DESCRIPCION_EFECTOS = ('Cambio_Descripcion_Efectos', 'descripcionEfectos')
+
+def resolver_metrica(etiqueta):
+    """resolveMetricKey"""
+    clave = ''.join(normalizar_texto(etiqueta).split())
+    return {'basdai': 'BASDAI', 'asdas': 'ASDAS', 'haq': 'HAQ', 'pcr': 'PCR', 'vsg': 'VSG',
+            'evadolor': 'EVA_DOLOR', 'evaglobal': 'EVA_GLOBAL'}.get(clave)
+
+def _parse_float(valor):
+    return float(a_numeros([valor])[0]) if valor not in (None, '') else math.nan
+
+# ================ BITMAPS ================
+
+def _contar_bits(bitmap):
+    if hasattr(np, 'bitwise_count'):
+        return int(np.bitwise_count(bitmap).sum())
+    return int(np.unpackbits(bitmap).sum())
+
+class Cohorte:
+    """Resultado de un filtro: bitmap de visitas sobre la numeración global del motor"""
+
+    def __init__(self, motor, bitmap):
+        self.motor = motor
+        self.bitmap = bitmap
+
+    def __len__(self):
+        return _contar_bits(self.bitmap)
+
+    def mascara(self):
+        return np.unpackbits(self.bitmap, count=self.motor.n, bitorder='little').astype(bool)
+
+    def indices(self):
+        """Posiciones globales (ESPA primero, luego APS) de las visitas de la cohorte"""
+        return np.flatnonzero(self.mascara())
+
+    def por_hoja(self):
+        """{hoja: posiciones dentro de appState.db[hoja]}"""
+        indices = self.indices()
+        resultado = {}
+        for hoja, inicio, fin in self.motor.hojas:
+            tramo = indices[(indices >= inicio) & (indices < fin)]
+            resultado[hoja] = tramo - inicio
+        return resultado
+
+    def __and__(self, otra):
+        return Cohorte(self.motor, self.bitmap & otra.bitmap)
+
+    def __or__(self, otra):
+        return Cohorte(self.motor, self.bitmap | otra.bitmap)
+
+# ================ MOTOR ================
+
+class MotorCohortes:
+    """Índices bitmap y ordenados de las visitas de ESPA y APS"""
+
+    def __init__(self, tablas, referencia=None):
+        referencia = referencia or date.today()
+        self.hojas = []
+        inicio = 0
+        for hoja, tabla in tablas.items():
+            self.hojas.append((hoja, inicio, inicio + len(tabla)))
+            inicio += len(tabla)
+        self.n = inicio
+        self._bytes = (self.n + 7) // 8
+        self.bitmaps = {}
+        tablas = list(tablas.items())
+
+        def juntar(funcion, dtype):
+            partes = [np.asarray(funcion(hoja, tabla), dtype=dtype) for hoja, tabla in tablas]
+            return np.concatenate(partes) if partes else np.empty(0, dtype=dtype)
+
+        def columna_numero(nombre):
+            return lambda hoja, tabla: tabla[nombre] if nombre in tabla else np.full(len(tabla), np.nan)
+
+        def primera_con_valor(nombres, funcion, vacio):
+            """`funcion` sobre la primera de las columnas `nombres` con valor en cada visita (getFieldValue)"""
+            def valores(hoja, tabla):
+                resultado = np.full(len(tabla), vacio, dtype=object)
+                pendientes = np.ones(len(tabla), dtype=bool)
+                for nombre in nombres:
+                    if nombre in tabla:
+                        con_valor = pendientes & ~tabla.nulos(nombre)
+                        resultado[con_valor] = funcion(tabla, nombre)[con_valor]
+                        pendientes &= ~con_valor
+                return resultado
+            return valores
+
+        def estado_si_no(tabla, nombre):
+            if tabla.tipo(nombre) == 'si_no':
+                return tabla[nombre].astype(np.int64)
+            return np.array([-1 if v is None else int(v) for v in por_categoria(tabla, nombre, normalizar_si_no).tolist()])
+
+        def columna_si_no(nombres):
+            """Estado normalizeYesNo por visita: 1 = sí, 0 = no, -1 = sin dato"""
+            return primera_con_valor(nombres, estado_si_no, -1)
+
+        # Patología (= hoja, como en getRealPoblationalData) y sexo
+        patologia = juntar(lambda hoja, tabla: np.full(len(tabla), normalizar_texto(hoja), dtype=object), object)
+        sexo = juntar(lambda hoja, tabla: por_categoria(tabla, 'Sexo', normalizar_texto), object)
+        for clave, valores in (('patologia', patologia), ('sexo', sexo)):
+            for valor in set(valores.tolist()) - {''}:
+                self._agregar((clave, valor), valores == valor)
+
+        # Tratamiento: categoría y texto normalizado (códigos por valor distinto para ttoSpecific)
+        categoria = juntar(lambda hoja, tabla: por_categoria(tabla, 'Tratamiento_Actual', categoria_tratamiento), object)
+        for valor in CATEGORIAS_TRATAMIENTO:
+            self._agregar(('tratamiento', valor), categoria == valor)
+        textos = {}
+        def codigos_texto(hoja, tabla):
+            normalizados = por_categoria(tabla, 'Tratamiento_Actual', normalizar_texto)
+            return np.fromiter((textos.setdefault(t, len(textos)) for t in normalizados.tolist()),
+                               dtype=np.int32, count=len(normalizados))
+        self._codigos_tratamiento = juntar(codigos_texto, np.int32)
+        self._textos_tratamiento = list(textos)
+
+        # Biomarcadores, comorbilidades, extraarticulares y efectos adversos
+        for clave, columnas in COLUMNAS_BIOMARCADOR.items():
+            estado = juntar(columna_si_no(columnas), np.int8)
+            self._agregar(('biomarcador', clave, True), estado == 1)
+            self._agregar(('biomarcador', clave, False), estado == 0)
+        for clave, columnas in COLUMNAS_COMORBILIDAD.items():
+            self._agregar(('comorbilidad', clave), juntar(columna_si_no(columnas), np.int8) == 1)
+        for clave, columnas in COLUMNAS_EXTRAARTICULAR.items():
+            self._agregar(('extraarticular', clave), juntar(columna_si_no(columnas), np.int8) == 1)
+        efecto = juntar(columna_si_no(COLUMNAS_EFECTO_ADVERSO), np.int8) == 1
+        descripcion = juntar(primera_con_valor(
+            COLUMNAS_DESCRIPCION_EFECTOS, lambda tabla, nombre: por_categoria(tabla, nombre, normalizar_texto) != '',
+            False), bool)
+        self._agregar(('efecto_adverso',), efecto | descripcion)
+
+        # Buckets de actividad (getActivityBucket) e índices ordenados de métricas
+        self._ordenados = {}
+        for metrica, columna in COLUMNAS_METRICA.items():
+            valores = juntar(columna_numero(columna), np.float64)
+            if metrica in METRICAS_ACTIVIDAD:
+                buckets = bucket_actividad(valores, UMBRALES_ACTIVIDAD[metrica])
+                for i, etiqueta in enumerate(BUCKETS_ACTIVIDAD):
+                    self._agregar(('actividad', metrica, etiqueta), buckets == i)
+            self._indexar(metrica, valores)
+
+        fechas = juntar(lambda hoja, tabla: tabla['Fecha_Visita'].astype(np.float64) if 'Fecha_Visita' in tabla
+                        else np.full(len(tabla), np.nan), np.float64)
+        fechas[fechas == FECHA_NULA] = np.nan
+        self._indexar('fecha', fechas)
+        self._indexar('edad', juntar(lambda hoja, tabla: edades_visitas(tabla, referencia), np.float64))
+
+    @classmethod
+    def desde_libro(cls, libro=LIBRO_MAESTRO, hojas=HOJAS_DATOS, referencia=None):
+        return cls(cargar(libro, hojas), referencia)
+
+    # ---------------- Construcción ----------------
+
+    def _agregar(self, clave, mascara):
+        self.bitmaps[clave] = np.packbits(mascara, bitorder='little')
+
+    def _indexar(self, nombre, valores):
+        """Índice ordenado (posiciones, valores) sin los NaN"""
+        validos = np.flatnonzero(~np.isnan(valores))
+        orden = validos[np.argsort(valores[validos], kind='stable')]
+        self._ordenados[nombre] = (orden, valores[orden])
+
+    # ---------------- Consulta ----------------
+
+    def todos(self):
+        bitmap = np.full(self._bytes, 0xFF, dtype=np.uint8)
+        if self.n % 8:
+            bitmap[-1] = (1 << (self.n % 8)) - 1
+        return bitmap
+
+    def ninguno(self):
+        return np.zeros(self._bytes, dtype=np.uint8)
+
+    def bitmap(self, *clave):
+        """Bitmap de una clave precalculada (vacío si no existe)"""
+        return self.bitmaps.get(clave, self.ninguno())
+
+    def rango(self, nombre, desde=None, hasta=None):
+        """Bitmap de las visitas con desde <= valor <= hasta en un índice ordenado"""
+        orden, valores = self._ordenados[nombre]
+        inicio = 0 if desde is None else np.searchsorted(valores, desde, side='left')
+        fin = len(valores) if hasta is None else np.searchsorted(valores, hasta, side='right')
+        mascara = np.zeros(self.n, dtype=bool)
+        mascara[orden[inicio:fin]] = True
+        return np.packbits(mascara, bitorder='little')
+
+    def texto_tratamiento(self, subcadena):
+        """Bitmap de visitas cuyo tratamiento normalizado contiene `subcadena`"""
+        coincide = np.array([bool(texto) and subcadena in texto for texto in self._textos_tratamiento] or [False])
+        return np.packbits(coincide[self._codigos_tratamiento], bitorder='little')
+
+    def filtrar(self, filtros):
+        """Cohorte con las visitas que pasan los filtros de estadisticas.html (mismas claves y semántica)"""
+        bitmap = self.todos()
+
+        patologia = normalizar_texto(filtros.get('pathology'))
+        if patologia and patologia not in ('all', 'todos'):
+            bitmap &= self.bitmap('patologia', patologia)
+
+        desde, hasta = (self._dia_filtro(filtros.get(clave)) for clave in ('dateFrom', 'dateTo'))
+        if desde is not None or hasta is not None:
+            bitmap &= self.rango('fecha', desde, hasta)
+
+        sexo = normalizar_texto(filtros.get('sex'))
+        if sexo and sexo not in ('all', 'todos'):
+            bitmap &= self.bitmap('sexo', sexo)
+
+        edad_desde, edad_hasta = (_parse_float(filtros.get(clave)) for clave in ('ageFrom', 'ageTo'))
+        if not (math.isnan(edad_desde) and math.isnan(edad_hasta)):
+            bitmap &= self.rango('edad', None if math.isnan(edad_desde) else math.trunc(edad_desde),
+                                 None if math.isnan(edad_hasta) else math.trunc(edad_hasta))
+
+        biomarcador = filtros.get('biomarker') or ''
+        if biomarcador and biomarcador != 'Todos':
+            partes = biomarcador.split('_')
+            marcador = ''.join(c for c in normalizar_texto(partes[0]) if c.isascii() and c.isalnum())
+            positivo = 'positive' in normalizar_texto(partes[1] if len(partes) > 1 else '')
+            clave = 'hla' if 'hlab27' in marcador or marcador == 'hla' else marcador
+            bitmap &= self.bitmap('biomarcador', clave, positivo)
+
+        estado = filtros.get('activityState')
+        if estado and estado != 'Todos':
+            metrica = resolver_metrica(filtros.get('activityIndex') or 'BASDAI')
+            bitmap &= self.bitmap('actividad', metrica, estado)
+
+        for clave, metrica in (('evaDolor', 'EVA_DOLOR'), ('evaGlobal', 'EVA_GLOBAL')):
+            limite = _parse_float(filtros.get(clave))
+            if not math.isnan(limite) and limite < 10:
+                bitmap &= self.rango(metrica, None, limite)
+
+        tipo = normalizar_texto(filtros.get('ttoType'))
+        if tipo and tipo != 'todos' and tipo in TIPOS_TRATAMIENTO:
+            bitmap &= self.bitmap('tratamiento', TIPOS_TRATAMIENTO[tipo])
+
+        especifico = normalizar_texto(filtros.get('ttoSpecific'))
+        if especifico and especifico != 'todos':
+            bitmap &= self.texto_tratamiento(especifico)
+
+        for clave, grupo in (('comorbidity', 'comorbilidad'), ('extraArticular', 'extraarticular')):
+            valor = str(filtros.get(clave) or '').strip().upper()
+            if valor and valor != 'TODOS':
+                bitmap &= self.bitmap(grupo, valor)
+
+        if filtros.get('adverseEffect'):
+            bitmap &= self.bitmap('efecto_adverso')
+
+        return Cohorte(self, bitmap)
+
+    @staticmethod
+    def _dia_filtro(valor):
+        """parseFilterDate → días desde 1970 (None si no es una fecha)"""
+        if not valor:
+            return None
+        dias = a_dias(normalizar_fecha(str(valor)))
+        return None if dias == FECHA_NULA else dias
+
+# ================ CLI ================
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Consulta cohortes del libro maestro con índices bitmap')
+    parser.add_argument('libro', nargs='?', default=LIBRO_MAESTRO)
+    parser.add_argument('--filtro', action='append', default=[], metavar='CLAVE=VALOR',
+                        help='Filtro de estadisticas.html (p. ej. pathology=ESPA, ttoType=biologicos)')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    inicio = time.perf_counter()
+    motor = MotorCohortes.desde_libro(args.libro)
+    construido = time.perf_counter()
+    filtros = dict(filtro.split('=', 1) for filtro in args.filtro)
+    cohorte = motor.filtrar(filtros)
+    print(f"Índices de {motor.n} visitas ({len(motor.bitmaps)} bitmaps) en {construido - inicio:.2f}s")
+    print(f"Cohorte: {len(cohorte)} visitas ({(time.perf_counter() - construido) * 1000:.1f}ms)")
+    for hoja, posiciones in cohorte.por_hoja().items():
+        print(f"  {hoja}: {len(posiciones)}")
+
+if __name__ == '__main__':
+    main()
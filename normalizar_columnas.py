@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Normalización de un libro maestro (o de una exportación suya) a las columnas canónicas
+
+dataManager.js resuelve los alias de cada campo registro a registro y en cada pasada de
+KPIs, filtros y gráficos (visit.BASDAI_Result ?? visit.basdaiResult ?? visit.BASDAI,
+getFieldValue(record, ['Comorbilidad_HTA', 'comorbilidad_hta']),
+p.ID_Paciente || p.idPaciente || p.ID || p.id). Este script reescribe el libro, o un
+CSV/TSV o JSON (lista de registros) exportado, con exactamente las columnas de
+column_schema (docs/CONTRATO_DATOS_UNIFICADO.md, en el orden de la cabecera),
+resolviendo los alias una sola vez.
+
+Cada columna de origen se asigna a una canónica por, en este orden: nombre exacto,
+nombre del contrato (ALIAS_CONTRATO), alias de las cadenas de dataManager.js
+(ALIAS_CAMPOS) y nombre sin mayúsculas ni separadores (comorbilidad_hta →
+Comorbilidad_HTA). Si varias columnas dan la misma canónica, cada fila toma el primer
+valor no vacío en ese orden, como las cadenas ?? / || de JS. Las columnas sin canónica se
+descartan, también las que tienen datos pero no nombre ('<col HM>'), y las canónicas sin
+origen quedan vacías; el informe
+<salida>.normalizacion.json recoge el mapeo aplicado, las descartadas, las que faltan y
+cuántas celdas se han rellenado desde un alias secundario.
+
+En el libro, las hojas con la cabecera canónica se copian tal cual; si solo cambian los
+nombres (misma posición) se copia el XML de las filas y se sustituye la cabecera; el
+resto se decodifica y se reescribe con xlsx_streaming. Si no hay nada que cambiar no se
+escribe el libro.
+
+Uso:
+    python normalizar_columnas.py Hub_Clinico_Maestro.xlsx --salida Hub_Clinico_Maestro_canonico.xlsx
+    python normalizar_columnas.py cohorte_exportada.csv          # → cohorte_exportada.canonico.csv
+"""
+
+import argparse
+import csv
+import json
+import os
+import re
+import time
+import zipfile
+
+from openpyxl.utils import get_column_letter
+
+from column_schema import ALIAS_CONTRATO, ANCHO, HOJAS_DATOS, INDICE, NOMBRES
+from particionar_maestro import plantilla_fila
+from xlsx_reader import (LIBRO_MAESTRO, NUM_FILA, LectorFilas, celdas_fila, convertir_celda, iter_filas_xml,
+                         leer_cadenas_compartidas, orden_columna)
+from xlsx_streaming import escribir_atomico, escribir_libro_streaming, guardar_json, localizar_hojas
+
+# Alias de las cadenas de fallback de dataManager.js (getFieldValue, ?? y ||), en su orden
+ALIAS_CAMPOS = {
+    'ID_Paciente': ('idPaciente', 'ID', 'id', '_id'),
+    'Nombre_Paciente': ('nombrePaciente', 'Nombre', 'nombre', '_nombre'),
+    'Sexo': ('sexoPaciente', 'sexo'),
+    'Fecha_Visita': ('fechaVisita', 'date', '_fecha'),
+    'Tipo_Visita': ('tipoVisita',),
+    'Diagnostico_Primario': ('Diagnostico_Principal', 'diagnosticoPrimario', 'Diagnostico', 'diagnostico',
+                             'pathology', 'Patologia', 'patologia'),
+    'HLA_B27': ('hlaB27', 'hla'),
+    'FR': ('fr',),
+    'APCC': ('apcc',),
+    'EVA_Global': ('evaGlobal', 'eva_global'),
+    'EVA_Dolor': ('evaDolor', 'eva_dolor'),
+    'PCR': ('pcrResult', 'pcr'),
+    'VSG': ('vsgResult', 'vsg'),
+    'BASDAI_Result': ('BASDAI', 'basdaiResult', 'basdai'),
+    'ASDAS_CRP_Result': ('ASDAS', 'asdasCrpResult', 'asdas', 'asdasCrp'),
+    'HAQ_Total': ('HAQ', 'haqResult', 'haq'),
+    'Tratamiento_Actual': ('tratamientoActual', '_tratamiento'),
+    'Fecha_Inicio_Tratamiento': ('fechaInicioTratamiento',),
+    'Cambio_Motivo': ('motivoCambio',),
+    'Cambio_Efectos_Adversos': ('efectosAdversos', 'adverseEvents'),
+    'Cambio_Descripcion_Efectos': ('descripcionEfectos',),
+    'Comentarios_Adicionales': ('comentariosAdicionales',),
+    **{nombre: (nombre.lower(),) for nombre in NOMBRES if nombre.startswith('Comorbilidad_')},
+    **{nombre: ('extraArticular' + nombre.split('_', 1)[1],) for nombre in NOMBRES
+       if nombre.startswith('ExtraArticular_')},
+}
+
+# Valores que cambian con el alias: las exportaciones guardan la patología en minúsculas (espa/aps)
+TRANSFORMACIONES = {
+    'Diagnostico_Primario': lambda valor: valor.upper() if isinstance(valor, str) else valor,
+}
+
+_NO_ALFANUMERICO = re.compile('[^a-z0-9]')
+EXTENSIONES_TABLA = ('.csv', '.tsv', '.json')
+
+# ================ MAPEO ================
+
+def _clave_laxa(nombre):
+    return _NO_ALFANUMERICO.sub('', nombre.lower())
+
+def _alias_exactos():
+    """
+    {nombre: (canónica, prioridad)}; prioridad (0, 0) = exacto, (1, 0) = contrato y
+    (2, i) = i-ésimo alias de la cadena de dataManager.js
+    """
+    alias = {}
+    for canonica, nombres in ALIAS_CAMPOS.items():
+        for orden, nombre in enumerate(nombres):
+            alias.setdefault(nombre, (canonica, (2, orden)))
+    alias.update((nombre, (canonica, (1, 0))) for nombre, canonica in ALIAS_CONTRATO.items())
+    alias.update((nombre, (nombre, (0, 0))) for nombre in NOMBRES)
+    return alias
+
+def _alias_laxos(exactos):
+    """{clave laxa: canónica}, sin las claves que apuntan a más de una canónica"""
+    laxos, ambiguas = {}, set()
+    for nombre, (canonica, _) in exactos.items():
+        clave = _clave_laxa(nombre)
+        if laxos.setdefault(clave, canonica) != canonica:
+            ambiguas.add(clave)
+    for clave in ambiguas:
+        del laxos[clave]
+    return laxos
+
+ALIAS = _alias_exactos()
+ALIAS_LAXOS = _alias_laxos(ALIAS)
+
+def canonica(nombre):
+    """(columna canónica, prioridad) de un nombre de columna; (None, None) si no tiene"""
+    if nombre in (None, ''):
+        return None, None
+    nombre = str(nombre).strip()
+    if nombre in ALIAS:
+        return ALIAS[nombre]
+    laxa = ALIAS_LAXOS.get(_clave_laxa(nombre))
+    return (laxa, (3, 0)) if laxa else (None, None)
+
+def mapear_cabecera(nombres):
+    """
+    Mapeo de una cabecera: {'fuentes': {canónica: [posiciones de origen por prioridad]},
+    'mapeo': {origen: canónica} de los que cambian de nombre, 'descartadas': [...],
+    'faltantes': [...]}
+    """
+    candidatas = {}
+    mapeo, descartadas = {}, []
+    for posicion, nombre in enumerate(nombres):
+        destino, prioridad = canonica(nombre)
+        if destino is None:
+            if nombre not in (None, ''):
+                descartadas.append(str(nombre))
+            continue
+        candidatas.setdefault(destino, []).append((prioridad, posicion))
+        if str(nombre) != destino:
+            mapeo[str(nombre)] = destino
+    fuentes = {destino: [posicion for _, posicion in sorted(posiciones)]
+               for destino, posiciones in candidatas.items()}
+    return {
+        'fuentes': fuentes,
+        'mapeo': mapeo,
+        'descartadas': descartadas,
+        'faltantes': [nombre for nombre in NOMBRES if nombre not in fuentes],
+    }
+
+def _transformadas(nombres, fuentes):
+    """Canónicas cuyo valor hay que transformar por venir de un alias de dataManager.js"""
+    return {destino for destino in TRANSFORMACIONES
+            if any(str(nombres[p]).strip() != destino for p in fuentes.get(destino, ()))}
+
+class _Resolutor:
+    """Fila canónica (ANCHO valores) a partir de una fila de origen, contando los alias usados"""
+
+    def __init__(self, nombres, fuentes):
+        self.simples = [(INDICE[d], ps[0]) for d, ps in fuentes.items() if len(ps) == 1]
+        self.multiples = [(INDICE[d], d, ps) for d, ps in fuentes.items() if len(ps) > 1]
+        self.transformaciones = [(INDICE[d], TRANSFORMACIONES[d]) for d in _transformadas(nombres, fuentes)]
+        self.rellenadas = {d: 0 for _, d, _ in self.multiples}
+
+    def fila(self, valores):
+        fila = [None] * ANCHO
+        for destino, posicion in self.simples:
+            fila[destino] = valores[posicion]
+        for destino, nombre, posiciones in self.multiples:
+            for orden, posicion in enumerate(posiciones):
+                valor = valores[posicion]
+                if valor not in (None, ''):
+                    fila[destino] = valor
+                    if orden:
+                        self.rellenadas[nombre] += 1
+                    break
+        for destino, transformar in self.transformaciones:
+            fila[destino] = transformar(fila[destino])
+        return fila
+
+def _informe_tabla(nombres, mapeo, filas, resolutor=None, estado=None, sin_nombre=()):
+    return {
+        'estado': estado,
+        'filas': filas,
+        'mapeo': mapeo['mapeo'],
+        'combinadas': {d: [str(nombres[p]) for p in ps] for d, ps in mapeo['fuentes'].items() if len(ps) > 1},
+        'rellenadas_por_alias': {d: n for d, n in (resolutor.rellenadas if resolutor else {}).items() if n},
+        'descartadas': mapeo['descartadas'] + [f'<col {letra}>' for letra in sorted(sin_nombre, key=orden_columna)],
+        'faltantes': mapeo['faltantes'],
+    }
+
+# ================ LIBRO ================
+
+def _cabecera(zf, ruta, compartidas):
+    """(nombres, letras) de la fila 1 de la hoja, en orden de columna"""
+    for fila in iter_filas_xml(zf, ruta):
+        if '<c' in fila:
+            celdas = celdas_fila(fila)
+            letras = sorted(celdas, key=orden_columna)
+            return [convertir_celda(*celdas[letra], compartidas) for letra in letras], letras
+    return [], []
+
+def _estado_hoja(nombres, letras, mapeo):
+    """'canonica', 'renombrada' (mismas posiciones, otros nombres) o 'reescrita'"""
+    fuentes = mapeo['fuentes']
+    posicional = (not mapeo['descartadas'] and len(fuentes) == ANCHO
+                  and all(len(ps) == 1 and letras[ps[0]] == get_column_letter(INDICE[d] + 1)
+                          for d, ps in fuentes.items())
+                  and not _transformadas(nombres, fuentes))
+    if not posicional:
+        return 'reescrita'
+    return 'canonica' if not mapeo['mapeo'] else 'renombrada'
+
+def _filas_copiadas(zf, ruta, contador):
+    """XML de cada fila de datos tal cual (con MARCADOR_FILA)"""
+    filas = iter_filas_xml(zf, ruta)
+    for fila in filas:
+        if '<c' in fila:
+            break
+    for fila in filas:
+        if '</c>' not in fila:
+            continue
+        numero = NUM_FILA.match(fila)
+        contador[0] += 1
+        yield plantilla_fila(fila, numero.group(1) if numero else '') + '</row>'
+
+def _filas_resueltas(zf, ruta, compartidas, nombres, letras, resolutor, contador, sin_nombre):
+    """
+    Fila canónica de cada fila de datos; cuenta en `sin_nombre` {letra: celdas} las celdas
+    con valor de columnas sin nombre o fuera de la cabecera, que no pasan a la salida
+    """
+    lector = LectorFilas(compartidas)
+    con_nombre = {letra for letra, nombre in zip(letras, nombres) if nombre not in (None, '')}
+    usadas = sorted({letras[p] for _, p in resolutor.simples}
+                    | {letras[p] for _, _, ps in resolutor.multiples for p in ps}, key=orden_columna)
+    posicion = {letra: i for i, letra in enumerate(usadas)}
+    # El resolutor indexa por posición en la cabecera; aquí los valores llegan en el orden de `usadas`
+    resolutor.simples = [(d, posicion[letras[p]]) for d, p in resolutor.simples]
+    resolutor.multiples = [(d, n, [posicion[letras[p]] for p in ps]) for d, n, ps in resolutor.multiples]
+    filas = iter_filas_xml(zf, ruta)
+    for fila in filas:
+        if '<c' in fila:
+            break
+    for fila in filas:
+        if '</c>' not in fila:
+            continue
+        contador[0] += 1
+        valores = lector.todas(fila)
+        for letra, valor in valores.items():
+            if letra not in con_nombre and valor is not None and valor != '':
+                sin_nombre[letra] = sin_nombre.get(letra, 0) + 1
+        yield resolutor.fila([valores.get(letra) for letra in usadas])
+
+def normalizar_libro(libro, salida, hojas=HOJAS_DATOS):
+    """Escribe `salida` con las hojas de datos en columnas canónicas; devuelve {hoja: informe}"""
+    informes = {}
+    with zipfile.ZipFile(libro) as zf:
+        rutas = localizar_hojas(zf)
+        compartidas = leer_cadenas_compartidas(zf)
+        datos, cabeceras, contadores, resolutores, sin_nombre = {}, {}, {}, {}, {}
+        for hoja in (hoja for hoja in hojas if hoja in rutas):
+            nombres, letras = _cabecera(zf, rutas[hoja], compartidas)
+            mapeo = mapear_cabecera(nombres)
+            estado = _estado_hoja(nombres, letras, mapeo)
+            informes[hoja] = (nombres, mapeo, estado)
+            if estado == 'canonica':
+                continue
+            contadores[hoja] = [0]
+            cabeceras[hoja] = NOMBRES
+            if estado == 'renombrada':
+                datos[hoja] = _filas_copiadas(zf, rutas[hoja], contadores[hoja])
+            else:
+                resolutores[hoja] = _Resolutor(nombres, mapeo['fuentes'])
+                sin_nombre[hoja] = {}
+                datos[hoja] = _filas_resueltas(zf, rutas[hoja], compartidas, nombres, letras, resolutores[hoja],
+                                               contadores[hoja], sin_nombre[hoja])
+        if datos:
+            escribir_libro_streaming(libro, salida, datos, cabeceras=cabeceras)
+    return {hoja: _informe_tabla(nombres, mapeo, contadores.get(hoja, [None])[0], resolutores.get(hoja), estado,
+                                 sin_nombre.get(hoja, ()))
+            for hoja, (nombres, mapeo, estado) in informes.items()}
+
+# ================ EXPORTACIONES ================
+
+def _delimitador(ruta):
+    return '\t' if ruta.lower().endswith('.tsv') else ','
+
+def _leer_tabla(ruta):
+    """(cabecera, iterable de filas) de un CSV/TSV con cabecera o de un JSON con una lista de registros"""
+    if ruta.lower().endswith('.json'):
+        with open(ruta, encoding='utf-8') as f:
+            registros = json.load(f)
+        if isinstance(registros, dict):
+            registros = registros.get('registros') or registros.get('visitas') or []
+        nombres = list(dict.fromkeys(clave for registro in registros for clave in registro))
+        return nombres, ([registro.get(nombre) for nombre in nombres] for registro in registros)
+    f = open(ruta, encoding='utf-8-sig', newline='')
+    lector = csv.reader(f, delimiter=_delimitador(ruta))
+    nombres = next(lector, [])
+
+    def filas():
+        with f:
+            for fila in lector:
+                if any(fila):
+                    yield fila + [''] * (len(nombres) - len(fila))
+    return nombres, filas()
+
+def _escribir_tabla(ruta, filas):
+    if ruta.lower().endswith('.json'):
+        guardar_json([dict(zip(NOMBRES, fila)) for fila in filas], ruta, indent=1)
+        return
+
+    def escribir(f):
+        escritor = csv.writer(f, delimiter=_delimitador(ruta))
+        escritor.writerow(NOMBRES)
+        escritor.writerows(['' if valor is None else valor for valor in fila] for fila in filas)
+    escribir_atomico(ruta, escribir, newline='')
+
+def normalizar_tabla(ruta, salida):
+    """Escribe `salida` (CSV/TSV/JSON según su extensión) en columnas canónicas; devuelve el informe"""
+    nombres, filas = _leer_tabla(ruta)
+    mapeo = mapear_cabecera(nombres)
+    resolutor = _Resolutor(nombres, mapeo['fuentes'])
+    contador = [0]
+    posiciones_sin_nombre = [p for p, nombre in enumerate(nombres) if nombre in (None, '')]
+    sin_nombre = {}
+
+    def resueltas():
+        for fila in filas:
+            contador[0] += 1
+            for p in posiciones_sin_nombre + list(range(len(nombres), len(fila))):
+                if fila[p] not in (None, ''):
+                    letra = get_column_letter(p + 1)
+                    sin_nombre[letra] = sin_nombre.get(letra, 0) + 1
+            yield resolutor.fila(fila)
+    _escribir_tabla(salida, resueltas())
+    return _informe_tabla(nombres, mapeo, contador[0], resolutor, 'reescrita', sin_nombre)
+
+# ================ INFORME ================
+
+def es_tabla(ruta):
+    return os.fspath(ruta).lower().endswith(EXTENSIONES_TABLA)
+
+def ruta_salida(entrada):
+    base, extension = os.path.splitext(os.fspath(entrada))
+    return f'{base}.canonico{extension}'
+
+def ruta_informe(salida):
+    return os.path.splitext(os.fspath(salida))[0] + '.normalizacion.json'
+
+def normalizar(entrada=LIBRO_MAESTRO, salida=None, informe_salida=None):
+    """Normaliza un libro o una exportación y guarda el informe; devuelve el informe"""
+    salida = salida or ruta_salida(entrada)
+    if es_tabla(entrada) != es_tabla(salida):
+        raise ValueError('Un libro se normaliza a .xlsx y una exportación a .csv, .tsv o .json')
+    if es_tabla(entrada):
+        tablas = {os.path.basename(os.fspath(entrada)): normalizar_tabla(entrada, salida)}
+    else:
+        tablas = normalizar_libro(entrada, salida)
+    informe = {
+        'entrada': os.path.basename(os.fspath(entrada)),
+        'salida': os.path.basename(os.fspath(salida)),
+        'escrita': any(tabla['estado'] != 'canonica' for tabla in tablas.values()),
+        'columnas': len(NOMBRES),
+        'tablas': tablas,
+    }
+    informe_salida = informe_salida or ruta_informe(salida)
+    guardar_json(informe, informe_salida, indent=1)
+    return informe
+
+# ================ CLI ================
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Reescribe un libro maestro o una exportación con las columnas canónicas')
+    parser.add_argument('entrada', nargs='?', default=LIBRO_MAESTRO, help='Libro .xlsx o exportación .csv/.tsv/.json')
+    parser.add_argument('--salida', help='Fichero normalizado (por defecto <entrada>.canonico.<ext>)')
+    parser.add_argument('--informe', help='Informe JSON (por defecto <salida>.normalizacion.json)')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    inicio = time.perf_counter()
+    salida = args.salida or ruta_salida(args.entrada)
+    informe = normalizar(args.entrada, salida, args.informe)
+    for nombre, tabla in informe['tablas'].items():
+        filas = f", {tabla['filas']} filas" if tabla['filas'] is not None else ''
+        print(f"{nombre}: {tabla['estado']}{filas}, {len(tabla['mapeo'])} columnas renombradas, "
+              f"{len(tabla['descartadas'])} descartadas, {len(tabla['faltantes'])} faltantes")
+        for destino, origenes in tabla['combinadas'].items():
+            rellenadas = tabla['rellenadas_por_alias'].get(destino, 0)
+            print(f"  {destino} ← {' ?? '.join(origenes)} ({rellenadas} celdas desde alias)")
+        if tabla['descartadas']:
+            print(f"  Descartadas: {', '.join(tabla['descartadas'][:10])}")
+    if informe['escrita']:
+        print(f"Escrito {salida} ({time.perf_counter() - inicio:.1f}s)")
+    else:
+        print(f"{args.entrada}: las columnas ya son las canónicas, no se escribe nada")
+    print(f"Informe: {args.informe or ruta_informe(salida)}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Paquete compacto de la base de datos (bitsets + diccionarios + deltas)
+
+saveToSessionStorage (modules/dataManager.js) guarda en localStorage el JSON de
+appState.db y, si pasa de 4MB, conserva solo las últimas 100 visitas por hoja. Este
+script convierte el libro maestro en un paquete JSON mucho más pequeño que
+dataManager.js decodifica (decodeCompactBundle) sin volver a leer el xlsx. El paquete
+se guarda completo en localStorage o, si pasa de 4MB, en IndexedDB.
+
+Contrato del paquete (versión 1):
+    {"formato": "hub-compacto", "version": 1, "libro": ..., "sha256": ...,
+     "hojas": {"ESPA": {"filas": n, "columnas": [columna, ...]}, "APS": {...}},
+     "Profesionales": [{cabecera: valor}, ...],       # filas tal cual (sheet_to_json)
+     "Fármacos": {"Sistemicos": [...], "FAMEs": [...], "Biologicos": [...]}}
+
+Cada columna, en el orden de la cabecera, es uno de:
+    {"nombre", "tipo": "bits", "presentes", "valores"}
+        Columnas SI/NO. Dos bitsets de `filas` bits (bit i = fila i, el menos
+        significativo primero, en base64): celda no vacía y celda == 'SI'.
+    {"nombre", "tipo": "num", "decimales": d, "presentes", "deltas"}
+        Columnas numéricas. Los valores presentes, multiplicados por 10^d, son enteros;
+        se guardan como diferencias con el anterior (el primero con 0), en zigzag y
+        varint LEB128, en base64. valor = entero / 10^d.
+    {"nombre", "tipo": "dic", "diccionario": [...], "ancho": 1|2|4, "codigos"}
+        Resto de columnas. Códigos enteros sin signo little-endian de `ancho` bytes en
+        base64: 0 = celda vacía, k = diccionario[k - 1].
+
+Las celdas vacías no generan clave en la fila decodificada, igual que sheet_to_json.
+
+Uso:
+    python paquete_compacto.py Hub_Clinico_Maestro.xlsx
+"""
+
+import argparse
+import base64
+import json
+import math
+import os
+import time
+import zipfile
+
+import numpy as np
+
+from column_schema import HOJAS_DATOS
+from columnar_cache import hash_libro
+from xlsx_reader import LIBRO_MAESTRO, columnas_hoja, iter_visits, leer_columnas
+from xlsx_streaming import guardar_json, localizar_hojas
+
+FORMATO = 'hub-compacto'
+VERSION_PAQUETE = 1
+
+MAX_DECIMALES = 6
+# Enteros exactos en un double de JS
+MAX_ENTERO_SEGURO = 2 ** 53 - 1
+
+# ================ CODIFICACIÓN ================
+
+def _b64(datos):
+    return base64.b64encode(bytes(datos)).decode('ascii')
+
+def _de_b64(texto):
+    return np.frombuffer(base64.b64decode(texto), dtype=np.uint8)
+
+def empaquetar_bits(bits):
+    return _b64(np.packbits(np.asarray(bits, dtype=bool), bitorder='little'))
+
+def desempaquetar_bits(texto, n):
+    return np.unpackbits(_de_b64(texto), count=n, bitorder='little').astype(bool)
+
+def codificar_varint(enteros):
+    """Enteros con signo → zigzag + LEB128 (vectorizado)"""
+    enteros = np.asarray(enteros, dtype=np.int64)
+    if not len(enteros):
+        return b''
+    zigzag = ((enteros << 1) ^ (enteros >> 63)).astype(np.uint64)
+    bits = np.zeros(len(zigzag), dtype=np.int64)
+    restante = zigzag.copy()
+    while restante.any():
+        bits += restante > 0
+        restante >>= np.uint64(7)
+    longitudes = np.maximum(bits, 1)
+    inicios = np.concatenate(([0], np.cumsum(longitudes)[:-1]))
+    salida = np.zeros(int(longitudes.sum()), dtype=np.uint8)
+    for k in range(int(longitudes.max())):
+        activos = longitudes > k
+        grupo = (zigzag[activos] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        continua = np.where(longitudes[activos] > k + 1, 0x80, 0).astype(np.uint64)
+        salida[inicios[activos] + k] = (grupo | continua).astype(np.uint8)
+    return salida.tobytes()
+
+def decodificar_varint(datos, n):
+    valores = np.empty(n, dtype=np.int64)
+    posicion = 0
+    for i in range(n):
+        resultado = desplazamiento = 0
+        while True:
+            byte = datos[posicion]
+            posicion += 1
+            resultado |= (byte & 0x7F) << desplazamiento
+            desplazamiento += 7
+            if byte < 0x80:
+                break
+        valores[i] = (resultado >> 1) ^ -(resultado & 1)
+    return valores
+
+def _decimales(valor):
+    """Decimales necesarios para escribir `valor` tal cual (None si más de MAX_DECIMALES)"""
+    if isinstance(valor, int):
+        return 0
+    texto = repr(valor)
+    if 'e' in texto or 'E' in texto or 'inf' in texto or 'nan' in texto:
+        return None
+    decimales = len(texto.split('.')[1].rstrip('0')) if '.' in texto else 0
+    return decimales if decimales <= MAX_DECIMALES else None
+
+def _columna_num(nombre, valores, presentes):
+    numeros = [v for v in valores if v is not None]
+    decimales = [_decimales(v) for v in numeros]
+    if None in decimales:
+        return None
+    decimales = max(decimales, default=0)
+    escala = 10 ** decimales
+    enteros = [round(v * escala) for v in numeros]
+    # La división entera / 10^d en JS debe devolver exactamente el mismo double
+    if any(abs(e) > MAX_ENTERO_SEGURO or e / escala != v for e, v in zip(enteros, numeros)):
+        return None
+    enteros = np.array(enteros, dtype=np.int64)
+    deltas = np.diff(enteros, prepend=np.int64(0))
+    return {'nombre': nombre, 'tipo': 'num', 'decimales': decimales,
+            'presentes': empaquetar_bits(presentes), 'deltas': _b64(codificar_varint(deltas))}
+
+def _columna_dic(nombre, valores):
+    diccionario = {}
+    codigos = np.empty(len(valores), dtype=np.uint32)
+    for i, valor in enumerate(valores):
+        if valor is None:
+            codigos[i] = 0
+            continue
+        clave = (type(valor) is bool, valor)
+        codigo = diccionario.get(clave)
+        if codigo is None:
+            codigo = diccionario[clave] = len(diccionario) + 1
+        codigos[i] = codigo
+    ancho = 1 if len(diccionario) < 2 ** 8 else 2 if len(diccionario) < 2 ** 16 else 4
+    return {'nombre': nombre, 'tipo': 'dic', 'diccionario': [valor for _, valor in diccionario],
+            'ancho': ancho, 'codigos': _b64(codigos.astype(f'<u{ancho}').tobytes())}
+
+def codificar_columna(nombre, valores):
+    """Elige la codificación más compacta que conserva exactamente los valores de la columna"""
+    valores = [None if v == '' else v for v in valores]
+    presentes = np.array([v is not None for v in valores], dtype=bool)
+    if presentes.any() and all(v in ('SI', 'NO') for v in valores if v is not None):
+        return {'nombre': nombre, 'tipo': 'bits', 'presentes': empaquetar_bits(presentes),
+                'valores': empaquetar_bits([v == 'SI' for v in valores])}
+    if presentes.any() and all(type(v) in (int, float) and math.isfinite(v) for v in valores if v is not None):
+        columna = _columna_num(nombre, valores, presentes)
+        if columna is not None:
+            return columna
+    return _columna_dic(nombre, valores)
+
+def decodificar_columna(columna, n):
+    """Lista de valores (None = vacío) de una columna del paquete"""
+    tipo = columna['tipo']
+    if tipo == 'bits':
+        presentes = desempaquetar_bits(columna['presentes'], n)
+        si = desempaquetar_bits(columna['valores'], n)
+        return [('SI' if s else 'NO') if p else None for p, s in zip(presentes, si)]
+    if tipo == 'num':
+        presentes = desempaquetar_bits(columna['presentes'], n)
+        enteros = np.cumsum(decodificar_varint(base64.b64decode(columna['deltas']), int(presentes.sum())))
+        escala = 10 ** columna['decimales']
+        numeros = iter(enteros.tolist() if escala == 1 else (e / escala for e in enteros.tolist()))
+        return [next(numeros) if p else None for p in presentes]
+    if tipo == 'dic':
+        codigos = np.frombuffer(base64.b64decode(columna['codigos']), dtype=f'<u{columna["ancho"]}')
+        tabla = [None] + columna['diccionario']
+        return [tabla[c] for c in codigos.tolist()]
+    raise ValueError(f"Tipo de columna desconocido en el paquete: {tipo}")
+
+# ================ PAQUETE ================
+
+def _farmacos(libro):
+    """Mismo objeto que construye loadDatabase a partir de la hoja Fármacos"""
+    farmacos = {'Sistemicos': [], 'FAMEs': [], 'Biologicos': []}
+    for fila in iter_visits('Fármacos', workbook=libro):
+        for lista, valor in zip(farmacos.values(), fila):
+            if valor not in (None, '', 0, False):
+                lista.append(valor)
+    return farmacos
+
+def empaquetar(libro=LIBRO_MAESTRO, hojas=HOJAS_DATOS):
+    with zipfile.ZipFile(libro) as zf:
+        disponibles = localizar_hojas(zf)
+    paquete = {'formato': FORMATO, 'version': VERSION_PAQUETE,
+               'libro': os.path.basename(os.fspath(libro)), 'sha256': hash_libro(libro), 'hojas': {}}
+    for hoja in hojas:
+        if hoja not in disponibles:
+            continue
+        nombres = [n for n in columnas_hoja(hoja, libro) if n is not None]
+        columnas = leer_columnas(hoja, nombres, libro=libro)
+        filas = len(columnas[nombres[0]]) if nombres else 0
+        paquete['hojas'][hoja] = {'filas': filas,
+                                  'columnas': [codificar_columna(n, columnas[n].tolist()) for n in nombres]}
+    if 'Profesionales' in disponibles:
+        nombres = columnas_hoja('Profesionales', libro)
+        paquete['Profesionales'] = [{n: v for n, v in zip(nombres, fila) if n is not None and v not in (None, '')}
+                                    for fila in iter_visits('Profesionales', workbook=libro)]
+    if 'Fármacos' in disponibles:
+        paquete['Fármacos'] = _farmacos(libro)
+    return paquete
+
+def desempaquetar(paquete):
+    """Referencia del decodificador: {hoja: [fila como dict sin celdas vacías]} de las hojas de datos"""
+    if paquete.get('formato') != FORMATO or paquete.get('version') != VERSION_PAQUETE:
+        raise ValueError(f"Paquete no soportado: {paquete.get('formato')} v{paquete.get('version')}")
+    resultado = {}
+    for hoja, datos in paquete['hojas'].items():
+        n = datos['filas']
+        filas = [{} for _ in range(n)]
+        for columna in datos['columnas']:
+            nombre = columna['nombre']
+            for fila, valor in zip(filas, decodificar_columna(columna, n)):
+                if valor is not None:
+                    fila[nombre] = valor
+        resultado[hoja] = filas
+    return resultado
+
+def ruta_paquete(libro):
+    return os.path.splitext(os.fspath(libro))[0] + '.compacto.json'
+
+def guardar_paquete(paquete, ruta):
+    guardar_json(paquete, ruta, separators=(',', ':'))
+
+# ================ CLI ================
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Empaqueta el libro maestro en el formato compacto de localStorage')
+    parser.add_argument('libro', nargs='?', default=LIBRO_MAESTRO)
+    parser.add_argument('--salida', help='Ruta del paquete (por defecto <libro>.compacto.json)')
+    parser.add_argument('--comparar', action='store_true',
+                        help='Calcula también el tamaño del JSON que guardaría saveToSessionStorage')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    inicio = time.perf_counter()
+    paquete = empaquetar(args.libro)
+    salida = args.salida or ruta_paquete(args.libro)
+    guardar_paquete(paquete, salida)
+    tamano = os.path.getsize(salida)
+    print(f"Paquete {salida}: {tamano / 1024:,.0f}KB ({time.perf_counter() - inicio:.1f}s)")
+    for hoja, datos in paquete['hojas'].items():
+        tipos = {}
+        for columna in datos['columnas']:
+            tipos[columna['tipo']] = tipos.get(columna['tipo'], 0) + 1
+        print(f"  {hoja}: {datos['filas']} visitas, columnas {tipos}")
+    if args.comparar:
+        db = desempaquetar(paquete)
+        db.update({k: paquete[k] for k in ('Profesionales', 'Fármacos') if k in paquete})
+        tamano_json = len(json.dumps(db, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        print(f"  JSON de appState.db: {tamano_json / 1024:,.0f}KB ({tamano / tamano_json:.1%} del original)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Archivo del libro maestro particionado por año de visita + manifiesto caliente/frío
+
+loadDatabase (modules/dataManager.js) lee siempre el maestro completo, aunque el dashboard
+y los seguimientos casi solo usan los últimos uno o dos años y el historial completo del
+paciente que se está viendo. Este script reparte las filas de ESPA y APS por año de
+Fecha_Visita en libros de partición (misma plantilla: cabeceras, Fármacos y Profesionales
+incluidos): una partición caliente con los últimos --anios-calientes años, que se carga
+como un maestro normal, y una partición fría por cada año anterior. El manifiesto guarda
+por partición sus filas por hoja, el rango de fechas y un filtro de Bloom de ID_Paciente,
+para abrir una partición fría solo cuando el historial del paciente llega hasta ella.
+Las filas se copian como XML sin decodificar; de cada una solo se leen ID_Paciente y
+Fecha_Visita.
+
+Filtro de Bloom: m bits (bytes en base64, bit i = byte i >> 3, máscara 1 << (i & 7)) y k
+posiciones (h1 + j·h2) mod m, con h1 = FNV-1a de 32 bits del ID en UTF-8 y h2 = FNV-1a con
+la base de desplazamiento BASE_H2 (forzado a impar); reproducible en JS con Math.imul.
+
+Uso:
+    python particionar_maestro.py Hub_Clinico_Maestro.xlsx
+    python particionar_maestro.py Hub_Clinico_Maestro.xlsx --anios-calientes 1 --paciente ESP-2024-003
+
+    from particionar_maestro import cargar_manifiesto, iter_visitas
+    manifiesto = cargar_manifiesto('Hub_Clinico_Maestro.particiones/manifiesto.json')
+    iter_visitas(manifiesto, 'ESPA')                                # solo la partición caliente
+    iter_visitas(manifiesto, 'ESPA', id_paciente='ESP-2024-003')   # + las frías con ese paciente
+"""
+
+import argparse
+import base64
+import json
+import math
+import os
+import re
+import tempfile
+import time
+import zipfile
+
+from column_schema import HOJAS_DATOS
+from columnar_cache import hash_libro
+from compactar_maestro import normalizar_fecha
+from xlsx_reader import (LIBRO_MAESTRO, NUM_FILA, LectorFilas, celdas_fila, convertir_celda, iter_filas_xml,
+                         iter_visits, leer_cadenas_compartidas, orden_columna)
+from xlsx_streaming import MARCADOR_FILA, TAM_BLOQUE, escribir_libro_streaming, guardar_json, localizar_hojas
+
+VERSION_MANIFIESTO = 1
+ANIOS_CALIENTES = 2
+# Tasa de falsos positivos del filtro de Bloom (abrir una partición fría de más)
+FALSOS_POSITIVOS = 0.01
+
+FNV_BASE = 0x811C9DC5
+FNV_PRIMO = 0x01000193
+BASE_H2 = 0x5BD1E995
+
+# Número de fila en las referencias r="..." de <row> y <c>
+_REF_FILA = re.compile(r'(<(?:row|c)\b[^>]*?\sr="[A-Z]*)\d+"')
+# Carácter ilegal en XML que separa las filas en los ficheros temporales
+SEPARADOR = '\x01'
+
+# ================ FILTRO DE BLOOM ================
+
+def _fnv1a(datos, base=FNV_BASE):
+    h = base
+    for byte in datos:
+        h = ((h ^ byte) * FNV_PRIMO) & 0xFFFFFFFF
+    return h
+
+def _posiciones(id_paciente, m, k):
+    datos = str(id_paciente).strip().encode('utf-8')
+    h1, h2 = _fnv1a(datos), _fnv1a(datos, BASE_H2) | 1
+    return [(h1 + j * h2) % m for j in range(k)]
+
+class FiltroBloom:
+    """Filtro de Bloom de IDs de paciente dimensionado para `n` elementos"""
+
+    def __init__(self, n, falsos_positivos=FALSOS_POSITIVOS, m=None, k=None, bits=None):
+        n = max(n, 1)
+        self.m = m or max(8, math.ceil(-n * math.log(falsos_positivos) / math.log(2) ** 2))
+        self.k = k or max(1, round(self.m / n * math.log(2)))
+        self.bits = bits if bits is not None else bytearray((self.m + 7) // 8)
+
+    def anadir(self, id_paciente):
+        for i in _posiciones(id_paciente, self.m, self.k):
+            self.bits[i >> 3] |= 1 << (i & 7)
+
+    def __contains__(self, id_paciente):
+        return all(self.bits[i >> 3] & (1 << (i & 7)) for i in _posiciones(id_paciente, self.m, self.k))
+
+    def a_json(self):
+        return {'m': self.m, 'k': self.k, 'bits': base64.b64encode(bytes(self.bits)).decode('ascii')}
+
+    @classmethod
+    def desde_json(cls, datos):
+        return cls(1, m=datos['m'], k=datos['k'], bits=bytearray(base64.b64decode(datos['bits'])))
+
+# ================ PARTICIONADO ================
+
+def ruta_particiones(libro):
+    return os.path.splitext(libro)[0] + '.particiones'
+
+def _anio(valor):
+    """Año de una Fecha_Visita (None si no es una fecha reconocible)"""
+    fecha = normalizar_fecha(valor)
+    if isinstance(fecha, str) and len(fecha) == 10 and fecha[4] == '-':
+        return int(fecha[:4]), fecha
+    return None, None
+
+def _leer_plantillas(ruta):
+    resto = ''
+    with open(ruta, encoding='utf-8', newline='') as f:
+        while True:
+            bloque = f.read(TAM_BLOQUE)
+            if not bloque:
+                return
+            partes = (resto + bloque).split(SEPARADOR)
+            resto = partes.pop()
+            yield from partes
+
+def letras_cabecera(zf, ruta, compartidas, nombres):
+    """Letra de columna de cada nombre de la cabecera (fila 1) de la hoja"""
+    for fila in iter_filas_xml(zf, ruta):
+        if '<c' in fila:
+            letras = {convertir_celda(*celda, compartidas): letra for letra, celda in celdas_fila(fila).items()}
+            return [letras[nombre] for nombre in nombres]
+    raise ValueError(f'Hoja sin cabecera: {ruta}')
+
+def _filas_hoja(zf, ruta, compartidas):
+    """(ID_Paciente, Fecha_Visita, XML de la fila con MARCADOR_FILA) de cada fila de datos, sin decodificar el resto"""
+    letra_id, letra_fecha = letras_cabecera(zf, ruta, compartidas, ('ID_Paciente', 'Fecha_Visita'))
+    orden = sorted((letra_id, letra_fecha), key=orden_columna)
+    lector = LectorFilas(compartidas)
+    filas = iter_filas_xml(zf, ruta)
+    for fila in filas:
+        if '<c' in fila:
+            break
+    for fila in filas:
+        if '</c>' not in fila:
+            continue
+        numero = NUM_FILA.match(fila)
+        num_fila = numero.group(1) if numero else ''
+        valores = dict(zip(orden, lector.valores(fila, num_fila, orden)))
+        yield valores[letra_id], valores[letra_fecha], plantilla_fila(fila, num_fila) + '</row>'
+
+def plantilla_fila(fila, num_fila):
+    """Fila con MARCADOR_FILA en lugar de su número en las referencias r="..." """
+    referencia = num_fila + '"'
+    # Caso habitual: el número solo aparece en <row r> y en el r="" de cada celda
+    if num_fila and fila.count(referencia) == fila.count('<c ') + 1:
+        return fila.replace(referencia, MARCADOR_FILA + '"')
+    return _REF_FILA.sub(lambda m: m.group(1) + MARCADOR_FILA + '"', fila)
+
+def particionar(libro=LIBRO_MAESTRO, directorio=None, anios_calientes=ANIOS_CALIENTES,
+                falsos_positivos=FALSOS_POSITIVOS, hojas=HOJAS_DATOS):
+    """
+    Escribe los libros de partición y el manifiesto en `directorio` (por defecto
+    <libro>.particiones) y devuelve el manifiesto. Las filas sin fecha reconocible van a
+    la partición caliente para que sigan visibles en el dashboard.
+    """
+    directorio = directorio or ruta_particiones(libro)
+    os.makedirs(directorio, exist_ok=True)
+    anteriores = set()
+    if os.path.exists(os.path.join(directorio, 'manifiesto.json')):
+        with open(os.path.join(directorio, 'manifiesto.json'), encoding='utf-8') as f:
+            anteriores = {p['archivo'] for p in json.load(f).get('particiones', [])}
+    base = os.path.splitext(os.path.basename(libro))[0]
+
+    with tempfile.TemporaryDirectory(dir=directorio) as temporal:
+        # Una pasada por el maestro: el XML de cada fila (sin número) al fichero de su (año, hoja).
+        # Las cadenas compartidas siguen siendo válidas porque cada partición copia sharedStrings.xml.
+        ficheros, resumen = {}, {}
+        try:
+            with zipfile.ZipFile(libro) as zf:
+                rutas = localizar_hojas(zf)
+                compartidas = leer_cadenas_compartidas(zf)
+                for hoja in hojas:
+                    for id_paciente, valor_fecha, plantilla in _filas_hoja(zf, rutas[hoja], compartidas):
+                        anio, fecha = _anio(valor_fecha)
+                        clave = (anio, hoja)
+                        if clave not in ficheros:
+                            ficheros[clave] = open(os.path.join(temporal, f'{anio}_{hoja}.xml'), 'w',
+                                                   encoding='utf-8', newline='')
+                        ficheros[clave].write(plantilla + SEPARADOR)
+                        datos = resumen.setdefault(anio, {'filas': dict.fromkeys(hojas, 0), 'ids': set(),
+                                                          'desde': None, 'hasta': None})
+                        datos['filas'][hoja] += 1
+                        if id_paciente not in (None, ''):
+                            datos['ids'].add(str(id_paciente).strip())
+                        if fecha:
+                            datos['desde'] = min(datos['desde'] or fecha, fecha)
+                            datos['hasta'] = max(datos['hasta'] or fecha, fecha)
+        finally:
+            for f in ficheros.values():
+                f.close()
+
+        anios = sorted(anio for anio in resumen if anio is not None)
+        corte = anios[-min(anios_calientes, len(anios))] if anios else 0
+        grupos = {'caliente': [anio for anio in resumen if anio is None or anio >= corte]}
+        grupos.update({str(anio): [anio] for anio in anios if anio < corte})
+
+        # Plantilla sin filas de datos: cada partición no vuelve a descomprimir las hojas del maestro
+        plantilla = os.path.join(temporal, 'plantilla.xlsx')
+        escribir_libro_streaming(libro, plantilla, {hoja: () for hoja in hojas})
+
+        particiones = []
+        for nombre, grupo in grupos.items():
+            archivo = f'{base}_{nombre}.xlsx'
+            ids, filas, desde, hasta = set(), dict.fromkeys(hojas, 0), None, None
+            for anio in grupo:
+                datos = resumen[anio]
+                ids |= datos['ids']
+                for hoja in hojas:
+                    filas[hoja] += datos['filas'][hoja]
+                if datos['desde']:
+                    desde = min(desde or datos['desde'], datos['desde'])
+                    hasta = max(hasta or datos['hasta'], datos['hasta'])
+            contenidos = {hoja: _concatenar([os.path.join(temporal, f'{anio}_{hoja}.xml') for anio in
+                                             sorted(grupo, key=lambda a: (a is None, a or 0))
+                                             if (anio, hoja) in ficheros])
+                          for hoja in hojas}
+            escribir_libro_streaming(plantilla, os.path.join(directorio, archivo), contenidos)
+            bloom = FiltroBloom(len(ids), falsos_positivos)
+            for id_paciente in ids:
+                bloom.anadir(id_paciente)
+            particiones.append({
+                'archivo': archivo,
+                'caliente': nombre == 'caliente',
+                'anios': [anio for anio in grupo if anio is not None],
+                'sin_fecha': None in grupo,
+                'filas': filas,
+                'desde': desde,
+                'hasta': hasta,
+                'pacientes': len(ids),
+                'bloom': bloom.a_json(),
+            })
+
+    manifiesto = {
+        'version': VERSION_MANIFIESTO,
+        'origen': os.path.basename(libro),
+        'hash_origen': hash_libro(libro),
+        'anios_calientes': anios_calientes,
+        'particiones': sorted(particiones, key=lambda p: (not p['caliente'], [-a for a in p['anios']])),
+    }
+    guardar_json(manifiesto, os.path.join(directorio, 'manifiesto.json'), indent=1)
+    # Particiones de una ejecución anterior que ya no existen (p. ej. un año que pasó a frío)
+    for archivo in anteriores - {p['archivo'] for p in particiones}:
+        if os.path.exists(os.path.join(directorio, archivo)):
+            os.remove(os.path.join(directorio, archivo))
+    return manifiesto
+
+def _concatenar(rutas):
+    for ruta in rutas:
+        yield from _leer_plantillas(ruta)
+
+# ================ CARGA ================
+
+def cargar_manifiesto(ruta):
+    """Manifiesto con la ruta de cada partición resuelta y su filtro de Bloom decodificado"""
+    with open(ruta, encoding='utf-8') as f:
+        manifiesto = json.load(f)
+    if manifiesto.get('version') != VERSION_MANIFIESTO:
+        raise ValueError(f"Versión de manifiesto no soportada: {manifiesto.get('version')}")
+    directorio = os.path.dirname(os.path.abspath(ruta))
+    for particion in manifiesto['particiones']:
+        particion['ruta'] = os.path.join(directorio, particion['archivo'])
+        particion['filtro'] = FiltroBloom.desde_json(particion['bloom'])
+    return manifiesto
+
+def particiones_paciente(manifiesto, id_paciente):
+    """Particiones que pueden contener visitas del paciente (la caliente siempre va primero)"""
+    return [p for p in manifiesto['particiones'] if p['caliente'] or str(id_paciente).strip() in p['filtro']]
+
+def iter_visitas(manifiesto, hoja, columnas=None, id_paciente=None, where=None):
+    """
+    Como xlsx_reader.iter_visits sobre las particiones: sin `id_paciente` solo la caliente;
+    con él, sus visitas de la caliente y de las frías que el filtro de Bloom no descarta.
+    """
+    if id_paciente is None:
+        particiones = [p for p in manifiesto['particiones'] if p['caliente']]
+    else:
+        particiones = particiones_paciente(manifiesto, id_paciente)
+        where = dict(where or {}, ID_Paciente=lambda v: v is not None and str(v).strip() == str(id_paciente).strip())
+    for particion in particiones:
+        if particion['filas'].get(hoja):
+            yield from iter_visits(hoja, columnas, where, particion['ruta'])
+
+# ================ CLI ================
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Particiona ESPA/APS por año de visita con manifiesto caliente/frío')
+    parser.add_argument('libro', nargs='?', default=LIBRO_MAESTRO)
+    parser.add_argument('--directorio', help='Destino de las particiones (por defecto <libro>.particiones)')
+    parser.add_argument('--anios-calientes', type=int, default=ANIOS_CALIENTES,
+                        help='Años más recientes que forman la partición caliente')
+    parser.add_argument('--paciente', help='Tras particionar, lista las particiones que se abrirían para este ID')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    inicio = time.perf_counter()
+    manifiesto = particionar(args.libro, args.directorio, args.anios_calientes)
+    directorio = args.directorio or ruta_particiones(args.libro)
+    print(f"{directorio}: {len(manifiesto['particiones'])} particiones ({time.perf_counter() - inicio:.1f}s)")
+    for p in manifiesto['particiones']:
+        filas = ', '.join(f'{hoja} {n}' for hoja, n in p['filas'].items())
+        print(f"  {p['archivo']}: {p['desde']} → {p['hasta']}, {filas}, {p['pacientes']} pacientes"
+              + (' [caliente]' if p['caliente'] else ''))
+    if args.paciente:
+        manifiesto = cargar_manifiesto(os.path.join(directorio, 'manifiesto.json'))
+        print(f"{args.paciente}: " + ', '.join(p['archivo'] for p in particiones_paciente(manifiesto, args.paciente)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Motor de scores por lotes: port de modules/scoreCalculators.js
+
+Las funciones del navegador calculan BASDAI, ASDAS, HAQ, LEI, RAPID3 y MDA para un
+formulario. Aquí las mismas fórmulas (y los cortes de categorizeScore definidos en
+hubTools.js) operan sobre columnas NumPy completas, de modo que una hoja entera del
+libro maestro se recalcula de una vez y se pueden auditar los resultados guardados
+(BASDAI_Result, ASDAS_CRP_Result, HAQ_Total, LEI_Score, RAPID3_Score, MDA_Cumple).
+El libro se lee a través de la caché columnar, que solo se reconstruye si cambia.
+
+Uso:
+    python score_engine.py Hub_Clinico_Maestro.xlsx --hojas ESPA APS --listar 20
+"""
+
+import argparse
+import re
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from column_schema import COLUMNAS_HAQ, COLUMNAS_LEI, HOJAS_DATOS
+from columnar_cache import cargar
+
+# ================ CORTES (hubTools.js → activityCutoffs) ================
+
+CORTES = {
+    'basdai': {'remission': 4, 'moderate': 6, 'high': 10},
+    'asdas': {'remission': 1.3, 'lowActivity': 2.1, 'moderate': 3.5, 'high': 3.5},
+    'haq': {'remission': 0.5, 'mild': 1.5, 'moderate': 2, 'severe': 3},
+    'lei': {'remission': 5, 'mild': 10, 'moderate': 15, 'high': 44},
+    'rapid3': {'remission': 3, 'lowActivity': 6, 'moderate': 12, 'high': 12},
+    'evaGlobal': {'remission': 2, 'mild': 4, 'moderate': 6, 'severe': 10},
+    'evaDolor': {'remission': 1, 'mild': 3, 'moderate': 6, 'severe': 10},
+}
+
+# Reglas de categorizeScore: (estricto, ((umbral, categoría), ...), categoría final).
+# Con estricto=True se compara con '<' y si no con '<='. Igual que en JS, un valor NaN
+# no cumple ninguna comparación y cae en la última categoría.
+REGLAS_CATEGORIA = {
+    'basdai': (True, ((CORTES['basdai']['remission'], 'low'), (CORTES['basdai']['high'], 'moderate')), 'high'),
+    'asdas': (True, ((CORTES['asdas']['remission'], 'remission'), (CORTES['asdas']['lowActivity'], 'low'),
+                     (CORTES['asdas']['moderate'], 'moderate')), 'high'),
+    'haq': (True, ((CORTES['haq']['remission'], 'remission'), (CORTES['haq']['mild'], 'mild'),
+                   (CORTES['haq']['moderate'], 'moderate')), 'severe'),
+    # categorizeScore usa umbrales fijos para LEI (no los de hubTools)
+    'lei': (False, ((1, 'remission'), (3, 'mild'), (5, 'moderate')), 'high'),
+    'rapid3': (False, ((CORTES['rapid3']['remission'], 'remission'), (CORTES['rapid3']['lowActivity'], 'low'),
+                       (CORTES['rapid3']['moderate'], 'moderate')), 'high'),
+    'evaGlobal': (True, ((CORTES['evaGlobal']['remission'], 'minimal'), (CORTES['evaGlobal']['mild'], 'mild'),
+                         (CORTES['evaGlobal']['moderate'], 'moderate')), 'severe'),
+    'evaDolor': (True, ((CORTES['evaDolor']['remission'], 'minimal'), (CORTES['evaDolor']['mild'], 'mild'),
+                        (CORTES['evaDolor']['moderate'], 'moderate')), 'severe'),
+}
+
+# ================ CONVERSIÓN DE COLUMNAS ================
+
+_NUMERO_JS = re.compile(r'\s*([+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)')
+
+def _parse_float(valor):
+    """parseFloat de JS: prefijo numérico del texto, NaN si no lo hay"""
+    if valor is None or isinstance(valor, bool):
+        return np.nan
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    coincidencia = _NUMERO_JS.match(str(valor))
+    return float(coincidencia.group(1)) if coincidencia else np.nan
+
+def a_numeros(valores):
+    """Columna a float64 con la semántica de parseFloat (NaN en vacíos y textos no numéricos)"""
+    if isinstance(valores, np.ndarray) and valores.dtype.kind in 'fiu':
+        return valores.astype(np.float64, copy=False)
+    try:
+        return np.asarray(valores, dtype=np.float64)
+    except (TypeError, ValueError):
+        return np.fromiter((_parse_float(v) for v in valores), dtype=np.float64, count=len(valores))
+
+def a_marcas(valores):
+    """Columna SI/NO, booleana o 0/1 a booleanos (True en 'SI', True o números > 0)"""
+    if isinstance(valores, np.ndarray) and valores.dtype.kind in 'biuf':
+        return np.asarray(valores > 0)
+    return np.fromiter((v == 'SI' or (not isinstance(v, str) and v is not None and v > 0) for v in valores),
+                       dtype=bool, count=len(valores))
+
+def _o_cero(valores):
+    """`parseFloat(x) || 0`: los NaN pasan a 0"""
+    numeros = a_numeros(valores)
+    return np.where(np.isnan(numeros), 0.0, numeros)
+
+def redondear_js(valores, decimales):
+    """Redondeo de Number.toFixed (mitades lejos de cero)"""
+    factor = 10.0 ** decimales
+    return np.sign(valores) * np.floor(np.abs(valores) * factor + 0.5) / factor
+
+# ================ SCORES ================
+
+def calcular_basdai(p1, p2, p3, p4, p5, p6):
+    """BASDAI con P6 en horas pasado a escala 0-10 (2 h o más = 10)"""
+    p1, p2, p3, p4, p5, p6 = (_o_cero(p) for p in (p1, p2, p3, p4, p5, p6))
+    p6_escala = np.minimum(p6 / 2 * 10, 10)
+    return (p1 + p2 + p3 + p4 + (p5 + p6_escala) / 2) / 5
+
+def calcular_asdas(dolor_espalda, duracion_rigidez, eva_global, nad, pcr, vsg):
+    """ASDAS-CRP y ASDAS-ESR"""
+    dolor_espalda, duracion_rigidez, eva_global, nad, pcr, vsg = (
+        _o_cero(c) for c in (dolor_espalda, duracion_rigidez, eva_global, nad, pcr, vsg))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        asdas_crp = (0.121 * dolor_espalda + 0.058 * duracion_rigidez + 0.110 * eva_global
+                     + 0.073 * nad + 0.579 * np.log(pcr + 1))
+        asdas_esr = (0.08 * dolor_espalda + 0.07 * duracion_rigidez + 0.11 * eva_global
+                     + 0.09 * nad + 0.29 * np.sqrt(vsg))
+    return asdas_crp, asdas_esr
+
+def calcular_haq(categorias, ayudas=None):
+    """HAQ-DI: media de las 8 categorías; con ayuda técnica una categoría 0-1 cuenta como 2"""
+    puntuaciones = np.column_stack([_o_cero(c) for c in categorias])
+    if ayudas is not None:
+        usa_ayuda = np.column_stack([a_marcas(a) for a in ayudas])
+        puntuaciones = np.where(usa_ayuda & (puntuaciones <= 1), 2.0, puntuaciones)
+    return puntuaciones.sum(axis=1) / len(categorias)
+
+def calcular_lei(puntos):
+    """LEI: número de puntos de entesitis marcados"""
+    return np.column_stack([a_marcas(p) for p in puntos]).sum(axis=1)
+
+def calcular_rapid3(haq, eva_dolor, eva_global):
+    """RAPID3 = función (HAQ × 3.33) + EVA dolor + EVA global"""
+    return _o_cero(haq) * 3.33 + _o_cero(eva_dolor) + _o_cero(eva_global)
+
+def calcular_mda(nat, nad, pasi, bsa, lei, eva_dolor, eva_global, haq):
+    """Criterios MDA cumplidos (0-7) y si se alcanza MDA (≥ 5)"""
+    nat, nad, pasi, bsa, lei, eva_dolor, eva_global, haq = (
+        _o_cero(c) for c in (nat, nad, pasi, bsa, lei, eva_dolor, eva_global, haq))
+    criterios = (
+        nat <= 1,
+        nad <= 1,
+        (pasi <= 1) | (bsa <= 3),
+        lei <= 1,
+        eva_dolor * 10 <= 15,
+        eva_global * 10 <= 20,
+        haq <= 0.5,
+    )
+    cumplidos = np.sum(criterios, axis=0)
+    return cumplidos, cumplidos >= 5
+
+def categorizar(valores, tipo):
+    """Categoría de categorizeScore para cada valor ('unknown' si el tipo no tiene cortes)"""
+    valores = a_numeros(valores)
+    if tipo not in REGLAS_CATEGORIA:
+        return np.full(len(valores), 'unknown', dtype=object)
+    estricto, tramos, final = REGLAS_CATEGORIA[tipo]
+    comparar = np.less if estricto else np.less_equal
+    return np.select([comparar(valores, umbral) for umbral, _ in tramos],
+                     [categoria for _, categoria in tramos], default=final).astype(object)
+
+# ================ HOJAS COMPLETAS ================
+
+COLUMNAS_BASDAI = tuple(f'BASDAI_P{i}' for i in range(1, 7))
+COLUMNAS_ASDAS = ('ASDAS_Dolor_Espalda', 'ASDAS_Duracion_Rigidez', 'ASDAS_EVA_Global', 'NAD_Total', 'PCR', 'VSG')
+
+COLUMNAS_ENTRADA = (COLUMNAS_BASDAI + COLUMNAS_ASDAS + COLUMNAS_HAQ + COLUMNAS_LEI
+                    + ('NAT_Total', 'PASI_Score', 'BSA_Percentage', 'EVA_Dolor', 'EVA_Global'))
+
+# Columna guardada → decimales con los que la escribe el formulario (None = booleano SI/NO)
+DECIMALES = {
+    'BASDAI_Result': 2,
+    'ASDAS_CRP_Result': 2,
+    'ASDAS_ESR_Result': 2,
+    'HAQ_Total': 2,
+    'LEI_Score': 0,
+    'RAPID3_Score': 1,
+    'MDA_Cumple': None,
+}
+COLUMNAS_GUARDADAS = tuple(DECIMALES)
+
+# Score de categorizeScore asociado a cada columna guardada
+TIPO_SCORE = {
+    'BASDAI_Result': 'basdai',
+    'ASDAS_CRP_Result': 'asdas',
+    'HAQ_Total': 'haq',
+    'LEI_Score': 'lei',
+    'RAPID3_Score': 'rapid3',
+}
+
+Discrepancia = namedtuple('Discrepancia', ['columna', 'comparadas', 'filas', 'guardado', 'recalculado'])
+
+def recalcular(columnas):
+    """
+    Recalcula los scores de una hoja a partir de un dict nombre → columna (una entrada
+    por visita). Las columnas de entrada que falten se tratan como vacías. Devuelve un
+    dict con las columnas de COLUMNAS_GUARDADAS (MDA_Cumple como booleanos) y
+    'MDA_Criterios' con el número de criterios cumplidos.
+    """
+    n = len(next(iter(columnas.values()))) if columnas else 0
+    vacia = np.full(n, np.nan)
+    col = {nombre: columnas.get(nombre, vacia) for nombre in COLUMNAS_ENTRADA}
+
+    asdas_crp, asdas_esr = calcular_asdas(*(col[nombre] for nombre in COLUMNAS_ASDAS))
+    haq = calcular_haq([col[nombre] for nombre in COLUMNAS_HAQ])
+    lei = calcular_lei([col[nombre] for nombre in COLUMNAS_LEI])
+    criterios, mda = calcular_mda(col['NAT_Total'], col['NAD_Total'], col['PASI_Score'], col['BSA_Percentage'],
+                                  lei, col['EVA_Dolor'], col['EVA_Global'], haq)
+    return {
+        'BASDAI_Result': calcular_basdai(*(col[nombre] for nombre in COLUMNAS_BASDAI)),
+        'ASDAS_CRP_Result': asdas_crp,
+        'ASDAS_ESR_Result': asdas_esr,
+        'HAQ_Total': haq,
+        'LEI_Score': lei.astype(np.float64),
+        'RAPID3_Score': calcular_rapid3(haq, col['EVA_Dolor'], col['EVA_Global']),
+        'MDA_Cumple': mda,
+        'MDA_Criterios': criterios,
+    }
+
+def categorias(recalculados):
+    """Categorías de categorizeScore de los scores recalculados (columna → array de categorías)"""
+    return {columna: categorizar(recalculados[columna], tipo) for columna, tipo in TIPO_SCORE.items()}
+
+def auditar(columnas, recalculados=None):
+    """
+    Compara los scores guardados con los recalculados. Solo se comparan las celdas con
+    valor guardado; un número coincide si es igual al recalculado con los decimales de
+    DECIMALES. Devuelve {columna: Discrepancia} para cada columna guardada presente,
+    con los índices (desde 0) de las visitas que no coinciden.
+    """
+    if recalculados is None:
+        recalculados = recalcular(columnas)
+    resultado = {}
+    for columna, decimales in DECIMALES.items():
+        if columna not in columnas:
+            continue
+        guardado = columnas[columna]
+        if decimales is None:
+            guardado = np.asarray(guardado, dtype=object)
+            presentes = (guardado == 'SI') | (guardado == 'NO')
+            esperado = np.where(recalculados[columna], 'SI', 'NO')
+            distintas = presentes & (guardado != esperado)
+        else:
+            guardado = a_numeros(guardado)
+            presentes = ~np.isnan(guardado)
+            esperado = redondear_js(recalculados[columna], decimales)
+            tolerancia = 0.5 * 10.0 ** -decimales + 1e-9
+            with np.errstate(invalid='ignore'):
+                distintas = presentes & ~(np.abs(guardado - esperado) <= tolerancia)
+        filas = np.flatnonzero(distintas)
+        resultado[columna] = Discrepancia(columna, int(presentes.sum()), filas, guardado[filas], esperado[filas])
+    return resultado
+
+# ================ LIBRO COMPLETO ================
+
+def _columna_cache(tabla, nombre):
+    """Columna de la caché columnar en la forma que espera auditar (SI/NO como texto)"""
+    if tabla.tipo(nombre) != 'si_no':
+        return tabla[nombre]
+    return np.where(tabla.nulos(nombre), None, np.where(tabla[nombre], 'SI', 'NO')).astype(object)
+
+def auditar_libro(ruta, hojas=HOJAS_DATOS):
+    """
+    Recalcula y audita las hojas de un libro sobre la caché columnar (columnar_cache), que
+    se reconstruye si el libro ha cambiado. Devuelve {hoja: (visitas, auditoría)} con las
+    filas de cada Discrepancia como números de fila de la hoja (los que se ven en Excel).
+    """
+    tablas = cargar(ruta, hojas)
+    informe = {}
+    for nombre_hoja in hojas:
+        if nombre_hoja not in tablas:
+            raise ValueError(f"El libro no tiene la hoja {nombre_hoja!r}")
+        tabla = tablas[nombre_hoja]
+        columnas = {c: _columna_cache(tabla, c) for c in COLUMNAS_ENTRADA + COLUMNAS_GUARDADAS if c in tabla}
+        numeros = tabla.filas.astype(np.int64)
+        auditoria = {columna: d._replace(filas=numeros[d.filas]) for columna, d in auditar(columnas).items()}
+        informe[nombre_hoja] = (len(numeros), auditoria)
+    return informe
+
+# ================ CLI ================
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Recalcula y audita los scores clínicos del libro maestro')
+    parser.add_argument('libro', nargs='?', default='Hub_Clinico_Maestro.xlsx')
+    parser.add_argument('--hojas', nargs='+', default=list(HOJAS_DATOS))
+    parser.add_argument('--listar', type=int, default=10,
+                        help='Discrepancias a listar por columna (fila de Excel, guardado, recalculado)')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    inicio = time.perf_counter()
+    informe = auditar_libro(args.libro, args.hojas)
+    total = 0
+    for nombre_hoja, (visitas, auditoria) in informe.items():
+        print(f"\n{nombre_hoja}: {visitas} visitas")
+        for columna, d in auditoria.items():
+            total += len(d.filas)
+            print(f"  {columna:<18} {d.comparadas:>8} comparadas, {len(d.filas):>8} discrepancias")
+            for fila, guardado, esperado in list(zip(d.filas, d.guardado, d.recalculado))[:args.listar]:
+                print(f"      fila {fila}: guardado {guardado}, recalculado {esperado}")
+    print(f"\nTotal discrepancias: {total} ({time.perf_counter() - inicio:.1f}s)")
+    return 1 if total else 0
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -1,8 +1,15 @@
 ﻿(function () {
     'use strict';
 
-    const PATIENT_ID_REGEX = /^(ESP|APS)-\d{4}-\d{3}$/i;
+    // Esquemas 1 (ESP-AAAA-NNN) y 2 (ESP-AAAA-NNNNNN) de id_pacientes.py (PATRON_ID)
+    const PATIENT_ID_REGEX = /^(ESP|APS)-\d{4}-(\d{3}|\d{6})$/i;
+    const PREBUILT_FORMAT = 'hub-busqueda';
+    const PREBUILT_VERSION = 1;
+    const MAX_SUGGESTIONS = 20;
     const searchIndex = [];
+    const indexById = new Map();
+    // Trigramas del índice precalculado (indice_busqueda.py); null si no se ha cargado
+    let ngramIndex = null;
 
     function normalize(str) {
         return (str || '')
@@ -36,18 +43,145 @@
     }
 
     function addPatientToIndex(candidate) {
-        const normalizedId = normalize(candidate.id);
-        if (!normalizedId) {
+        const idKey = candidate.idKey ?? normalize(candidate.id);
+        if (!idKey || indexById.has(idKey)) {
             return;
         }
-        if (searchIndex.some(entry => normalize(entry.id) === normalizedId)) {
-            return;
-        }
-        searchIndex.push({
+        const entry = {
             id: candidate.id,
             nombre: candidate.nombre || 'Paciente sin nombre',
-            patologia: (candidate.patologia || candidate.diagnostico || '').toLowerCase() || null
+            patologia: String(candidate.patologia || candidate.diagnostico || '').toLowerCase() || null,
+            idKey,
+            nombreKey: candidate.nombreKey ?? normalize(candidate.nombre)
+        };
+        indexById.set(idKey, entry);
+        searchIndex.push(entry);
+    }
+
+    /**
+     * Carga busqueda_pacientes.js si existe; sin él (checkout nuevo) se sigue sin índice precalculado
+     */
+    function loadPrebuiltIndex() {
+        if (window.HubSearchIndex || typeof HubTools === 'undefined' || !HubTools.utils.cargarScriptOpcional) {
+            return Promise.resolve(Boolean(window.HubSearchIndex));
+        }
+        return HubTools.utils.cargarScriptOpcional('busqueda_pacientes.js');
+    }
+
+    /**
+     * Carga window.HubSearchIndex (indice_busqueda.py --salida busqueda_pacientes.js): una
+     * entrada por paciente con las claves ya normalizadas. Debe cargarse con el índice vacío
+     * para que las posiciones de las listas de trigramas coincidan con las de searchIndex.
+     */
+    function hydrateIndexFromPrebuilt() {
+        const prebuilt = window.HubSearchIndex;
+        if (!prebuilt) return;
+        if (prebuilt.formato !== PREBUILT_FORMAT || prebuilt.version !== PREBUILT_VERSION || searchIndex.length) {
+            console.warn('dashboard_search: índice precalculado no soportado', prebuilt.formato, prebuilt.version);
+            return;
+        }
+        for (let i = 0; i < prebuilt.pacientes; i++) {
+            addPatientToIndex({
+                id: prebuilt.ids[i],
+                nombre: prebuilt.nombres[i],
+                patologia: prebuilt.patologias[i],
+                idKey: prebuilt.claves_id[i],
+                nombreKey: prebuilt.claves_nombre[i]
+            });
+        }
+        if (typeof decodeBase64Bytes !== 'function' || typeof decodeVarints !== 'function') {
+            // Sin los decodificadores de dataManager.js no se usan los trigramas: recorrido lineal
+            console.warn('dashboard_search: dataManager.js no cargado, búsqueda sin índice de trigramas');
+            return;
+        }
+        ngramIndex = {
+            n: prebuilt.ngramas.n,
+            size: searchIndex.length,
+            lists: prebuilt.ngramas.listas,
+            decoded: new Map()
+        };
+    }
+
+    function ngramPositions(gram) {
+        let positions = ngramIndex.decoded.get(gram);
+        if (!positions) {
+            positions = [];
+            const encoded = ngramIndex.lists[gram];
+            if (encoded) {
+                // Diferencias en varint (decodeVarints de dataManager.js); cada varint termina en un byte < 0x80
+                const bytes = decodeBase64Bytes(encoded);
+                let count = 0;
+                for (let i = 0; i < bytes.length; i++) {
+                    if (bytes[i] < 0x80) count++;
+                }
+                let current = 0;
+                positions = decodeVarints(bytes, count).map(delta => (current += delta));
+            }
+            ngramIndex.decoded.set(gram, positions);
+        }
+        return positions;
+    }
+
+    /**
+     * Posiciones de searchIndex que pueden contener el término (en orden creciente), o
+     * null si hay que recorrer todo el índice
+     */
+    function candidatePositions(normalizedTerm) {
+        if (!ngramIndex || normalizedTerm.length < ngramIndex.n) {
+            return null;
+        }
+        const lists = [];
+        for (let i = 0; i + ngramIndex.n <= normalizedTerm.length; i++) {
+            lists.push(ngramPositions(normalizedTerm.slice(i, i + ngramIndex.n)));
+        }
+        lists.sort((a, b) => a.length - b.length);
+        let positions = lists[0].slice();
+        for (let i = 1; i < lists.length && positions.length; i++) {
+            // Intersección de listas ordenadas
+            const other = lists[i];
+            let kept = 0;
+            let j = 0;
+            for (const position of positions) {
+                while (j < other.length && other[j] < position) j++;
+                if (j < other.length && other[j] === position) positions[kept++] = position;
+            }
+            positions.length = kept;
+        }
+        // Pacientes añadidos después del índice precalculado (HubTools, mocks): sin trigramas
+        for (let position = ngramIndex.size; position < searchIndex.length; position++) {
+            positions.push(position);
+        }
+        return positions;
+    }
+
+    function forEachCandidate(normalizedTerm, callback) {
+        const positions = candidatePositions(normalizedTerm);
+        const total = positions ? positions.length : searchIndex.length;
+        for (let k = 0; k < total; k++) {
+            if (callback(searchIndex[positions ? positions[k] : k]) === false) break;
+        }
+    }
+
+    /**
+     * Sugerencias para el término: ID exacto, prefijos de ID, prefijos de nombre y el
+     * resto de coincidencias en ID o nombre, hasta `limit`
+     */
+    function searchPatients(term, limit = MAX_SUGGESTIONS) {
+        const normalizedTerm = normalize(term);
+        if (!normalizedTerm) return [];
+        const exact = indexById.get(normalizedTerm);
+        const buckets = [[], [], []];
+        forEachCandidate(normalizedTerm, entry => {
+            if (entry === exact) return;
+            const bucket = entry.idKey.startsWith(normalizedTerm) ? 0
+                : entry.nombreKey.startsWith(normalizedTerm) ? 1
+                : (entry.idKey.includes(normalizedTerm) || entry.nombreKey.includes(normalizedTerm)) ? 2 : -1;
+            if (bucket >= 0 && buckets[bucket].length < limit) {
+                buckets[bucket].push(entry);
+            }
+            return buckets[0].length < limit;
         });
+        return (exact ? [exact] : []).concat(...buckets).slice(0, limit);
     }
 
     function hydrateIndexFromHubTools() {
@@ -57,7 +191,7 @@
                 patients.forEach(p => {
                     const id = p.ID_Paciente || p.idPaciente || p.ID || p.id;
                     const nombre = p.Nombre_Paciente || p.nombrePaciente || p.Nombre || p.nombre;
-                    const diagnostico = p.Diagnostico_Principal || p.diagnosticoPrimario || p.Diagnostico || p.pathology;
+                    const diagnostico = p.Diagnostico_Primario || p.Diagnostico_Principal || p.diagnosticoPrimario || p.Diagnostico || p.pathology;
                     if (id && nombre) {
                         addPatientToIndex({ id, nombre, patologia: diagnostico });
                     }
@@ -81,18 +215,22 @@
         }
     }
 
-    function populateDatalist(datalist) {
+    function populateDatalist(datalist, entries) {
         if (!datalist) return;
+        const fragment = document.createDocumentFragment();
+        entries.forEach(entry => {
+            const option = document.createElement('option');
+            option.value = entry.id;
+            option.label = `${entry.id} · ${entry.nombre}`;
+            fragment.appendChild(option);
+        });
         datalist.innerHTML = '';
-        searchIndex
-            .slice()
-            .sort((a, b) => a.id.localeCompare(b.id))
-            .forEach(entry => {
-                const option = document.createElement('option');
-                option.value = entry.id;
-                option.label = `${entry.id} · ${entry.nombre}`;
-                datalist.appendChild(option);
-            });
+        datalist.appendChild(fragment);
+    }
+
+    function initialSuggestions() {
+        const entries = ngramIndex ? searchIndex.slice(0, MAX_SUGGESTIONS) : searchIndex.slice();
+        return entries.sort((a, b) => a.id.localeCompare(b.id)).slice(0, MAX_SUGGESTIONS);
     }
 
     function resolvePatient(term) {
@@ -101,12 +239,15 @@
             return { error: 'Introduce un identificador o nombre de paciente.' };
         }
 
-        const exactMatch = searchIndex.find(entry => normalize(entry.id) === normalizedTerm);
+        const exactMatch = indexById.get(normalizedTerm);
         if (exactMatch) {
             return { patient: exactMatch };
         }
 
-        const matchingByName = searchIndex.filter(entry => normalize(entry.nombre).includes(normalizedTerm));
+        const matchingByName = [];
+        forEachCandidate(normalizedTerm, entry => {
+            if (entry.nombreKey.includes(normalizedTerm)) matchingByName.push(entry);
+        });
         if (matchingByName.length === 1) {
             return { patient: matchingByName[0] };
         }
@@ -122,7 +263,7 @@
             return { error: `No se encontró el paciente ${term}. Verifica el ID.` };
         }
 
-        return { error: 'No hay coincidencias. Usa el formato ESP-AAAA-### o el nombre completo.' };
+        return { error: 'No hay coincidencias. Usa el formato ESP-AAAA-### (o ESP-AAAA-######) o el nombre completo.' };
     }
 
     function navigateToDashboard(patient) {
@@ -164,11 +305,19 @@
             return;
         }
 
-        hydrateIndexFromHubTools();
-        hydrateIndexFromMocks();
-        populateDatalist(datalist);
+        // El índice precalculado tiene que entrar antes que el resto (posiciones de los trigramas)
+        loadPrebuiltIndex().then(() => {
+            hydrateIndexFromPrebuilt();
+            hydrateIndexFromHubTools();
+            hydrateIndexFromMocks();
+            populateDatalist(datalist, initialSuggestions());
+        });
 
         button.addEventListener('click', handleSearch);
+        input.addEventListener('input', () => {
+            const term = input.value.trim();
+            populateDatalist(datalist, term ? searchPatients(term) : initialSuggestions());
+        });
         input.addEventListener('keydown', event => {
             if (event.key === 'Enter') {
                 event.preventDefault();
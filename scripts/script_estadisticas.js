@@ -56,6 +56,12 @@ document.addEventListener('DOMContentLoaded', () => {
     initializeTableControls();
     addEventListeners();
     bindFiltersPanelResize();
+    initCohortHomunculus();
+
+    // Nubes precalculadas (correlaciones.py); sin el fichero se usan los pacientes cargados
+    HubTools?.utils?.cargarScriptOpcional?.('correlaciones.js').then(cargado => {
+        if (cargado) updateDashboard();
+    });
 
     // Intentar cargar el dashboard inmediatamente
     updateDashboard();
@@ -238,7 +244,7 @@ function initializeFilters() {
     // Poblar selectores de correlación
     const scatterX = document.getElementById('scatterX');
     const scatterY = document.getElementById('scatterY');
-    const options = ['BASDAI', 'ASDAS', 'HAQ', 'PCR', 'VSG', 'EVA Dolor', 'EVA Global'];
+    const options = ['BASDAI', 'ASDAS', 'HAQ', 'PASI', 'PCR', 'VSG', 'EVA Dolor', 'EVA Global', 'RAPID3'];
 
     options.forEach((option, index) => {
         const optX = document.createElement('option');
@@ -739,17 +745,38 @@ function renderCorrelationScatterChart(canvasId, chartConfig) {
 
     const scatterX = document.getElementById('scatterX')?.value || 'BASDAI';
     const scatterY = document.getElementById('scatterY')?.value || 'ASDAS';
+    const precalculado = getPrecomputedScatter(scatterX, scatterY);
+    // Sin nube precalculada para estos filtros, los puntos calculados de los pacientes cargados
+    // (sin el marcador 0,0 que deja dataManager cuando no hay pares)
+    const puntos = precalculado
+        ? precalculado.data
+        : (chartConfig?.datasets?.[0]?.data || []).filter(p => p.x !== 0 || p.y !== 0);
+    const sinDatos = puntos.length === 0;
+    const maxVisitas = precalculado ? Math.max(1, ...precalculado.data.map(p => p.n)) : 1;
+    const etiqueta = precalculado && precalculado.r !== null
+        ? `${scatterX} vs ${scatterY} (r = ${precalculado.r.toFixed(2)}`
+          + (precalculado.ic ? ` [${precalculado.ic[0].toFixed(2)}, ${precalculado.ic[1].toFixed(2)}]` : '')
+          + `, n = ${precalculado.n})`
+        : `${scatterX} vs ${scatterY}`;
+    // Límite del eje de la nube precalculada, redondeado hacia arriba para que quepan las medias
+    // de las celdas extremas; sin nube, escala automática de Chart.js
+    const maximoEje = (limites, eje) => (precalculado && limites
+        ? Math.ceil(Math.max(limites[1], ...precalculado.data.map(p => p[eje])))
+        : undefined);
 
     chartInstances[canvasId] = new Chart(ctx, {
         type: 'scatter',
         data: {
             datasets: [{
-                label: `${scatterX} vs ${scatterY}`,
-                data: chartConfig?.datasets?.[0]?.data || generateMockScatterData(),
+                label: etiqueta,
+                data: puntos,
                 backgroundColor: 'rgba(37, 99, 235, 0.6)',
                 borderColor: COLORS.primary,
                 borderWidth: 2,
-                pointRadius: 6,
+                // Con la nube precalculada cada punto es una celda: el radio crece con sus visitas
+                pointRadius: precalculado
+                    ? context => 3 + 7 * Math.sqrt((context.raw?.n || 0) / maxVisitas)
+                    : 6,
                 pointHoverRadius: 8
             }]
         },
@@ -757,7 +784,7 @@ function renderCorrelationScatterChart(canvasId, chartConfig) {
             scales: {
                 x: {
                     beginAtZero: true,
-                    max: 10,
+                    max: maximoEje(precalculado?.limitesX, 'x'),
                     title: {
                         display: true,
                         text: scatterX,
@@ -767,7 +794,7 @@ function renderCorrelationScatterChart(canvasId, chartConfig) {
                 },
                 y: {
                     beginAtZero: true,
-                    max: 10,
+                    max: maximoEje(precalculado?.limitesY, 'y'),
                     title: {
                         display: true,
                         text: scatterY,
@@ -778,10 +805,17 @@ function renderCorrelationScatterChart(canvasId, chartConfig) {
             },
             plugins: {
                 legend: { display: false },
+                title: {
+                    display: sinDatos,
+                    text: `Sin datos para ${scatterX} vs ${scatterY} con los filtros actuales`,
+                    color: COLORS.secondary,
+                    font: { weight: 'normal' }
+                },
                 tooltip: {
                     callbacks: {
                         label: function(context) {
-                            return `${scatterX}: ${context.parsed.x.toFixed(1)}, ${scatterY}: ${context.parsed.y.toFixed(1)}`;
+                            const visitas = context.raw?.n ? ` (${context.raw.n} visitas)` : '';
+                            return `${scatterX}: ${context.parsed.x.toFixed(1)}, ${scatterY}: ${context.parsed.y.toFixed(1)}${visitas}`;
                         }
                     }
                 }
@@ -790,14 +824,81 @@ function renderCorrelationScatterChart(canvasId, chartConfig) {
     });
 }
 
-function generateMockScatterData() {
-    const data = [];
-    for (let i = 0; i < 30; i++) {
-        const x = Math.random() * 8 + 1;
-        const y = x * 0.7 + (Math.random() - 0.5) * 3;
-        data.push({ x: Math.min(10, Math.max(0, x)), y: Math.min(10, Math.max(0, y)) });
-    }
-    return data;
+/**
+ * Mapa articular de la cohorte: carga homunculo_cohorte.js (homunculo_cohorte.py) si existe y
+ * pinta sus frecuencias en el homúnculo de solo lectura; sin el fichero la tarjeta sigue oculta
+ */
+function initCohortHomunculus() {
+    const card = document.getElementById('cohortHomunculusCard');
+    if (!card || typeof HubTools === 'undefined' || !HubTools.homunculus.applyCohortOverlay) return;
+
+    HubTools.utils.cargarScriptOpcional('homunculo_cohorte.js').then(cargado => {
+        const overlay = window.HubHomunculusOverlay;
+        if (!cargado || !overlay || !overlay.modos) return;
+
+        const svg = document.getElementById('cohortHomunculusSvg');
+        const note = document.getElementById('cohortHomunculusNote');
+        const botones = card.querySelectorAll('.cohort-mode-btn');
+        const filtros = Object.entries(overlay.filtros || {}).map(([clave, valor]) => `${clave}=${valor}`).join(', ');
+
+        const pintar = mode => {
+            botones.forEach(btn => {
+                const activo = btn.dataset.mode === mode;
+                btn.classList.toggle('primary-button', activo);
+                btn.classList.toggle('secondary-button', !activo);
+            });
+            HubTools.homunculus.applyCohortOverlay(overlay, mode, svg);
+            const datos = overlay.modos[mode];
+            if (note) {
+                note.textContent = `Precalculado para ${filtros || 'toda la cohorte'}: ${overlay.visitas} visitas`
+                    + (datos ? `, media ${datos.media} por visita` : '');
+            }
+        };
+
+        botones.forEach(btn => btn.addEventListener('click', () => pintar(btn.dataset.mode)));
+        card.hidden = false;
+        pintar('nad');
+    });
+}
+
+/**
+ * Nube reducida y correlación de window.HubCorrelaciones (correlaciones.py) para el par de ejes,
+ * solo si se calculó con los mismos filtros que están activos; null en otro caso
+ */
+function getPrecomputedScatter(scatterX, scatterY) {
+    const datos = window.HubCorrelaciones;
+    if (!datos || !datos.nubes || !sameCorrelationFilters(datos.filtros || {})) return null;
+
+    const i = datos.metricas.indexOf(scatterX);
+    const j = datos.metricas.indexOf(scatterY);
+    if (i < 0 || j < 0 || i === j) return null;
+
+    // Las nubes se guardan una vez por par (métrica anterior primero)
+    const invertido = i > j;
+    const nube = datos.nubes[invertido ? `${scatterY}|${scatterX}` : `${scatterX}|${scatterY}`] || [];
+    const inferior = datos.ic?.inferior?.[i]?.[j];
+    const superior = datos.ic?.superior?.[i]?.[j];
+    return {
+        data: nube.map(([a, b, n]) => (invertido ? { x: b, y: a, n } : { x: a, y: b, n })),
+        r: datos.r[i][j],
+        ic: inferior !== null && inferior !== undefined && superior !== null && superior !== undefined
+            ? [inferior, superior] : null,
+        n: datos.n[i][j],
+        limitesX: datos.limites?.[scatterX],
+        limitesY: datos.limites?.[scatterY]
+    };
+}
+
+function sameCorrelationFilters(filtrosLote) {
+    const activos = {};
+    Object.entries(getActiveFilters()).forEach(([clave, valor]) => {
+        if (clave === 'scatterX' || clave === 'scatterY') return;
+        if (!valor || ['todos', 'all'].includes(String(valor).toLowerCase())) return;
+        activos[clave] = String(valor);
+    });
+    const claves = Object.keys(activos);
+    return claves.length === Object.keys(filtrosLote).length
+        && claves.every(clave => String(filtrosLote[clave]) === activos[clave]);
 }
 
 // === TABLA CON PAGINACIÓN, ORDENAMIENTO Y BÚSQUEDA ===
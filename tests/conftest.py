@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""Utilidades comunes de las pruebas: copia del libro maestro y recuento de celdas"""
+
+import os
+import shutil
+import sys
+
+import pytest
+from openpyxl import load_workbook
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+LIBRO = os.path.join(RAIZ, 'Hub_Clinico_Maestro.xlsx')
+
+
+def celdas(libro, hojas=None):
+    """{hoja: {(fila de datos, letra): valor}} de las celdas no vacías bajo la cabecera"""
+    from openpyxl.utils import get_column_letter
+    resultado = {}
+    wb = load_workbook(libro, read_only=True)
+    try:
+        for ws in wb.worksheets:
+            if hojas is not None and ws.title not in hojas:
+                continue
+            resultado[ws.title] = {
+                (i, get_column_letter(j + 1)): valor
+                for i, fila in enumerate(ws.iter_rows(min_row=2, values_only=True))
+                for j, valor in enumerate(fila) if valor not in (None, '')}
+    finally:
+        wb.close()
+    return resultado
+
+
+def cabecera(libro, hoja):
+    wb = load_workbook(libro, read_only=True)
+    try:
+        return next(wb[hoja].iter_rows(max_row=1, values_only=True))
+    finally:
+        wb.close()
+
+
+@pytest.fixture
+def maestro(tmp_path):
+    """Copia del libro maestro (0644) en un directorio temporal"""
+    ruta = tmp_path / 'maestro.xlsx'
+    shutil.copyfile(LIBRO, ruta)
+    os.chmod(ruta, 0o644)
+    return str(ruta)
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+import shutil
+
+from openpyxl import load_workbook
+
+from cambios_maestro import calcular_huellas, diferencias
+
+
+def _claves(cambios):
+    return [(c['ID_Paciente'], c['Fecha_Visita'], c['Tipo_Visita'], c['n']) for c in cambios]
+
+
+def test_insertadas_actualizadas_eliminadas_y_cambio_de_clave(maestro, tmp_path):
+    nuevo = str(tmp_path / 'nuevo.xlsx')
+    shutil.copyfile(maestro, nuevo)
+    wb = load_workbook(nuevo)
+    ws = wb['ESPA']
+    columnas = {celda.value: celda.column for celda in ws[1]}
+    clave = lambda fila: (ws.cell(fila, columnas['ID_Paciente']).value,
+                          str(ws.cell(fila, columnas['Fecha_Visita']).value)[:10],
+                          ws.cell(fila, columnas['Tipo_Visita']).value)
+
+    actualizada, con_clave_nueva, eliminada = clave(2), clave(4), clave(6)
+    ws.cell(2, columnas['BASDAI_P1']).value = 9.5
+    ws.cell(4, columnas['Fecha_Visita']).value = '2099-01-01'
+    ws.delete_rows(6)
+    insertada = [ws.cell(3, j).value for j in range(1, ws.max_column + 1)]
+    insertada[columnas['ID_Paciente'] - 1] = 'ESP-2099-000001'
+    ws.append(insertada)
+    wb.save(nuevo)
+
+    anteriores = calcular_huellas(maestro)
+    nuevas = calcular_huellas(nuevo)
+    # Reutilizar las huellas de las filas con el mismo XML no cambia el resultado
+    assert calcular_huellas(nuevo, previas=anteriores)['hojas'] == nuevas['hojas']
+
+    cambios = diferencias(anteriores, nuevas)
+    assert cambios['APS'] == {'insertadas': [], 'actualizadas': [], 'eliminadas': []}
+    espa = cambios['ESPA']
+    assert [c[:3] for c in _claves(espa['actualizadas'])] == [actualizada]
+    assert espa['actualizadas'][0]['fila'] == espa['actualizadas'][0]['fila_anterior'] == 2
+    # Editar una columna de la clave es eliminar la visita antigua e insertar la nueva
+    assert sorted(c[:3] for c in _claves(espa['insertadas'])) == sorted(
+        [con_clave_nueva[:1] + ('2099-01-01',) + con_clave_nueva[2:], ('ESP-2099-000001',) + clave(3)[1:]])
+    assert sorted(c[:3] for c in _claves(espa['eliminadas'])) == sorted([con_clave_nueva, eliminada])
+    assert {c['fila_anterior'] for c in espa['eliminadas']} == {4, 6}
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from datetime import date
+
+from openpyxl import load_workbook
+
+from columnar_cache import FECHA_NULA, a_dias, cargar, dias_a_fecha
+
+
+def test_a_dias_numero_de_serie_excel():
+    assert a_dias(45292) == a_dias('2024-01-01') == a_dias(date(2024, 1, 1))
+    assert a_dias(45292.5) == a_dias(45292)
+    assert a_dias(0) == a_dias(True) == a_dias('') == FECHA_NULA
+
+
+def test_fechas_como_numero_de_serie(maestro):
+    wb = load_workbook(maestro)
+    hoja = wb['ESPA']
+    columna = [celda.value for celda in hoja[1]].index('Fecha_Visita') + 1
+    esperadas = []
+    for fila in range(2, hoja.max_row + 1):
+        celda = hoja.cell(fila, columna)
+        if celda.value:
+            valor = date.fromisoformat(str(celda.value)[:10])
+            celda.value = (valor - date(1899, 12, 30)).days
+            celda.number_format = 'General'
+            esperadas.append(valor.isoformat())
+    wb.save(maestro)
+
+    fechas = dias_a_fecha(cargar(maestro, ['ESPA'])['ESPA']['Fecha_Visita'])
+    assert esperadas and [str(f) for f in fechas if str(f) != 'NaT'] == esperadas
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+import os
+from collections import Counter
+
+import pytest
+
+from compactar_maestro import compactar, main, normalizar_fecha
+from conftest import celdas
+
+
+def _por_columna(libro, hoja):
+    return Counter((letra, str(normalizar_fecha(valor))) for (_, letra), valor in celdas(libro, [hoja])[hoja].items())
+
+
+def test_compactar_conserva_todas_las_celdas(maestro, tmp_path):
+    salida = str(tmp_path / 'compactado.xlsx')
+    indice = compactar(maestro, salida)
+
+    for hoja in ('ESPA', 'APS'):
+        assert _por_columna(salida, hoja) == _por_columna(maestro, hoja)
+        # El libro maestro tiene datos bajo cabeceras vacías (HM, HN)
+        assert indice['columnas_ambiguas'][hoja]
+        assert all(etiqueta.startswith('<col ') for etiqueta in indice['columnas_ambiguas'][hoja])
+
+
+def test_indice_apunta_al_historial_ordenado(maestro, tmp_path):
+    salida = str(tmp_path / 'compactado.xlsx')
+    indice = compactar(maestro, salida)
+    filas = {hoja: sorted(celdas(salida, [hoja])[hoja].items()) for hoja in ('ESPA', 'APS')}
+    ids = {hoja: {i: v for (i, letra), v in datos if letra == 'A'} for hoja, datos in filas.items()}
+    for id_paciente, rangos in indice['pacientes'].items():
+        for hoja, inicio, fin in rangos:
+            assert {ids[hoja][i] for i in range(inicio, fin)} == {id_paciente}
+
+
+def test_cli_no_sustituye_el_libro_por_defecto(maestro):
+    with pytest.raises(SystemExit):
+        main([maestro])
+    antes = os.stat(maestro).st_mtime_ns
+    main([maestro, '--salida', maestro + '.compactado.xlsx'])
+    assert os.stat(maestro).st_mtime_ns == antes
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+
+from correlaciones import correlacion_pares, nube_reducida
+
+
+def _valores():
+    rng = np.random.default_rng(5)
+    valores = rng.uniform(0, 10, (200, 3))
+    valores[rng.random((200, 3)) < 0.2] = np.nan
+    valores[:30, :2] = 0.0
+    valores[30:40, 0] = 0.0
+    return valores
+
+
+def test_pares_a_cero_no_cuentan_en_el_coeficiente():
+    valores = _valores()
+    r, n = correlacion_pares(valores)
+    for i in range(3):
+        for j in range(3):
+            if i == j:
+                continue
+            x, y = valores[:, i], valores[:, j]
+            validos = ~(np.isnan(x) | np.isnan(y) | ((x == 0) & (y == 0)))
+            assert n[i, j] == validos.sum()
+            assert np.isclose(r[i, j], np.corrcoef(x[validos], y[validos])[0, 1])
+    assert n[0, 0] == (~np.isnan(valores[:, 0])).sum()
+
+
+def test_nube_sin_pares_a_cero():
+    valores = _valores()
+    nube = nube_reducida(valores[:, 0], valores[:, 1], (0.0, 10.0), (0.0, 10.0))
+    x, y = valores[:, 0], valores[:, 1]
+    assert sum(n for _, _, n in nube) == (~(np.isnan(x) | np.isnan(y) | ((x == 0) & (y == 0)))).sum()
+    assert [0.0, 0.0] not in [punto[:2] for punto in nube]
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+import math
+
+from openpyxl import load_workbook
+
+from cubo_estadisticas import COLUMNAS_METRICA, consultar, construir_cubo, kpis, redondear
+from tratamientos import categoria_tratamiento
+
+
+def _parse_float(valor):
+    """parseFloat de JS sobre el valor de la celda (NaN si no es un número)"""
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return float(valor)
+    try:
+        return float(str(valor).strip().replace(',', '.'))
+    except ValueError:
+        return math.nan
+
+
+def _kpis_por_visita(libro):
+    """calculateRealKPIs visita a visita con el filtro de patología 'Todos'"""
+    total = biologicos = remision = alta = con_actividad = 0
+    suma_actividad = 0.0
+    acumulados = {m: [0.0, 0] for m in COLUMNAS_METRICA}
+    wb = load_workbook(libro, read_only=True)
+    try:
+        for hoja, (principal, umbral_remision, umbral_alta) in {'ESPA': ('BASDAI', 2, 4),
+                                                                 'APS': ('HAQ', 0.5, 2)}.items():
+            filas = wb[hoja].iter_rows(values_only=True)
+            columnas = next(filas)
+            for fila in filas:
+                visita = dict(zip(columnas, fila))
+                total += 1
+                valores = {}
+                for metrica, columna in COLUMNAS_METRICA.items():
+                    v = _parse_float(visita.get(columna))
+                    valores[metrica] = None if math.isnan(v) or v == 0 else v  # parseFloat(x) || null
+                    if valores[metrica] is not None:
+                        acumulados[metrica][0] += v
+                        acumulados[metrica][1] += 1
+                actividad = valores[principal]
+                if actividad is not None:
+                    con_actividad += 1
+                    suma_actividad += actividad
+                    remision += actividad < umbral_remision
+                    alta += actividad >= umbral_alta
+                biologicos += categoria_tratamiento(visita.get('Tratamiento_Actual')) == 'biologic'
+    finally:
+        wb.close()
+    return {
+        'totalPatients': total,
+        'remissionPercent': redondear(remision / con_actividad * 100),
+        'highActivityPercent': redondear(alta / con_actividad * 100),
+        'biologicPercent': redondear(biologicos / total * 100),
+        'avgActivity': redondear(suma_actividad / con_actividad, 1),
+        'metrics': {m: redondear(s / n, 2) if n else None for m, (s, n) in acumulados.items()},
+    }
+
+
+def test_redondeo_mitad_hacia_arriba():
+    assert redondear(2.5) == 3 and redondear(0.5) == 1 and redondear(-2.5) == -2
+    assert redondear(0.125, 2) == 0.13 and redondear(2.25, 1) == 2.3
+    assert redondear(1.005, 2) == 1.0  # toFixed usa el valor binario (1.00499...)
+
+
+def test_kpis_del_cubo_igual_que_por_visita(maestro):
+    # Ceros en la métrica principal de unas visitas: no cuentan, como en calculateRealKPIs
+    wb = load_workbook(maestro)
+    for hoja, columna in (('ESPA', 'BASDAI_Result'), ('APS', 'HAQ_Total')):
+        ws = wb[hoja]
+        indice = [celda.value for celda in ws[1]].index(columna) + 1
+        for fila in range(2, 12):
+            ws.cell(fila, indice).value = 0
+    wb.save(maestro)
+
+    cubo = construir_cubo(maestro)
+    biologicos = consultar(cubo, tratamiento='biologic')['n']
+    assert kpis(consultar(cubo), biologicos) == _kpis_por_visita(maestro)
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import shutil
+from collections import Counter
+
+from openpyxl import load_workbook
+
+from compactar_maestro import normalizar_fecha
+from conftest import celdas
+from fusionar_maestros import fusionar
+
+
+def _valor(valor):
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    return str(normalizar_fecha(valor))
+
+
+def _por_columna(libro, hoja):
+    return Counter((letra, _valor(valor)) for (_, letra), valor in celdas(libro, [hoja])[hoja].items())
+
+
+def test_fusion_de_copias_iguales_conserva_todas_las_celdas(maestro, tmp_path):
+    copia = str(tmp_path / 'copia.xlsx')
+    shutil.copyfile(maestro, copia)
+    salida = str(tmp_path / 'fusion.xlsx')
+    informe = fusionar([maestro, copia], salida, procesos=1)
+
+    for hoja in ('ESPA', 'APS'):
+        assert _por_columna(salida, hoja) == _por_columna(maestro, hoja)
+        # Las celdas bajo cabeceras vacías (HM, HN) se copian por letra y se informan
+        assert set(informe['columnas_por_letra']['maestro.xlsx'][hoja]) == {'<col HM>', '<col HN>'}
+    assert not informe['columnas_descartadas']
+
+
+def test_columnas_sin_pareja_se_informan(maestro, tmp_path):
+    copia = str(tmp_path / 'copia.xlsx')
+    wb = load_workbook(maestro)
+    hoja = wb['ESPA']
+    hoja['C1'].value = None
+    hoja['C2'].value = 'valor'
+    wb.save(copia)
+
+    informe = fusionar([maestro, copia], str(tmp_path / 'fusion.xlsx'), procesos=1)
+    assert informe['columnas_descartadas'] == {'copia.xlsx': {'ESPA': ['<col C>']}}
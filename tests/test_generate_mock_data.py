@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+import random
+import zipfile
+
+import numpy as np
+import pytest
+
+import generate_mock_data
+from column_schema import INDICE, NOMBRES
+from conftest import LIBRO
+from generate_mock_data import calcular_scores, generar_base_datos, generar_filas, generar_shard
+from id_pacientes import analizar_id
+from score_engine import COLUMNAS_ENTRADA, DECIMALES, auditar, recalcular, redondear_js
+from vectorized_mock_data import generar_bloque
+from xlsx_streaming import localizar_hojas
+
+
+def _columnas(filas):
+    return {nombre: [fila[i] for fila in filas] for i, nombre in enumerate(NOMBRES)}
+
+
+def _discrepancias(filas):
+    auditoria = auditar(_columnas(filas))
+    assert sum(d.comparadas for d in auditoria.values()) > 0
+    return {columna: len(d.filas) for columna, d in auditoria.items() if len(d.filas)}
+
+
+@pytest.mark.parametrize('pathology', ['espa', 'aps'])
+def test_scores_coherentes_por_filas(pathology):
+    filas = list(generar_filas(pathology, 60, rng=random.Random(11)))
+    assert _discrepancias(filas) == {}
+
+
+@pytest.mark.parametrize('pathology', ['espa', 'aps'])
+def test_scores_escalares_igual_que_score_engine(pathology):
+    filas = list(generar_filas(pathology, 500, rng=random.Random(4)))
+    recalculados = recalcular({c: [fila[INDICE[c]] for fila in filas] for c in COLUMNAS_ENTRADA})
+    for i, fila in enumerate(filas):
+        scores = calcular_scores(fila)
+        for columna, decimales in DECIMALES.items():
+            if decimales is None:
+                assert scores[columna] == ('SI' if recalculados[columna][i] else 'NO')
+            else:
+                assert scores[columna] == redondear_js(recalculados[columna][i], decimales)
+        assert scores['RAPID3_Funcion'] == redondear_js(recalculados['HAQ_Total'][i] * 3.33, 1)
+
+
+@pytest.mark.parametrize('pathology', ['espa', 'aps'])
+def test_scores_coherentes_vectorizado(pathology):
+    filas = generar_bloque(pathology, 0, 60, rng=np.random.default_rng(11)).filas(NOMBRES)
+    assert _discrepancias(filas) == {}
+
+
+def test_esquema_de_id_por_defecto_admite_mas_de_999_pacientes():
+    filas = generar_shard('s', 'espa', 998, 1001, 1, 1)
+    bloque = generar_bloque('espa', 998, 1001, 1, 1, rng=np.random.default_rng(3)).filas(NOMBRES)
+    for lote in (filas, bloque):
+        ids = [fila[NOMBRES.index('ID_Paciente')] for fila in lote]
+        assert [analizar_id(i)[2:] for i in ids] == [(999, 2), (1000, 2), (1001, 2)]
+    primera = next(generar_filas('aps', 5, 1, 1, rng=random.Random(1)))
+    assert analizar_id(primera[NOMBRES.index('ID_Paciente')])[3] == 1
+
+
+@pytest.mark.parametrize('vectorizado', [False, True])
+@pytest.mark.parametrize('streaming', [False, True])
+def test_misma_semilla_mismo_libro_con_cualquier_numero_de_procesos(tmp_path, monkeypatch, vectorizado, streaming):
+    # Shards pequeños para que los procesos se repartan varios por patología
+    planificar = generate_mock_data.planificar_shards
+    monkeypatch.setattr(generate_mock_data, 'planificar_shards', lambda p, total: planificar(p, total, 15))
+    hojas = {}
+    for procesos in (1, 3):
+        salida = str(tmp_path / f'procesos_{procesos}.xlsx')
+        generar_base_datos(total_espa=70, total_aps=55, visitas_espa=(1, 4), visitas_aps=(2, 3), plantilla=LIBRO,
+                           salida=salida, streaming=streaming, semilla=42, procesos=procesos, vectorizado=vectorizado)
+        with zipfile.ZipFile(salida) as zf:
+            rutas = localizar_hojas(zf)
+            hojas[procesos] = {hoja: zf.read(rutas[hoja]) for hoja in ('ESPA', 'APS')}
+    assert hojas[1] == hojas[3]
+    assert hojas[1]['ESPA'].count(b'</row>') > 70
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+from openpyxl import load_workbook
+
+from historial_pacientes import construir_historial
+
+# (hoja, ID, fecha, {columna: valor}); en la hoja van desordenadas a propósito
+VISITAS = [
+    ('ESPA', 'ESP-T-1', '2024-07-10', {'BASDAI_Result': 1.5, 'ASDAS_CRP_Result': 1.2,
+                                       'Tratamiento_Actual': 'Secukinumab 150mg', 'Trat_Biologico': 'Secukinumab'}),
+    ('ESPA', 'ESP-T-1', '2024-01-10', {'BASDAI_Result': 3.0, 'ASDAS_CRP_Result': 1.5,
+                                       'Tratamiento_Actual': 'Ibuprofeno 600mg'}),
+    ('ESPA', 'ESP-T-1', '2024-10-10', {'BASDAI_Result': 8.0, 'Tratamiento_Actual': 'Secukinumab 150mg',
+                                       'Trat_Biologico': 'Ixekizumab', 'Cambio_Descripcion_Efectos': 'Cefalea'}),
+    ('ESPA', 'ESP-T-1', '2024-04-10', {'BASDAI_Result': 5.5, 'ASDAS_CRP_Result': 3.0,
+                                       'Tratamiento_Actual': 'Adalimumab 40mg', 'Trat_Biologico': 'Adalimumab',
+                                       'Cambio_Motivo': 'Ineficacia'}),
+    ('ESPA', 'ESP-T-2', '2024-02-01', {'BASDAI_Result': 2.0, 'Cambio_Descripcion_Efectos': 'Náuseas'}),
+    ('APS', 'APS-T-1', '2024-03-01', {'HAQ_Total': 0.4, 'RAPID3_Score': 5.0, 'Trat_FAME': 'Metotrexato'}),
+    ('APS', 'APS-T-1', '2024-06-01', {'HAQ_Total': 0.75, 'RAPID3_Score': 7.5, 'Trat_FAME': 'Metotrexato'}),
+    ('APS', 'APS-T-1', '2024-09-01', {'HAQ_Total': 0.3, 'RAPID3_Score': 2.0, 'Trat_FAME': 'Leflunomida',
+                                      'Comentarios_Adicionales': 'Intolerancia digestiva'}),
+    ('APS', 'APS-T-1', '2024-12-01', {'HAQ_Total': 2.0, 'Trat_FAME': 'Sulfasalazina'}),
+]
+
+
+def _libro(maestro):
+    wb = load_workbook(maestro)
+    for hoja in ('ESPA', 'APS'):
+        wb[hoja].delete_rows(2, wb[hoja].max_row)
+    for hoja, id_paciente, fecha, valores in VISITAS:
+        ws = wb[hoja]
+        columnas = [celda.value for celda in ws[1]]
+        fila = dict(valores, ID_Paciente=id_paciente, Fecha_Visita=fecha)
+        ws.append([fila.get(columna) for columna in columnas])
+    wb.save(maestro)
+    return construir_historial(maestro, hoy='2025-01-01')['pacientes']
+
+
+def test_eventos_e_historial_de_tratamientos(maestro):
+    pacientes = _libro(maestro)
+
+    espa = pacientes['ESP-T-1']
+    assert (espa['pathology'], espa['visitas'], espa['firstVisit'], espa['latestVisit']) == (
+        'espa', 4, '2024-01-10', '2024-10-10')
+    assert espa['treatmentHistory'] == [
+        {'startDate': '2024-01-10', 'name': 'Ibuprofeno 600mg', 'reason': 'Tratamiento activo'},
+        {'startDate': '2024-04-10', 'name': 'Adalimumab 40mg', 'reason': 'Ineficacia'},
+        {'startDate': '2024-07-10', 'name': 'Secukinumab 150mg', 'reason': 'Tratamiento activo'},
+    ]
+    # Como extractKeyEvents: la última visita no se compara con la anterior
+    assert espa['keyEvents'] == [
+        {'date': '2024-04-10', 'type': 'flare', 'description': 'Brote clínico detectado: BASDAI ↑ (3.0 → 5.5)'},
+        {'date': '2024-07-10', 'type': 'treatment',
+         'description': 'Cambio de tratamiento: Adalimumab → Secukinumab'},
+        {'date': '2024-07-10', 'type': 'remission',
+         'description': 'Remisión clínica alcanzada: BASDAI baja (1.5)'},
+        {'date': '2024-10-10', 'type': 'adverse', 'description': 'Cefalea'},
+    ]
+
+    aps = pacientes['APS-T-1']
+    assert [t['name'] for t in aps['treatmentHistory']] == ['Metotrexato', 'Leflunomida', 'Sulfasalazina']
+    assert aps['treatmentHistory'][1]['reason'] == 'Intolerancia digestiva'
+    # HAQ sube menos de 0.5: el brote lo marca la segunda regla (RAPID3)
+    assert aps['keyEvents'] == [
+        {'date': '2024-06-01', 'type': 'flare', 'description': 'Brote clínico detectado: RAPID3 ↑ (5.0 → 7.5)'},
+        {'date': '2024-09-01', 'type': 'treatment', 'description': 'Cambio de tratamiento: Metotrexato → Leflunomida'},
+        {'date': '2024-09-01', 'type': 'remission',
+         'description': 'Remisión clínica alcanzada: HAQ en remisión (0.30)'},
+    ]
+
+    # Con una sola visita no hay eventos
+    assert pacientes['ESP-T-2']['keyEvents'] == []
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import os
+import stat
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import ingesta_csv
+from column_schema import ANCHO, INDICE
+from conftest import celdas
+from ingesta_csv import (TIPOS_VISITA, anexar, compactar, confirmar_periodicamente, contar_pendientes,
+                         ruta_anexo, ruta_segmento)
+
+
+def _linea(id_paciente):
+    campos = [''] * ANCHO
+    campos[INDICE['ID_Paciente']] = id_paciente
+    campos[INDICE['Diagnostico_Primario']] = 'espa'
+    campos[INDICE['Tipo_Visita']] = TIPOS_VISITA[0]
+    campos[INDICE['Fecha_Visita']] = '2024-05-01'
+    return '\t'.join(campos)
+
+
+def test_compactar_conserva_permisos(maestro):
+    os.chmod(maestro, 0o640)
+    antes = len({i for i, _ in celdas(maestro, ['ESPA'])['ESPA']})
+
+    anexadas, rechazadas, _ = anexar(maestro, [_linea('ESPA-T-0001'), _linea('ESPA-T-0002')])
+    assert anexadas == {'ESPA': 2} and not rechazadas
+    assert compactar(maestro) == {'ESPA': 2}
+
+    assert stat.S_IMODE(os.stat(maestro).st_mode) == 0o640
+    despues = celdas(maestro, ['ESPA'])['ESPA']
+    assert len({i for i, _ in despues}) == antes + 2
+    assert {v for (_, letra), v in despues.items() if letra == 'A'} >= {'ESPA-T-0001', 'ESPA-T-0002'}
+
+
+def _ids(libro):
+    return [v for (_, letra), v in sorted(celdas(libro, ['ESPA'])['ESPA'].items()) if letra == 'A']
+
+
+def _escritor(libro, escritor, lotes, por_lote):
+    for lote in range(lotes):
+        anexar(libro, [_linea(f'ESPA-W{escritor}-{lote:03d}-{i}') for i in range(por_lote)])
+
+
+def test_cola_rota_mayor_que_un_bloque(maestro, monkeypatch):
+    monkeypatch.setattr(ingesta_csv, 'TAM_BLOQUE', 64)
+    os.makedirs(ruta_anexo(maestro))
+    completas = ''.join(_linea(f'ESPA-T-000{i}') + '\n' for i in (1, 2))
+    rota = _linea('ESPA-T-ROTA')[:500]
+    with open(ruta_segmento(maestro, 'ESPA'), 'w', encoding='utf-8', newline='') as f:
+        f.write(completas + rota)
+
+    # La compactación no confirma la línea incompleta
+    assert contar_pendientes(maestro) == 2
+    anexar(maestro, [_linea('ESPA-T-0003')])
+    with open(ruta_segmento(maestro, 'ESPA'), encoding='utf-8', newline='') as f:
+        contenido = f.read()
+    assert contenido.startswith(completas) and contenido.endswith('\n')
+    assert [linea.split('\t')[0] for linea in contenido.splitlines()] == ['ESPA-T-0001', 'ESPA-T-0002', 'ESPA-T-0003']
+
+    with open(ruta_segmento(maestro, 'ESPA'), 'a', encoding='utf-8', newline='') as f:
+        f.write(rota)
+    assert compactar(maestro) == {'ESPA': 3}
+    assert _ids(maestro)[-3:] == ['ESPA-T-0001', 'ESPA-T-0002', 'ESPA-T-0003']
+
+
+def test_escritores_concurrentes_con_confirmador(maestro):
+    antes = _ids(maestro)
+    parar = threading.Event()
+    confirmador = threading.Thread(target=confirmar_periodicamente, args=(maestro, 0.05, parar))
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        confirmador.start()
+        try:
+            for futuro in [executor.submit(_escritor, maestro, e, 10, 3) for e in range(4)]:
+                futuro.result()
+        finally:
+            parar.set()
+            confirmador.join()
+    compactar(maestro)
+
+    ids = _ids(maestro)
+    nuevos = ids[len(antes):]
+    assert ids[:len(antes)] == antes and contar_pendientes(maestro) == 0
+    assert sorted(nuevos) == sorted(f'ESPA-W{e}-{l:03d}-{i}' for e in range(4) for l in range(10) for i in range(3))
+    # Los lotes de cada escritor no se intercalan ni se reordenan
+    for e in range(4):
+        propios = [i for i in nuevos if i.startswith(f'ESPA-W{e}-')]
+        assert propios == sorted(propios)
+    for n in range(0, len(nuevos), 3):
+        assert len({i.rsplit('-', 1)[0] for i in nuevos[n:n + 3]}) == 1
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+import os
+from collections import Counter
+
+import pytest
+
+from conftest import celdas
+from id_pacientes import analizar_id
+from migrar_ids import main, migrar
+
+
+def test_migracion_solo_cambia_los_id(maestro, tmp_path):
+    salida = str(tmp_path / 'migrado.xlsx')
+    informe = migrar(maestro, salida, esquema=2)
+    assert informe['cambios'] and len(set(informe['cambios'].values())) == len(informe['cambios'])
+
+    antes, despues = celdas(maestro), celdas(salida)
+    for hoja in ('ESPA', 'APS'):
+        esperadas = {clave: informe['cambios'].get(valor, valor) if clave[1] == 'A' else valor
+                     for clave, valor in antes[hoja].items()}
+        assert despues[hoja] == esperadas
+        ids = Counter(valor for (_, letra), valor in despues[hoja].items() if letra == 'A')
+        assert all(analizar_id(i)[3] == 2 for i in ids)
+        assert sum(ids.values()) == sum(1 for (_, letra) in antes[hoja] if letra == 'A')
+
+
+def test_cli_exige_salida_o_en_sitio(maestro):
+    antes = os.stat(maestro).st_mtime_ns
+    with pytest.raises(SystemExit):
+        main([maestro])
+    assert os.stat(maestro).st_mtime_ns == antes
+    main([maestro, '--en-sitio'])
+    assert all(analizar_id(v)[3] == 2 for (_, letra), v in celdas(maestro, ['ESPA'])['ESPA'].items() if letra == 'A')
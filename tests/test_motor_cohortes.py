@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+import math
+import os
+import re
+import shutil
+from datetime import date
+
+import pytest
+from openpyxl import load_workbook
+
+from conftest import LIBRO
+from motor_cohortes import MotorCohortes
+
+# ================ applyFiltersToPatients visita a visita ================
+
+_NUMERO_JS = re.compile(r'\s*([+-]?(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)')
+
+COMORBIDITY_FIELDS = {c: [f'Comorbilidad_{n}', f'comorbilidad_{n.lower()}'] for c, n in (
+    ('HTA', 'HTA'), ('DM', 'DM'), ('DLP', 'DLP'), ('ECV', 'ECV'), ('GASTRITIS', 'Gastritis'),
+    ('OBESIDAD', 'Obesidad'), ('OSTEOPOROSIS', 'Osteoporosis'), ('GOTA', 'Gota'))}
+EXTRA_ARTICULAR_FIELDS = {e: [f'ExtraArticular_{e.capitalize()}', f'extraArticular{e.capitalize()}']
+                          for e in ('DIGESTIVA', 'UVEITIS', 'PSORIASIS')}
+MARCADORES = {'hla': ['HLA_B27', 'HLA-B27', 'hlaB27', 'hla'], 'fr': ['FR', 'fr'], 'apcc': ['APCC', 'aPCC', 'apcc']}
+METRIC_FIELDS = {
+    'basdai': ['BASDAI_Result', 'BASDAI', 'basdaiResult', 'basdai'],
+    'haq': ['HAQ_Total', 'HAQ', 'haqResult', 'haq'],
+    'pcr': ['PCR', 'pcrResult', 'pcr'],
+    'evadolor': ['EVA_Dolor', 'evaDolor', 'eva_dolor'],
+    'evaglobal': ['EVA_Global', 'evaGlobal', 'eva_global'],
+}
+UMBRALES = {'basdai': (2, 4, 6), 'haq': (0.5, 1.5, 2), 'pcr': (5, 10, 20)}
+
+
+def _texto(valor):
+    return '' if valor is None else str(valor).strip().lower()
+
+
+def _campo(registro, claves):
+    return next((registro[c] for c in claves if registro.get(c) not in (None, '')), None)
+
+
+def _parse_float(valor):
+    if valor is None or isinstance(valor, bool):
+        return math.nan
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    coincidencia = _NUMERO_JS.match(str(valor))
+    return float(coincidencia.group(1)) if coincidencia else math.nan
+
+
+def _numero(registro, claves):
+    valor = _parse_float(_campo(registro, claves))
+    return None if math.isnan(valor) else valor
+
+
+def _si_no(valor):
+    texto = _texto(valor)
+    if texto in ('si', 's', 'true', '1', 'positivo', 'positive', 'pos'):
+        return True
+    if texto in ('no', 'false', '0', 'negativo', 'negative', 'neg'):
+        return False
+    return None
+
+
+def _fecha(texto):
+    """parseVisitDate: DD/MM/YYYY o ISO"""
+    try:
+        if '/' in texto:
+            dia, mes, anio = texto.split('/')
+            return date(int(anio), int(mes), int(dia))
+        return date.fromisoformat(texto[:10])
+    except ValueError:
+        return None
+
+
+def _edad(registro, hoy):
+    edad = _numero(registro, ['Edad', 'edad'])
+    if edad is not None:
+        return edad
+    nacimiento = _campo(registro, ['Fecha_Nacimiento', 'fechaNacimiento', 'fecha_nacimiento', 'Nacimiento'])
+    nacimiento = _fecha(str(nacimiento)) if nacimiento else None
+    if nacimiento is None:
+        return None
+    return hoy.year - nacimiento.year - ((hoy.month, hoy.day) < (nacimiento.month, nacimiento.day))
+
+
+def _categoria(texto):
+    if not texto:
+        return 'other'
+    for categoria, claves in (
+            ('biologic', ('biolog', 'anti-tnf', 'adalimumab', 'etanercept', 'infliximab', 'golimumab', 'certolizumab',
+                          'secukinumab', 'ixekizumab', 'ustekinumab', 'guselkumab', 'risankizumab', 'tofacitinib',
+                          'upadacitinib')),
+            ('fame', ('fame', 'metotrexato', 'leflunomida', 'sulfasalazina', 'ciclosporina', 'azatioprina')),
+            ('systemic', ('sistemic', 'aine', 'ibuprofeno', 'naproxeno', 'diclofenaco', 'indometacina', 'etoricoxib'))):
+        if any(clave in texto for clave in claves):
+            return categoria
+    return 'other'
+
+
+def _aplicar_filtros(registros, filtros, hoy):
+    """Port de applyFiltersToPatients (modules/dataManager.js) evaluado registro a registro"""
+    patologia, sexo = _texto(filtros.get('pathology')), _texto(filtros.get('sex'))
+    desde, hasta = (_fecha(str(filtros[c])) if filtros.get(c) else None for c in ('dateFrom', 'dateTo'))
+    edad_desde, edad_hasta = (_parse_float(filtros.get(c)) for c in ('ageFrom', 'ageTo'))
+    edad_desde, edad_hasta = (None if math.isnan(e) else math.trunc(e) for e in (edad_desde, edad_hasta))
+    estado = filtros.get('activityState') if filtros.get('activityState') not in (None, '', 'Todos') else None
+    indice = ''.join(_texto(filtros.get('activityIndex') or 'BASDAI').split())
+    limites = {m: _parse_float(filtros.get(c)) for m, c in (('evadolor', 'evaDolor'), ('evaglobal', 'evaGlobal'))}
+    biomarcador = filtros.get('biomarker') or ''
+    tipo, especifico = _texto(filtros.get('ttoType')), _texto(filtros.get('ttoSpecific'))
+    comorbilidad = str(filtros.get('comorbidity') or '').strip().upper()
+    extraarticular = str(filtros.get('extraArticular') or '').strip().upper()
+
+    seleccion = []
+    for i, p in enumerate(registros):
+        if patologia and patologia not in ('all', 'todos') and _texto(p['pathology']) != patologia:
+            continue
+        if desde or hasta:
+            fecha = _campo(p, ['Fecha_Visita', 'fechaVisita'])
+            fecha = _fecha(str(fecha)) if fecha else None
+            if fecha is None or (desde and fecha < desde) or (hasta and fecha > hasta):
+                continue
+        if sexo and sexo not in ('all', 'todos') and _texto(_campo(p, ['Sexo', 'sexoPaciente', 'sexo'])) != sexo:
+            continue
+        if edad_desde is not None or edad_hasta is not None:
+            edad = _edad(p, hoy)
+            if edad is None or (edad_desde is not None and edad < edad_desde) or (
+                    edad_hasta is not None and edad > edad_hasta):
+                continue
+        if biomarcador and biomarcador != 'Todos':
+            partes = biomarcador.split('_')
+            marcador = re.sub('[^a-z0-9]', '', _texto(partes[0]))
+            positivo = 'positive' in _texto(partes[1] if len(partes) > 1 else '')
+            clave = 'hla' if 'hlab27' in marcador or marcador == 'hla' else marcador
+            estado_marcador = _si_no(_campo(p, MARCADORES[clave])) if clave in MARCADORES else None
+            if estado_marcador is None or estado_marcador != positivo:
+                continue
+        if estado:
+            valor = _numero(p, METRIC_FIELDS[indice])
+            umbrales = UMBRALES[indice]
+            cubo = None if valor is None else ('Remision' if valor < umbrales[0] else 'Baja Actividad'
+                                               if valor < umbrales[1] else 'Moderada Actividad'
+                                               if valor < umbrales[2] else 'Alta Actividad')
+            if cubo != estado:
+                continue
+        if any(not math.isnan(limite) and limite < 10 and (
+                _numero(p, METRIC_FIELDS[m]) is None or _numero(p, METRIC_FIELDS[m]) > limite)
+               for m, limite in limites.items()):
+            continue
+        tratamiento = _texto(p.get('Tratamiento_Actual') or p.get('tratamientoActual') or '')
+        esperada = {'fames': 'fame', 'biologicos': 'biologic', 'sistemicos': 'systemic'}.get(tipo)
+        if tipo and tipo != 'todos' and esperada and _categoria(tratamiento) != esperada:
+            continue
+        if especifico and especifico != 'todos' and (not tratamiento or especifico not in tratamiento):
+            continue
+        if comorbilidad and comorbilidad != 'TODOS' and (
+                comorbilidad not in COMORBIDITY_FIELDS or _si_no(_campo(p, COMORBIDITY_FIELDS[comorbilidad])) is not True):
+            continue
+        if extraarticular and extraarticular != 'TODOS' and (
+                extraarticular not in EXTRA_ARTICULAR_FIELDS
+                or _si_no(_campo(p, EXTRA_ARTICULAR_FIELDS[extraarticular])) is not True):
+            continue
+        if filtros.get('adverseEffect') and not (
+                _si_no(_campo(p, ['Cambio_Efectos_Adversos', 'efectosAdversos', 'adverseEvents'])) is True
+                or _texto(_campo(p, ['Cambio_Descripcion_Efectos', 'descripcionEfectos'])) != ''):
+            continue
+        seleccion.append(i)
+    return seleccion
+
+# ================ PRUEBAS ================
+
+
+def _preparar(libro):
+    """Edades, fechas de nacimiento, fechas DD/MM/YYYY, SI/NO con alias y una columna con alias"""
+    wb = load_workbook(libro)
+    for hoja in ('ESPA', 'APS'):
+        ws = wb[hoja]
+        cabecera = [celda.value for celda in ws[1]]
+        fecha = cabecera.index('Fecha_Visita') + 1
+        hta = cabecera.index('Comorbilidad_HTA') + 1
+        efectos = cabecera.index('Cambio_Descripcion_Efectos') + 1
+        nueva = len(cabecera) + 1
+        ws.cell(1, nueva).value = 'Edad' if hoja == 'ESPA' else 'Fecha_Nacimiento'
+        for fila in range(2, ws.max_row + 1):
+            if hoja == 'ESPA':
+                edad = None if fila % 5 == 0 else f'{30 + fila % 40} años' if fila % 7 == 0 else 20 + fila % 60
+            else:
+                anio, mes, dia = 1940 + fila % 60, 1 + fila % 12, 1 + fila % 28
+                edad = (None if fila % 6 == 0 else f'{dia:02d}/{mes:02d}/{anio}' if fila % 4 == 0
+                        else f'{anio}-{mes:02d}-{dia:02d}')
+            ws.cell(fila, nueva).value = edad
+            if fila % 9 == 0:
+                anio, mes, dia = str(ws.cell(fila, fecha).value).split('-')
+                ws.cell(fila, fecha).value = f'{dia}/{mes}/{anio}'
+            if fila % 8 == 0:
+                ws.cell(fila, hta).value = ('Si', 'true', 'positivo', ' no ', '1')[fila // 8 % 5]
+            if fila % 11 == 0:
+                ws.cell(fila, efectos).value = 'Cefalea'
+    aps = wb['APS']
+    for celda in aps[1]:
+        if celda.value == 'APCC':
+            celda.value = 'aPCC'
+        elif celda.value == 'FR':
+            for fila in range(2, aps.max_row + 1, 10):
+                aps.cell(fila, celda.column).value = ('pos', 'Negativo', 'neg')[fila // 10 % 3]
+    wb.save(libro)
+
+    wb = load_workbook(libro, read_only=True)
+    registros = []
+    try:
+        for hoja in ('ESPA', 'APS'):
+            filas = wb[hoja].iter_rows(values_only=True)
+            cabecera = next(filas)
+            registros.append([dict(zip(cabecera, fila), pathology=hoja) for fila in filas])
+    finally:
+        wb.close()
+    return registros
+
+
+FILTROS = [
+    {},
+    {'pathology': 'espa', 'sex': 'Mujer'},
+    {'dateFrom': '2024-06-01', 'dateTo': '2025-03-31'},
+    {'dateFrom': '15/10/2024'},
+    {'ageFrom': '35', 'ageTo': '60'},
+    {'ageFrom': '50.9', 'pathology': 'APS'},
+    {'evaDolor': '2.5'},
+    {'evaGlobal': '4', 'evaDolor': '10'},
+    {'biomarker': 'HLA-B27_positive'},
+    {'biomarker': 'hlab27_negative', 'pathology': 'ESPA'},
+    {'biomarker': 'HLA_B27_positive'},
+    {'biomarker': 'FR_Positive'},
+    {'biomarker': 'apcc_negative'},
+    {'biomarker': 'aPCC_positive', 'ageTo': '70'},
+    {'comorbidity': 'hta'},
+    {'comorbidity': ' Obesidad ', 'sex': 'Hombre'},
+    {'comorbidity': 'DESCONOCIDA'},
+    {'extraArticular': 'uveitis', 'comorbidity': 'TODOS'},
+    {'activityState': 'Remision', 'activityIndex': 'HAQ'},
+    {'activityState': 'Baja Actividad', 'dateFrom': '2025-01-01', 'ttoType': 'biologicos'},
+    {'ttoSpecific': 'Metotrexato', 'adverseEffect': True},
+    {'ttoType': 'sistemicos', 'biomarker': 'Todos', 'sex': 'todos', 'pathology': 'all'},
+]
+
+
+@pytest.fixture(scope='module')
+def libro_preparado(tmp_path_factory):
+    ruta = str(tmp_path_factory.mktemp('cohortes') / 'maestro.xlsx')
+    shutil.copyfile(LIBRO, ruta)
+    os.chmod(ruta, 0o644)
+    return _preparar(ruta), MotorCohortes.desde_libro(ruta)
+
+
+@pytest.mark.parametrize('filtros', FILTROS)
+def test_bitmaps_igual_que_applyFiltersToPatients(libro_preparado, filtros):
+    registros, motor = libro_preparado
+    cohorte = motor.filtrar(filtros)
+    hoy = date.today()
+    esperadas = {hoja: _aplicar_filtros(filas, filtros, hoy) for hoja, filas in zip(('ESPA', 'APS'), registros)}
+    obtenidas = {hoja: posiciones.tolist() for hoja, posiciones in cohorte.por_hoja().items()}
+    assert obtenidas == esperadas
+    assert len(cohorte) == sum(len(p) for p in esperadas.values())
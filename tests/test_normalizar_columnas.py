@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+import csv
+
+from openpyxl import load_workbook
+
+from conftest import celdas
+from normalizar_columnas import normalizar
+
+
+def test_reescritura_informa_de_las_columnas_sin_nombre(maestro, tmp_path):
+    # Una columna sin canónica obliga a reescribir las filas en vez de copiarlas
+    wb = load_workbook(maestro)
+    wb['ESPA']['HO1'].value = 'Columna_Extra'
+    wb.save(maestro)
+    salida = str(tmp_path / 'canonico.xlsx')
+    tabla = normalizar(maestro, salida)['tablas']['ESPA']
+
+    assert tabla['estado'] == 'reescrita'
+    assert tabla['descartadas'] == ['Columna_Extra', '<col HM>', '<col HN>']
+    antes, despues = celdas(maestro, ['ESPA'])['ESPA'], celdas(salida, ['ESPA'])['ESPA']
+    sin_nombre = {clave: valor for clave, valor in antes.items() if clave[1] in ('HM', 'HN')}
+    assert sin_nombre
+    assert len(despues) == len(antes) - len(sin_nombre)
+
+
+def test_exportacion_con_columna_sin_nombre(tmp_path):
+    entrada = tmp_path / 'cohorte.csv'
+    with open(entrada, 'w', encoding='utf-8', newline='') as f:
+        escritor = csv.writer(f)
+        escritor.writerow(['ID_Paciente', '', 'basdaiResult'])
+        escritor.writerow(['ESP-2024-000001', 'nota', '3.2'])
+        escritor.writerow(['ESP-2024-000002', '', '1.0', 'suelta'])
+    tabla = normalizar(str(entrada))['tablas']['cohorte.csv']
+    assert tabla['descartadas'] == ['<col B>', '<col D>']
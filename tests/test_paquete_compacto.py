@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from conftest import RAIZ
+from paquete_compacto import FORMATO, VERSION_PAQUETE, codificar_columna, desempaquetar, empaquetar
+
+# Carga dataManager.js en un contexto aislado (sin DOM) y decodifica el paquete de stdin
+DECODIFICADOR_JS = """
+const fs = require('fs');
+const vm = require('vm');
+const contexto = {
+    console: { log() {}, warn() {}, error() {} },
+    atob: texto => Buffer.from(texto, 'base64').toString('latin1'),
+    localStorage: { getItem: () => null, setItem() {}, removeItem() {} },
+    setTimeout, Blob
+};
+contexto.window = contexto;
+vm.createContext(contexto);
+vm.runInContext(fs.readFileSync(process.argv[1], 'utf8'), contexto);
+const paquete = JSON.parse(fs.readFileSync(0, 'utf8'));
+process.stdout.write(JSON.stringify(vm.runInContext('decodeCompactBundle', contexto)(paquete)));
+"""
+
+pytestmark = pytest.mark.skipif(shutil.which('node') is None, reason='node no disponible')
+
+
+def _decodificar_js(paquete):
+    resultado = subprocess.run(
+        ['node', '-e', DECODIFICADOR_JS, os.path.join(RAIZ, 'modules', 'dataManager.js')],
+        input=json.dumps(paquete, ensure_ascii=False), capture_output=True, text=True, encoding='utf-8', check=True)
+    return json.loads(resultado.stdout)
+
+
+def test_decodificador_js_igual_que_el_codificador():
+    columnas = {
+        'Dolor_Axial': ['SI', None, 'NO', 'SI', ''] * 60,
+        'Edad': [45, None, -3, 2 ** 40, 0] * 60,
+        'PCR': [0.1, -2.35, None, 1e-06, 12.5] * 60,
+        'Tratamiento_Actual': [f'Pauta {i}' if i % 7 else None for i in range(300)],
+        'Mixta': ['texto', 3, None, 'SI', 4.5] * 60,
+        'Vacia': [None] * 300,
+    }
+    paquete = {'formato': FORMATO, 'version': VERSION_PAQUETE,
+               'hojas': {'ESPA': {'filas': 300, 'columnas': [codificar_columna(n, v) for n, v in columnas.items()]}}}
+    assert {c['tipo'] for c in paquete['hojas']['ESPA']['columnas']} == {'bits', 'num', 'dic'}
+    assert any(c.get('ancho') == 2 for c in paquete['hojas']['ESPA']['columnas'])
+
+    esperadas = [{n: v[i] for n, v in columnas.items() if v[i] not in (None, '')} for i in range(300)]
+    assert desempaquetar(paquete)['ESPA'] == esperadas
+    assert _decodificar_js(paquete)['ESPA'] == esperadas
+
+
+def test_decodificador_js_sobre_el_maestro(maestro):
+    paquete = empaquetar(maestro)
+    decodificado = _decodificar_js(paquete)
+    for hoja, filas in desempaquetar(paquete).items():
+        assert decodificado[hoja] == filas
+    assert decodificado['Fármacos'] == paquete['Fármacos']
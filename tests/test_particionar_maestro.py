@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import os
+from collections import Counter
+
+from conftest import celdas
+from particionar_maestro import cargar_manifiesto, particionar, particiones_paciente
+
+
+def _filas(libro, hoja):
+    """Multiconjunto de filas como {letra: valor}, sin depender del número de fila"""
+    por_fila = {}
+    for (i, letra), valor in celdas(libro, [hoja])[hoja].items():
+        por_fila.setdefault(i, set()).add((letra, valor))
+    return Counter(frozenset(fila) for fila in por_fila.values())
+
+
+def test_particiones_reunen_todas_las_filas(maestro, tmp_path):
+    directorio = str(tmp_path / 'particiones')
+    manifiesto = particionar(maestro, directorio, anios_calientes=1)
+    assert len(manifiesto['particiones']) > 1
+
+    for hoja in ('ESPA', 'APS'):
+        reunidas = Counter()
+        for particion in manifiesto['particiones']:
+            filas = _filas(os.path.join(directorio, particion['archivo']), hoja)
+            assert sum(filas.values()) == particion['filas'].get(hoja, 0)
+            reunidas += filas
+        assert reunidas == _filas(maestro, hoja)
+
+
+def test_filtro_de_bloom_encuentra_cada_historial(maestro, tmp_path):
+    directorio = str(tmp_path / 'particiones')
+    particionar(maestro, directorio, anios_calientes=1)
+    manifiesto = cargar_manifiesto(os.path.join(directorio, 'manifiesto.json'))
+    for particion in manifiesto['particiones']:
+        ruta = os.path.join(directorio, particion['archivo'])
+        for hoja in ('ESPA', 'APS'):
+            ids = {v for (_, letra), v in celdas(ruta, [hoja]).get(hoja, {}).items() if letra == 'A'}
+            for id_paciente in ids:
+                assert particion['archivo'] in [p['archivo'] for p in particiones_paciente(manifiesto, id_paciente)]
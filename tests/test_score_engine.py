@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+from openpyxl import load_workbook
+
+from score_engine import COLUMNAS_ENTRADA, COLUMNAS_GUARDADAS, auditar, auditar_libro
+from xlsx_reader import FILA, columnas_hoja, leer_columnas
+
+
+def _auditar_xlsx(libro, hoja):
+    """Auditoría leyendo las columnas directamente del XML del libro"""
+    presentes = set(columnas_hoja(hoja, libro))
+    nombres = [c for c in COLUMNAS_ENTRADA + COLUMNAS_GUARDADAS if c in presentes]
+    columnas = leer_columnas(hoja, [FILA] + nombres, libro=libro)
+    numeros = columnas.pop(FILA).astype(np.int64)
+    return len(numeros), {c: d._replace(filas=numeros[d.filas]) for c, d in auditar(columnas).items()}
+
+
+def test_auditoria_desde_la_cache_igual_que_desde_el_libro(maestro):
+    wb = load_workbook(maestro)
+    for hoja, columna, valor in (('ESPA', 'BASDAI_Result', 9.99), ('APS', 'MDA_Cumple', 'NO'),
+                                 ('APS', 'HAQ_Total', 2.75)):
+        ws = wb[hoja]
+        indice = [celda.value for celda in ws[1]].index(columna) + 1
+        for fila in (3, 8):
+            ws.cell(fila, indice).value = valor
+    wb.save(maestro)
+
+    informe = auditar_libro(maestro, ('ESPA', 'APS'))
+    for hoja in ('ESPA', 'APS'):
+        visitas, esperada = _auditar_xlsx(maestro, hoja)
+        assert informe[hoja][0] == visitas
+        assert informe[hoja][1].keys() == esperada.keys()
+        for columna, d in esperada.items():
+            obtenida = informe[hoja][1][columna]
+            assert obtenida.comparadas == d.comparadas
+            assert obtenida.filas.tolist() == d.filas.tolist()
+            assert list(obtenida.guardado) == list(d.guardado)
+    assert 3 in informe['ESPA'][1]['BASDAI_Result'].filas
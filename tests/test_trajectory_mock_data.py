@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+import trajectory_mock_data as tm
+
+
+def _simular(semilla, pacientes=3000, num_biologicos=8):
+    rng = np.random.default_rng(semilla)
+    num_visitas = rng.integers(2, 10, pacientes)
+    linea_inicial = rng.integers(0, 3, pacientes)
+    biologico_inicial = np.where(linea_inicial == tm.LINEA_BIOLOGICO, rng.integers(0, num_biologicos, pacientes), -1)
+    return tm.simular_trayectorias(rng, num_visitas, linea_inicial, biologico_inicial, num_biologicos)
+
+
+def test_trayectorias_dentro_de_rango():
+    t = _simular(5)
+    mascara = t['mascara']
+    actividad = t['actividad'][mascara]
+    assert actividad.min() >= 0.02 and actividad.max() <= 1.0
+
+    # Intervalos: revisión precoz solo tras una visita con actividad alta
+    siguiente = mascara[:, 1:]
+    intervalo = np.diff(t['dias'], axis=1)[siguiente]
+    precoz = (t['actividad'][:, :-1] >= tm.UMBRAL_ALTA)[siguiente]
+    assert intervalo[precoz].min() >= tm.INTERVALO_PRECOZ[0] and intervalo[precoz].max() <= tm.INTERVALO_PRECOZ[1]
+    assert intervalo[~precoz].min() >= tm.INTERVALO_HABITUAL[0] and intervalo[~precoz].max() <= tm.INTERVALO_HABITUAL[1]
+    assert precoz.any() and (~precoz).any()
+
+    assert (t['decision'][:, 0] == -1).all()
+    assert set(np.unique(t['decision'][:, 1:][siguiente])) == {tm.CONTINUAR, tm.AUMENTAR_DOSIS, tm.CAMBIAR}
+    assert t['biologico'][mascara].min() >= -1 and t['biologico'][mascara].max() < 8
+    assert (t['inicio_linea'][mascara] <= t['dias'][mascara]).all()
+
+    # Un cambio pasa a biológico; si ya había uno, rota a otro distinto
+    cambia = (t['decision'][:, 1:] == tm.CAMBIAR) & siguiente
+    assert (t['linea'][:, 1:][cambia] == tm.LINEA_BIOLOGICO).all()
+    anterior, nuevo = t['biologico'][:, :-1][cambia], t['biologico'][:, 1:][cambia]
+    assert (nuevo >= 0).all()
+    assert (nuevo[anterior >= 0] != anterior[anterior >= 0]).all()
+    assert (t['inicio_linea'][:, 1:][cambia] == t['dias'][:, 1:][cambia]).all()
+
+
+def test_desviacion_ar1(monkeypatch):
+    # Sin brotes ni efecto del tratamiento la actividad es basal + AR(1): las diferencias
+    # consecutivas tienen autocorrelación -(1 - φ) / 2 (0 en un paseo aleatorio, -0.5 en ruido blanco)
+    monkeypatch.setattr(tm, 'PROB_BROTE', 0.0)
+    monkeypatch.setattr(tm, 'EFICACIA_LINEA', np.zeros(3))
+    monkeypatch.setattr(tm, 'ACTIVIDAD_BASAL', (0.5, 0.0))
+    pacientes = 20000
+    t = tm.simular_trayectorias(np.random.default_rng(0), np.full(pacientes, 12), np.zeros(pacientes, dtype=np.int64),
+                                np.full(pacientes, -1), 8)
+    actividad = t['actividad'][:, 4:]  # tras el transitorio desde desviación 0
+    assert actividad.min() > 0.02 and actividad.max() < 1.0  # sin recorte
+    diferencias = np.diff(actividad, axis=1)
+    correlacion = np.corrcoef(diferencias[:, :-1].ravel(), diferencias[:, 1:].ravel())[0, 1]
+    assert correlacion == pytest.approx(-(1 - tm.AUTOCORRELACION) / 2, abs=0.02)
+
+
+def test_misma_semilla_mismas_trayectorias():
+    primera, segunda, otra = _simular(11), _simular(11), _simular(12)
+    assert primera.keys() == segunda.keys()
+    for clave in primera:
+        assert np.array_equal(primera[clave], segunda[clave])
+    assert not np.array_equal(primera['actividad'], otra['actividad'])
+
+    planas = tm.aplanar(primera)
+    assert len(planas['dias']) == primera['mascara'].sum()
+    assert 'mascara' not in planas
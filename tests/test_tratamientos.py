@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from tratamientos import Componente, catalogo_desde_listas, parsear_componente, parsear_tratamiento
+
+
+def test_pauta_sin_farmaco():
+    assert parsear_componente('500mg/12h') == Componente('other', '', '500mg', '12h', False)
+    assert parsear_componente('40 mg') == Componente('other', '', '40mg', '', False)
+
+
+def test_farmaco_con_pauta():
+    catalogo = catalogo_desde_listas(biologicos=['Adalimumab'])
+    assert parsear_componente('Adalimumab 40mg/2sem', catalogo) == \
+        Componente('biologic', 'Adalimumab', '40mg', '2sem', True)
+    assert parsear_componente('Metotrexato').farmaco == 'Metotrexato'
+
+
+def test_pauta_suelta_no_cambia_la_categoria():
+    tratamiento = parsear_tratamiento('Metotrexato 15mg + 500mg/12h')
+    assert tratamiento.categoria == 'fame'
+    assert [c.farmaco for c in tratamiento.componentes] == ['Metotrexato', '']
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+from openpyxl import load_workbook
+from openpyxl.utils import get_column_letter
+
+import validar_contrato
+from validar_contrato import validar
+
+# (fila, columna, valor, severidad, regla) de cada celda que se estropea en ESPA
+INCIDENCIAS = [
+    (3, 'BASDAI_P1', 'alto', 'error', 'numero'),
+    (4, 'EVA_Dolor', 12, 'error', 'rango'),
+    (5, 'PCR', 600.5, 'error', 'rango'),
+    (6, 'Fecha_Visita', '2024-13-45', 'error', 'fecha'),
+    (7, 'Fecha_Visita', '15/03/2024', 'aviso', 'fecha_no_iso'),
+    (8, 'Comorbilidad_HTA', 'Quizás', 'error', 'dominio'),
+    (9, 'Sexo', 'X', 'error', 'dominio'),
+    (10, 'ID_Paciente', None, 'error', 'obligatorio'),
+    (11, None, 'suelta', 'error', 'columna_extra'),
+]
+
+
+def _estropear(libro):
+    """Estropea las celdas de INCIDENCIAS y devuelve {clave de incidencia esperada: valor}"""
+    wb = load_workbook(libro)
+    ws = wb['ESPA']
+    columnas = [celda.value for celda in ws[1]]
+    esperadas = {}
+    for fila, columna, valor, severidad, regla in INCIDENCIAS:
+        indice = columnas.index(columna) + 1 if columna else len(columnas) + 2
+        ws.cell(fila, indice).value = valor
+        esperadas['ESPA', f'{get_column_letter(indice)}{fila}', columna, severidad, regla] = valor
+    wb.save(libro)
+    return esperadas
+
+
+def _claves(informe):
+    return {(r['hoja'], r['celda'], r['columna'], r['severidad'], r['regla']): r['valor']
+            for r in informe['incidencias']}
+
+
+def test_cada_regla_del_contrato(maestro):
+    antes = _claves(validar(maestro))
+    esperadas = _estropear(maestro)
+    informe = validar(maestro)
+
+    nuevas = {clave: valor for clave, valor in _claves(informe).items() if clave not in antes}
+    assert nuevas == esperadas
+    assert not informe['valido']
+
+
+def test_mismo_informe_con_varios_procesos(maestro, monkeypatch):
+    _estropear(maestro)
+    # Rangos de pocas filas para repartir cada hoja entre varios procesos
+    monkeypatch.setattr(validar_contrato, 'FILAS_MIN_TAREA', 10)
+    assert validar(maestro, procesos=3) == validar(maestro, procesos=1)
+    assert validar(maestro, procesos=3, max_errores=4) == validar(maestro, procesos=1, max_errores=4)
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from column_schema import NOMBRES, SI_NO, TIPOS
+from vectorized_mock_data import generar_bloque
+
+
+@pytest.fixture(scope='module', params=['espa', 'aps'])
+def filas(request):
+    bloque = generar_bloque(request.param, 0, 40, rng=np.random.default_rng(7))
+    return bloque.filas(NOMBRES)
+
+
+def test_valores_segun_tipo_de_columna(filas):
+    for i, nombre in enumerate(NOMBRES):
+        valores = {fila[i] for fila in filas} - {None}
+        if TIPOS[nombre].tipo == 'si_no':
+            assert valores <= set(SI_NO), nombre
+        else:
+            assert not valores & set(SI_NO), nombre
+
+
+def test_otras_entesitis_es_texto_libre(filas):
+    assert {fila[NOMBRES.index('Otras_Entesitis')] for fila in filas} == {None}
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+import re
+import zipfile
+
+import pytest
+
+from xlsx_reader import FILA, iter_visits
+from xlsx_streaming import localizar_hojas
+
+_R_FILA = re.compile(r'(<row\b[^>]*?)\sr="\d+"')
+_R_CELDA = re.compile(r'(<c\b[^>]*?)\sr="[A-Z]+\d+"')
+
+
+def _sin_referencias(origen, destino, hoja, celdas):
+    """Copia del libro sin r="" en las <row> de `hoja` (y en sus <c> si `celdas`)"""
+    with zipfile.ZipFile(origen) as zin, zipfile.ZipFile(destino, 'w', zipfile.ZIP_DEFLATED) as zout:
+        ruta = localizar_hojas(zin)[hoja]
+        for info in zin.infolist():
+            datos = zin.read(info.filename)
+            if info.filename == ruta:
+                texto = _R_FILA.sub(r'\1', datos.decode('utf-8'))
+                if celdas:
+                    texto = _R_CELDA.sub(r'\1', texto)
+                datos = texto.encode('utf-8')
+            zout.writestr(info, datos)
+
+
+@pytest.mark.parametrize('celdas', [False, True])
+def test_filas_y_celdas_sin_referencia(maestro, tmp_path, celdas):
+    copia = str(tmp_path / 'sin_r.xlsx')
+    _sin_referencias(maestro, copia, 'ESPA', celdas)
+    columnas = [FILA, 'ID_Paciente', 'Fecha_Visita', 'BASDAI_Result', 'Tratamiento_Actual']
+    esperadas = list(iter_visits('ESPA', columnas, workbook=maestro))
+    assert esperadas and list(iter_visits('ESPA', columnas, workbook=copia)) == esperadas
+    assert list(iter_visits('ESPA', workbook=copia)) == list(iter_visits('ESPA', workbook=maestro))
+
+    filtro = {FILA: lambda n: n % 2 == 0, 'ID_Paciente': {esperadas[0][1], esperadas[-1][1]}}
+    assert (list(iter_visits('ESPA', columnas, filtro, workbook=copia))
+            == list(iter_visits('ESPA', columnas, filtro, workbook=maestro)))
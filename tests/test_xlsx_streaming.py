@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import stat
+
+import pytest
+from openpyxl.utils import column_index_from_string
+
+from conftest import cabecera, celdas
+from xlsx_reader import iter_visits
+from xlsx_streaming import escribir_atomico, escribir_libro_streaming, guardar_json
+
+
+def _modo(ruta):
+    return stat.S_IMODE(os.stat(ruta).st_mode)
+
+
+def test_reescritura_conserva_filas_y_resto_del_libro(maestro, tmp_path):
+    antes = celdas(maestro)
+    filas = {}
+    for hoja in ('ESPA', 'APS'):
+        nombres = [nombre for nombre in cabecera(maestro, hoja) if nombre is not None]
+        filas[hoja] = [list(fila) for fila in iter_visits(hoja, nombres, workbook=maestro)]
+    salida = str(tmp_path / 'copia.xlsx')
+    totales = escribir_libro_streaming(maestro, salida, filas)
+
+    assert totales == {hoja: len(f) for hoja, f in filas.items()}
+    despues = celdas(salida)
+    for hoja in ('Fármacos', 'Profesionales'):
+        assert despues[hoja] == antes[hoja]
+    for hoja in ('ESPA', 'APS'):
+        assert cabecera(salida, hoja) == cabecera(maestro, hoja)
+        # Las columnas con nombre están al principio de la cabecera: mismas celdas no vacías
+        ancho = len(filas[hoja][0])
+        assert despues[hoja].keys() == {(i, letra) for i, letra in antes[hoja]
+                                        if column_index_from_string(letra) <= ancho}
+
+
+def test_reescritura_en_sitio_conserva_permisos(maestro):
+    os.chmod(maestro, 0o640)
+    escribir_libro_streaming(maestro, maestro, {'ESPA': [['ESP-2024-000001']]})
+    assert _modo(maestro) == 0o640
+
+
+def test_salida_nueva_con_permisos_por_defecto(maestro, tmp_path):
+    mascara = os.umask(0o022)
+    try:
+        salida = str(tmp_path / 'nuevo.xlsx')
+        escribir_libro_streaming(maestro, salida, {'ESPA': []})
+    finally:
+        os.umask(mascara)
+    assert _modo(salida) == 0o644
+
+
+def test_escritura_atomica_no_deja_temporales(tmp_path):
+    ruta = tmp_path / 'informe.json'
+    guardar_json({'paciente': 'Muñoz'}, str(ruta), indent=1)
+    os.chmod(ruta, 0o640)
+
+    def fallar(f):
+        f.write('{"a medias')
+        raise RuntimeError('corte')
+    with pytest.raises(RuntimeError):
+        escribir_atomico(str(ruta), fallar)
+    with pytest.raises(TypeError):
+        guardar_json({'no serializable': object()}, str(ruta))
+
+    assert os.listdir(tmp_path) == ['informe.json']
+    assert json.loads(ruta.read_text(encoding='utf-8')) == {'paciente': 'Muñoz'}
+    assert 'Muñoz' in ruta.read_text(encoding='utf-8') and _modo(ruta) == 0o640
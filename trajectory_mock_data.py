@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Simulación longitudinal de la actividad de la enfermedad para datos ficticios
+
+Los seguimientos del generador por filas se sortean sin relación con la visita
+anterior (datos_previos=None), así que las series de un paciente no tienen
+tendencia. Aquí las series de todos los pacientes de un shard se simulan a la vez
+como arrays (pacientes × visitas): actividad latente autocorrelacionada, efecto
+del tratamiento con latencia, cambios de tratamiento decididos según la actividad
+observada, brotes e intervalos entre visitas (revisión precoz si hay actividad alta).
+Solo la recurrencia recorre las visitas; cada paso opera sobre todos los pacientes.
+"""
+
+import numpy as np
+
+# ================ PARÁMETROS DEL MODELO ================
+
+LINEA_AINE, LINEA_FAME, LINEA_BIOLOGICO = 0, 1, 2
+
+# Reducción máxima de la actividad basal por línea de tratamiento (en un respondedor completo)
+EFICACIA_LINEA = np.array([0.2, 0.4, 0.7])
+LATENCIA_DIAS = 90
+REFUERZO_AUMENTO_DOSIS = 0.1
+
+ACTIVIDAD_BASAL = (0.55, 0.15)
+AUTOCORRELACION = 0.6
+RUIDO = 0.07
+PROB_BROTE = 0.06
+INTENSIDAD_BROTE = (0.25, 0.4)
+
+# Actividad (escala 0-1) a partir de la cual se cambia de tratamiento o se ajusta la dosis
+UMBRAL_ALTA = 0.55
+UMBRAL_MODERADA = 0.35
+PROB_CAMBIO_ALTA = 0.7
+PROB_AUMENTO_MODERADA = 0.3
+
+INTERVALO_HABITUAL = (90, 180)
+INTERVALO_PRECOZ = (45, 90)
+
+DECISIONES = ['CONTINUAR', 'AUMENTAR_DOSIS', 'CAMBIAR']
+CONTINUAR, AUMENTAR_DOSIS, CAMBIAR = range(3)
+
+# ================ SIMULACIÓN ================
+
+def simular_trayectorias(rng, num_visitas, linea_inicial, biologico_inicial, num_biologicos):
+    """
+    Simula las series de todos los pacientes en una pasada.
+
+    `linea_inicial` y `biologico_inicial` (índice o -1) son arrays por paciente. Devuelve
+    un dict de arrays (pacientes × máximo de visitas); las celdas con mascara=False no son
+    visitas reales. Claves: 'mascara', 'dias' (desde la primera visita), 'actividad' (0-1),
+    'brote', 'linea', 'biologico', 'inicio_linea' (día de inicio del tratamiento vigente)
+    y 'decision' (índice en DECISIONES; -1 en la primera visita).
+    """
+    pacientes = len(num_visitas)
+    max_visitas = int(num_visitas.max()) if pacientes else 0
+    forma = (pacientes, max_visitas)
+
+    basal = np.clip(rng.normal(*ACTIVIDAD_BASAL, pacientes), 0.15, 0.95)
+    respuesta = rng.beta(3.0, 2.0, pacientes)
+
+    # Todo el azar se sortea de golpe; la recurrencia solo combina columnas
+    ruido = rng.normal(0.0, RUIDO, forma)
+    brote = rng.random(forma) < PROB_BROTE
+    brote[:, 0] = False
+    intensidad = np.where(brote, rng.uniform(*INTENSIDAD_BROTE, forma), 0.0)
+    sorteo_decision = rng.random(forma)
+    sorteo_biologico = rng.integers(0, num_biologicos, forma)
+    respuesta_nueva = rng.beta(3.0, 2.0, forma)
+    intervalo_habitual = rng.integers(INTERVALO_HABITUAL[0], INTERVALO_HABITUAL[1] + 1, forma)
+    intervalo_precoz = rng.integers(INTERVALO_PRECOZ[0], INTERVALO_PRECOZ[1] + 1, forma)
+
+    dias = np.zeros(forma, dtype=np.int64)
+    actividad = np.zeros(forma)
+    linea = np.zeros(forma, dtype=np.int64)
+    biologico = np.full(forma, -1, dtype=np.int64)
+    inicio_linea = np.zeros(forma, dtype=np.int64)
+    decision = np.full(forma, -1, dtype=np.int64)
+
+    linea_actual = np.asarray(linea_inicial, dtype=np.int64).copy()
+    biologico_actual = np.asarray(biologico_inicial, dtype=np.int64).copy()
+    inicio_actual = np.zeros(pacientes, dtype=np.int64)
+    desviacion = np.zeros(pacientes)
+
+    for v in range(max_visitas):
+        if v > 0:
+            precoz = actividad[:, v - 1] >= UMBRAL_ALTA
+            intervalo = np.where(precoz, intervalo_precoz[:, v], intervalo_habitual[:, v])
+            dias[:, v] = dias[:, v - 1] + intervalo
+
+        # Actividad: objetivo según el tratamiento vigente + desviación AR(1) con brotes
+        tiempo_en_linea = dias[:, v] - inicio_actual
+        efecto = EFICACIA_LINEA[linea_actual] * respuesta * (1 - np.exp(-tiempo_en_linea / LATENCIA_DIAS))
+        desviacion = AUTOCORRELACION * desviacion + ruido[:, v] + intensidad[:, v]
+        actividad[:, v] = np.clip(basal * (1 - efecto) + desviacion, 0.02, 1.0)
+
+        # Decisión terapéutica con la actividad observada en la visita
+        if v > 0:
+            alta = actividad[:, v] >= UMBRAL_ALTA
+            moderada = ~alta & (actividad[:, v] >= UMBRAL_MODERADA)
+            cambia = alta & (sorteo_decision[:, v] < PROB_CAMBIO_ALTA)
+            aumenta = (alta & ~cambia) | (moderada & (sorteo_decision[:, v] < PROB_AUMENTO_MODERADA))
+            decision[:, v] = np.where(cambia, CAMBIAR, np.where(aumenta, AUMENTAR_DOSIS, CONTINUAR))
+
+            # Escalada a biológico, o rotación a otro biológico distinto del actual
+            rotacion = (biologico_actual + 1 + sorteo_biologico[:, v] % max(num_biologicos - 1, 1)) % num_biologicos
+            nuevo = np.where(biologico_actual >= 0, rotacion, sorteo_biologico[:, v])
+            biologico_actual = np.where(cambia, nuevo, biologico_actual)
+            linea_actual = np.where(cambia, LINEA_BIOLOGICO, linea_actual)
+            inicio_actual = np.where(cambia, dias[:, v], inicio_actual)
+            respuesta = np.where(cambia, respuesta_nueva[:, v], respuesta)
+            respuesta = np.where(aumenta, np.minimum(respuesta + REFUERZO_AUMENTO_DOSIS, 1.0), respuesta)
+
+        linea[:, v] = linea_actual
+        biologico[:, v] = biologico_actual
+        inicio_linea[:, v] = inicio_actual
+
+    return {
+        'mascara': np.arange(max_visitas) < num_visitas[:, None],
+        'dias': dias,
+        'actividad': actividad,
+        'brote': brote,
+        'linea': linea,
+        'biologico': biologico,
+        'inicio_linea': inicio_linea,
+        'decision': decision,
+    }
+
+def aplanar(trayectorias):
+    """Pasa las series (pacientes × visitas) a arrays por visita, paciente a paciente y en orden"""
+    mascara = trayectorias['mascara']
+    return {clave: valores[mascara] for clave, valores in trayectorias.items() if clave != 'mascara'}
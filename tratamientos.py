@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Parser de tratamientos y codificación categórica de las columnas de fármacos
+
+getTreatmentCategory (modules/dataManager.js) pasa a minúsculas Tratamiento_Actual y lo
+recorre contra tres listas de palabras clave en cada visita y en cada pasada. Aquí cada
+texto distinto ("Naproxeno 500mg/12h + Adalimumab 40mg/2sem") se analiza una sola vez
+(caché LRU acotada) en componentes (categoría, fármaco, dosis, intervalo), comprobados
+contra el catálogo de la hoja Fármacos, y las columnas de tratamiento del libro se
+representan como códigos enteros pequeños + una tabla de consulta.
+
+Uso:
+    from tratamientos import parsear_tratamiento
+    parsear_tratamiento('Naproxeno 500mg/12h + Adalimumab 40mg/14d').categoria   # 'biologic'
+
+    python tratamientos.py Hub_Clinico_Maestro.xlsx      # tabla de códigos + fármacos fuera de catálogo
+"""
+
+import argparse
+import os
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+# Columnas del libro que contienen un fármaco o una pauta completa
+COLUMNAS_TRATAMIENTO = (
+    'Tratamiento_Actual', 'Trat_Sistemico', 'Trat_FAME', 'Trat_Biologico',
+    'Cambio_Sistemico_Farmaco', 'Cambio_FAME_Farmaco', 'Cambio_Biologico_Farmaco',
+)
+
+# Categorías en el orden de prioridad de getTreatmentCategory
+CATEGORIAS_TRATAMIENTO = ('biologic', 'fame', 'systemic', 'other')
+CODIGO_CATEGORIA = {categoria: i for i, categoria in enumerate(CATEGORIAS_TRATAMIENTO)}
+
+# getTreatmentCategory: se prueba en este orden y gana la primera lista con coincidencia.
+# Aquí solo decide la categoría de los fármacos que no están en el catálogo.
+CLAVES_TRATAMIENTO = (
+    ('biologic', ('biolog', 'anti-tnf', 'adalimumab', 'etanercept', 'infliximab',
+                  'golimumab', 'certolizumab', 'secukinumab', 'ixekizumab',
+                  'ustekinumab', 'guselkumab', 'risankizumab', 'tofacitinib', 'upadacitinib')),
+    ('fame', ('fame', 'metotrexato', 'leflunomida', 'sulfasalazina', 'ciclosporina', 'azatioprina')),
+    ('systemic', ('sistemic', 'aine', 'ibuprofeno', 'naproxeno', 'diclofenaco', 'indometacina', 'etoricoxib')),
+)
+
+# Columnas de la hoja Fármacos → categoría
+COLUMNAS_CATALOGO = {'Sistemicos': 'systemic', 'FAMEs': 'fame', 'Biologicos': 'biologic'}
+
+TAM_CACHE = 4096
+
+Componente = namedtuple('Componente', ['categoria', 'farmaco', 'dosis', 'intervalo', 'en_catalogo'])
+Tratamiento = namedtuple('Tratamiento', ['texto', 'categoria', 'componentes'])
+# Nombres de fármaco normalizados (minúsculas) por categoría; hashable para la caché
+Catalogo = namedtuple('Catalogo', ['biologic', 'fame', 'systemic'])
+
+CATALOGO_VACIO = Catalogo(frozenset(), frozenset(), frozenset())
+
+_SEPARADORES = re.compile(r'\s*(?:\+|;|,(?!\d))\s*')
+# "Adalimumab 40mg/2sem", "Sulfasalazina 2g/día", "Metotrexato 15 mg / semana"
+_COMPONENTE = re.compile(
+    r'^(?P<farmaco>.*?)\s*'
+    r'(?:(?P<dosis>\d+(?:[.,]\d+)?\s*(?:mg|g|mcg|µg|ml|ui)?)\s*(?:/\s*(?P<intervalo>\S.*?))?)?\s*$',
+    re.IGNORECASE)
+_DOSIS = re.compile(r'^\s*(?P<dosis>\d+(?:[.,]\d+)?\s*(?:mg|g|mcg|µg|ml|ui)?)\s*(?:/\s*(?P<intervalo>\S.*?))?\s*$',
+                    re.IGNORECASE)
+
+# ================ CATÁLOGO ================
+
+def normalizar_farmaco(nombre):
+    return ' '.join(str(nombre).strip().lower().split())
+
+def catalogo_desde_listas(sistemicos=(), fames=(), biologicos=()):
+    return Catalogo(frozenset(map(normalizar_farmaco, biologicos)), frozenset(map(normalizar_farmaco, fames)),
+                    frozenset(map(normalizar_farmaco, sistemicos)))
+
+def cargar_catalogo(libro):
+    """Catálogo de la hoja Fármacos (columnas Sistemicos, FAMEs, Biologicos); vacío si no existe"""
+    from xlsx_reader import columnas_hoja, iter_visits
+    try:
+        nombres = columnas_hoja('Fármacos', libro)
+        filas = list(iter_visits('Fármacos', workbook=libro))
+    except (KeyError, ValueError):
+        return CATALOGO_VACIO
+    listas = {categoria: [] for categoria in COLUMNAS_CATALOGO.values()}
+    for fila in filas:
+        for nombre, valor in zip(nombres, fila):
+            if nombre in COLUMNAS_CATALOGO and valor not in (None, ''):
+                listas[COLUMNAS_CATALOGO[nombre]].append(valor)
+    return catalogo_desde_listas(listas['systemic'], listas['fame'], listas['biologic'])
+
+# ================ PARSER ================
+
+def categoria_tratamiento(texto):
+    """getTreatmentCategory sobre el texto de Tratamiento_Actual (solo palabras clave)"""
+    texto = '' if texto is None else str(texto).strip().lower()
+    if texto:
+        for categoria, claves in CLAVES_TRATAMIENTO:
+            if any(clave in texto for clave in claves):
+                return categoria
+    return 'other'
+
+def parsear_dosis(texto):
+    """'40mg/2sem' → ('40mg', '2sem'); (texto, '') si no tiene forma de dosis"""
+    texto = '' if texto is None else str(texto).strip()
+    coincidencia = _DOSIS.match(texto)
+    if not coincidencia:
+        return texto, ''
+    return coincidencia.group('dosis').replace(' ', ''), coincidencia.group('intervalo') or ''
+
+def texto_dosis(componente):
+    """Dosis e intervalo como en las columnas *_Dosis ('40mg/2sem')"""
+    return f'{componente.dosis}/{componente.intervalo}' if componente.intervalo else componente.dosis
+
+def parsear_componente(texto, catalogo=CATALOGO_VACIO):
+    """
+    Un fármaco con su pauta: 'Adalimumab 40mg/2sem' → Componente('biologic', 'Adalimumab', '40mg', '2sem', ...).
+    Una pauta sin fármaco ('500mg/12h') deja farmaco vacío y categoría 'other'.
+    """
+    texto = ' '.join(str(texto).split())
+    coincidencia = _COMPONENTE.match(texto)
+    farmaco = coincidencia.group('farmaco') if coincidencia else texto
+    dosis = (coincidencia.group('dosis') or '').replace(' ', '') if coincidencia else ''
+    intervalo = (coincidencia.group('intervalo') or '') if coincidencia else ''
+    if not farmaco:
+        return Componente('other', '', dosis, intervalo, False)
+    clave = normalizar_farmaco(farmaco)
+    for categoria in ('biologic', 'fame', 'systemic'):
+        if clave in getattr(catalogo, categoria):
+            return Componente(categoria, farmaco, dosis, intervalo, True)
+    return Componente(categoria_tratamiento(farmaco), farmaco, dosis, intervalo, False)
+
+@lru_cache(maxsize=TAM_CACHE)
+def parsear_tratamiento(texto, catalogo=CATALOGO_VACIO):
+    """
+    Tratamiento(texto, categoria, componentes) de un texto libre de pauta. La categoría
+    global sigue la prioridad de getTreatmentCategory (biológico > FAME > sistémico).
+    """
+    texto = '' if texto is None else str(texto).strip()
+    componentes = tuple(parsear_componente(parte, catalogo) for parte in _SEPARADORES.split(texto) if parte)
+    categorias = {componente.categoria for componente in componentes}
+    categoria = next((c for c in CATEGORIAS_TRATAMIENTO if c in categorias), 'other')
+    if categoria == 'other':
+        # Texto sin fármacos reconocibles: mismas palabras clave que el JS sobre el texto completo
+        categoria = categoria_tratamiento(texto)
+    return Tratamiento(texto, categoria, componentes)
+
+# ================ CODIFICACIÓN DEL LIBRO ================
+
+class TablaTratamientos:
+    """
+    Códigos enteros de las columnas de tratamiento (espacio de códigos compartido por
+    todas las columnas y hojas; 0 = vacío) y tabla código → Tratamiento.
+    """
+
+    def __init__(self, tablas, catalogo=CATALOGO_VACIO, columnas=COLUMNAS_TRATAMIENTO):
+        import numpy as np
+
+        self.catalogo = catalogo
+        self.registros = [None]
+        indice = {}
+        self._codigos = {}
+        for hoja, tabla in tablas.items():
+            for columna in columnas:
+                if columna not in tabla:
+                    continue
+                traduccion = np.zeros(len(tabla.categorias(columna)) + 1, dtype=np.int16)
+                for i, texto in enumerate(tabla.categorias(columna).tolist()):
+                    clave = texto.strip()
+                    if clave not in indice:
+                        indice[clave] = len(self.registros)
+                        self.registros.append(parsear_tratamiento(clave, catalogo))
+                    traduccion[i] = indice[clave]
+                # El código -1 (vacío) de la caché apunta al último elemento: 0
+                self._codigos[hoja, columna] = traduccion[tabla.codigos(columna)]
+        self._categorias = np.array([CODIGO_CATEGORIA['other']] + [CODIGO_CATEGORIA[r.categoria]
+                                                                     for r in self.registros[1:]], dtype=np.int8)
+
+    def codigos(self, hoja, columna):
+        """Código por visita (int16, 0 = vacío)"""
+        return self._codigos[hoja, columna]
+
+    def categorias(self, hoja, columna):
+        """Índice en CATEGORIAS_TRATAMIENTO por visita (int8); las celdas vacías son 'other'"""
+        return self._categorias[self._codigos[hoja, columna]]
+
+    def codigos_categoria(self, categoria):
+        """Códigos de la tabla cuya categoría global es `categoria` (para comparar con isin)"""
+        return [i for i, registro in enumerate(self.registros) if registro and registro.categoria == categoria]
+
+    def fuera_de_catalogo(self):
+        """{fármaco: nº de textos distintos} de los componentes que no están en el catálogo"""
+        faltan = {}
+        for registro in self.registros[1:]:
+            for componente in registro.componentes:
+                if componente.farmaco and not componente.en_catalogo:
+                    faltan[componente.farmaco] = faltan.get(componente.farmaco, 0) + 1
+        return faltan
+
+    def tabla_json(self):
+        return [None] + [{'texto': r.texto, 'categoria': r.categoria,
+                          'componentes': [c._asdict() for c in r.componentes]} for r in self.registros[1:]]
+
+def codificar_libro(libro, hojas=('ESPA', 'APS')):
+    from columnar_cache import cargar
+    return TablaTratamientos(cargar(libro, hojas), cargar_catalogo(libro))
+
+# ================ CLI ================
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Codifica las columnas de tratamiento del libro maestro')
+    parser.add_argument('libro', nargs='?', default='Hub_Clinico_Maestro.xlsx')
+    parser.add_argument('--salida', help='Tabla de códigos JSON (por defecto <libro>.tratamientos.json)')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    from xlsx_streaming import guardar_json
+    args = parse_args(argv)
+    tabla = codificar_libro(args.libro)
+    salida = args.salida or os.path.splitext(args.libro)[0] + '.tratamientos.json'
+    guardar_json({'columnas': list(COLUMNAS_TRATAMIENTO), 'categorias': list(CATEGORIAS_TRATAMIENTO),
+                  'tabla': tabla.tabla_json()}, salida, indent=1)
+    print(f"{salida}: {len(tabla.registros) - 1} tratamientos distintos")
+    faltan = tabla.fuera_de_catalogo()
+    if faltan:
+        print(f"Fármacos que no están en la hoja Fármacos: {', '.join(sorted(faltan))}")
+    info = parsear_tratamiento.cache_info()
+    print(f"Caché del parser: {info.hits} aciertos, {info.misses} fallos, {info.currsize}/{info.maxsize}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Validación streaming de ESPA y APS contra docs/CONTRATO_DATOS_UNIFICADO.md
+
+Nada comprueba que las filas pegadas en el libro maestro respeten el contrato, y una
+fecha con otro formato o un texto en una columna numérica rompe parseVisitDate o los
+KPIs del dashboard en tiempo de ejecución. Este script recorre el XML de cada hoja por
+bloques (memoria constante) y reparte hojas y rangos de filas entre procesos.
+
+Cada bloque se valida sin decodificar celda a celda: una expresión regular por tipo de
+columna (SI/NO, dominios de opción, números dentro de rango, fechas ISO) elimina de una
+pasada todas las celdas que cumplen el contrato, y solo lo que queda se decodifica y
+se comprueba con las reglas exactas (column_schema + NUMERIC_RANGES de utils.js). El
+informe JSON indica hoja, fila, columna y celda de cada error.
+
+Uso:
+    python validar_contrato.py Hub_Clinico_Maestro.xlsx                 # informe en <libro>.validacion.json
+    python validar_contrato.py Hub_Clinico_Maestro.xlsx --procesos 0 --max-errores 100
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+import zipfile
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+from column_schema import HOJAS_DATOS, TIPOS, Columna, nombre_canonico
+from xlsx_reader import LIBRO_MAESTRO, columnas_hoja, convertir_celda, leer_cadenas_compartidas
+from xlsx_streaming import TAM_BLOQUE, guardar_json, localizar_hojas
+
+VERSION_INFORME = 1
+
+# NUMERIC_RANGES de modules/utils.js (validarRangosNumericos) por columna del libro;
+# sustituyen al rango de column_schema cuando lo hay
+RANGOS_FORMULARIO = {
+    'EVA_Global': (0, 10), 'EVA_Dolor': (0, 10),
+    'Peso': (20, 300), 'Talla': (100, 250),
+    **{f'BASDAI_P{i}': (0, 10) for i in range(1, 6)}, 'BASDAI_P6': (0, 24),
+    'ASDAS_Dolor_Espalda': (0, 10), 'ASDAS_Duracion_Rigidez': (0, 120), 'ASDAS_EVA_Global': (0, 10),
+    'PCR': (0, 500), 'VSG': (0, 200),
+}
+
+# REQUIRED_FIELDS.seguimiento
+CAMPOS_OBLIGATORIOS = ('ID_Paciente', 'Fecha_Visita')
+
+# Filas mínimas por tarea (rango de filas que valida un proceso)
+FILAS_MIN_TAREA = 50000
+
+_FECHA_ISO = re.compile(r'^(\d{4})-(\d{2})-(\d{2})$')
+_FECHA_DMY = re.compile(r'^(\d{1,2})/(\d{1,2})/(\d{4})$')
+_DIMENSION = re.compile(rb'<dimension ref="[A-Z]+\d+:[A-Z]+(\d+)"')
+_FILA = re.compile(rb'<row r="(\d+)"')
+_FILA_CON_DATOS = re.compile(rb'<row r="(\d+)"[^>/]*>(?!(?:<c [^>]*?(?:/>|></c>))*</row>)')
+_CELDA = re.compile(rb'<c r="([A-Z]+)(\d+)"([^>]*?)(?:/>|>(.*?)</c>)', re.S)
+
+# ================ REGLAS ================
+
+def regla_columna(nombre):
+    """Columna de column_schema (con el rango de NUMERIC_RANGES si lo hay) o texto libre si no está en el esquema"""
+    columna = TIPOS.get(nombre)
+    if columna is None:
+        return Columna(nombre, 'texto', None)
+    if nombre in RANGOS_FORMULARIO:
+        return columna._replace(dominio=RANGOS_FORMULARIO[nombre])
+    return columna
+
+def _numero(valor):
+    if isinstance(valor, bool):
+        return None
+    if isinstance(valor, (int, float)):
+        return float(valor)
+    try:
+        return float(valor.strip())
+    except ValueError:
+        return None
+
+def comprobar_valor(columna, valor):
+    """(severidad, regla, mensaje) si el valor no cumple el contrato de la columna; None si lo cumple"""
+    if valor is None or valor == '':
+        return None
+    tipo, dominio = columna.tipo, columna.dominio
+    if tipo in ('si_no', 'opcion'):
+        if valor not in dominio:
+            return 'error', 'dominio', f"{columna.nombre} debe ser {' o '.join(dominio)}"
+    elif tipo == 'numero':
+        numero = _numero(valor)
+        if numero is None or numero != numero:
+            return 'error', 'numero', f'{columna.nombre} debe ser un número'
+        minimo, maximo = dominio or (None, None)
+        if (minimo is not None and numero < minimo) or (maximo is not None and numero > maximo):
+            if maximo is None:
+                return 'error', 'rango', f'{columna.nombre} debe ser mayor o igual que {minimo}'
+            return 'error', 'rango', f'{columna.nombre} debe estar entre {minimo} y {maximo}'
+    elif tipo == 'fecha':
+        if not isinstance(valor, str):
+            # Un número de serie de Excel llega al dashboard como número y parseVisitDate falla
+            return 'error', 'fecha', f'{columna.nombre} debe ser texto YYYY-MM-DD (la celda es de tipo fecha/número)'
+        for patron, severidad, orden in ((_FECHA_ISO, None, (0, 1, 2)), (_FECHA_DMY, 'aviso', (2, 1, 0))):
+            coincidencia = patron.match(valor.strip())
+            if coincidencia:
+                partes = [int(coincidencia.group(i + 1)) for i in orden]
+                try:
+                    date(*partes)
+                except ValueError:
+                    break
+                if severidad:
+                    return severidad, 'fecha_no_iso', f'{columna.nombre} en DD/MM/YYYY; el contrato usa YYYY-MM-DD'
+                return None
+        return 'error', 'fecha', f'{columna.nombre} no es una fecha válida (YYYY-MM-DD)'
+    return None
+
+# ================ FILTRO RÁPIDO ================
+
+def _trie(palabras):
+    """Expresión regular (sin grupos de captura) que reconoce exactamente `palabras`"""
+    arbol = {}
+    for palabra in palabras:
+        nodo = arbol
+        for caracter in palabra:
+            nodo = nodo.setdefault(caracter, {})
+        nodo[''] = {}
+
+    def expresion(nodo):
+        ramas = [re.escape(c) + expresion(hijo) for c, hijo in sorted(nodo.items()) if c]
+        opcional = '' in nodo
+        if not ramas:
+            return ''
+        cuerpo = ramas[0] if len(ramas) == 1 and not opcional else f"(?:{'|'.join(ramas)})"
+        return cuerpo + '?' if opcional else cuerpo
+
+    return expresion(arbol)
+
+def _regex_numero(dominio):
+    """
+    Forma textual de números que seguro cumplen el rango (None si no hay atajo): parte
+    entera en [mínimo, máximo) con cualquier decimal, o el máximo exacto. Lo que no
+    encaja no es necesariamente un error: pasa a la comprobación exacta.
+    """
+    minimo, maximo = dominio or (None, None)
+    decimales = r'(?:\.\d+)?'
+    if maximo is None:
+        if minimo is None:
+            return r'-?\d+' + decimales
+        return r'\d+' + decimales if minimo == 0 else None
+    minimo = 0 if minimo is None else minimo
+    if minimo < 0 or int(minimo) != minimo or int(maximo) != maximo or maximo - minimo > 1000:
+        return None
+    enteros = _trie(str(i) for i in range(int(minimo), int(maximo)))
+    return f'(?:{enteros}){decimales}|{int(maximo)}(?:\\.0+)?'
+
+def _contenidos(textos=None, indices=None, numeros=None):
+    """Contenido válido de una celda tras r="..." y el estilo: texto en línea, cadena compartida o número"""
+    contenidos = []
+    if textos:
+        contenidos.append(f' t="inlineStr"><is><t>(?:{textos})</t></is></c>')
+    if indices:
+        contenidos.append(f' t="s"><v>(?:{_trie(indices)})</v></c>')
+    if numeros:
+        contenidos.append(f'(?: t="n")?><v>(?:{numeros})</v></c>')
+    return '|'.join(contenidos)
+
+class _Filtro:
+    """
+    Expresión que elimina de un bloque de XML todas las celdas que cumplen el contrato.
+    Es una sola alternancia tras el prefijo común <c r=" con una rama por grupo de
+    columnas con la misma regla (las más numerosas primero), de modo que cada celda se
+    descarta o se acepta en una única pasada del motor de expresiones regulares.
+    """
+
+    def __init__(self, letras, compartidas):
+        indices = {}
+        for i, texto in enumerate(compartidas):
+            indices.setdefault(texto, []).append(str(i))
+        grupos = {}
+        for letra, columna in letras.items():
+            if columna.tipo in ('si_no', 'opcion'):
+                clave = ('dominio', columna.dominio)
+            elif columna.tipo == 'numero':
+                clave = ('numero', _regex_numero(columna.dominio))
+            elif columna.tipo == 'fecha':
+                clave = ('fecha',)
+            else:
+                clave = ('texto',)
+            grupos.setdefault(clave, []).append(letra)
+
+        ramas = []
+        for clave, grupo in sorted(grupos.items(), key=lambda item: -len(item[1])):
+            if clave[0] == 'dominio':
+                valores = [v for v in clave[1] if not set(v) & set('<>&"\'')]
+                contenido = _contenidos(textos=_trie(valores), indices=[i for v in clave[1] for i in indices.get(v, ())])
+            elif clave[0] == 'numero':
+                contenido = _contenidos(textos=clave[1], numeros=clave[1]) if clave[1] else ''
+            elif clave[0] == 'fecha':
+                # Días 01-28: válidos en cualquier mes sin mirar el calendario
+                contenido = _contenidos(textos=r'\d{4}-(?:0[1-9]|1[0-2])-(?:0[1-9]|1\d|2[0-8])')
+            else:
+                contenido = r'(?: [a-z]+="[^"]*")*>.*?</c>'
+            if contenido:
+                ramas.append(f'(?:{_trie(grupo)})\\d+"(?: s="\\d+")?(?:{contenido})')
+        # Celdas vacías de cualquier columna de la cabecera
+        ramas.append(f'(?:{_trie(letras)})\\d+"[^>]*?(?:/>|></c>|><is><t></t></is></c>)')
+        self.expresion = re.compile(f'<c r="(?:{"|".join(ramas)})'.encode('utf-8'), re.S)
+
+    def restante(self, bloque):
+        return self.expresion.sub(b'', bloque)
+
+# ================ VALIDACIÓN DE UN RANGO ================
+
+def _registro(hoja, fila, letra, columna, valor, severidad, regla, mensaje):
+    return {'hoja': hoja, 'fila': fila, 'columna': columna, 'celda': f'{letra}{fila}', 'valor': valor,
+            'severidad': severidad, 'regla': regla, 'mensaje': mensaje}
+
+def _iter_bloques(zf, ruta):
+    """Bloques de bytes del XML de la hoja que terminan en un </row> completo"""
+    resto = b''
+    with zf.open(ruta) as f:
+        while True:
+            datos = f.read(TAM_BLOQUE)
+            bloque = resto + datos
+            corte = bloque.rfind(b'</row>') + 6 if datos else len(bloque)
+            if corte > 5:
+                yield bloque[:corte]
+                resto = bloque[corte:]
+            else:
+                resto = bloque
+            if not datos:
+                return
+
+def validar_rango(libro, hoja, inicio=2, fin=None, max_errores=1000):
+    """
+    Valida las filas [inicio, fin] de una hoja (números de fila de Excel, 1 = cabecera).
+    Devuelve {'filas', 'conteos': {(severidad, regla): n}, 'registros'}; `registros`
+    contiene como mucho `max_errores` incidencias.
+    """
+    with zipfile.ZipFile(libro) as zf:
+        ruta = localizar_hojas(zf)[hoja]
+        compartidas = leer_cadenas_compartidas(zf)
+        nombres = columnas_hoja(hoja, zf)
+        letras = {_letra(i): regla_columna(nombre_canonico(n)) for i, n in enumerate(nombres) if n is not None}
+        filtro = _Filtro(letras, compartidas)
+        obligatorias = {letra: columna.nombre for letra, columna in letras.items()
+                        if columna.nombre in CAMPOS_OBLIGATORIOS}
+        presencia = re.compile(f'<c r="({_trie(obligatorias)})(\\d+)"[^>]*?>(?:<is><t[^>]*>[^<]|<v>)'.encode())
+        fin = fin or float('inf')
+
+        filas = 0
+        conteos = Counter()
+        registros = []
+
+        def anotar(fila, letra, columna, valor, severidad, regla, mensaje):
+            conteos[severidad, regla] += 1
+            if len(registros) < max_errores:
+                registros.append(_registro(hoja, fila, letra, columna, valor, severidad, regla, mensaje))
+
+        for bloque in _iter_bloques(zf, ruta):
+            primera = _FILA.search(bloque)
+            if primera is None:
+                continue
+            ultima = _FILA.search(bloque, bloque.rfind(b'<row r="'))
+            if int(ultima.group(1)) < inicio:
+                continue
+            if int(primera.group(1)) > fin:
+                break
+            con_datos = [int(n) for n in _FILA_CON_DATOS.findall(bloque)]
+            con_datos = {n for n in con_datos if inicio <= n <= fin and n > 1}
+            filas += len(con_datos)
+            presentes = {}
+            for letra, n in presencia.findall(bloque):
+                presentes.setdefault(letra.decode(), set()).add(int(n))
+            for letra, nombre in obligatorias.items():
+                for fila in sorted(con_datos - presentes.get(letra, set())):
+                    anotar(fila, letra, nombre, None, 'error', 'obligatorio', f'{nombre} es obligatorio')
+
+            for letra, n, atributos, contenido in _CELDA.findall(filtro.restante(bloque)):
+                fila = int(n)
+                if fila not in con_datos:
+                    continue
+                letra = letra.decode()
+                valor = convertir_celda(atributos.decode('utf-8'), (contenido or b'').decode('utf-8'), compartidas)
+                if letra not in letras:
+                    if valor is not None:
+                        anotar(fila, letra, None, valor, 'error', 'columna_extra',
+                               f'Celda {letra}{fila} fuera de la cabecera ({len(nombres)} columnas)')
+                    continue
+                resultado = comprobar_valor(letras[letra], valor)
+                if resultado:
+                    anotar(fila, letra, letras[letra].nombre, valor, *resultado)
+    return {'filas': filas, 'conteos': conteos, 'registros': registros}
+
+def _letra(indice):
+    letras = ''
+    indice += 1
+    while indice:
+        indice, resto = divmod(indice - 1, 26)
+        letras = chr(65 + resto) + letras
+    return letras
+
+# ================ LIBRO ================
+
+def validar_cabecera(nombres, hoja):
+    """Incidencias de la cabecera de una hoja frente a column_schema (fila 1)"""
+    registros = []
+    canonicos = [nombre_canonico(n) if n is not None else None for n in nombres]
+    for i, nombre in enumerate(canonicos):
+        if nombre is not None and nombre not in TIPOS:
+            registros.append(_registro(hoja, 1, _letra(i), nombre, nombre, 'aviso', 'columna_desconocida',
+                                       f'{nombre} no está en el contrato: se valida como texto libre'))
+    presentes = set(canonicos)
+    for nombre in TIPOS:
+        if nombre not in presentes:
+            registros.append(_registro(hoja, 1, None, nombre, None, 'error', 'columna_faltante',
+                                       f'Falta la columna {nombre}'))
+    vistos = set()
+    for i, nombre in enumerate(canonicos):
+        if nombre is not None and nombre in vistos:
+            registros.append(_registro(hoja, 1, _letra(i), nombre, nombre, 'error', 'columna_duplicada',
+                                       f'{nombre} aparece más de una vez en la cabecera'))
+        vistos.add(nombre)
+    return registros
+
+def rangos_filas(zf, ruta, partes):
+    """Hasta `partes` rangos [inicio, fin] de filas de datos según <dimension>; uno solo si no la hay"""
+    with zf.open(ruta) as f:
+        cabecera = f.read(4096)
+    dimension = _DIMENSION.search(cabecera)
+    if not dimension:
+        return [(2, None)]
+    ultima = int(dimension.group(1))
+    partes = max(1, min(partes, (ultima - 1) // FILAS_MIN_TAREA))
+    paso = -(-(ultima - 1) // partes)
+    inicios = list(range(2, ultima + 1, paso)) or [2]
+    # El último rango queda abierto por si <dimension> se ha quedado corta
+    return [(inicio, siguiente - 1) for inicio, siguiente in zip(inicios, inicios[1:])] + [(inicios[-1], None)]
+
+def validar(libro=LIBRO_MAESTRO, hojas=HOJAS_DATOS, procesos=1, max_errores=1000):
+    """Informe de validación del libro (dict serializable a JSON)"""
+    with zipfile.ZipFile(libro) as zf:
+        disponibles = localizar_hojas(zf)
+        hojas = [hoja for hoja in hojas if hoja in disponibles]
+        cabeceras = {hoja: columnas_hoja(hoja, zf) for hoja in hojas}
+        tareas = [(hoja, inicio, fin) for hoja in hojas
+                  for inicio, fin in rangos_filas(zf, disponibles[hoja], procesos)]
+
+    if procesos > 1 and len(tareas) > 1:
+        with ProcessPoolExecutor(max_workers=procesos) as executor:
+            futuros = [executor.submit(validar_rango, libro, hoja, inicio, fin, max_errores)
+                       for hoja, inicio, fin in tareas]
+            resultados = [futuro.result() for futuro in futuros]
+    else:
+        resultados = [validar_rango(libro, hoja, inicio, fin, max_errores) for hoja, inicio, fin in tareas]
+
+    resumen = {}
+    registros = []
+    for hoja in hojas:
+        cabecera = validar_cabecera(cabeceras[hoja], hoja)
+        conteos = Counter((r['severidad'], r['regla']) for r in cabecera)
+        filas = 0
+        de_hoja = list(cabecera)
+        for (hoja_tarea, _, _), resultado in zip(tareas, resultados):
+            if hoja_tarea == hoja:
+                filas += resultado['filas']
+                conteos.update(resultado['conteos'])
+                de_hoja += resultado['registros']
+        orden = {nombre_canonico(nombre): i for i, nombre in enumerate(cabeceras[hoja]) if nombre is not None}
+        de_hoja.sort(key=lambda r: (r['fila'], orden.get(r['columna'], len(orden))))
+        registros += de_hoja[:max_errores]
+        resumen[hoja] = {
+            'filas': filas,
+            'errores': sum(n for (severidad, _), n in conteos.items() if severidad == 'error'),
+            'avisos': sum(n for (severidad, _), n in conteos.items() if severidad == 'aviso'),
+            'reglas': {f'{severidad}:{regla}': n for (severidad, regla), n in sorted(conteos.items())},
+        }
+    return {
+        'version': VERSION_INFORME,
+        'libro': os.path.basename(libro),
+        'valido': all(r['errores'] == 0 for r in resumen.values()),
+        'hojas': resumen,
+        'incidencias': registros,
+    }
+
+def ruta_informe(libro):
+    return os.path.splitext(os.fspath(libro))[0] + '.validacion.json'
+
+# ================ CLI ================
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Valida las hojas ESPA y APS contra el contrato de datos')
+    parser.add_argument('libro', nargs='?', default=LIBRO_MAESTRO)
+    parser.add_argument('--salida', help='Informe JSON (por defecto <libro>.validacion.json)')
+    parser.add_argument('--procesos', type=int, default=1, help='Procesos en paralelo (0 = todos los núcleos)')
+    parser.add_argument('--max-errores', type=int, default=1000,
+                        help='Incidencias detalladas por hoja en el informe (los conteos son siempre completos)')
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.procesos <= 0:
+        args.procesos = os.cpu_count() or 1
+    inicio = time.perf_counter()
+    informe = validar(args.libro, procesos=args.procesos, max_errores=args.max_errores)
+    salida = args.salida or ruta_informe(args.libro)
+    guardar_json(informe, salida, indent=1, default=str)
+    for hoja, resumen in informe['hojas'].items():
+        print(f"  {hoja}: {resumen['filas']} filas, {resumen['errores']} errores, {resumen['avisos']} avisos")
+    estado = 'cumple el contrato' if informe['valido'] else 'NO cumple el contrato'
+    print(f"{args.libro} {estado} ({time.perf_counter() - inicio:.1f}s); informe en {salida}")
+    return 0 if informe['valido'] else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
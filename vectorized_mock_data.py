@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Generación vectorizada de visitas ficticias con NumPy
+
+Los constructores de filas de generate_mock_data.py hacen decenas de llamadas a
+random por visita ('SI' if random.random() < p else 'NO', randint, gauss...). Aquí
+cada campo se sortea de una vez para todas las visitas de un shard a partir de
+tablas de probabilidad por columna, y el resultado es un bloque columnar que se
+convierte en filas (modo en memoria) o directamente en XML (modo streaming).
+
+Las columnas independientes siguen las distribuciones de los generadores por
+fila; las fechas, el tratamiento y los índices de actividad de los seguimientos
+salen de trayectorias por paciente (trajectory_mock_data.py). Los valores se
+asignan por nombre de columna de la cabecera y no por posición.
+"""
+
+import hashlib
+from itertools import repeat
+
+import numpy as np
+
+from column_schema import COLUMNAS_DACT, COLUMNAS_ENTESITIS, COLUMNAS_HAQ, COLUMNAS_LEI, COLUMNAS_NAD, COLUMNAS_NAT
+from score_engine import (calcular_asdas, calcular_basdai, calcular_haq, calcular_lei, calcular_mda, calcular_rapid3,
+                          redondear_js)
+from id_pacientes import esquema_para, formatear_id
+from generate_mock_data import (APELLIDOS, ARTICULATIONS, DACTILITIS, MAX_VISITS, MIN_VISITS, NOMBRES,
+                                PROFESIONALES, TRATAMIENTOS_APS, TRATAMIENTOS_ESPA, _descripcion_pasi, _dosis_fame,
+                                semilla_shard)
+from trajectory_mock_data import CAMBIAR, DECISIONES, LINEA_AINE, LINEA_BIOLOGICO, LINEA_FAME, aplanar, simular_trayectorias
+from tratamientos import parsear_componente, texto_dosis
+from xlsx_streaming import MARCADOR_FILA, CodificadorFilas
+
+# ================ COLUMNAS ================
+
+DEDOS_MANO = 10
+
+# Catálogos de texto indexados por código entero (evita formatear cadenas fila a fila)
+TENSIONES = [f"{sistolica}/{diastolica}" for sistolica in range(110, 141) for diastolica in range(70, 91)]
+
+COLUMNAS_TRATAMIENTO_INICIAL = {
+    'Trat_Sistemico': 'trat_sistemico', 'Trat_Sistemico_Dosis': 'trat_sistemico_dosis',
+    'Trat_FAME': 'trat_fame', 'Trat_FAME_Dosis': 'trat_fame_dosis',
+    'Trat_Biologico': 'trat_biologico', 'Trat_Biologico_Dosis': 'trat_biologico_dosis'
+}
+
+IMC_FIJO = round(70 / (1.75**2), 1)
+PASI_MAX = 72
+
+# ================ TABLAS DE PROBABILIDAD ================
+
+_COMORBILIDADES_PRIMERA = {
+    'Comorbilidad_ECV': 0.05, 'Comorbilidad_Gastritis': 0.1, 'Comorbilidad_Obesidad': 0.3,
+    'Comorbilidad_Osteoporosis': 0.15, 'Comorbilidad_Gota': 0.05
+}
+
+_COMORBILIDADES_SEGUIMIENTO = dict(_COMORBILIDADES_PRIMERA, Comorbilidad_ECV=0.0)
+
+_TOXICOS = {'Toxico_Tabaco': 0.3, 'Toxico_Alcohol': 0.2, 'Toxico_Drogas': 0.1}
+
+_CONTINUAR = {'Continuar_Adherencia': 0.6, 'Continuar_Ajuste_Terapeutico': 0.3}
+
+_EXTRA_ESPA = {'ExtraArticular_Digestiva': 0.1, 'ExtraArticular_Uveitis': 0.15, 'ExtraArticular_Psoriasis': 0.0}
+_EXTRA_APS = {'ExtraArticular_Digestiva': 0.1, 'ExtraArticular_Uveitis': 0.05, 'ExtraArticular_Psoriasis': 0.2}
+
+# Otras_Entesitis es texto libre y no se sortea
+_ENTESITIS_ESPA = dict(zip(COLUMNAS_ENTESITIS, [0.2, 0.15, 0.1, 0.08, 0.05, 0.2, 0.15, 0.1, 0.08, 0.05]))
+_ENTESITIS_APS = dict(zip(COLUMNAS_ENTESITIS, [0.2, 0.15, 0.15, 0.1, 0.08, 0.2, 0.15, 0.15, 0.1, 0.08]))
+
+_PSORIASIS_APS = {
+    'Psoriasis_Cuero_Cabelludo': 0.7, 'Psoriasis_Ungueal': 0.4, 'Psoriasis_Extensora': 0.6,
+    'Psoriasis_Pliegues': 0.3, 'Psoriasis_Palmoplantar': 0.2
+}
+
+# P('SI') de cada columna SI/NO independiente, por (patología, tipo de visita)
+PROBABILIDADES_SI = {
+    ('espa', 'primera'): {
+        'Dolor_Axial': 0.4, 'Irradiacion_Nalgas': 0.6, 'Clinica_Axial_Presente': 0.7,
+        **_EXTRA_ESPA, **_COMORBILIDADES_PRIMERA, **_TOXICOS, **_ENTESITIS_ESPA
+    },
+    ('espa', 'seguimiento'): {**_EXTRA_ESPA, **_COMORBILIDADES_SEGUIMIENTO, **_CONTINUAR},
+    ('aps', 'primera'): {
+        'FR': 0.3, 'APCC': 0.4, 'Dolor_Axial': 0.3, 'Irradiacion_Nalgas': 0.4, 'Clinica_Axial_Presente': 0.5,
+        **_PSORIASIS_APS, **_EXTRA_APS, **_COMORBILIDADES_PRIMERA, **_TOXICOS, **_ENTESITIS_APS
+    },
+    ('aps', 'seguimiento'): {'FR': 0.3, 'APCC': 0.4, **_EXTRA_APS, **_COMORBILIDADES_SEGUIMIENTO, **_CONTINUAR},
+}
+
+# Resto de columnas independientes: ('entero', min, max) | ('uniforme', min, max, decimales)
+# | ('elegir', opciones, probabilidades) | ('fijo', valor)
+_ANAMNESIS = {
+    'Inicio_Sintomas': ('elegir', ['2024-01', '2023-06'], None),
+    'Rigidez_Matutina': ('fijo', '30'),
+    'Duracion_Rigidez': ('fijo', '45'),
+}
+
+_DOLOR_NOCTURNO = {'Dolor_Nocturno': ('uniforme', 2, 8, 1)}
+
+_ANTROPOMETRIA_ESPA = {'Peso': ('entero', 60, 95), 'Talla': ('entero', 160, 185), 'IMC': ('fijo', IMC_FIJO)}
+_ANTROPOMETRIA_APS = {'Peso': ('entero', 55, 95), 'Talla': ('entero', 155, 185), 'IMC': ('fijo', IMC_FIJO)}
+
+DISTRIBUCIONES = {
+    ('espa', 'primera'): {**_ANAMNESIS, **_ANTROPOMETRIA_ESPA},
+    ('espa', 'seguimiento'): {
+        **_ANTROPOMETRIA_ESPA, **_DOLOR_NOCTURNO,
+        'Schober': ('uniforme', 3, 7, 1),
+        'Rotacion_Cervical': ('entero', 40, 80),
+        'Distancia_OP': ('uniforme', 5, 25, 1),
+        'Distancia_TP': ('uniforme', 40, 80, 1),
+        'Expansion_Toracica': ('uniforme', 2, 5, 1),
+        'Distancia_Intermaleolar': ('entero', 30, 50),
+    },
+    ('aps', 'primera'): {
+        **_ANAMNESIS, **_ANTROPOMETRIA_APS,
+        'Inicio_Psoriasis': ('elegir', ['2023-06', '2022-12'], [0.7, 0.3]),
+    },
+    ('aps', 'seguimiento'): {
+        **_ANTROPOMETRIA_APS, **_DOLOR_NOCTURNO,
+        'Rigidez_Matutina_Min': ('entero', 10, 60),
+    },
+}
+
+# ================ BLOQUE COLUMNAR ================
+
+class BloqueColumnar:
+    """
+    Visitas almacenadas por columnas: {nombre: [(índices de fila, valores), ...]}.
+
+    Cada segmento es un array de un único dtype (o un escalar para todo el segmento);
+    las filas sin segmento quedan vacías. Los arrays booleanos se escriben como
+    'SI'/'NO', igual que los campos del formulario.
+    """
+
+    def __init__(self, n):
+        self.n = n
+        self.columnas = {}
+
+    def asignar(self, nombre, valores, indices=slice(None)):
+        self.columnas.setdefault(nombre, []).append((indices, valores))
+
+    def _comprobar(self, cabecera):
+        desconocidas = set(self.columnas) - set(cabecera)
+        if desconocidas:
+            raise ValueError(f"Columnas que no están en la cabecera: {sorted(desconocidas)}")
+
+    def filas(self, cabecera):
+        """Tuplas de valores en el orden de `cabecera` (None en las celdas vacías)"""
+        self._comprobar(cabecera)
+        listas = []
+        for nombre in cabecera:
+            segmentos = self.columnas.get(nombre)
+            if not segmentos:
+                listas.append(repeat(None, self.n))
+                continue
+            columna = np.full(self.n, None, dtype=object)
+            for indices, valores in segmentos:
+                if getattr(valores, 'dtype', None) == bool:
+                    valores = np.where(valores, 'SI', 'NO').astype(object)
+                columna[indices] = valores
+            listas.append(columna.tolist())
+        return list(zip(*listas))
+
+    def plantillas_xml(self, cabecera, codificador):
+        """
+        Filas ya serializadas (CodificadorFilas.plantilla): el XML de cada valor distinto
+        se genera una vez por segmento y se reparte con el índice inverso de np.unique
+        """
+        self._comprobar(cabecera)
+        listas = []
+        for columna, nombre in enumerate(cabecera):
+            segmentos = self.columnas.get(nombre)
+            if not segmentos:
+                continue
+            celdas = np.full(self.n, '', dtype=object)
+            for indices, valores in segmentos:
+                if np.ndim(valores) == 0:
+                    celdas[indices] = codificador.celda(columna, valores)
+                    continue
+                if valores.dtype == bool:
+                    unicos, inverso = ['NO', 'SI'], valores.view(np.uint8)
+                else:
+                    unicos, inverso = np.unique(valores, return_inverse=True)
+                    unicos = unicos.tolist()
+                xml = np.array([codificador.celda(columna, valor) for valor in unicos], dtype=object)
+                celdas[indices] = xml[inverso]
+            listas.append(celdas.tolist())
+
+        apertura = '<row r="' + MARCADOR_FILA + '">'
+        if not listas:
+            return [apertura + '</row>'] * self.n
+        return [apertura + ''.join(partes) + '</row>' for partes in zip(*listas)]
+
+# ================ MUESTREO ================
+
+def _elegir(rng, opciones, n, probabilidades=None):
+    return np.array(opciones, dtype=object)[rng.choice(len(opciones), n, p=probabilidades)]
+
+def _muestrear(rng, distribucion, n):
+    """Sortea n valores de una entrada de DISTRIBUCIONES"""
+    tipo = distribucion[0]
+    if tipo == 'entero':
+        return rng.integers(distribucion[1], distribucion[2] + 1, n)
+    if tipo == 'uniforme':
+        return np.round(rng.uniform(distribucion[1], distribucion[2], n), distribucion[3])
+    if tipo == 'elegir':
+        return _elegir(rng, distribucion[1], n, distribucion[2])
+    if tipo == 'fijo':
+        return distribucion[1]
+    raise ValueError(f"Distribución desconocida: {distribucion!r}")
+
+def _rangos(claves):
+    """Rango de cada elemento dentro de su fila: una permutación aleatoria si las claves lo son"""
+    return np.argsort(np.argsort(claves, axis=1), axis=1)
+
+def muestrear_articulaciones(rng, n, count_nad_max=12, count_nad=None):
+    """NAD (0..count_nad_max, o los recuentos dados) y NAT ⊆ NAD (0-66% de NAD) como matrices booleanas n × 28"""
+    rangos = _rangos(rng.random((n, len(ARTICULATIONS))))
+    if count_nad is None:
+        count_nad = rng.integers(0, count_nad_max + 1, n)
+    count_nat = rng.integers(0, (count_nad * 0.66).astype(int) + 1)
+    # Las count_nat primeras de la misma permutación: subconjunto uniforme de NAD
+    return rangos < count_nad[:, None], rangos < count_nat[:, None]
+
+def muestrear_dactilitis(rng, n):
+    """Dactilitis (0-3 dedos, más manos que pies) como matriz booleana n × 20"""
+    count = rng.integers(0, 4, n)
+    mano_count = rng.integers(count // 2, count + 1)
+    claves = rng.random((n, len(DACTILITIS)))
+    manos = _rangos(claves[:, :DEDOS_MANO]) < mano_count[:, None]
+    pies = _rangos(claves[:, DEDOS_MANO:]) < (count - mano_count)[:, None]
+    return np.hstack([manos, pies])
+
+def _escala(rng, media, desviacion, maximo):
+    """Escala analógica 0-maximo con un decimal alrededor de `media`"""
+    return np.round(np.clip(media + rng.normal(0, desviacion, len(media)), 0, maximo), 1)
+
+def _farmacos_dosis(pautas):
+    """('Adalimumab 40mg/2sem', ...) → arrays de fármacos ('Adalimumab') y dosis ('40mg/2sem')"""
+    componentes = [parsear_componente(pauta) for pauta in pautas]
+    return (np.array([c.farmaco for c in componentes], dtype=object),
+            np.array([texto_dosis(c) for c in componentes], dtype=object))
+
+def _datos_pacientes(rng, pathology, inicio, fin, esquema_id):
+    """Constantes por paciente (columnas de longitud fin - inicio)"""
+    n = fin - inicio
+    tratamientos = TRATAMIENTOS_ESPA if pathology == 'espa' else TRATAMIENTOS_APS
+
+    anios = rng.choice([2024, 2025], n).tolist()
+    pacientes = {
+        'id': np.array([formatear_id(pathology, anio, i + 1, esquema_id) for anio, i in zip(anios, range(inicio, fin))],
+                       dtype=object),
+        'nombre': _elegir(rng, NOMBRES, n) + ' ' + _elegir(rng, APELLIDOS, n) + ' ' + _elegir(rng, APELLIDOS, n),
+        'sexo': _elegir(rng, ['Hombre', 'Mujer'], n),
+        'fecha_primera': np.datetime64('2024-01-01', 'D') + rng.integers(0, 366, n),
+        'profesional': _elegir(rng, PROFESIONALES, n),
+        'HTA': rng.random(n) < 0.35,
+        'DM': rng.random(n) < 0.2,
+        'DLP': rng.random(n) < 0.4,
+    }
+    if pathology == 'espa':
+        pacientes['hla_b27'] = np.where(rng.random(n) < 0.8, 'Positivo', 'Negativo')
+    else:
+        pacientes['hla_b27'] = np.where(rng.random(n) < 0.7, 'Negativo', 'Positivo')
+
+    # Escalada terapéutica: <0.4 AINE, <0.7 AINE + FAME, resto AINE + biológico
+    escalada = rng.random(n)
+    solo_aine = escalada < 0.4
+    con_fame = ~solo_aine & (escalada < 0.7)
+    con_biologico = escalada >= 0.7
+
+    aine = _elegir(rng, tratamientos['AINEs'], n)
+    otro_aine = _elegir(rng, tratamientos['AINEs'], n)
+    i_fame = rng.integers(0, len(tratamientos['FAMEs']), n)
+    i_bio = rng.integers(0, len(tratamientos['Biológicos']), n)
+    fame = np.array(tratamientos['FAMEs'], dtype=object)[i_fame]
+    bio = np.array(tratamientos['Biológicos'], dtype=object)[i_bio]
+
+    pacientes['tratamiento_inicial'] = np.where(solo_aine, aine, aine + ' + ' + np.where(con_fame, fame, bio))
+    pacientes['trat_sistemico'] = np.where(solo_aine, otro_aine, aine)
+    pacientes['trat_sistemico_dosis'] = '500mg/12h'
+    pacientes['trat_fame'] = np.where(con_fame, fame, '')
+    dosis_fame = np.array([_dosis_fame(f) for f in tratamientos['FAMEs']], dtype=object)
+    pacientes['trat_fame_dosis'] = np.where(con_fame, dosis_fame[i_fame], '')
+    farmaco_bio, dosis_bio = _farmacos_dosis(tratamientos['Biológicos'])
+    pacientes['trat_biologico'] = np.where(con_biologico, farmaco_bio[i_bio], '')
+    pacientes['trat_biologico_dosis'] = np.where(con_biologico, dosis_bio[i_bio], '')
+
+    # Punto de partida de la trayectoria
+    pacientes['linea'] = np.where(solo_aine, LINEA_AINE, np.where(con_fame, LINEA_FAME, LINEA_BIOLOGICO))
+    pacientes['biologico'] = np.where(con_biologico, i_bio, -1)
+    return pacientes
+
+# ================ GENERACIÓN DEL BLOQUE ================
+
+def generar_bloque(pathology, inicio, fin, min_visitas=MIN_VISITS, max_visitas=MAX_VISITS, rng=None, esquema_id=None):
+    """
+    Genera las visitas de los pacientes [inicio, fin) como BloqueColumnar (paciente a paciente, en orden).
+    Sin `esquema_id` se usa el esquema de ID que admite `fin`, como en generar_shard.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    esquema_id = esquema_id or esquema_para(max(fin, 1))
+    espa = pathology == 'espa'
+    tratamientos = TRATAMIENTOS_ESPA if espa else TRATAMIENTOS_APS
+    pacientes = _datos_pacientes(rng, pathology, inicio, fin, esquema_id)
+
+    # Series longitudinales (pacientes × visitas) aplanadas a una fila por visita
+    num_visitas = rng.integers(min_visitas, max_visitas + 1, fin - inicio)
+    serie = aplanar(simular_trayectorias(rng, num_visitas, pacientes['linea'], pacientes['biologico'],
+                                         len(tratamientos['Biológicos'])))
+    total = int(num_visitas.sum())
+    paciente = np.repeat(np.arange(fin - inicio), num_visitas)
+    orden_visita = np.arange(total) - np.repeat(np.cumsum(num_visitas) - num_visitas, num_visitas)
+    primera = np.flatnonzero(orden_visita == 0)
+    seguimiento = np.flatnonzero(orden_visita > 0)
+    p_primera = paciente[primera]
+    s = len(seguimiento)
+
+    actividad = serie['actividad']
+    fechas = pacientes['fecha_primera'][paciente] + serie['dias']
+
+    bloque = BloqueColumnar(total)
+
+    # Identificación y datos del paciente
+    bloque.asignar('ID_Paciente', pacientes['id'][paciente])
+    bloque.asignar('Nombre_Paciente', pacientes['nombre'][paciente])
+    bloque.asignar('Sexo', pacientes['sexo'][paciente])
+    bloque.asignar('Fecha_Visita', np.datetime_as_string(fechas, unit='D'))
+    bloque.asignar('Tipo_Visita', 'Primera Visita', primera)
+    bloque.asignar('Tipo_Visita', 'Seguimiento', seguimiento)
+    bloque.asignar('Profesional', pacientes['profesional'][paciente])
+    bloque.asignar('Diagnostico_Primario', 'ESPA' if espa else 'APS')
+    bloque.asignar('HLA_B27', pacientes['hla_b27'][paciente])
+    for comorbilidad in ('HTA', 'DM', 'DLP'):
+        bloque.asignar(f'Comorbilidad_{comorbilidad}', pacientes[comorbilidad][paciente])
+
+    # Columnas independientes, por tipo de visita
+    for tipo, filas in (('primera', primera), ('seguimiento', seguimiento)):
+        probabilidades = PROBABILIDADES_SI[(pathology, tipo)]
+        sorteo = rng.random((len(filas), len(probabilidades))) < np.array(list(probabilidades.values()))
+        for k, nombre in enumerate(probabilidades):
+            bloque.asignar(nombre, sorteo[:, k], filas)
+        for nombre, distribucion in DISTRIBUCIONES[(pathology, tipo)].items():
+            bloque.asignar(nombre, _muestrear(rng, distribucion, len(filas)), filas)
+
+    # Homúnculo: el número de articulaciones dolorosas sigue a la actividad
+    count_nad_max = 12 if espa else 10
+    nad, nat = muestrear_articulaciones(rng, total, count_nad=rng.binomial(count_nad_max, actividad * 0.8))
+    dactilitis = muestrear_dactilitis(rng, total)
+    for matriz, columnas in ((nad, COLUMNAS_NAD), (nat, COLUMNAS_NAT), (dactilitis, COLUMNAS_DACT)):
+        for k, nombre in enumerate(columnas):
+            bloque.asignar(nombre, matriz[:, k])
+    count_nad, count_nat, count_dact = nad.sum(axis=1), nat.sum(axis=1), dactilitis.sum(axis=1)
+    bloque.asignar('NAD_Total', count_nad)
+    bloque.asignar('NAT_Total', count_nat)
+    bloque.asignar('Dactilitis_Total', count_dact)
+
+    tension = rng.integers(0, 31, total) * 21 + rng.integers(0, 21, total)
+    bloque.asignar('TA', np.array(TENSIONES, dtype=object)[tension])
+
+    # Medidas de seguimiento derivadas de la actividad latente
+    a = actividad[seguimiento]
+    pcr = np.round(np.exp(rng.normal(np.log(0.5 + 20 * a**2), 0.35)), 1)
+    vsg = np.rint(np.exp(rng.normal(np.log(4 + 30 * a), 0.3))).astype(np.int64)
+    eva_global = _escala(rng, 10 * a, 0.8, 10)
+    eva_dolor = _escala(rng, 10 * a, 0.8, 10)
+    bloque.asignar('PCR', pcr, seguimiento)
+    bloque.asignar('VSG', vsg, seguimiento)
+    bloque.asignar('EVA_Global', eva_global, seguimiento)
+    bloque.asignar('EVA_Dolor', eva_dolor, seguimiento)
+    bloque.asignar('EVA_Fatiga', _escala(rng, 10 * a, 1.0, 10), seguimiento)
+
+    if espa:
+        # BASDAI y ASDAS con las fórmulas de scoreCalculators.js (score_engine) a partir de los ítems
+        items = np.clip(np.rint(10 * a[:, None] + rng.normal(0, 1.2, (s, 5))), 0, 10).astype(np.int64)
+        horas_rigidez = np.clip(np.rint((2 * a + rng.normal(0, 0.3, s)) * 4) / 4, 0, 2)
+        rigidez = redondear_js(np.minimum(horas_rigidez / 2 * 10, 10), 1)
+        basdai = redondear_js(calcular_basdai(*items.T, horas_rigidez), 2)
+        asdas_crp, asdas_esr = calcular_asdas(items[:, 1], rigidez, eva_global, count_nad[seguimiento], pcr, vsg)
+
+        for k in range(5):
+            bloque.asignar(f'BASDAI_P{k + 1}', items[:, k], seguimiento)
+        bloque.asignar('BASDAI_P6', horas_rigidez, seguimiento)
+        bloque.asignar('BASDAI_Result', basdai, seguimiento)
+        bloque.asignar('Rigidez_Matutina_Min', (horas_rigidez * 60).astype(np.int64), seguimiento)
+        bloque.asignar('ASDAS_Dolor_Espalda', items[:, 1], seguimiento)
+        bloque.asignar('ASDAS_Duracion_Rigidez', rigidez, seguimiento)
+        bloque.asignar('ASDAS_EVA_Global', eva_global, seguimiento)
+        bloque.asignar('ASDAS_CRP_Result', redondear_js(asdas_crp, 2), seguimiento)
+        bloque.asignar('ASDAS_ESR_Result', redondear_js(asdas_esr, 2), seguimiento)
+    else:
+        pasi = np.rint(np.clip(20 * actividad * rng.normal(1, 0.25, total), 0, PASI_MAX)).astype(np.int64)
+        bsa = np.round(np.clip(pasi * 0.6 + rng.normal(0, 1, total), 0, 100), 1)
+        bloque.asignar('PASI_Score', pasi)
+        bloque.asignar('BSA_Percentage', bsa)
+        descripciones = np.array([_descripcion_pasi(valor) for valor in range(PASI_MAX + 1)], dtype=object)
+        bloque.asignar('Psoriasis_Descripcion', descripciones[pasi])
+
+        # HAQ (8 categorías 0-3), LEI (6 puntos) y RAPID3/MDA como en scoreCalculators.js
+        categorias = np.clip(np.rint(3 * a[:, None] + rng.normal(0, 0.6, (s, 8))), 0, 3).astype(np.int64)
+        haq_calculado = calcular_haq(categorias.T)
+        haq = redondear_js(haq_calculado, 2)
+        lei = (rng.random((s, len(COLUMNAS_LEI))) < 0.35 * a[:, None]).astype(np.int64)
+        lei_score = calcular_lei(lei.T)
+        nad_seg, nat_seg, pasi_seg, bsa_seg = count_nad[seguimiento], count_nat[seguimiento], pasi[seguimiento], bsa[seguimiento]
+        _, mda = calcular_mda(nat_seg, nad_seg, pasi_seg, bsa_seg, lei_score, eva_dolor, eva_global, haq_calculado)
+        rapid3 = calcular_rapid3(haq_calculado, eva_dolor, eva_global)
+
+        for k, nombre in enumerate(COLUMNAS_HAQ):
+            bloque.asignar(nombre, categorias[:, k], seguimiento)
+        bloque.asignar('HAQ_Total', haq, seguimiento)
+        for k, nombre in enumerate(COLUMNAS_LEI):
+            bloque.asignar(nombre, lei[:, k], seguimiento)
+        bloque.asignar('LEI_Score', lei_score, seguimiento)
+        bloque.asignar('MDA_NAT', nat_seg, seguimiento)
+        bloque.asignar('MDA_NAD', nad_seg, seguimiento)
+        bloque.asignar('MDA_PASI', pasi_seg, seguimiento)
+        bloque.asignar('MDA_Dolor', eva_dolor, seguimiento)
+        bloque.asignar('MDA_Global', eva_global, seguimiento)
+        bloque.asignar('MDA_HAQ', haq, seguimiento)
+        bloque.asignar('MDA_Entesitis', lei_score, seguimiento)
+        bloque.asignar('MDA_Cumple', mda, seguimiento)
+        bloque.asignar('RAPID3_Funcion', redondear_js(haq_calculado * 3.33, 1), seguimiento)
+        bloque.asignar('RAPID3_Dolor', eva_dolor, seguimiento)
+        bloque.asignar('RAPID3_Global', eva_global, seguimiento)
+        bloque.asignar('RAPID3_Score', redondear_js(rapid3, 1), seguimiento)
+
+    # Tratamiento: el vigente en cada visita según las decisiones de la trayectoria
+    biologicos = np.array(tratamientos['Biológicos'], dtype=object)
+    biologico = serie['biologico']
+    cambiado = biologico != pacientes['biologico'][paciente]
+    actual = np.where(cambiado, biologicos[np.maximum(biologico, 0)], pacientes['tratamiento_inicial'][paciente])
+    bloque.asignar('Tratamiento_Actual', actual)
+    inicio_tratamiento = pacientes['fecha_primera'][paciente] + serie['inicio_linea']
+    bloque.asignar('Fecha_Inicio_Tratamiento', np.datetime_as_string(inicio_tratamiento, unit='D'))
+
+    decision = serie['decision'][seguimiento]
+    bloque.asignar('Decision_Terapeutica_SEG', np.array(DECISIONES, dtype=object)[decision], seguimiento)
+    cambios = seguimiento[decision == CAMBIAR]
+    nuevos = biologico[cambios]
+    bloque.asignar('Cambio_Motivo', 'Ineficacia', cambios)
+    farmaco_bio, dosis_bio = _farmacos_dosis(biologicos)
+    bloque.asignar('Cambio_Biologico_Farmaco', farmaco_bio[nuevos], cambios)
+    bloque.asignar('Cambio_Biologico_Dosis', dosis_bio[nuevos], cambios)
+
+    for columna, clave in COLUMNAS_TRATAMIENTO_INICIAL.items():
+        valores = pacientes[clave]
+        bloque.asignar(columna, valores[p_primera] if np.ndim(valores) else valores, primera)
+
+    bloque.asignar('Fecha_Proxima_Revision', np.datetime_as_string(fechas + 180, unit='D'))
+    return bloque
+
+# ================ SHARDS ================
+
+def rng_shard(semilla, pathology, inicio):
+    """Generator de NumPy sembrado con la misma cadena que los shards de random.Random"""
+    resumen = hashlib.sha256(semilla_shard(semilla, pathology, inicio).encode('utf-8')).digest()
+    return np.random.default_rng(int.from_bytes(resumen, 'big'))
+
+def generar_shard_vectorizado(cabecera, semilla, pathology, inicio, fin, min_visitas, max_visitas, codificar=False,
+                              esquema_id=None):
+    """Equivalente vectorizado de generar_shard: filas en el orden de `cabecera` (o ya codificadas)"""
+    bloque = generar_bloque(pathology, inicio, fin, min_visitas, max_visitas,
+                            rng=rng_shard(semilla, pathology, inicio), esquema_id=esquema_id)
+    if codificar:
+        return bloque.plantillas_xml(cabecera, CodificadorFilas())
+    return bloque.filas(cabecera)
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Lectura streaming con proyección de columnas de Hub_Clinico_Maestro.xlsx
+
+openpyxl (también en read_only) construye una celda por cada una de las 220 columnas
+de cada visita, unas pocas decenas de miles de celdas por segundo. Aquí el XML de la
+hoja se descomprime por bloques y cada <row> se recorre como texto: solo se buscan y
+decodifican las celdas de las columnas pedidas (y de las del filtro `where`, que se
+evalúa antes de decodificar el resto). La memoria queda acotada al bloque en curso.
+
+Uso:
+    for id_paciente, fecha, basdai in iter_visits('ESPA', ['ID_Paciente', 'Fecha_Visita', 'BASDAI_Result'],
+                                                  where={'Tipo_Visita': 'Seguimiento'}):
+        ...
+"""
+
+import codecs
+import html
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+
+from openpyxl.utils import column_index_from_string, get_column_letter
+
+from xlsx_streaming import NS_MAIN, TAM_BLOQUE, localizar_hojas
+
+LIBRO_MAESTRO = 'Hub_Clinico_Maestro.xlsx'
+
+# Pseudocolumna con el número de fila de la hoja (1 = cabecera)
+FILA = '#fila'
+
+TAM_LOTE = 65536
+
+NUM_FILA = re.compile(r'<row\b[^>]*?\sr="(\d+)"')
+_CELDA = re.compile(r'<c\b([^>]*?)(?:/>|>(.*?)</c>)', re.S)
+_REFERENCIA = re.compile(r'\sr="([A-Z]+)\d*"')
+_TIPO = re.compile(r'\st="([^"]*)"')
+_VALOR = re.compile(r'<v>([^<]*)</v>')
+_TEXTO = re.compile(r'<t(?:\s[^>]*)?>([^<]*)</t>')
+_FONETICA = re.compile(r'<rPh\b.*?</rPh>', re.S)
+# Celdas habituales (<v> o cadena en línea simple, vacías o autocerradas) en una sola expresión
+_CELDA_SIMPLE = re.compile(r'<c r="([A-Z]+)\d+"[^>]*?(?: t="(\w+)")?\s*(?:/>|>(?:<v>([^<]*)</v>|<is><t>([^<]*)</t></is>|)</c>)')
+
+# ================ CADENAS Y CELDAS ================
+
+def leer_cadenas_compartidas(zf):
+    """Tabla xl/sharedStrings.xml (vacía si el libro usa solo cadenas en línea)"""
+    if 'xl/sharedStrings.xml' not in zf.namelist():
+        return []
+    cadenas = []
+    etiqueta_si, etiqueta_t, etiqueta_rph = (f'{{{NS_MAIN}}}si', f'{{{NS_MAIN}}}t', f'{{{NS_MAIN}}}rPh')
+    with zf.open('xl/sharedStrings.xml') as f:
+        for _, elemento in ET.iterparse(f):
+            if elemento.tag == etiqueta_si:
+                foneticas = {id(t) for rph in elemento.iter(etiqueta_rph) for t in rph.iter(etiqueta_t)}
+                cadenas.append(''.join(t.text or '' for t in elemento.iter(etiqueta_t) if id(t) not in foneticas))
+                elemento.clear()
+    return cadenas
+
+def _texto(valor):
+    return html.unescape(valor) if '&' in valor else valor
+
+def _numero(valor):
+    if '.' in valor or 'E' in valor or 'e' in valor:
+        return float(valor)
+    return int(valor)
+
+def convertir_celda(atributos, contenido, compartidas):
+    """Valor Python de una celda a partir de sus atributos y su contenido XML"""
+    if not contenido:
+        return None
+    tipo = _TIPO.search(atributos) if ' t="' in atributos else None
+    tipo = tipo.group(1) if tipo else 'n'
+    if tipo == 'inlineStr':
+        # Caso habitual <is><t>texto</t></is>; texto enriquecido o fonético por expresión regular
+        if contenido.startswith('<is><t>') and contenido.count('<') == 3:
+            texto = contenido[7:-9]
+        else:
+            texto = ''.join(_TEXTO.findall(_FONETICA.sub('', contenido)))
+        return _texto(texto) if texto else None
+    if contenido.startswith('<v>'):
+        valor = contenido[3:contenido.find('</v>')]
+    else:
+        valor = _VALOR.search(contenido)
+        if valor is None:
+            return None
+        valor = valor.group(1)
+    if tipo == 's':
+        return compartidas[int(valor)]
+    if tipo == 'b':
+        return valor == '1'
+    if tipo in ('str', 'e'):
+        return _texto(valor)
+    return _numero(valor)
+
+def celdas_fila(fila):
+    """Todas las celdas de una fila como {letra: (atributos, contenido)} (las celdas sin r="" van en orden)"""
+    celdas = {}
+    siguiente = 1
+    for atributos, contenido in _CELDA.findall(fila):
+        referencia = _REFERENCIA.search(atributos)
+        letra = referencia.group(1) if referencia else get_column_letter(siguiente)
+        celdas[letra] = (atributos, contenido)
+        siguiente = column_index_from_string(letra) + 1
+    return celdas
+
+def iter_filas_xml(zf, ruta):
+    """Texto de cada <row> de la hoja, descomprimiendo por bloques"""
+    decodificador = codecs.getincrementaldecoder('utf-8')()
+    resto = ''
+    with zf.open(ruta) as f:
+        while True:
+            bloque = f.read(TAM_BLOQUE)
+            texto = resto + decodificador.decode(bloque, final=not bloque)
+            partes = texto.split('</row>')
+            resto = partes.pop()
+            for parte in partes:
+                # Las filas vacías (<row r="n"/>) quedan delante de la siguiente
+                inicio = parte.find('<row')
+                yield parte[parte.rfind('<row', inicio, parte.find('<c', inicio)):]
+            if not bloque:
+                return
+
+# ================ LECTOR ================
+
+# Por encima de este número de columnas pedidas sale más barato decodificar la fila entera
+MAX_COLUMNAS_BUSQUEDA = 48
+
+class LectorFilas:
+    """Decodifica de cada fila las celdas de unas letras de columna concretas"""
+
+    def __init__(self, compartidas):
+        self.compartidas = compartidas
+
+    def todas(self, fila):
+        """{letra: valor} de todas las celdas de la fila con una sola pasada de expresión regular"""
+        celdas = _CELDA_SIMPLE.findall(fila)
+        if len(celdas) != fila.count('</c>') + fila.count('/>'):
+            # Fórmulas, texto enriquecido o celdas sin r="": lectura celda a celda
+            return {letra: convertir_celda(*celda, self.compartidas) for letra, celda in celdas_fila(fila).items()}
+        valores = {}
+        for letra, tipo, valor, texto in celdas:
+            if tipo == 'inlineStr':
+                valores[letra] = (_texto(texto) if '&' in texto else texto) or None
+            elif not valor:
+                valores[letra] = None
+            elif not tipo or tipo == 'n':
+                valores[letra] = _numero(valor)
+            elif tipo == 's':
+                valores[letra] = self.compartidas[int(valor)]
+            elif tipo == 'b':
+                valores[letra] = valor == '1'
+            else:
+                valores[letra] = _texto(valor)
+        return valores
+
+    def valores(self, fila, num_fila, letras):
+        """
+        Valores de las columnas `letras` (en orden de columna) de una fila; `num_fila` es el
+        r="" de la <row> ('' si no lo tiene, y entonces las celdas se toman por posición)
+        """
+        if len(letras) > MAX_COLUMNAS_BUSQUEDA:
+            todas = self.todas(fila)
+            return [todas.get(letra) for letra in letras]
+        if not num_fila or fila.count('<c r="') != fila.count('<c'):
+            celdas = celdas_fila(fila)
+            return [convertir_celda(*celdas[letra], self.compartidas) if letra in celdas else None for letra in letras]
+        valores = []
+        posicion = 0
+        for letra in letras:
+            inicio = fila.find(f'<c r="{letra}{num_fila}"', posicion)
+            if inicio < 0:
+                valores.append(None)
+                continue
+            fin_etiqueta = fila.index('>', inicio)
+            if fila[fin_etiqueta - 1] == '/':
+                valores.append(None)
+                posicion = fin_etiqueta
+                continue
+            fin = fila.index('</c>', fin_etiqueta)
+            valores.append(convertir_celda(fila[inicio + 3:fin_etiqueta], fila[fin_etiqueta + 1:fin], self.compartidas))
+            posicion = fin
+        return valores
+
+def _condicion(valor):
+    """Normaliza una condición de `where`: callable, colección de valores admitidos o valor exacto"""
+    if callable(valor):
+        return valor
+    if isinstance(valor, (set, frozenset, list, tuple)):
+        admitidos = frozenset(valor)
+        return admitidos.__contains__
+    return lambda v: v == valor
+
+def orden_columna(letra):
+    return len(letra), letra
+
+def _abrir(workbook):
+    return workbook if isinstance(workbook, zipfile.ZipFile) else zipfile.ZipFile(workbook)
+
+def iter_visits(sheet, columns=None, where=None, workbook=LIBRO_MAESTRO):
+    """
+    Tuplas con los valores de `columns` (por defecto todas las de la cabecera) de cada
+    fila de datos de la hoja `sheet`, en orden.
+
+    `where` es un dict {columna: condición}; la condición puede ser un valor exacto,
+    una colección de valores admitidos o un callable(valor) -> bool. Las columnas del
+    filtro se decodifican primero y el resto solo en las filas que lo cumplen. Las
+    celdas vacías valen None y FILA da el número de fila de la hoja. Las filas sin
+    ningún valor se omiten.
+    """
+    zf = _abrir(workbook)
+    try:
+        hojas = localizar_hojas(zf)
+        if sheet not in hojas:
+            raise ValueError(f"El libro no tiene la hoja {sheet!r} (hojas: {', '.join(hojas)})")
+        compartidas = leer_cadenas_compartidas(zf)
+        lector = LectorFilas(compartidas)
+        filas = iter_filas_xml(zf, hojas[sheet])
+
+        letras = {}
+        # Número de la fila por posición cuando la <row> no trae r=""
+        num_fila = 0
+        for fila in filas:
+            numero = NUM_FILA.match(fila)
+            num_fila = int(numero.group(1)) if numero else num_fila + 1
+            if '<c' not in fila:
+                continue
+            letras = {convertir_celda(*celda, compartidas): letra for letra, celda in celdas_fila(fila).items()}
+            break
+        letras.pop(None, None)
+
+        columns = list(letras) if columns is None else list(columns)
+        desconocidas = [c for c in list(columns) + list(where or ()) if c != FILA and c not in letras]
+        if desconocidas:
+            raise ValueError(f"Columnas que no están en la hoja {sheet}: {desconocidas}")
+
+        # Letras pedidas en orden de columna (búsqueda secuencial dentro de la fila)
+        proyeccion = sorted({letras[c] for c in columns if c != FILA}, key=orden_columna)
+        posicion = {letra: i for i, letra in enumerate(proyeccion)}
+        salida = [None if c == FILA else posicion[letras[c]] for c in columns]
+        filtros = [(letras[c], _condicion(v)) for c, v in (where or {}).items() if c != FILA]
+        filtro_fila = _condicion(where[FILA]) if where and FILA in where else None
+        letras_filtro = [letra for letra, _ in filtros]
+
+        for fila in filas:
+            numero = NUM_FILA.match(fila)
+            referencia = numero.group(1) if numero else ''
+            num_fila = int(referencia) if numero else num_fila + 1
+            if '</c>' not in fila:
+                continue
+            if filtro_fila is not None and not filtro_fila(num_fila):
+                continue
+            if filtros:
+                valores_filtro = lector.valores(fila, referencia, letras_filtro)
+                if not all(cumple(v) for (_, cumple), v in zip(filtros, valores_filtro)):
+                    continue
+            valores = lector.valores(fila, referencia, proyeccion)
+            yield tuple(num_fila if i is None else valores[i] for i in salida)
+    finally:
+        if zf is not workbook:
+            zf.close()
+
+def iter_lotes(hoja, columnas, where=None, libro=LIBRO_MAESTRO, tam_lote=TAM_LOTE):
+    """Como iter_visits, pero en lotes {columna: array de objetos} de hasta `tam_lote` visitas"""
+    import numpy as np
+
+    columnas = list(columnas)
+    lote = []
+    for fila in iter_visits(hoja, columnas, where, libro):
+        lote.append(fila)
+        if len(lote) >= tam_lote:
+            yield _a_columnas(np, columnas, lote)
+            lote = []
+    if lote:
+        yield _a_columnas(np, columnas, lote)
+
+def _a_columnas(np, columnas, lote):
+    resultado = {}
+    for nombre, valores in zip(columnas, zip(*lote)):
+        array = np.empty(len(valores), dtype=object)
+        array[:] = valores
+        resultado[nombre] = array
+    return resultado
+
+def leer_columnas(hoja, columnas, where=None, libro=LIBRO_MAESTRO):
+    """Columnas completas de una hoja como {columna: array de objetos}"""
+    import numpy as np
+
+    columnas = list(columnas)
+    lotes = list(iter_lotes(hoja, columnas, where, libro))
+    if not lotes:
+        return {nombre: np.empty(0, dtype=object) for nombre in columnas}
+    return {nombre: np.concatenate([lote[nombre] for lote in lotes]) for nombre in columnas}
+
+def columnas_hoja(hoja, libro=LIBRO_MAESTRO):
+    """Nombres de la cabecera de una hoja, en orden"""
+    zf = _abrir(libro)
+    try:
+        compartidas = leer_cadenas_compartidas(zf)
+        for fila in iter_filas_xml(zf, localizar_hojas(zf)[hoja]):
+            if '<c' in fila:
+                celdas = celdas_fila(fila)
+                return [convertir_celda(*celdas[letra], compartidas) for letra in sorted(celdas, key=orden_columna)]
+        return []
+    finally:
+        if zf is not libro:
+            zf.close()
+
+def cabecera_xml(filas, compartidas):
+    """{letra: nombre} de la primera fila con celdas de `filas` (None en las celdas sin valor); consume `filas` hasta ella"""
+    for fila in filas:
+        if '<c' in fila:
+            return {letra: convertir_celda(*celda, compartidas) for letra, celda in celdas_fila(fila).items()}
+    return {}
+
+def columnas_ambiguas(cabecera):
+    """
+    {letra: etiqueta} de las columnas de una cabecera {letra: nombre} que no se pueden
+    direccionar por nombre: sin nombre ('<col HM>') o con un nombre ya usado en una
+    columna anterior ('Nota <col HN>'). Las letras de datos que no están en la cabecera
+    tampoco tienen nombre.
+    """
+    vistos, ambiguas = set(), {}
+    for letra in sorted(cabecera, key=orden_columna):
+        nombre = cabecera[letra]
+        if nombre is None or str(nombre).strip() == '':
+            ambiguas[letra] = f'<col {letra}>'
+        elif nombre in vistos:
+            ambiguas[letra] = f'{nombre} <col {letra}>'
+        else:
+            vistos.add(nombre)
+    return ambiguas
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Escritura streaming de Hub_Clinico_Maestro.xlsx
+
+openpyxl (incluso en modo write_only) serializa cada celda con su propio árbol XML,
+lo que limita la escritura a unos pocos miles de celdas por segundo. Para masters de
+carga (100k-1M visitas) este módulo copia la plantilla tal cual (estilos, anchos,
+cabeceras y catálogos byte a byte) y sustituye solo el bloque <sheetData> de las hojas
+de datos, que se genera como texto fila a fila con memoria constante.
+"""
+
+import json
+import numbers
+import os
+import re
+import shutil
+import stat
+import tempfile
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+from datetime import date, datetime
+
+from openpyxl.utils import get_column_letter
+
+NS_MAIN = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+NS_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+NS_PKG_REL = 'http://schemas.openxmlformats.org/package/2006/relationships'
+
+TAM_BLOQUE = 1 << 20
+FILAS_POR_ESCRITURA = 2000
+
+_ESCAPE_XML = str.maketrans({'&': '&amp;', '<': '&lt;', '>': '&gt;'})
+_CARACTERES_ILEGALES = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+DIMENSION = re.compile(rb'<dimension ref="[^"]*"\s*/>')
+_INFINITO = float('inf')
+
+# Carácter ilegal en XML (nunca aparece en los datos): marca dónde va el número de fila
+MARCADOR_FILA = '\x00'
+
+
+# ================ LOCALIZACIÓN DE HOJAS ================
+
+def localizar_hojas(zf):
+    """Devuelve {nombre_hoja: ruta del XML dentro del zip} leyendo workbook.xml y sus relaciones"""
+    libro = ET.fromstring(zf.read('xl/workbook.xml'))
+    relaciones = ET.fromstring(zf.read('xl/_rels/workbook.xml.rels'))
+
+    destinos = {}
+    for rel in relaciones.iter(f'{{{NS_PKG_REL}}}Relationship'):
+        destino = rel.get('Target')
+        destino = destino.lstrip('/') if destino.startswith('/') else f'xl/{destino}'
+        destinos[rel.get('Id')] = destino
+
+    hojas = {}
+    for hoja in libro.iter(f'{{{NS_MAIN}}}sheet'):
+        hojas[hoja.get('name')] = destinos[hoja.get(f'{{{NS_REL}}}id')]
+    return hojas
+
+
+# ================ SERIALIZACIÓN DE FILAS ================
+
+def texto_xml(valor):
+    valor = valor.translate(_ESCAPE_XML)
+    if _CARACTERES_ILEGALES.search(valor):
+        valor = _CARACTERES_ILEGALES.sub('', valor)
+    if valor[:1].isspace() or valor[-1:].isspace():
+        return f'<is><t xml:space="preserve">{valor}</t></is>'
+    return f'<is><t>{valor}</t></is>'
+
+
+def _es_finito(valor):
+    return valor == valor and valor not in (_INFINITO, -_INFINITO)
+
+
+def _final_celda(valor):
+    """Parte de la celda que sigue al número de fila; None si la celda debe omitirse"""
+    if isinstance(valor, str):
+        return f'" t="inlineStr">{texto_xml(valor)}</c>' if valor else None
+    if isinstance(valor, bool):
+        return f'" t="b"><v>{int(valor)}</v></c>'
+    if isinstance(valor, (datetime, date)):
+        return f'" t="inlineStr"><is><t>{valor.isoformat()}</t></is></c>'
+    if isinstance(valor, numbers.Integral):
+        return f'"><v>{int(valor)}</v></c>'
+    if isinstance(valor, numbers.Real):
+        return f'"><v>{float(valor)!r}</v></c>' if _es_finito(float(valor)) else None
+    return f'" t="inlineStr">{texto_xml(str(valor))}</c>'
+
+
+class CodificadorFilas:
+    """
+    Serializa filas como <row> de SpreadsheetML.
+
+    Los valores se repiten muchísimo (SI/NO, profesionales, tratamientos, enteros
+    pequeños), así que el XML completo de cada celda se cachea por columna con el
+    número de fila sustituido por MARCADOR_FILA. Una fila queda en unir celdas
+    cacheadas y un único str.replace, y la plantilla (sin número de fila) puede
+    generarse en otro proceso y numerarse después en el escritor.
+    """
+
+    def __init__(self, max_cache_columna=5000):
+        self.prefijos = []
+        self.caches = []
+        self.max_cache_columna = max_cache_columna
+
+    def _ampliar(self, n):
+        while len(self.prefijos) < n:
+            self.prefijos.append('<c r="' + get_column_letter(len(self.prefijos) + 1) + MARCADOR_FILA)
+            self.caches.append({})
+
+    def _celda(self, columna, valor):
+        final = _final_celda(valor)
+        celda = None if final is None else self.prefijos[columna] + final
+        cache = self.caches[columna]
+        # True/False comparten clave con 1/0 en el dict: nunca se cachean
+        if valor.__class__ is not bool and len(cache) < self.max_cache_columna:
+            cache[valor] = celda
+        return celda
+
+    def celda(self, columna, valor):
+        """XML de una celda (índice de columna desde 0) con MARCADOR_FILA; '' si se omite"""
+        if columna >= len(self.caches):
+            self._ampliar(columna + 1)
+        celda = self.caches[columna].get(valor, False) if valor.__class__ is not bool else False
+        if celda is False:
+            celda = self._celda(columna, valor)
+        return celda or ''
+
+    def plantilla(self, fila):
+        """XML de la fila con MARCADOR_FILA en lugar del número; '' y None se omiten"""
+        if len(fila) > len(self.caches):
+            self._ampliar(len(fila))
+        partes = []
+        for columna, (cache, valor) in enumerate(zip(self.caches, fila)):
+            if valor is None:
+                continue
+            celda = cache.get(valor, False) if valor.__class__ is not bool else False
+            if celda is False:
+                celda = self._celda(columna, valor)
+            if celda is not None:
+                partes.append(celda)
+        return '<row r="' + MARCADOR_FILA + '">' + ''.join(partes) + '</row>'
+
+    def fila(self, num_fila, fila):
+        return self.plantilla(fila).replace(MARCADOR_FILA, str(num_fila))
+
+
+# ================ DIVISIÓN DEL XML DE LA PLANTILLA ================
+
+def _dividir_hoja(origen):
+    """
+    Lee el XML de una hoja en bloques y devuelve (prefijo, sufijo, filas_cabecera):
+    el prefijo llega hasta el final de la fila de cabecera y el sufijo empieza en
+    </sheetData>. Las filas de datos de la plantilla se descartan sin cargarlas enteras.
+    """
+    buffer = b''
+    prefijo = None
+    while prefijo is None:
+        bloque = origen.read(TAM_BLOQUE)
+        buffer += bloque
+        vacia = buffer.find(b'<sheetData/>')
+        if vacia != -1:
+            return buffer[:vacia] + b'<sheetData>', b'</sheetData>' + buffer[vacia + len(b'<sheetData/>'):] + origen.read(), 0
+        inicio_datos = buffer.find(b'<sheetData>')
+        if inicio_datos != -1:
+            primera_fila = buffer.find(b'<row', inicio_datos)
+            fin_datos = buffer.find(b'</sheetData>', inicio_datos)
+            if fin_datos != -1 and (primera_fila == -1 or primera_fila > fin_datos):
+                return buffer[:fin_datos], buffer[fin_datos:] + origen.read(), 0
+            if primera_fila != -1:
+                fin_cabecera = buffer.find(b'</row>', primera_fila)
+                if fin_cabecera != -1:
+                    prefijo = buffer[:fin_cabecera + len(b'</row>')]
+                    buffer = buffer[fin_cabecera + len(b'</row>'):]
+                    break
+        if not bloque:
+            raise ValueError('XML de hoja sin <sheetData> reconocible')
+
+    # Saltar las filas de datos existentes buscando </sheetData> con solapamiento entre bloques
+    marcador = b'</sheetData>'
+    while True:
+        fin_datos = buffer.find(marcador)
+        if fin_datos != -1:
+            return prefijo, buffer[fin_datos:] + origen.read(), 1
+        buffer = buffer[-(len(marcador) - 1):]
+        bloque = origen.read(TAM_BLOQUE)
+        if not bloque:
+            raise ValueError('XML de hoja sin </sheetData>')
+        buffer += bloque
+
+
+_ESTILO = re.compile(rb'\ss="(\d+)"')
+_ATRIBUTOS_FILA = re.compile(rb'<row\b([^>]*?)/?>')
+_SPANS = re.compile(rb'\sspans="[^"]*"')
+
+
+def _sustituir_cabecera(prefijo, filas_cabecera, nombres):
+    """
+    Prefijo de la hoja con la fila 1 sustituida por `nombres`; las celdas toman el estilo
+    de la primera celda de la cabecera anterior y la fila conserva sus atributos (salvo spans)
+    """
+    if filas_cabecera:
+        inicio = prefijo.rfind(b'<row')
+        anterior = prefijo[inicio:]
+        estilo = _ESTILO.search(anterior[anterior.find(b'<c'):]) if b'<c' in anterior else None
+        atributos = _SPANS.sub(b'', _ATRIBUTOS_FILA.match(anterior).group(1)).decode('utf-8')
+        prefijo = prefijo[:inicio]
+    else:
+        estilo, atributos = None, ' r="1"'
+    estilo = f' s="{estilo.group(1).decode("ascii")}"' if estilo else ''
+    celdas = ''.join(f'<c r="{get_column_letter(i + 1)}1"{estilo} t="inlineStr">{texto_xml(str(nombre))}</c>'
+                     for i, nombre in enumerate(nombres))
+    return prefijo + f'<row{atributos}>{celdas}</row>'.encode('utf-8'), 1
+
+
+# ================ ESCRITURA ================
+
+def _umask():
+    mascara = os.umask(0)
+    os.umask(mascara)
+    return mascara
+
+
+def sustituir_archivo(temporal, destino):
+    """
+    os.replace de `temporal` (creado con mkstemp, 0600) sobre `destino` conservando el modo
+    y, si se puede, el dueño del fichero existente; un destino nuevo recibe los permisos
+    por defecto (0666 & ~umask), como un fichero creado con open()
+    """
+    try:
+        anterior = os.stat(destino)
+    except FileNotFoundError:
+        os.chmod(temporal, 0o666 & ~_umask())
+    else:
+        os.chmod(temporal, stat.S_IMODE(anterior.st_mode))
+        if hasattr(os, 'chown') and (anterior.st_uid, anterior.st_gid) != (os.getuid(), os.getgid()):
+            try:
+                os.chown(temporal, anterior.st_uid, anterior.st_gid)
+            except PermissionError:
+                pass
+    os.replace(temporal, destino)
+
+
+def escribir_atomico(destino, escribir, modo='w', **opciones):
+    """
+    Llama a escribir(f) sobre un temporal del directorio de `destino` y lo sustituye con
+    sustituir_archivo; si algo falla, borra el temporal y el destino queda como estaba.
+    `opciones` van a open() (en modo texto la codificación es utf-8)
+    """
+    if 'b' not in modo:
+        opciones.setdefault('encoding', 'utf-8')
+    fd, temporal = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(destino)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, modo, **opciones) as f:
+            escribir(f)
+        sustituir_archivo(temporal, destino)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.unlink(temporal)
+        raise
+
+
+def guardar_json(contenido, destino, **opciones):
+    """json.dump atómico de `contenido` (escribir_atomico); `opciones` van a json.dump"""
+    opciones.setdefault('ensure_ascii', False)
+    escribir_atomico(destino, lambda f: json.dump(contenido, f, **opciones))
+
+
+def escribir_libro_streaming(plantilla, salida, hojas, progreso_cada=0, nivel_compresion=1, cabeceras=None):
+    """
+    Escribe `salida` a partir de `plantilla` sustituyendo los datos de las hojas indicadas.
+
+    `hojas` es {nombre_hoja: iterable de filas}; cada fila es una secuencia de valores en el
+    orden de la cabecera de la plantilla, o una fila ya codificada con
+    CodificadorFilas.plantilla (p. ej. en un proceso trabajador). La cabecera (fila 1) y el
+    resto de partes del libro se copian sin tocar, salvo en las hojas de `cabeceras`
+    ({nombre_hoja: nombres de columna}), cuya fila 1 se sustituye. Devuelve
+    {nombre_hoja: filas escritas}.
+    """
+    totales = {}
+    codificador = CodificadorFilas()
+    directorio = os.path.dirname(os.path.abspath(salida))
+    fd, temporal_salida = tempfile.mkstemp(suffix='.xlsx', dir=directorio)
+    os.close(fd)
+
+    try:
+        with zipfile.ZipFile(plantilla) as zin, \
+                zipfile.ZipFile(temporal_salida, 'w', zipfile.ZIP_DEFLATED, compresslevel=nivel_compresion) as zout:
+            rutas = localizar_hojas(zin)
+            faltan = [nombre for nombre in hojas if nombre not in rutas]
+            if faltan:
+                raise KeyError(f"La plantilla {plantilla} no contiene las hojas: {', '.join(faltan)}")
+            rutas_datos = {rutas[nombre]: nombre for nombre in hojas}
+
+            for info in zin.infolist():
+                nombre_hoja = rutas_datos.get(info.filename)
+                if nombre_hoja is None:
+                    zout.writestr(info, zin.read(info))
+                    continue
+
+                with zin.open(info) as origen:
+                    prefijo, sufijo, filas_cabecera = _dividir_hoja(origen)
+                if cabeceras and nombre_hoja in cabeceras:
+                    prefijo, filas_cabecera = _sustituir_cabecera(prefijo, filas_cabecera, cabeceras[nombre_hoja])
+
+                num_fila = filas_cabecera
+                max_columnas = 0
+                inicio = time.perf_counter()
+                with tempfile.TemporaryFile(dir=directorio) as cuerpo:
+                    pendientes = []
+                    for fila in hojas[nombre_hoja]:
+                        num_fila += 1
+                        if isinstance(fila, str):
+                            pendientes.append(fila.replace(MARCADOR_FILA, str(num_fila)))
+                        else:
+                            if len(fila) > max_columnas:
+                                max_columnas = len(fila)
+                            pendientes.append(codificador.fila(num_fila, fila))
+                        if len(pendientes) >= FILAS_POR_ESCRITURA:
+                            cuerpo.write(''.join(pendientes).encode('utf-8'))
+                            pendientes.clear()
+                        escritas = num_fila - filas_cabecera
+                        if progreso_cada and escritas % progreso_cada == 0:
+                            transcurrido = time.perf_counter() - inicio
+                            print(f"  {nombre_hoja}: {escritas} filas ({escritas / transcurrido:,.0f} filas/s)")
+                    cuerpo.write(''.join(pendientes).encode('utf-8'))
+                    totales[nombre_hoja] = num_fila - filas_cabecera
+
+                    ultima_columna = get_column_letter(max_columnas) if max_columnas else 'A'
+                    dimension = f'<dimension ref="A1:{ultima_columna}{max(num_fila, 1)}"/>'.encode('utf-8')
+                    prefijo = DIMENSION.sub(lambda m: ampliar_dimension(m.group(0), dimension), prefijo, count=1)
+
+                    # Abrir por nombre para que se aplique el nivel de compresión del ZipFile
+                    with zout.open(info.filename, 'w', force_zip64=True) as destino:
+                        destino.write(prefijo)
+                        cuerpo.seek(0)
+                        shutil.copyfileobj(cuerpo, destino, TAM_BLOQUE)
+                        destino.write(sufijo)
+
+        sustituir_archivo(temporal_salida, salida)
+    except BaseException:
+        if os.path.exists(temporal_salida):
+            os.remove(temporal_salida)
+        raise
+
+    return totales
+
+
+def ampliar_dimension(original, calculada):
+    """Conserva la columna final de la plantilla si es más ancha que los datos"""
+    ref_original = re.search(rb'ref="(?:[A-Z]+\d+:)?([A-Z]+)\d+"', original)
+    ref_calculada = re.search(rb'ref="A1:([A-Z]+)(\d+)"', calculada)
+    if not ref_original or not ref_calculada:
+        return calculada
+    col_original, col_calculada = ref_original.group(1), ref_calculada.group(1)
+    columna = max(col_original, col_calculada, key=lambda c: (len(c), c))
+    return b'<dimension ref="A1:' + columna + ref_calculada.group(2) + b'"/>'